@@ -0,0 +1,183 @@
+"""Разбор полученных файлов: хэш содержимого и метаданные аудио
+
+Без зависимостей от GUI: используется и в процессах-обработчиках приема (receiver_worker).
+"""
+import hashlib
+import os
+import struct
+import wave
+
+try:
+    import mutagen  # Необязательная зависимость: точные метаданные для любых форматов
+except ImportError:
+    mutagen = None
+
+def file_digest(path: str) -> str:
+    """SHA-1 содержимого файла"""
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+_MP3_BITRATES = {
+    (3, 3): (0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448),
+    (3, 2): (0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),
+    (3, 1): (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    (2, 3): (0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),
+    (2, 2): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+    (2, 1): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+_MP3_SAMPLE_RATES = {3: (44100, 48000, 32000), 2: (22050, 24000, 16000), 0: (11025, 12000, 8000)}
+_ID3_TEXT_FRAMES = {b"TIT2": "title", b"TPE1": "artist", b"TALB": "album"}
+_ID3_ENCODINGS = {0: "latin-1", 1: "utf-16", 2: "utf-16-be", 3: "utf-8"}
+
+def _syncsafe(data: bytes) -> int:
+    return (data[0] << 21) | (data[1] << 14) | (data[2] << 7) | data[3]
+
+def _parse_id3v2(f, info: dict) -> int:
+    """Теги ID3v2; возвращает размер тега"""
+    header = f.read(10)
+    if len(header) < 10 or header[:3] != b"ID3":
+        return 0
+    version = header[3]
+    size = _syncsafe(header[6:10]) + 10 + (10 if header[5] & 0x10 else 0)
+    body = f.read(size - 10)
+    pos = 0
+    while pos + 10 <= len(body) and body[pos] != 0:
+        frame_id = body[pos:pos + 4]
+        frame_size = _syncsafe(body[pos + 4:pos + 8]) if version >= 4 else struct.unpack(">I", body[pos + 4:pos + 8])[0]
+        frame = body[pos + 10:pos + 10 + frame_size]
+        if frame_id in _ID3_TEXT_FRAMES and frame:
+            encoding = _ID3_ENCODINGS.get(frame[0], "latin-1")
+            text = frame[1:].decode(encoding, errors="ignore").strip("\x00").strip()
+            if text:
+                info["tags"][_ID3_TEXT_FRAMES[frame_id]] = text
+        pos += 10 + frame_size
+    return size
+
+def _parse_mp3(path: str, info: dict):
+    file_size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        offset = _parse_id3v2(f, info)
+        f.seek(offset)
+        data = f.read(64 * 1024)
+        
+        # Теги ID3v1 в конце файла, если нет ID3v2
+        if not info["tags"] and file_size >= 128:
+            f.seek(-128, os.SEEK_END)
+            tail = f.read(128)
+            if tail[:3] == b"TAG":
+                for key, start in (("title", 3), ("artist", 33), ("album", 63)):
+                    value = tail[start:start + 30].split(b"\x00")[0].decode("latin-1").strip()
+                    if value:
+                        info["tags"][key] = value
+    
+    for i in range(len(data) - 4):
+        if data[i] != 0xFF or data[i + 1] & 0xE0 != 0xE0:
+            continue
+        version = (data[i + 1] >> 3) & 3
+        layer = (data[i + 1] >> 1) & 3
+        bitrate_index = data[i + 2] >> 4
+        rate_index = (data[i + 2] >> 2) & 3
+        if version == 1 or layer == 0 or bitrate_index in (0, 15) or rate_index == 3:
+            continue
+        
+        bitrate = _MP3_BITRATES[(3 if version == 3 else 2, layer)][bitrate_index] * 1000
+        sample_rate = _MP3_SAMPLE_RATES[version][rate_index]
+        mono = (data[i + 3] >> 6) == 3
+        samples_per_frame = 384 if layer == 3 else (1152 if layer == 2 or version == 3 else 576)
+        info.update(codec="mp3", sample_rate=sample_rate, channels=1 if mono else 2, bitrate=bitrate)
+        audio_bytes = file_size - offset - i
+        
+        # VBR: число кадров из заголовка Xing/Info или VBRI
+        side_info = (17 if mono else 32) if version == 3 else (9 if mono else 17)
+        xing = i + 4 + side_info
+        frames = None
+        if data[xing:xing + 4] in (b"Xing", b"Info") and struct.unpack(">I", data[xing + 4:xing + 8])[0] & 1:
+            frames = struct.unpack(">I", data[xing + 8:xing + 12])[0]
+        elif data[i + 36:i + 40] == b"VBRI":
+            frames = struct.unpack(">I", data[i + 50:i + 54])[0]
+        
+        if frames:
+            info["duration"] = frames * samples_per_frame / sample_rate
+            info["bitrate"] = int(audio_bytes * 8 / info["duration"]) if info["duration"] else bitrate
+        elif bitrate:
+            info["duration"] = audio_bytes * 8 / bitrate
+        return
+
+def _parse_flac(path: str, info: dict):
+    with open(path, "rb") as f:
+        if f.read(4) != b"fLaC":
+            return
+        info["codec"] = "flac"
+        last = False
+        while not last:
+            header = f.read(4)
+            if len(header) < 4:
+                break
+            last = bool(header[0] & 0x80)
+            block_type = header[0] & 0x7F
+            block = f.read(int.from_bytes(header[1:4], "big"))
+            if block_type == 0 and len(block) >= 18:
+                packed = int.from_bytes(block[10:18], "big")
+                sample_rate = packed >> 44
+                total_samples = packed & 0xFFFFFFFFF
+                info["sample_rate"] = sample_rate
+                info["channels"] = ((packed >> 41) & 7) + 1
+                if sample_rate and total_samples:
+                    info["duration"] = total_samples / sample_rate
+                    info["bitrate"] = int(os.path.getsize(path) * 8 / info["duration"])
+            elif block_type == 4:
+                vendor_length = struct.unpack("<I", block[:4])[0]
+                pos = 4 + vendor_length
+                count = struct.unpack("<I", block[pos:pos + 4])[0]
+                pos += 4
+                for _ in range(count):
+                    length = struct.unpack("<I", block[pos:pos + 4])[0]
+                    key, _, value = block[pos + 4:pos + 4 + length].decode("utf-8", errors="ignore").partition("=")
+                    if key.lower() in ("title", "artist", "album") and value:
+                        info["tags"][key.lower()] = value
+                    pos += 4 + length
+
+def _parse_wav(path: str, info: dict):
+    with wave.open(path, "rb") as w:
+        info["codec"] = "pcm"
+        info["sample_rate"] = w.getframerate()
+        info["channels"] = w.getnchannels()
+        info["bitrate"] = w.getframerate() * w.getnchannels() * w.getsampwidth() * 8
+        if w.getframerate():
+            info["duration"] = w.getnframes() / w.getframerate()
+
+def _parse_with_mutagen(path: str, info: dict):
+    audio = mutagen.File(path, easy=True)
+    if audio is None:
+        return
+    stream = audio.info
+    info["codec"] = type(audio).__name__.lower()
+    info["duration"] = getattr(stream, "length", None)
+    info["bitrate"] = getattr(stream, "bitrate", None)
+    info["sample_rate"] = getattr(stream, "sample_rate", None)
+    info["channels"] = getattr(stream, "channels", None)
+    for key in ("title", "artist", "album"):
+        if audio.tags and audio.tags.get(key):
+            info["tags"][key] = str(audio.tags[key][0])
+
+def extract_audio_metadata(path: str) -> dict:
+    """Длительность, битрейт, кодек и теги аудиофайла"""
+    extension = os.path.splitext(path)[1].lower().lstrip(".")
+    info = {"codec": extension or None, "duration": None, "bitrate": None,
+            "sample_rate": None, "channels": None, "tags": {}}
+    if mutagen is not None:
+        _parse_with_mutagen(path, info)
+        return info
+    
+    with open(path, "rb") as f:
+        magic = f.read(4)
+    if magic == b"fLaC":
+        _parse_flac(path, info)
+    elif magic == b"RIFF":
+        _parse_wav(path, info)
+    elif magic[:3] == b"ID3" or extension == "mp3" or magic[:2] in (b"\xff\xfb", b"\xff\xf3", b"\xff\xfa"):
+        _parse_mp3(path, info)
+    return info
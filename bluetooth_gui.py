@@ -1,32 +1,93 @@
 ﻿import sys
 import os
+import argparse
+import io
 import ctypes
 import logging
 import hashlib
-from ctypes import c_char_p, c_int, c_void_p, CFUNCTYPE, POINTER
+import json
+import queue
+import multiprocessing
+import secrets
+import atexit
+import threading
+import heapq
+import itertools
+import types
+import struct
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque, OrderedDict
+from contextlib import contextmanager
+from functools import wraps
+from ctypes import (c_char, c_char_p, c_int, c_uint, c_void_p, c_double, c_ulonglong, c_longlong,
+                    CFUNCTYPE, POINTER, Structure)
 from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 from pathlib import Path
 import time
-from typing import Optional, Dict, List, Set
+from typing import Callable, Optional, Dict, List, Set, Tuple
 
 from PyQt6.QtWidgets import (QApplication, QWidget, QVBoxLayout, QHBoxLayout, 
-                             QPushButton, QListWidget, QListWidgetItem, QLabel, 
+                             QPushButton, QListWidget, QListWidgetItem, QListView, QLabel, 
                              QProgressBar, QLineEdit, QCheckBox, QSlider, 
-                             QFileDialog, QMessageBox, QGroupBox)
-from PyQt6.QtCore import QTimer, Qt, pyqtSignal, QThread
+                             QFileDialog, QMessageBox, QGroupBox, QSpinBox,
+                             QComboBox, QInputDialog)
+from PyQt6.QtCore import (QTimer, Qt, QEvent, pyqtSignal, pyqtSlot, QThread, QObject, QAbstractListModel,
+                          QModelIndex)
 from PyQt6.QtGui import QFont, QPalette, QColor, QIcon
 import pygame
 
+from audio_metadata import extract_audio_metadata, file_digest
+import receiver_worker
+
 # Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('bluetooth_transfer.log', encoding='utf-8'),
-        logging.StreamHandler()
-    ]
-)
+LOG_FILE = 'bluetooth_transfer.log'
+LOG_MAX_BYTES = 5 * 1024 * 1024  # Ротация лога по размеру
+LOG_BACKUP_COUNT = 3
+LOG_SUBSYSTEMS = ("backend", "server", "GUI", "player")
+
+def _parse_log_levels(spec: str) -> Dict[str, int]:
+    """Разбор уровней подсистем вида "backend=DEBUG,player=WARNING" """
+    levels = {}
+    for part in spec.split(","):
+        name, _, level = part.partition("=")
+        name, level = name.strip(), level.strip().upper()
+        if name in LOG_SUBSYSTEMS and isinstance(logging.getLevelName(level), int):
+            levels[name] = logging.getLevelName(level)
+    return levels
+
+def setup_logging(levels: Optional[Dict[str, int]] = None) -> QueueListener:
+    """Асинхронное логирование: запись на диск и в консоль в отдельном потоке"""
+    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    
+    file_handler = RotatingFileHandler(LOG_FILE, maxBytes=LOG_MAX_BYTES,
+                                       backupCount=LOG_BACKUP_COUNT, encoding='utf-8')
+    file_handler.setFormatter(formatter)
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(formatter)
+    
+    # Вызывающий поток (в т.ч. поток callback из C++) только кладет запись в очередь
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    root.handlers = [QueueHandler(log_queue)]
+    root.setLevel(logging.INFO)
+    
+    if levels is None:
+        levels = _parse_log_levels(os.environ.get("BLUETOOTH_LOG_LEVELS", ""))
+    for name in LOG_SUBSYSTEMS:
+        logging.getLogger(name).setLevel(levels.get(name, logging.INFO))
+    
+    listener = QueueListener(log_queue, file_handler, stream_handler)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
+# В процессах-обработчиках приема журнал пересылается родителю (см. receiver_worker.py)
+log_listener = setup_logging() if multiprocessing.parent_process() is None else None
 logger = logging.getLogger(__name__)
+backend_logger = logging.getLogger('backend')
+server_logger = logging.getLogger('server')
+player_logger = logging.getLogger('player')
 
 # Определение типов callback функций для основной библиотеки
 DeviceDiscoveredCallback = CFUNCTYPE(None, c_char_p, c_char_p)
@@ -36,24 +97,929 @@ FileCallback = CFUNCTYPE(None, c_char_p)
 ScanFinishedCallback = CFUNCTYPE(None)
 ConnectedCallback = CFUNCTYPE(None)
 DisconnectedCallback = CFUNCTYPE(None)  # Добавлен callback для отключения
+ChannelResolverCallback = CFUNCTYPE(c_int, c_char_p)  # адрес -> канал RFCOMM (0 - сервиса нет)
 
 # Определение типов callback функций для сервера
 ServerStatusCallback = CFUNCTYPE(None, c_char_p)
 FileReceivedCallback = CFUNCTYPE(None, c_char_p)
 ClientConnectedCallback = CFUNCTYPE(None)
 ClientDisconnectedCallback = CFUNCTYPE(None)  # Добавлен callback для отключения клиента
+FileStreamCallback = CFUNCTYPE(None, c_char_p, c_int, c_int)
+# Итог подключения: адрес отправителя, файл, принятые байты, длительность (мс), 1 - успех
+TransferFinishedCallback = CFUNCTYPE(None, c_char_p, c_char_p, c_ulonglong, c_double, c_int)
+
+# Пакетная выдача событий клиента (drainEvents): типы - Event::Type в bluetoothtransfer.h
+(EVENT_DEVICE_DISCOVERED, EVENT_SCAN_FINISHED, EVENT_CONNECTED, EVENT_DISCONNECTED,
+ EVENT_FILE_SENT, EVENT_PROGRESS, EVENT_STATUS) = range(7)
+EVENT_BATCH_TEXT_SIZE = 256
+EVENT_BATCH_ADDRESS_SIZE = 32
+EVENT_BATCH_CAPACITY = 256
+EVENT_BATCH_WAIT_MS = 200  # ожидание событий за вызов - задержка остановки потока доставки
+
+# Состояния принимаемого файла (STREAM_STATE_* в serverthread.h)
+STREAM_STATE_STARTED = 0
+STREAM_STATE_FINISHED = 1
+STREAM_STATE_ABORTED = 2
+
+# Сервер принимает файл в "<имя>.<pid>-<n>.part" и переносит на место только после приема целиком
+RECEIVE_PART_SUFFIX = '.part'
+
+# Границы корзин задержки (секунды), совпадают с STATS_LATENCY_BUCKETS в C++
+LATENCY_BUCKETS = (0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0)
+CONNECT_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 20.0)
+
+class NativeTransferStats(Structure):
+    """Статистика передачи из C++ (TransferStats / ServerStats)"""
+    _fields_ = [
+        ("bytesTransferred", c_ulonglong),
+        ("chunksTransferred", c_ulonglong),
+        ("lastTransferMs", c_double),
+        ("firstByteMs", c_double),
+        ("stallCount", c_ulonglong),
+        ("stallTotalMs", c_double),
+        ("stallMaxMs", c_double),
+        ("chunkLatencyBuckets", c_ulonglong * (len(LATENCY_BUCKETS) + 1)),
+        ("chunkLatencySumMs", c_double),
+        ("dispatchCount", c_ulonglong),
+        ("dispatchSumMs", c_double),
+        ("dispatchMaxMs", c_double),
+        ("eventQueueDepth", c_int),
+        ("eventQueueMaxDepth", c_int),
+        ("chunkSize", c_int),
+        ("socketBuffer", c_int),
+        ("ackedBytes", c_ulonglong),
+        ("ackWaitMs", c_double),
+        ("diskWaitMs", c_double),
+        ("cryptoMs", c_double),
+    ]
+
+class LinkSimConfig(Structure):
+    """Параметры имитации канала RFCOMM (LinkSimConfig в linksim.h)"""
+    _fields_ = [
+        ("enabled", c_int),
+        ("basePort", c_int),
+        ("bandwidthKBps", c_double),
+        ("latencyMs", c_double),
+        ("jitterMs", c_double),
+        ("maxSegment", c_int),
+        ("stallProbability", c_double),
+        ("stallMs", c_double),
+        ("disconnectProbability", c_double),
+        ("disconnectAfterBytes", c_ulonglong),
+        ("seed", c_uint),
+    ]
+
+class LinkSimStats(Structure):
+    """Счетчики внесенных сбоев (LinkSimStats в linksim.h)"""
+    _fields_ = [
+        ("bytesSent", c_ulonglong),
+        ("bytesReceived", c_ulonglong),
+        ("partialCalls", c_ulonglong),
+        ("stalls", c_ulonglong),
+        ("disconnects", c_ulonglong),
+        ("injectedDelayMs", c_double),
+    ]
+
+class NativeBroadcastStats(Structure):
+    """Счетчики общего источника рассылки (BroadcastStats в bluetoothtransfer.h)"""
+    _fields_ = [
+        ("fileSize", c_ulonglong),
+        ("diskBytes", c_ulonglong),
+        ("fallbackBytes", c_ulonglong),
+        ("readers", c_int),
+        ("detached", c_int),
+    ]
+
+class NativeBatchedEvent(Structure):
+    """Событие клиентской библиотеки в пакетной выдаче (BatchedEvent в bluetoothtransfer.h)"""
+    _fields_ = [
+        ("type", c_int),
+        ("intValue", c_int),
+        ("text", c_char * EVENT_BATCH_TEXT_SIZE),
+        ("address", c_char * EVENT_BATCH_ADDRESS_SIZE),
+    ]
+
+class Histogram:
+    """Гистограмма с фиксированными границами корзин"""
+    
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+    
+    def observe(self, value: float):
+        """Добавление наблюдения"""
+        index = 0
+        while index < len(self.buckets) and value > self.buckets[index]:
+            index += 1
+        self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+    
+    def load(self, counts, total: float):
+        """Замена содержимого готовыми счетчиками (из C++)"""
+        self.counts = list(counts)
+        self.count = sum(self.counts)
+        self.sum = total
+    
+    def snapshot(self) -> dict:
+        return {
+            "buckets": list(self.buckets),
+            "counts": list(self.counts),
+            "sum": self.sum,
+            "count": self.count,
+        }
+
+class TransferMetrics:
+    """Метрики передачи для диагностики медленных каналов"""
+    
+    THROUGHPUT_SAMPLE_INTERVAL = 0.25  # секунды между замерами скорости
+    THROUGHPUT_HISTORY = 240
+    
+    def __init__(self, role: str):
+        self.role = role
+        self._lock = threading.Lock()
+        self.connect_latency = Histogram(CONNECT_BUCKETS)
+        self.time_to_first_byte = Histogram(CONNECT_BUCKETS)
+        self.chunk_latency = Histogram(LATENCY_BUCKETS)
+        self.callback_latency = Histogram(LATENCY_BUCKETS)
+        self.connects_failed = 0
+        self.transfers_total = 0
+        self.transfers_failed = 0
+        self.bytes_total = 0
+        self.last_connect_latency = None
+        self.last_time_to_first_byte = None
+        self.throughput = 0.0
+        self.throughput_history = deque(maxlen=self.THROUGHPUT_HISTORY)
+        self.stall_count = 0
+        self.stall_total = 0.0
+        self.stall_max = 0.0
+        self.dispatch_count = 0
+        self.dispatch_sum = 0.0
+        self.dispatch_max = 0.0
+        self.event_queue_depth = 0
+        self.event_queue_max_depth = 0
+        self.chunk_size = 0
+        self.socket_buffer = 0
+        self.acked_bytes = 0
+        self.ack_wait = 0.0
+        self.disk_wait = 0.0
+        self.crypto_time = 0.0
+        self._transfer_start = None
+        self._transfer_size = 0
+        self._first_byte_seen = False
+        self._sample_time = None
+        self._sample_bytes = 0
+        self._native_ttfb_ms = 0.0
+        # Планировщик автосканирования клиента (ScanScheduler) - его решения попадают в снимок
+        self.scan_scheduler = None
+    
+    def observe_connect(self, seconds: float, ok: bool):
+        """Задержка подключения"""
+        with self._lock:
+            self.connect_latency.observe(seconds)
+            self.last_connect_latency = seconds
+            if not ok:
+                self.connects_failed += 1
+    
+    def begin_transfer(self, size: int = 0):
+        """Начало передачи файла"""
+        with self._lock:
+            self._transfer_start = time.perf_counter()
+            self._transfer_size = size
+            self._first_byte_seen = False
+            self._sample_time = self._transfer_start
+            self._sample_bytes = 0
+    
+    def observe_progress(self, percent: int):
+        """Прогресс текущей передачи (клиент)"""
+        with self._lock:
+            if self._transfer_start is None:
+                return
+            if not self._first_byte_seen:
+                self._first_byte_seen = True
+                ttfb = time.perf_counter() - self._transfer_start
+                self.time_to_first_byte.observe(ttfb)
+                self.last_time_to_first_byte = ttfb
+            self._sample_throughput(self._transfer_size * percent // 100)
+    
+    def end_transfer(self, ok: bool):
+        """Завершение передачи файла"""
+        with self._lock:
+            self.transfers_total += 1
+            if ok:
+                self.bytes_total += self._transfer_size
+            else:
+                self.transfers_failed += 1
+            self._transfer_start = None
+    
+    def observe_callback(self, seconds: float):
+        """Длительность обработки callback в Python"""
+        with self._lock:
+            self.callback_latency.observe(seconds)
+    
+    def update_native(self, stats: NativeTransferStats):
+        """Обновление из статистики C++ библиотеки"""
+        with self._lock:
+            self.chunk_latency.load(stats.chunkLatencyBuckets, stats.chunkLatencySumMs / 1000.0)
+            self.stall_count = stats.stallCount
+            self.stall_total = stats.stallTotalMs / 1000.0
+            self.stall_max = stats.stallMaxMs / 1000.0
+            self.dispatch_count = stats.dispatchCount
+            self.dispatch_sum = stats.dispatchSumMs / 1000.0
+            self.dispatch_max = stats.dispatchMaxMs / 1000.0
+            self.event_queue_depth = stats.eventQueueDepth
+            self.event_queue_max_depth = stats.eventQueueMaxDepth
+            self.chunk_size = stats.chunkSize
+            self.socket_buffer = stats.socketBuffer
+            self.acked_bytes = stats.ackedBytes
+            self.ack_wait = stats.ackWaitMs / 1000.0
+            self.disk_wait = stats.diskWaitMs / 1000.0
+            self.crypto_time = stats.cryptoMs / 1000.0
+            
+            # На сервере прогресс известен только по счетчику байт из C++
+            if self.role == "server":
+                if stats.firstByteMs and stats.firstByteMs != self._native_ttfb_ms:
+                    self._native_ttfb_ms = stats.firstByteMs
+                    self.last_time_to_first_byte = stats.firstByteMs / 1000.0
+                    self.time_to_first_byte.observe(self.last_time_to_first_byte)
+                self.bytes_total = stats.bytesTransferred
+                if self._sample_time is None:
+                    self._sample_time = time.perf_counter()
+                    self._sample_bytes = stats.bytesTransferred
+                else:
+                    self._sample_throughput(stats.bytesTransferred)
+    
+    def _sample_throughput(self, bytes_done: int):
+        now = time.perf_counter()
+        interval = now - self._sample_time
+        if interval < self.THROUGHPUT_SAMPLE_INTERVAL:
+            return
+        self.throughput = max(0, bytes_done - self._sample_bytes) / interval
+        self.throughput_history.append((time.time(), self.throughput))
+        self._sample_time = now
+        self._sample_bytes = bytes_done
+    
+    def snapshot(self) -> dict:
+        """Снимок всех метрик"""
+        with self._lock:
+            return {
+                "role": self.role,
+                "timestamp": time.time(),
+                "connect_latency_seconds": self.connect_latency.snapshot(),
+                "last_connect_latency_seconds": self.last_connect_latency,
+                "connects_failed": self.connects_failed,
+                "time_to_first_byte_seconds": self.time_to_first_byte.snapshot(),
+                "last_time_to_first_byte_seconds": self.last_time_to_first_byte,
+                "transfers_total": self.transfers_total,
+                "transfers_failed": self.transfers_failed,
+                "bytes_total": self.bytes_total,
+                "throughput_bytes_per_second": self.throughput,
+                "throughput_history": list(self.throughput_history),
+                "chunk_latency_seconds": self.chunk_latency.snapshot(),
+                "stall_count": self.stall_count,
+                "stall_seconds_total": self.stall_total,
+                "stall_seconds_max": self.stall_max,
+                "callback_latency_seconds": self.callback_latency.snapshot(),
+                "dispatch_count": self.dispatch_count,
+                "dispatch_seconds_total": self.dispatch_sum,
+                "dispatch_seconds_max": self.dispatch_max,
+                "event_queue_depth": self.event_queue_depth,
+                "event_queue_max_depth": self.event_queue_max_depth,
+                "chunk_size_bytes": self.chunk_size,
+                "socket_buffer_bytes": self.socket_buffer,
+                "acked_bytes": self.acked_bytes,
+                "ack_wait_seconds_total": self.ack_wait,
+                "disk_wait_seconds_total": self.disk_wait,
+                "crypto_seconds_total": self.crypto_time,
+                "auto_scan": self.scan_scheduler.snapshot() if self.scan_scheduler else None,
+            }
+    
+    def to_json(self) -> str:
+        """Экспорт снимка в JSON"""
+        return json.dumps(self.snapshot(), ensure_ascii=False, indent=2)
+    
+    def to_prometheus(self) -> str:
+        """Экспорт в текстовом формате Prometheus"""
+        snap = self.snapshot()
+        prefix = f"bluetooth_{self.role}"
+        lines = []
+        
+        def scalar(name, kind, help_text, value):
+            lines.append(f"# HELP {prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {prefix}_{name} {kind}")
+            lines.append(f"{prefix}_{name} {value if value is not None else 'NaN'}")
+        
+        def histogram(name, help_text, data):
+            lines.append(f"# HELP {prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {prefix}_{name} histogram")
+            cumulative = 0
+            for bound, count in zip(data["buckets"], data["counts"]):
+                cumulative += count
+                lines.append(f'{prefix}_{name}_bucket{{le="{bound}"}} {cumulative}')
+            lines.append(f'{prefix}_{name}_bucket{{le="+Inf"}} {data["count"]}')
+            lines.append(f"{prefix}_{name}_sum {data['sum']}")
+            lines.append(f"{prefix}_{name}_count {data['count']}")
+        
+        histogram("connect_latency_seconds", "Connect latency", snap["connect_latency_seconds"])
+        scalar("connects_failed_total", "counter", "Failed connects", snap["connects_failed"])
+        histogram("time_to_first_byte_seconds", "Time to first byte", snap["time_to_first_byte_seconds"])
+        scalar("transfers_total", "counter", "Finished transfers", snap["transfers_total"])
+        scalar("transfers_failed_total", "counter", "Failed transfers", snap["transfers_failed"])
+        scalar("bytes_total", "counter", "Transferred bytes", snap["bytes_total"])
+        scalar("throughput_bytes_per_second", "gauge", "Current throughput", snap["throughput_bytes_per_second"])
+        histogram("chunk_latency_seconds", "Chunk send/recv latency", snap["chunk_latency_seconds"])
+        scalar("stalls_total", "counter", "Link stalls", snap["stall_count"])
+        scalar("stall_seconds_total", "counter", "Total stall time", snap["stall_seconds_total"])
+        scalar("stall_seconds_max", "gauge", "Longest stall", snap["stall_seconds_max"])
+        histogram("callback_latency_seconds", "Python callback handling time", snap["callback_latency_seconds"])
+        scalar("dispatch_total", "counter", "Dispatched native events", snap["dispatch_count"])
+        scalar("dispatch_seconds_total", "counter", "Native event dispatch latency", snap["dispatch_seconds_total"])
+        scalar("dispatch_seconds_max", "gauge", "Max native event dispatch latency", snap["dispatch_seconds_max"])
+        scalar("event_queue_depth", "gauge", "Native event queue depth", snap["event_queue_depth"])
+        scalar("event_queue_max_depth", "gauge", "Max native event queue depth", snap["event_queue_max_depth"])
+        scalar("chunk_size_bytes", "gauge", "Tuned chunk size", snap["chunk_size_bytes"])
+        scalar("socket_buffer_bytes", "gauge", "Tuned socket buffer size", snap["socket_buffer_bytes"])
+        scalar("acked_bytes", "gauge", "Bytes confirmed by receiver in last transfer", snap["acked_bytes"])
+        scalar("ack_wait_seconds_total", "counter", "Time spent waiting for acknowledgements", snap["ack_wait_seconds_total"])
+        scalar("disk_wait_seconds_total", "counter", "Time the sender waited for file reads", snap["disk_wait_seconds_total"])
+        scalar("crypto_seconds_total", "counter", "Time spent encrypting or decrypting records", snap["crypto_seconds_total"])
+        scan = snap["auto_scan"]
+        if scan:
+            scalar("auto_scan_interval_seconds", "gauge", "Current auto-scan interval", scan["interval_seconds"])
+            scalar("auto_scan_next_seconds", "gauge", "Seconds until next auto-scan is due", scan["next_scan_seconds"])
+            scalar("auto_scan_suspended", "gauge", "Auto-scan suspended by connection or transfer",
+                   int(bool(scan["suspended_by"])))
+            scalar("auto_scan_started_total", "counter", "Auto-scans started", scan["scans_started"])
+            scalar("auto_scan_backoffs_total", "counter", "Interval doublings after unchanged scans", scan["backoffs"])
+            scalar("auto_scan_resets_total", "counter", "Interval resets after changes or user activity", scan["resets"])
+            lines.append(f"# HELP {prefix}_auto_scan_deferred_total Due auto-scans postponed, by reason")
+            lines.append(f"# TYPE {prefix}_auto_scan_deferred_total counter")
+            for reason, count in sorted(scan["deferred"].items()):
+                lines.append(f'{prefix}_auto_scan_deferred_total{{reason="{reason}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+# Параметры канала, подобранные для каждого устройства
+LINK_TUNING_FILE = 'link_tuning.json'
+
+class LinkTuningStore:
+    """Размер чанка и буфера сокета, подобранные при прошлых передачах, по адресу устройства"""
+    
+    def __init__(self, tuning_path: str = LINK_TUNING_FILE):
+        self.tuning_path = tuning_path
+        self._lock = threading.Lock()
+        self._devices: Dict[str, dict] = {}
+        self.logger = logging.getLogger('backend')
+        self._load()
+    
+    def get(self, address: str) -> Optional[dict]:
+        """Сохраненные параметры устройства"""
+        with self._lock:
+            return self._devices.get(address)
+    
+    def update(self, address: str, chunk_size: int, socket_buffer: int, throughput: float):
+        """Запоминание параметров после успешной передачи"""
+        with self._lock:
+            self._devices[address] = {
+                "chunk_size": chunk_size,
+                "socket_buffer": socket_buffer,
+                "throughput": throughput,
+                "updated": time.time(),
+            }
+            data = json.dumps(self._devices, ensure_ascii=False)
+        tmp_path = self.tuning_path + ".tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(data)
+            os.replace(tmp_path, self.tuning_path)
+        except OSError as e:
+            self.logger.error(f"Не удалось сохранить параметры канала: {e}")
+    
+    def _load(self):
+        try:
+            with open(self.tuning_path, encoding='utf-8') as f:
+                self._devices = json.load(f)
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            self.logger.warning(f"Файл параметров канала поврежден, будет перестроен: {e}")
+
+# Ключи шифрования передачи по адресу устройства
+DEVICE_KEYS_FILE = 'device_keys.json'
+TRANSFER_KEY_SIZE = 32  # TRANSFER_KEY_SIZE в transfercrypto.h
+KEY_PASSPHRASE_SALT = b'bluetooth-audio-transfer/key/v1'
+KEY_PASSPHRASE_ITERATIONS = 200_000
+
+def derive_transfer_key(passphrase: str) -> bytes:
+    """Ключ из парольной фразы: одна и та же фраза на обоих устройствах дает один ключ"""
+    return hashlib.pbkdf2_hmac('sha256', passphrase.encode('utf-8'), KEY_PASSPHRASE_SALT,
+                               KEY_PASSPHRASE_ITERATIONS, TRANSFER_KEY_SIZE)
+
+def parse_transfer_key(text: str) -> bytes:
+    """Ключ в hex (64 символа) как есть, иначе - производный от парольной фразы"""
+    text = text.strip()
+    if len(text) == TRANSFER_KEY_SIZE * 2:
+        try:
+            return bytes.fromhex(text)
+        except ValueError:
+            pass
+    if not text:
+        raise ValueError("Пустая парольная фраза")
+    return derive_transfer_key(text)
+
+class DeviceKeyStore:
+    """Общие ключи пар устройств: заданные заранее (фраза, hex) или созданные при сопряжении
+    
+    Отправитель берет ключ по адресу получателя, получатель принимает передачи, зашифрованные
+    любым из сохраненных ключей (библиотека находит ключ по его идентификатору).
+    """
+    
+    def __init__(self, keys_path: str = DEVICE_KEYS_FILE):
+        self.keys_path = keys_path
+        self._lock = threading.Lock()
+        self._devices: Dict[str, dict] = {}
+        self.logger = logging.getLogger('backend')
+        self._load()
+    
+    def get(self, address: str) -> Optional[bytes]:
+        """Ключ пары с устройством"""
+        with self._lock:
+            entry = self._devices.get(address)
+        return bytes.fromhex(entry["key"]) if entry else None
+    
+    def keys(self) -> List[bytes]:
+        """Все сохраненные ключи (для приема)"""
+        with self._lock:
+            return [bytes.fromhex(entry["key"]) for entry in self._devices.values()]
+    
+    def addresses(self) -> List[str]:
+        with self._lock:
+            return sorted(self._devices)
+    
+    def set(self, address: str, key: bytes):
+        """Сохранение ключа пары"""
+        if len(key) != TRANSFER_KEY_SIZE:
+            raise ValueError(f"Ключ должен быть {TRANSFER_KEY_SIZE} байт")
+        with self._lock:
+            self._devices[address] = {"key": key.hex(), "updated": time.time()}
+        self._save()
+    
+    def pair(self, address: str) -> bytes:
+        """Новый случайный ключ для устройства; его нужно ввести и на второй стороне"""
+        key = secrets.token_bytes(TRANSFER_KEY_SIZE)
+        self.set(address, key)
+        return key
+    
+    def remove(self, address: str):
+        with self._lock:
+            if self._devices.pop(address, None) is None:
+                return
+        self._save()
+    
+    def _save(self):
+        with self._lock:
+            data = json.dumps(self._devices, ensure_ascii=False)
+        tmp_path = self.keys_path + ".tmp"
+        try:
+            # Файл с ключами - только для владельца (там, где ОС это поддерживает)
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with open(fd, 'w', encoding='utf-8') as f:
+                f.write(data)
+            os.replace(tmp_path, self.keys_path)
+        except OSError as e:
+            self.logger.error(f"Не удалось сохранить ключи устройств: {e}")
+    
+    def _load(self):
+        try:
+            with open(self.keys_path, encoding='utf-8') as f:
+                devices = json.load(f)
+            self._devices = {address: entry for address, entry in devices.items()
+                             if len(bytes.fromhex(entry.get("key", ""))) == TRANSFER_KEY_SIZE}
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, AttributeError) as e:
+            self.logger.warning(f"Файл ключей устройств поврежден и не загружен: {e}")
+
+# История передач
+TRANSFER_HISTORY_FILE = 'transfer_history.jsonl'
+TRANSFER_HISTORY_LIMIT = 50_000  # записей в журнале; при двукратном превышении старые отбрасываются
+
+class TransferHistory:
+    """Журнал завершенных передач (отправка и прием) и сводка по устройствам
+    
+    Записи дописываются в конец файла JSON Lines фоновым потоком: record() только ставит
+    запись в очередь и не задерживает поток передачи. Сводка по устройствам ведется
+    по мере записи, поэтому запросы не перечитывают журнал.
+    """
+    
+    def __init__(self, history_path: str = TRANSFER_HISTORY_FILE, limit: int = TRANSFER_HISTORY_LIMIT):
+        self.history_path = history_path
+        self.limit = limit
+        self._lock = threading.Lock()
+        self._records: deque = deque(maxlen=limit)
+        self._devices: Dict[str, dict] = {}
+        # (адрес, направление, файл) -> неудачных попыток подряд
+        self._failures: Dict[tuple, int] = {}
+        self._lines = 0
+        self.version = 0  # меняется с каждой записью - GUI перерисовывает сводку только при изменении
+        self.logger = logging.getLogger('backend')
+        self._load()
+        
+        self._queue: queue.Queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="transfer-history", daemon=True)
+        self._thread.start()
+    
+    def record(self, direction: str, peer: str, file_name: str, size: int, duration: float, ok: bool,
+               error: str = "", stalls: int = 0) -> dict:
+        """Запись о завершенной передаче (direction - "send" или "receive")"""
+        entry = {
+            "time": time.time(),
+            "direction": direction,
+            "peer": peer or "",
+            "file": os.path.basename(file_name) if file_name else "",
+            "size": int(size),
+            "duration": round(duration, 3),
+            "throughput": round(size / duration) if ok and duration > 0 else 0,
+            "retries": 0,
+            "stalls": int(stalls),
+            "result": "ok" if ok else "failed",
+        }
+        if error:
+            entry["error"] = error
+        with self._lock:
+            self._apply(entry)
+        self._queue.put(entry)
+        return entry
+    
+    def query(self, peer: Optional[str] = None, direction: Optional[str] = None,
+              since: Optional[float] = None, failed_only: bool = False,
+              limit: Optional[int] = None) -> List[dict]:
+        """Записи журнала, сначала новые"""
+        result = []
+        with self._lock:
+            for entry in reversed(self._records):
+                if since is not None and entry["time"] < since:
+                    break
+                if peer is not None and entry["peer"] != peer:
+                    continue
+                if direction is not None and entry["direction"] != direction:
+                    continue
+                if failed_only and entry["result"] == "ok":
+                    continue
+                result.append(entry)
+                if limit is not None and len(result) >= limit:
+                    break
+        return result
+    
+    def device_summary(self) -> Dict[str, dict]:
+        """По адресу устройства: число передач, доля неудачных, средняя скорость удачных"""
+        summary = {}
+        with self._lock:
+            for peer, device in self._devices.items():
+                summary[peer] = {
+                    "transfers": device["transfers"],
+                    "failures": device["failures"],
+                    "failure_rate": device["failures"] / device["transfers"],
+                    "retries": device["retries"],
+                    "bytes": device["bytes"],
+                    "avg_throughput": device["bytes"] / device["seconds"] if device["seconds"] > 0 else 0.0,
+                    "last": device["last"],
+                }
+        return summary
+    
+    def flush(self):
+        """Ожидание записи всех поставленных в очередь записей"""
+        self._queue.join()
+    
+    def close(self):
+        """Запись очереди и остановка фонового потока"""
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join(timeout=5)
+    
+    def _apply(self, entry: dict):
+        # Вызывается под блокировкой: повторы и сводка по устройству
+        key = (entry["peer"], entry["direction"], entry["file"])
+        failures = self._failures.pop(key, 0)
+        if entry["result"] != "ok":
+            self._failures[key] = failures + 1
+        entry["retries"] = failures
+        
+        device = self._devices.setdefault(entry["peer"], {
+            "transfers": 0, "failures": 0, "retries": 0, "bytes": 0, "seconds": 0.0, "last": 0.0})
+        device["transfers"] += 1
+        device["last"] = entry["time"]
+        if entry["result"] == "ok":
+            device["bytes"] += entry["size"]
+            device["seconds"] += entry["duration"]
+            device["retries"] += failures
+        else:
+            device["failures"] += 1
+        self._records.append(entry)
+        self.version += 1
+    
+    def _run(self):
+        stopping = False
+        while not stopping:
+            batch = [self._queue.get()]
+            # Накопившиеся записи пишутся одним вызовом
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if None in batch:
+                stopping = True
+            entries = [entry for entry in batch if entry is not None]
+            try:
+                if entries:
+                    self._append(entries)
+            except Exception as e:
+                self.logger.error(f"Не удалось записать историю передач: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+    
+    def _append(self, entries: List[dict]):
+        data = "".join(json.dumps(entry, ensure_ascii=False) + "\n" for entry in entries)
+        with open(self.history_path, 'a', encoding='utf-8') as f:
+            f.write(data)
+        self._lines += len(entries)
+        if self._lines > self.limit * 2:
+            self._compact()
+    
+    def _compact(self):
+        """Оставляет в журнале последние limit записей (атомарно)"""
+        with open(self.history_path, encoding='utf-8') as f:
+            lines = deque(f, maxlen=self.limit)
+        tmp_path = self.history_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.writelines(lines)
+        os.replace(tmp_path, self.history_path)
+        self._lines = len(lines)
+        self.logger.info(f"Журнал истории передач сокращен до {len(lines)} записей")
+    
+    def _load(self):
+        try:
+            with open(self.history_path, encoding='utf-8') as f:
+                for line in f:
+                    self._lines += 1
+                    try:
+                        entry = json.loads(line)
+                        self._apply(entry)
+                    except (ValueError, KeyError, TypeError):
+                        # Оборванная при аварийном завершении последняя строка
+                        continue
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            self.logger.warning(f"Не удалось прочитать историю передач: {e}")
+
+# Журнал callback библиотек для воспроизведения без DLL (отладка производительности GUI)
+EVENT_LOG_MAGIC = b'BTEV'
+EVENT_LOG_VERSION = 1
+EVENT_LOG_ROLES = ("client", "server")
+# Номер callback в журнале -> (имя метода backend, типы аргументов: s - строка, иначе формат struct)
+EVENT_LOG_CALLBACKS = (
+    ("_on_device_discovered", "ss"),
+    ("_on_status", "s"),
+    ("_on_progress", "i"),
+    ("_on_file_received", "s"),
+    ("_on_file_sent", "s"),
+    ("_on_scan_finished", ""),
+    ("_on_connected", ""),
+    ("_on_disconnected", ""),
+    ("_on_client_connected", ""),
+    ("_on_client_disconnected", ""),
+    ("_on_file_stream", "sii"),
+    ("_on_transfer_finished", "ssQdi"),
+)
+_EVENT_LOG_CODES = {name: (code, kinds) for code, (name, kinds) in enumerate(EVENT_LOG_CALLBACKS)}
+_EVENT_RECORD = struct.Struct("<IBB")  # мкс от предыдущего события, роль, номер callback
+_EVENT_STRING = struct.Struct("<H")
+_EVENT_NULL_STRING = 0xFFFF
+
+class EventRecorder:
+    """Запись потока callback библиотек с отметками времени в компактный двоичный журнал
+    
+    Записываются сырые аргументы callback (как их передала библиотека) для backend,
+    подключенных через attach(). Запись - одна упаковка struct под блокировкой, поток
+    событий библиотеки почти не замедляется.
+    """
+    
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, 'wb')
+        self._file.write(EVENT_LOG_MAGIC + struct.pack("<Bd", EVENT_LOG_VERSION, time.time()))
+        self._last = time.perf_counter()
+        self.count = 0
+    
+    def attach(self, backend):
+        """Запись callback backend (BluetoothBackend или ServerBackend)"""
+        backend.recorder = self
+    
+    def detach(self, backend):
+        if getattr(backend, 'recorder', None) is self:
+            backend.recorder = None
+    
+    def record(self, role: str, name: str, args: tuple):
+        entry = _EVENT_LOG_CODES.get(name)
+        if entry is None:
+            return
+        code, kinds = entry
+        payload = bytearray()
+        for kind, value in zip(kinds, args):
+            if kind != "s":
+                payload += struct.pack("<" + kind, value)
+            elif value is None:
+                payload += _EVENT_STRING.pack(_EVENT_NULL_STRING)
+            else:
+                value = value[:_EVENT_NULL_STRING - 1]
+                payload += _EVENT_STRING.pack(len(value)) + value
+        with self._lock:
+            if self._file is None:
+                return
+            now = time.perf_counter()
+            delta = min(int((now - self._last) * 1_000_000), 0xFFFFFFFF)
+            self._last = now
+            self._file.write(_EVENT_RECORD.pack(delta, EVENT_LOG_ROLES.index(role), code))
+            self._file.write(payload)
+            self.count += 1
+    
+    def close(self):
+        with self._lock:
+            file, self._file = self._file, None
+        if file:
+            file.close()
+            logging.getLogger('backend').info(f"Журнал событий {self.path}: {self.count} событий")
+
+class EventReplayer:
+    """Воспроизведение журнала EventRecorder: те же _on_* backend в том же порядке и темпе
+    
+    Backend для воспроизведения создаются с ReplayLibrary - без DLL, поэтому горячие пути
+    GUI можно профилировать на одном и том же потоке событий. speed - множитель темпа,
+    0 - без пауз; invoke - как вызывать callback (GuiThreadInvoker - в потоке GUI).
+    """
+    
+    def __init__(self, path: str):
+        self.path = path
+        self.started_at, self.events = self.read(path)
+        self._stop = threading.Event()
+    
+    @staticmethod
+    def read(path: str) -> Tuple[float, List[tuple]]:
+        """Время начала записи и события (секунды от начала, роль, имя метода, аргументы)"""
+        with open(path, 'rb') as f:
+            data = f.read()
+        if data[:4] != EVENT_LOG_MAGIC or len(data) < 13 or data[4] != EVENT_LOG_VERSION:
+            raise ValueError(f"Не журнал событий: {path}")
+        started_at = struct.unpack_from("<d", data, 5)[0]
+        events = []
+        offset = 0.0
+        pos = 13
+        try:
+            while pos < len(data):
+                delta, role, code = _EVENT_RECORD.unpack_from(data, pos)
+                pos += _EVENT_RECORD.size
+                name, kinds = EVENT_LOG_CALLBACKS[code]
+                args = []
+                for kind in kinds:
+                    if kind == "s":
+                        length = _EVENT_STRING.unpack_from(data, pos)[0]
+                        pos += _EVENT_STRING.size
+                        if length == _EVENT_NULL_STRING:
+                            args.append(None)
+                        else:
+                            args.append(data[pos:pos + length])
+                            pos += length
+                    else:
+                        args.append(struct.unpack_from("<" + kind, data, pos)[0])
+                        pos += struct.calcsize("<" + kind)
+                offset += delta / 1_000_000
+                events.append((offset, EVENT_LOG_ROLES[role], name, tuple(args)))
+        except (struct.error, IndexError):
+            # Оборванная запись в конце журнала (приложение закрылось аварийно)
+            logging.getLogger('backend').warning(f"Журнал событий {path} обрывается на {len(events)} событии")
+        return started_at, events
+    
+    @property
+    def duration(self) -> float:
+        return self.events[-1][0] if self.events else 0.0
+    
+    def stop(self):
+        self._stop.set()
+    
+    def replay(self, client=None, server=None, speed: float = 1.0,
+               invoke: Optional[Callable[[Callable], None]] = None) -> dict:
+        """Подача событий в backend из текущего потока; итог - длительности обработки по callback"""
+        targets = {"client": client, "server": server}
+        timings: Dict[str, List[float]] = {}
+        self._stop.clear()
+        started = time.perf_counter()
+        delivered = 0
+        for offset, role, name, args in self.events:
+            if self._stop.is_set():
+                break
+            target = targets.get(role)
+            if target is None:
+                continue
+            if speed > 0:
+                delay = started + offset / speed - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            callback = getattr(target, name)
+            dispatch_started = time.perf_counter()
+            if invoke:
+                invoke(lambda: callback(*args))
+            else:
+                callback(*args)
+            elapsed = time.perf_counter() - dispatch_started
+            timing = timings.setdefault(name, [0, 0.0, 0.0])
+            timing[0] += 1
+            timing[1] += elapsed
+            timing[2] = max(timing[2], elapsed)
+            delivered += 1
+        return {
+            "events": delivered,
+            "recorded_seconds": self.duration,
+            "replay_seconds": time.perf_counter() - started,
+            "callbacks": {name: {"count": count, "total_ms": total * 1000, "max_ms": worst * 1000}
+                          for name, (count, total, worst) in timings.items()},
+        }
+
+class GuiThreadInvoker(QObject):
+    """Вызов функции в потоке GUI с ожиданием завершения (из любого другого потока)
+    
+    Время вызова включает ожидание, пока поток GUI освободится, - при воспроизведении
+    событий это и есть задержка интерфейса.
+    """
+    
+    _call = pyqtSignal(object)
+    
+    def __init__(self):
+        super().__init__()
+        self._call.connect(self._run, Qt.ConnectionType.BlockingQueuedConnection)
+    
+    def __call__(self, function: Callable):
+        self._call.emit(function)
+    
+    @pyqtSlot(object)
+    def _run(self, function: Callable):
+        function()
+
+class ReplayLibrary:
+    """Библиотека-пустышка для воспроизведения событий: любой экспорт есть и ничего не делает"""
+    
+    # События подает EventReplayer - пакетной выдачи (и потока, который ее опрашивает) нет
+    _ABSENT_EXPORTS = ("drainEvents",)
+    
+    def __getattr__(self, name: str):
+        if name in self._ABSENT_EXPORTS:
+            raise AttributeError(name)
+        
+        def export(*args):
+            return 0
+        # argtypes/restype задаются backend так же, как у настоящих экспортов
+        setattr(self, name, export)
+        return export
+
+def timed_callback(method):
+    """Замер длительности обработки callback для метрик (и запись в журнал событий)"""
+    name = method.__name__
+    
+    @wraps(method)
+    def wrapper(self, *args):
+        recorder = self.recorder
+        if recorder:
+            recorder.record(self.metrics.role, name, args)
+        started = time.perf_counter()
+        try:
+            return method(self, *args)
+        finally:
+            self.metrics.observe_callback(time.perf_counter() - started)
+    return wrapper
 
 class BluetoothBackend:
     """Класс для взаимодействия с C++ библиотекой"""
     
-    def __init__(self):
-        # Настройка поиска библиотеки
-        self.lib_path = self._find_library("bluetooth_transfer")
-        if not self.lib_path:
-            raise RuntimeError("Не удалось найти библиотеку bluetooth_transfer.dll")
+    def __init__(self, library=None):
+        # Журнал событий (EventRecorder.attach)
+        self.recorder = None
         
-        logger.info(f"Загружаем библиотеку: {self.lib_path}")
-        self.lib = ctypes.CDLL(self.lib_path)
+        # Готовая библиотека - ReplayLibrary для воспроизведения событий без DLL
+        if library is not None:
+            self.lib_path = None
+            self.lib = library
+        else:
+            # Настройка поиска библиотеки
+            self.lib_path = self._find_library("bluetooth_transfer")
+            if not self.lib_path:
+                raise RuntimeError("Не удалось найти библиотеку bluetooth_transfer.dll")
+            
+            backend_logger.info(f"Загружаем библиотеку: {self.lib_path}")
+            self.lib = ctypes.CDLL(self.lib_path)
         
         # Определение функций C API
         self.lib.createBluetoothTransfer.restype = c_void_p
@@ -63,6 +1029,11 @@ class BluetoothBackend:
         
         self.lib.startDiscovery.argtypes = [c_void_p]
         
+        # Прерывание сканирования (нет в старых сборках библиотеки)
+        self._has_cancel_discovery = hasattr(self.lib, 'cancelDiscovery')
+        if self._has_cancel_discovery:
+            self.lib.cancelDiscovery.argtypes = [c_void_p]
+        
         self.lib.connectDevice.argtypes = [c_void_p, c_char_p]
         self.lib.connectDevice.restype = c_int
         
@@ -79,6 +1050,75 @@ class BluetoothBackend:
         self.lib.getLastErrorMessage.argtypes = [c_void_p]
         self.lib.getLastErrorMessage.restype = c_char_p
         
+        self.lib.cleanupTransfer.argtypes = [c_void_p]
+        
+        # Статистика передачи (нет в старых сборках библиотеки)
+        self._has_native_stats = hasattr(self.lib, 'getTransferStats')
+        if self._has_native_stats:
+            self.lib.getTransferStats.argtypes = [c_void_p, POINTER(NativeTransferStats)]
+            self.lib.getTransferStats.restype = c_int
+        
+        # Ограничение скорости и отмена отправки (нет в старых сборках библиотеки)
+        self._has_rate_control = hasattr(self.lib, 'setSendRateLimit')
+        if self._has_rate_control:
+            self.lib.setSendRateLimit.argtypes = [c_void_p, c_longlong]
+            self.lib.cancelSendFile.argtypes = [c_void_p]
+        
+        # Автоподстройка чанка: начальные параметры для устройства
+        self._has_tuning = hasattr(self.lib, 'setTransferTuning')
+        if self._has_tuning:
+            self.lib.setTransferTuning.argtypes = [c_void_p, c_int, c_int]
+        self.tuning = LinkTuningStore()
+        
+        # Дельта-передача измененных файлов (протокол версии 2)
+        self._has_delta = hasattr(self.lib, 'setDeltaTransfer')
+        if self._has_delta:
+            self.lib.setDeltaTransfer.argtypes = [c_void_p, c_int]
+        
+        # Подтверждения записи от получателя (протокол версии 2)
+        self._has_acks = hasattr(self.lib, 'setAckInterval')
+        if self._has_acks:
+            self.lib.setAckInterval.argtypes = [c_void_p, c_int]
+        
+        # Шифрование передачи ключом пары с устройством (протокол версии 2)
+        self._has_encryption = hasattr(self.lib, 'setEncryptionKey')
+        if self._has_encryption:
+            self.lib.setEncryptionKey.argtypes = [c_void_p, c_char_p, c_int]
+        self.keys = DeviceKeyStore()
+        self.encryption_enabled = False
+        self._encryption_key_set = False
+        
+        # Канал сервиса ищется по SDP; подменный поиск - для тестов без радиомодуля
+        self._has_channel_resolver = hasattr(self.lib, 'setChannelResolver')
+        if self._has_channel_resolver:
+            self.lib.setChannelResolver.argtypes = [c_void_p, ChannelResolverCallback]
+        self._channel_resolver_cb = None
+        self.channel_resolver = None
+        
+        # Имитация канала со сбоями - для отладки и длительных прогонов без радиомодуля
+        self._has_link_sim = hasattr(self.lib, 'setLinkSimulation')
+        if self._has_link_sim:
+            self.lib.setLinkSimulation.argtypes = [POINTER(LinkSimConfig)]
+            self.lib.getLinkSimulationStats.argtypes = [POINTER(LinkSimStats)]
+            self.lib.getLinkSimulationStats.restype = c_int
+        
+        # Рассылка одного файла нескольким устройствам с общим чтением с диска
+        self._has_broadcast = hasattr(self.lib, 'createBroadcastSource')
+        if self._has_broadcast:
+            self.lib.createBroadcastSource.argtypes = [c_char_p]
+            self.lib.createBroadcastSource.restype = c_void_p
+            self.lib.destroyBroadcastSource.argtypes = [c_void_p]
+            self.lib.getBroadcastSize.argtypes = [c_void_p]
+            self.lib.getBroadcastSize.restype = c_longlong
+            self.lib.getBroadcastStats.argtypes = [c_void_p, POINTER(NativeBroadcastStats)]
+            self.lib.getBroadcastStats.restype = c_int
+            self.lib.setSendBroadcast.argtypes = [c_void_p, c_void_p]
+        
+        self.metrics = TransferMetrics("client")
+        self._file_size = 0
+        self._file_path = ""
+        self.connected_address = None
+        
         self.lib.registerCallbacks.argtypes = [
             c_void_p,
             DeviceDiscoveredCallback,
@@ -92,7 +1132,7 @@ class BluetoothBackend:
         ]
         
         # Создание экземпляра
-        logger.info("Создаем экземпляр BluetoothTransfer")
+        backend_logger.info("Создаем экземпляр BluetoothTransfer")
         self.instance = self.lib.createBluetoothTransfer()
         
         # Callback функции
@@ -127,6 +1167,22 @@ class BluetoothBackend:
         self.on_scan_finished = None
         self.on_connected = None
         self.on_disconnected = None  # Добавлен callback
+        # Итог отправки для истории передач: (адрес, файл, байт, секунд, успех, error=, stalls=)
+        self.on_transfer_finished = None
+        
+        # Пакетная выдача событий: один вызов библиотеки (и один захват GIL) на пачку событий
+        # вместо callback на каждое; в старых сборках события идут через callback выше
+        self._has_event_batch = hasattr(self.lib, 'drainEvents')
+        self._event_thread = None
+        if self._has_event_batch:
+            self.lib.setEventBatching.argtypes = [c_void_p, c_int]
+            self.lib.drainEvents.argtypes = [c_void_p, POINTER(NativeBatchedEvent), c_int, c_int]
+            self.lib.drainEvents.restype = c_int
+            self._event_buffer = (NativeBatchedEvent * EVENT_BATCH_CAPACITY)()
+            self._draining = True
+            self.lib.setEventBatching(self.instance, 1)
+            self._event_thread = threading.Thread(target=self._drain_events, name="client-events", daemon=True)
+            self._event_thread.start()
         
     def _find_library(self, base_name: str) -> Optional[str]:
         """Поиск библиотеки в возможных местах"""
@@ -156,12 +1212,12 @@ class BluetoothBackend:
         
         for path in possible_paths:
             if os.path.exists(path):
-                logger.info(f"Найдена библиотека: {path}")
+                backend_logger.info(f"Найдена библиотека: {path}")
                 return path
         
-        logger.error(f"Библиотека {base_name}.dll не найдена в следующих местах:")
+        backend_logger.error(f"Библиотека {base_name}.dll не найдена в следующих местах:")
         for path in possible_paths:
-            logger.error(f"  - {path}")
+            backend_logger.error(f"  - {path}")
         
         # Создаем информационное сообщение для пользователя
         msg = f"Библиотека {base_name}.dll не найдена.\n\n"
@@ -175,7 +1231,43 @@ class BluetoothBackend:
         QMessageBox.critical(None, "Ошибка", msg)
         return None
     
+    def _drain_events(self):
+        """Поток доставки событий: пачка за вызов drainEvents, записи читаются прямо из общего
+        буфера, строки копируются и декодируются только у событий, которым они нужны"""
+        instance = self.instance
+        buffer = self._event_buffer
+        while self._draining:
+            count = self.lib.drainEvents(instance, buffer, EVENT_BATCH_CAPACITY, EVENT_BATCH_WAIT_MS)
+            for index in range(count):
+                event = buffer[index]
+                kind = event.type
+                if kind == EVENT_PROGRESS:
+                    self._on_progress(event.intValue)
+                elif kind == EVENT_STATUS:
+                    self._on_status(event.text)
+                elif kind == EVENT_DEVICE_DISCOVERED:
+                    self._on_device_discovered(event.text, event.address)
+                elif kind == EVENT_FILE_SENT:
+                    self._on_file_sent(b"")
+                elif kind == EVENT_SCAN_FINISHED:
+                    self._on_scan_finished()
+                elif kind == EVENT_CONNECTED:
+                    self._on_connected()
+                elif kind == EVENT_DISCONNECTED:
+                    self._on_disconnected()
+    
+    def _stop_event_thread(self, instance):
+        """Остановка пакетной выдачи; оставшиеся события библиотека доставит через callback"""
+        thread, self._event_thread = getattr(self, '_event_thread', None), None
+        if not thread:
+            return
+        self._draining = False
+        self.lib.setEventBatching(instance, 0)
+        if thread is not threading.current_thread():
+            thread.join()
+    
     # Callback методы
+    @timed_callback
     def _on_device_discovered(self, name: bytes, address: bytes):
         try:
             if self.on_device_discovered:
@@ -183,132 +1275,331 @@ class BluetoothBackend:
                 address_str = address.decode('utf-8', errors='ignore')
                 self.on_device_discovered(name_str, address_str)
         except Exception as e:
-            logger.error(f"Ошибка в callback устройства: {e}")
+            backend_logger.error(f"Ошибка в callback устройства: {e}")
     
+    @timed_callback
     def _on_status(self, message: bytes):
         try:
             if self.on_status:
                 message_str = message.decode('utf-8', errors='ignore')
                 self.on_status(message_str)
         except Exception as e:
-            logger.error(f"Ошибка в callback статуса: {e}")
+            backend_logger.error(f"Ошибка в callback статуса: {e}")
     
+    @timed_callback
     def _on_progress(self, percent: int):
         try:
+            self.metrics.observe_progress(percent)
             if self.on_progress:
                 self.on_progress(percent)
         except Exception as e:
-            logger.error(f"Ошибка в callback прогресса: {e}")
+            backend_logger.error(f"Ошибка в callback прогресса: {e}")
     
+    @timed_callback
     def _on_file_received(self, filename: bytes):
         try:
             if self.on_file_received:
                 filename_str = filename.decode('utf-8', errors='ignore')
                 self.on_file_received(filename_str)
         except Exception as e:
-            logger.error(f"Ошибка в callback получения файла: {e}")
+            backend_logger.error(f"Ошибка в callback получения файла: {e}")
     
+    @timed_callback
     def _on_file_sent(self, _: bytes):
         try:
             if self.on_file_sent:
                 self.on_file_sent()
         except Exception as e:
-            logger.error(f"Ошибка в callback отправки файла: {e}")
+            backend_logger.error(f"Ошибка в callback отправки файла: {e}")
     
+    @timed_callback
     def _on_scan_finished(self):
         try:
             if self.on_scan_finished:
                 self.on_scan_finished()
         except Exception as e:
-            logger.error(f"Ошибка в callback завершения сканирования: {e}")
+            backend_logger.error(f"Ошибка в callback завершения сканирования: {e}")
     
+    @timed_callback
     def _on_connected(self):
         try:
             if self.on_connected:
                 self.on_connected()
         except Exception as e:
-            logger.error(f"Ошибка в callback подключения: {e}")
+            backend_logger.error(f"Ошибка в callback подключения: {e}")
     
+    @timed_callback
     def _on_disconnected(self):
         try:
             if self.on_disconnected:
                 self.on_disconnected()
         except Exception as e:
-            logger.error(f"Ошибка в callback отключения: {e}")
+            backend_logger.error(f"Ошибка в callback отключения: {e}")
     
     # Public методы
     def start_discovery(self):
         """Запуск сканирования устройств"""
-        logger.info("Запуск сканирования Bluetooth устройств")
+        if not self.instance:
+            return
+        backend_logger.info("Запуск сканирования Bluetooth устройств")
         self.lib.startDiscovery(self.instance)
     
+    def cancel_discovery(self):
+        """Прерывание сканирования (завершится после текущего раунда опроса)"""
+        if self._has_cancel_discovery and self.instance:
+            backend_logger.info("Прерывание сканирования")
+            self.lib.cancelDiscovery(self.instance)
+    
     def connect_to_device(self, address: str) -> bool:
         """Подключение к устройству по адресу"""
-        logger.info(f"Попытка подключения к устройству {address}")
+        if not self.instance:
+            return False
+        backend_logger.info(f"Попытка подключения к устройству {address}")
+        started = time.perf_counter()
         result = self.lib.connectDevice(self.instance, address.encode('utf-8')) == 1
-        logger.info(f"Результат подключения: {'Успешно' if result else 'Неудачно'}")
+        self.metrics.observe_connect(time.perf_counter() - started, result)
+        self.connected_address = address if result else None
+        backend_logger.info(f"Результат подключения: {'Успешно' if result else 'Неудачно'}")
+        if result and self._has_tuning:
+            # Начинаем с параметров, подобранных для этого устройства в прошлый раз
+            tuned = self.tuning.get(address) or {}
+            self.lib.setTransferTuning(self.instance, tuned.get("chunk_size", 0), tuned.get("socket_buffer", 0))
+            if tuned:
+                backend_logger.debug(f"Параметры канала {address}: чанк {tuned['chunk_size']} байт, "
+                                     f"буфер {tuned['socket_buffer']} байт")
+        if result:
+            self._apply_encryption_key()
         return result
     
     def disconnect_device(self):
         """Отключение от устройства"""
-        logger.info("Отключение от устройства")
+        if not self.instance:
+            return
+        backend_logger.info("Отключение от устройства")
         self.lib.disconnectDevice(self.instance)
+        self.connected_address = None
     
     def set_file_to_send(self, file_path: str):
         """Установка файла для отправки"""
         if not os.path.exists(file_path):
-            logger.error(f"Файл не существует: {file_path}")
+            backend_logger.error(f"Файл не существует: {file_path}")
             raise FileNotFoundError(f"Файл не существует: {file_path}")
         
-        logger.info(f"Установлен файл для отправки: {file_path}")
-        self.lib.setSendFile(self.instance, file_path.encode('utf-8'))
+        backend_logger.info(f"Установлен файл для отправки: {file_path}")
+        self._file_size = os.path.getsize(file_path)
+        self._file_path = file_path
+        if self.instance:
+            self.lib.setSendFile(self.instance, file_path.encode('utf-8'))
+    
+    def set_broadcast_source(self, source: Optional['BroadcastSource']):
+        """Отправка из общего источника рассылки вместо собственного чтения файла (None - сброс)"""
+        if not self._has_broadcast:
+            raise RuntimeError("Библиотека не поддерживает рассылку")
+        if source:
+            self._file_size = source.size
+            self._file_path = source.path
+        if self.instance:
+            self.lib.setSendBroadcast(self.instance, source.handle if source else None)
     
     def send_file(self) -> bool:
         """Отправка файла"""
-        logger.info("Начало отправки файла")
+        if not self.instance:
+            return False
+        if self.encryption_enabled and not self._encryption_key_set:
+            # Открытым текстом при включенном шифровании не отправляем
+            raise RuntimeError(f"Нет ключа шифрования для устройства {self.connected_address}")
+        backend_logger.info("Начало отправки файла")
+        stalls = self.refresh_metrics().stall_count
+        self.metrics.begin_transfer(self._file_size)
+        started = time.perf_counter()
         result = self.lib.sendFileData(self.instance) == 1
-        logger.info(f"Результат отправки: {'Успешно' if result else 'Неудачно'}")
+        duration = time.perf_counter() - started
+        self.metrics.end_transfer(result)
+        self.refresh_metrics()
+        if self.on_transfer_finished:
+            try:
+                delivered = self._file_size if result else self.metrics.acked_bytes
+                self.on_transfer_finished(self.connected_address, self._file_path, delivered, duration, result,
+                                          error="" if result else self.get_last_error(),
+                                          stalls=self.metrics.stall_count - stalls)
+            except Exception as e:
+                backend_logger.error(f"Ошибка в callback итога отправки: {e}")
+        if result and self._has_tuning and self.connected_address and self.metrics.chunk_size:
+            self.tuning.update(self.connected_address, self.metrics.chunk_size,
+                               self.metrics.socket_buffer, self.metrics.throughput)
+        backend_logger.info(f"Результат отправки: {'Успешно' if result else 'Неудачно'}")
+        if not result and self._has_acks:
+            backend_logger.info(f"Получатель подтвердил {self.metrics.acked_bytes} из {self._file_size} байт")
         return result
     
+    def set_ack_interval(self, interval_bytes: int):
+        """Интервал подтверждений записи от получателя (0 - без подтверждений). Получателя
+        без записи сервиса в SDP (старая версия) библиотека о подтверждениях не просит"""
+        if not self.instance:
+            return
+        if self._has_acks:
+            self.lib.setAckInterval(self.instance, max(0, int(interval_bytes)))
+        elif interval_bytes:
+            backend_logger.warning("Библиотека не поддерживает подтверждения приема")
+    
+    def set_rate_limit(self, bytes_per_second: int):
+        """Ограничение скорости отправки (0 - без ограничения)"""
+        if not self.instance:
+            return
+        if self._has_rate_control:
+            self.lib.setSendRateLimit(self.instance, max(0, int(bytes_per_second)))
+        elif bytes_per_second:
+            backend_logger.warning("Библиотека не поддерживает ограничение скорости")
+    
+    def cancel_send(self):
+        """Прерывание текущей отправки (соединение будет разорвано)"""
+        if self._has_rate_control and self.instance:
+            backend_logger.info("Прерывание отправки файла")
+            self.lib.cancelSendFile(self.instance)
+    
+    def set_delta_enabled(self, enabled: bool):
+        """Передача только изменений файла, уже имеющегося у получателя"""
+        if not self.instance:
+            return
+        if self._has_delta:
+            self.lib.setDeltaTransfer(self.instance, 1 if enabled else 0)
+        elif enabled:
+            backend_logger.warning("Библиотека не поддерживает дельта-передачу")
+    
+    def set_encryption_enabled(self, enabled: bool):
+        """Шифрование передачи ключом пары с текущим устройством (см. keys)"""
+        if enabled and not self._has_encryption:
+            backend_logger.warning("Библиотека не поддерживает шифрование передачи")
+            return
+        self.encryption_enabled = enabled
+        self._apply_encryption_key()
+    
+    def _apply_encryption_key(self):
+        """Передача ключа текущего устройства в библиотеку (или его сброс)"""
+        if not self._has_encryption or not self.instance:
+            return
+        key = self.keys.get(self.connected_address) if self.encryption_enabled and self.connected_address else None
+        if self.encryption_enabled and self.connected_address and key is None:
+            backend_logger.warning(f"Нет ключа шифрования для устройства {self.connected_address}")
+        self.lib.setEncryptionKey(self.instance, key, len(key) if key else 0)
+        self._encryption_key_set = key is not None
+    
+    def set_channel_resolver(self, resolver: Optional[Callable[[str], int]]):
+        """Подмена поиска канала RFCOMM (None - снова запрос SDP)"""
+        if not self._has_channel_resolver:
+            backend_logger.warning("Библиотека не поддерживает подмену поиска канала")
+            return
+        
+        def resolve(address: bytes) -> int:
+            try:
+                return int(resolver(address.decode('utf-8', errors='ignore')) or 0)
+            except Exception as e:
+                backend_logger.error(f"Ошибка в подменном поиске канала: {e}")
+                return 0
+        
+        # Ссылку на callback нужно держать, пока библиотека может его вызвать
+        self.channel_resolver = resolver
+        self._channel_resolver_cb = ChannelResolverCallback(resolve) if resolver else ChannelResolverCallback()
+        if self.instance:
+            self.lib.setChannelResolver(self.instance, self._channel_resolver_cb)
+    
+    def set_link_simulation(self, config: Optional[LinkSimConfig]) -> bool:
+        """Имитация канала вместо Bluetooth (None - настоящий канал)"""
+        if not self._has_link_sim:
+            backend_logger.warning("Библиотека не поддерживает имитацию канала")
+            return False
+        self.lib.setLinkSimulation(ctypes.byref(config) if config else None)
+        return True
+    
+    def link_simulation_stats(self) -> Optional[LinkSimStats]:
+        """Счетчики сбоев, внесенных имитацией канала"""
+        if not self._has_link_sim:
+            return None
+        stats = LinkSimStats()
+        self.lib.getLinkSimulationStats(ctypes.byref(stats))
+        return stats
+    
     def is_connected(self) -> bool:
         """Проверка подключения"""
+        if not self.instance:
+            return False
         result = self.lib.isDeviceConnected(self.instance) == 1
         return result
     
     def get_last_error(self) -> str:
         """Получение последней ошибки"""
+        if not self.instance:
+            return "Экземпляр библиотеки уже освобожден"
         error_msg = self.lib.getLastErrorMessage(self.instance)
         if error_msg:
             error_str = error_msg.decode('utf-8', errors='ignore')
-            logger.error(f"Получена ошибка: {error_str}")
+            backend_logger.error(f"Получена ошибка: {error_str}")
             return error_str
         return "Неизвестная ошибка"
     
+    def refresh_metrics(self) -> TransferMetrics:
+        """Подтягивание статистики из C++ библиотеки в метрики"""
+        if self._has_native_stats and self.instance:
+            stats = NativeTransferStats()
+            if self.lib.getTransferStats(self.instance, ctypes.byref(stats)) == 1:
+                self.metrics.update_native(stats)
+        return self.metrics
+    
     def cleanup(self):
-        """Очистка ресурсов"""
-        self.lib.cleanupTransfer(self.instance)
+        """Закрытие соединения; экземпляр остается пригодным для нового подключения"""
+        if self.instance:
+            self.lib.cleanupTransfer(self.instance)
+    
+    def close(self):
+        """Уничтожение экземпляра библиотеки (повторный вызов ничего не делает)"""
+        instance = getattr(self, 'instance', None)
+        if not instance:
+            return
+        self.instance = None
+        self._stop_event_thread(instance)
+        backend_logger.info("Уничтожение экземпляра BluetoothTransfer")
+        # Деструктор дожидается потоков библиотеки - после него callback больше не вызываются
+        self.lib.destroyBluetoothTransfer(instance)
+        self.connected_address = None
+    
+    def abandon(self):
+        """Отказ от экземпляра без уничтожения: к нему еще обращается поток, не завершившийся
+        вовремя. Дальнейшие вызовы ничего не делают, память освободит выход процесса"""
+        if getattr(self, 'instance', None):
+            backend_logger.warning("Экземпляр BluetoothTransfer оставлен без уничтожения")
+        self.instance = None
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
     
     def __del__(self):
-        """Деструктор"""
-        if hasattr(self, 'instance') and self.instance:
-            try:
-                logger.info("Уничтожение экземпляра BluetoothTransfer")
-                self.lib.destroyBluetoothTransfer(self.instance)
-                self.instance = None
-            except Exception as e:
-                logger.error(f"Ошибка при уничтожении экземпляра: {e}")
+        """Страховка, если close() не был вызван"""
+        try:
+            self.close()
+        except Exception as e:
+            backend_logger.error(f"Ошибка при уничтожении экземпляра: {e}")
 
 class ServerBackend:
     """Класс для взаимодействия с серверной библиотекой"""
     
-    def __init__(self):
-        # Загрузка библиотеки
-        self.lib_path = self._find_library("serverthread")
-        if not self.lib_path:
-            raise RuntimeError("Не удалось найти библиотеку serverthread.dll")
+    def __init__(self, library=None):
+        # Журнал событий (EventRecorder.attach)
+        self.recorder = None
         
-        logger.info(f"Загружаем библиотеку сервера: {self.lib_path}")
-        self.lib = ctypes.CDLL(self.lib_path)
+        # Загрузка библиотеки (готовая - ReplayLibrary для воспроизведения событий без DLL)
+        if library is not None:
+            self.lib_path = None
+            self.lib = library
+        else:
+            self.lib_path = self._find_library("serverthread")
+            if not self.lib_path:
+                raise RuntimeError("Не удалось найти библиотеку serverthread.dll")
+            
+            server_logger.info(f"Загружаем библиотеку сервера: {self.lib_path}")
+            self.lib = ctypes.CDLL(self.lib_path)
         
         # Определение функций C API
         self.lib.createServerThread.restype = c_void_p
@@ -320,6 +1611,14 @@ class ServerBackend:
         
         self.lib.stopServer.argtypes = [c_void_p]
         
+        # Статистика приема (нет в старых сборках библиотеки)
+        self._has_native_stats = hasattr(self.lib, 'getServerStats')
+        if self._has_native_stats:
+            self.lib.getServerStats.argtypes = [c_void_p, POINTER(NativeTransferStats)]
+            self.lib.getServerStats.restype = c_int
+        
+        self.metrics = TransferMetrics("server")
+        
         self.lib.registerServerCallbacks.argtypes = [
             c_void_p,
             ServerStatusCallback,
@@ -329,7 +1628,7 @@ class ServerBackend:
         ]
         
         # Создание экземпляра
-        logger.info("Создаем экземпляр ServerThread")
+        server_logger.info("Создаем экземпляр ServerThread")
         self.instance = self.lib.createServerThread()
         
         # Callback функции
@@ -352,6 +1651,44 @@ class ServerBackend:
         self.on_file_received = None
         self.on_client_connected = None
         self.on_client_disconnected = None
+        self.on_file_stream = None
+        # Итог каждого подключения для истории передач: (адрес, файл, байт, секунд, успех)
+        self.on_transfer_finished = None
+        
+        # Уведомления о начале/конце приема для потокового воспроизведения
+        self._file_stream_cb = FileStreamCallback(self._on_file_stream)
+        if hasattr(self.lib, 'registerServerStreamCallback'):
+            self.lib.registerServerStreamCallback.argtypes = [c_void_p, FileStreamCallback]
+            self.lib.registerServerStreamCallback(self.instance, self._file_stream_cb)
+        
+        # Итоги подключений для истории передач (нет в старых сборках библиотеки)
+        self._transfer_finished_cb = TransferFinishedCallback(self._on_transfer_finished)
+        if hasattr(self.lib, 'registerServerTransferCallback'):
+            self.lib.registerServerTransferCallback.argtypes = [c_void_p, TransferFinishedCallback]
+            self.lib.registerServerTransferCallback(self.instance, self._transfer_finished_cb)
+        
+        # Имитация канала со сбоями (своя в библиотеке сервера)
+        self._has_link_sim = hasattr(self.lib, 'setLinkSimulation')
+        if self._has_link_sim:
+            self.lib.setLinkSimulation.argtypes = [POINTER(LinkSimConfig)]
+            self.lib.getLinkSimulationStats.argtypes = [POINTER(LinkSimStats)]
+            self.lib.getLinkSimulationStats.restype = c_int
+        
+        # Ключи сопряженных устройств для шифрованной передачи
+        self._has_encryption = hasattr(self.lib, 'addServerKey')
+        if self._has_encryption:
+            self.lib.addServerKey.argtypes = [c_void_p, c_char_p, c_int]
+            self.lib.clearServerKeys.argtypes = [c_void_p]
+            self.lib.setServerRequireEncryption.argtypes = [c_void_p, c_int]
+        
+        # Прием в нескольких процессах на копиях одного слушающего сокета
+        self._has_shared_listener = hasattr(self.lib, 'startSharedListener')
+        if self._has_shared_listener:
+            self.lib.startSharedListener.argtypes = [c_void_p]
+            self.lib.shareListener.argtypes = [c_void_p, ctypes.c_ulong, c_char_p, c_int]
+            self.lib.shareListener.restype = c_int
+            self.lib.startServerOnSharedListener.argtypes = [c_void_p, c_char_p, c_int]
+            self.lib.startServerOnSharedListener.restype = c_int
         
     def _find_library(self, base_name: str) -> Optional[str]:
         """Поиск библиотеки в возможных местах"""
@@ -371,63 +1708,1808 @@ class ServerBackend:
         
         for path in possible_paths:
             if os.path.exists(path):
-                logger.info(f"Найдена библиотека сервера: {path}")
+                server_logger.info(f"Найдена библиотека сервера: {path}")
                 return path
         
-        logger.error(f"Библиотека {base_name}.dll не найдена")
+        server_logger.error(f"Библиотека {base_name}.dll не найдена")
         return None
     
     # Callback методы
+    @timed_callback
     def _on_status(self, message: bytes):
         try:
             if self.on_status:
                 message_str = message.decode('utf-8', errors='ignore')
                 self.on_status(message_str)
         except Exception as e:
-            logger.error(f"Ошибка в callback статуса сервера: {e}")
+            server_logger.error(f"Ошибка в callback статуса сервера: {e}")
     
+    @timed_callback
     def _on_file_received(self, filename: bytes):
         try:
+            self.metrics.end_transfer(True)
             if self.on_file_received:
                 filename_str = filename.decode('utf-8', errors='ignore')
                 self.on_file_received(filename_str)
         except Exception as e:
-            logger.error(f"Ошибка в callback получения файла сервером: {e}")
+            server_logger.error(f"Ошибка в callback получения файла сервером: {e}")
     
+    @timed_callback
     def _on_client_connected(self):
         try:
             if self.on_client_connected:
                 self.on_client_connected()
         except Exception as e:
-            logger.error(f"Ошибка в callback подключения клиента: {e}")
+            server_logger.error(f"Ошибка в callback подключения клиента: {e}")
     
+    @timed_callback
     def _on_client_disconnected(self):
         try:
             if self.on_client_disconnected:
                 self.on_client_disconnected()
         except Exception as e:
-            logger.error(f"Ошибка в callback отключения клиента: {e}")
+            server_logger.error(f"Ошибка в callback отключения клиента: {e}")
+    
+    @timed_callback
+    def _on_file_stream(self, filename: bytes, total_size: int, state: int):
+        try:
+            if self.on_file_stream:
+                filename_str = filename.decode('utf-8', errors='ignore')
+                self.on_file_stream(filename_str, total_size, state)
+        except Exception as e:
+            server_logger.error(f"Ошибка в callback потокового приема: {e}")
+    
+    @timed_callback
+    def _on_transfer_finished(self, peer: bytes, filename: bytes, size: int, duration_ms: float, ok: int):
+        try:
+            if self.on_transfer_finished:
+                self.on_transfer_finished(peer.decode('utf-8', errors='ignore'),
+                                          filename.decode('utf-8', errors='ignore'),
+                                          size, duration_ms / 1000.0, bool(ok))
+        except Exception as e:
+            server_logger.error(f"Ошибка в callback итога приема: {e}")
     
     # Public методы
     def start(self):
         """Запуск сервера"""
-        logger.info("Запуск Bluetooth сервера")
+        if not self.instance:
+            return
+        server_logger.info("Запуск Bluetooth сервера")
         self.lib.startServer(self.instance)
     
     def stop(self):
         """Остановка сервера"""
-        logger.info("Остановка Bluetooth сервера")
+        if not self.instance:
+            return
+        server_logger.info("Остановка Bluetooth сервера")
         self.lib.stopServer(self.instance)
     
+    def start_shared_listener(self):
+        """Запуск без приема: только слушающий сокет и запись SDP для процессов-обработчиков"""
+        if not self.instance:
+            return
+        server_logger.info("Запуск слушающего сокета для процессов-обработчиков")
+        self.lib.startSharedListener(self.instance)
+    
+    def share_listener(self, process_id: int) -> Optional[bytes]:
+        """Копия слушающего сокета для процесса process_id (None - сокет не открыт)"""
+        if not self.instance:
+            return None
+        buffer = ctypes.create_string_buffer(SHARED_LISTENER_BUFFER_SIZE)
+        size = self.lib.shareListener(self.instance, process_id, buffer, len(buffer))
+        return buffer.raw[:size] if size > 0 else None
+    
+    def start_on_shared_listener(self, protocol_info: bytes) -> bool:
+        """Прием на копии слушающего сокета из share_listener() другого процесса"""
+        if not self.instance:
+            return False
+        server_logger.info("Запуск приема на общем слушающем сокете")
+        return self.lib.startServerOnSharedListener(self.instance, protocol_info, len(protocol_info)) == 1
+    
+    def set_encryption_keys(self, keys: List[bytes], required: bool = False) -> bool:
+        """Ключи сопряженных устройств; required - отклонять передачи без шифрования"""
+        if not self._has_encryption:
+            if keys or required:
+                server_logger.warning("Библиотека сервера не поддерживает шифрование передачи")
+            return False
+        if not self.instance:
+            return False
+        self.lib.clearServerKeys(self.instance)
+        for key in keys:
+            self.lib.addServerKey(self.instance, key, len(key))
+        self.lib.setServerRequireEncryption(self.instance, 1 if required else 0)
+        server_logger.info(f"Ключей шифрования: {len(keys)}, только шифрованные передачи: {required}")
+        return True
+    
+    def set_link_simulation(self, config: Optional[LinkSimConfig]) -> bool:
+        """Имитация канала вместо Bluetooth (None - настоящий канал); действует при запуске сервера"""
+        if not self._has_link_sim:
+            server_logger.warning("Библиотека сервера не поддерживает имитацию канала")
+            return False
+        self.lib.setLinkSimulation(ctypes.byref(config) if config else None)
+        return True
+    
+    def link_simulation_stats(self) -> Optional[LinkSimStats]:
+        """Счетчики сбоев, внесенных имитацией канала"""
+        if not self._has_link_sim:
+            return None
+        stats = LinkSimStats()
+        self.lib.getLinkSimulationStats(ctypes.byref(stats))
+        return stats
+    
+    def native_stats(self) -> Optional[NativeTransferStats]:
+        """Статистика приема из C++ библиотеки (None - старая сборка)"""
+        if self._has_native_stats and self.instance:
+            stats = NativeTransferStats()
+            if self.lib.getServerStats(self.instance, ctypes.byref(stats)) == 1:
+                return stats
+        return None
+    
+    def refresh_metrics(self) -> TransferMetrics:
+        """Подтягивание статистики из C++ библиотеки в метрики"""
+        stats = self.native_stats()
+        if stats is not None:
+            self.metrics.update_native(stats)
+        return self.metrics
+    
+    def close(self):
+        """Остановка сервера и уничтожение экземпляра (повторный вызов ничего не делает)"""
+        instance = getattr(self, 'instance', None)
+        if not instance:
+            return
+        self.instance = None
+        server_logger.info("Уничтожение экземпляра ServerThread")
+        # Деструктор останавливает сервер и поток событий, затем освобождает Winsock
+        self.lib.destroyServerThread(instance)
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+    
     def __del__(self):
-        """Деструктор"""
-        if hasattr(self, 'instance') and self.instance:
+        """Страховка, если close() не был вызван"""
+        try:
+            self.close()
+        except Exception as e:
+            server_logger.error(f"Ошибка при уничтожении экземпляра сервера: {e}")
+
+SHARED_LISTENER_BUFFER_SIZE = 1024  # с запасом больше sizeof(WSAPROTOCOL_INFOA)
+RECEIVER_START_TIMEOUT = 10.0
+
+# Поля статистики, которые при сложении по обработчикам берутся по максимуму
+_RECEIVER_MAX_FIELDS = {"lastTransferMs", "firstByteMs", "stallMaxMs", "dispatchMaxMs",
+                        "eventQueueMaxDepth", "chunkSize", "socketBuffer"}
+
+@contextmanager
+def _spawn_without_main():
+    """Запуск spawn-процесса без повторного выполнения главного модуля
+    
+    spawn выполняет в дочернем процессе главный модуль родителя (GUI или soak.py, а с ним
+    PyQt6 и pygame); обработчикам приема он не нужен - их точка входа в receiver_worker.
+    """
+    main = sys.modules['__main__']
+    sys.modules['__main__'] = types.ModuleType('__main__')
+    try:
+        yield
+    finally:
+        sys.modules['__main__'] = main
+
+class MultiprocessReceiver:
+    """Прием в нескольких процессах: по обработчику на ядро, общий поток событий и каталог
+    
+    Родительский процесс держит слушающий сокет и запись SDP, обработчики принимают
+    подключения на его копиях (WSADuplicateSocket) и сами считают хэш и метаданные
+    полученных файлов. Интерфейс - как у ServerBackend: callback вызываются из одного
+    потока сбора событий.
+    """
+    
+    def __init__(self, workers: Optional[int] = None):
+        self.workers = workers or os.cpu_count() or 1
+        self.listener = ServerBackend()
+        if not self.listener._has_shared_listener:
+            self.listener.close()
+            raise RuntimeError("Библиотека сервера не поддерживает прием в нескольких процессах")
+        self.listener.on_status = self._on_listener_status
+        self.metrics = TransferMetrics("server")
+        
+        # Callback для GUI (как у ServerBackend) и запись каталога до on_file_received
+        self.on_status = None
+        self.on_file_received = None
+        self.on_client_connected = None
+        self.on_client_disconnected = None
+        self.on_file_stream = None
+        self.on_transfer_finished = None
+        self.on_file_cataloged = None
+        
+        self._context = multiprocessing.get_context("spawn")
+        self._events = None
+        self._collector = None
+        self._processes: List[multiprocessing.Process] = []
+        self._controls = []
+        self._channel_ready = threading.Event()
+        self._link_config: Optional[bytes] = None
+        self._encryption: Optional[tuple] = None
+        self._lock = threading.Lock()
+        self._catalog: Dict[str, dict] = {}
+        self._worker_stats: Dict[int, NativeTransferStats] = {}
+    
+    def _on_listener_status(self, message: str):
+        if "started on channel" in message:
+            self._channel_ready.set()
+        self._emit(self.on_status, message)
+    
+    def _emit(self, callback, *args):
+        if callback:
+            try:
+                callback(*args)
+            except Exception as e:
+                server_logger.error(f"Ошибка в callback приема: {e}")
+    
+    def start(self):
+        """Слушающий сокет и процессы-обработчики"""
+        if self._processes:
+            return
+        server_logger.info(f"Запуск приема в {self.workers} процессах")
+        self._channel_ready.clear()
+        self.listener.start_shared_listener()
+        if not self._channel_ready.wait(RECEIVER_START_TIMEOUT):
+            self.listener.stop()
+            raise RuntimeError("Не удалось открыть слушающий сокет")
+        
+        self._events = self._context.Queue()
+        self._collector = threading.Thread(target=self._collect, daemon=True, name="receiver-events")
+        self._collector.start()
+        for index in range(self.workers):
+            control, child_control = self._context.Pipe()
+            process = self._context.Process(target=receiver_worker.run, name=f"receiver-{index}", daemon=True,
+                                            args=(index, child_control, self._events, self.listener.lib_path,
+                                                  ctypes.sizeof(NativeTransferStats), self._link_config,
+                                                  self._encryption))
+            with _spawn_without_main():
+                process.start()
+            child_control.close()
+            # Копия сокета привязана к процессу, поэтому создается после его запуска
+            protocol_info = self.listener.share_listener(process.pid)
+            if protocol_info is None:
+                server_logger.error(f"Не удалось передать слушающий сокет обработчику {index}")
+                process.terminate()
+                continue
+            control.send_bytes(protocol_info)
+            self._processes.append(process)
+            self._controls.append(control)
+        if not self._processes:
+            self.stop()
+            raise RuntimeError("Ни один процесс-обработчик не запущен")
+    
+    def stop(self):
+        """Остановка обработчиков, затем слушающего сокета"""
+        server_logger.info("Остановка приема в нескольких процессах")
+        for control in self._controls:
+            try:
+                control.send("stop")
+            except OSError:
+                pass
+        for process in self._processes:
+            process.join(RECEIVER_START_TIMEOUT)
+            if process.is_alive():
+                server_logger.warning(f"Обработчик {process.name} не остановился, завершаем")
+                process.terminate()
+        for control in self._controls:
+            control.close()
+        self._processes, self._controls = [], []
+        self.listener.stop()
+        
+        if self._collector:
+            self._events.put(None)
+            self._collector.join()
+            self._events.close()
+            self._collector = self._events = None
+    
+    def _collect(self):
+        """Поток сбора событий всех обработчиков"""
+        while True:
+            event = self._events.get()
+            if event is None:
+                break
+            if isinstance(event, logging.LogRecord):
+                logging.getLogger(event.name).handle(event)
+                continue
+            
+            kind, index, *payload = event
+            if kind == "status":
+                self._emit(self.on_status, payload[0])
+            elif kind == "connected":
+                self._emit(self.on_client_connected)
+            elif kind == "disconnected":
+                self._emit(self.on_client_disconnected)
+            elif kind == "stream":
+                self._emit(self.on_file_stream, *payload)
+            elif kind == "transfer":
+                self._emit(self.on_transfer_finished, *payload)
+            elif kind == "file":
+                path, entry = payload
+                with self._lock:
+                    self._catalog[path] = entry
+                self.metrics.end_transfer(True)
+                self._emit(self.on_file_cataloged, path, entry)
+                self._emit(self.on_file_received, path)
+            elif kind == "stats":
+                with self._lock:
+                    self._worker_stats[index] = NativeTransferStats.from_buffer_copy(payload[0])
+    
+    def catalog(self) -> Dict[str, dict]:
+        """Полученные файлы: путь -> обработчик, размер, SHA-1 и метаданные"""
+        with self._lock:
+            return dict(self._catalog)
+    
+    def native_stats(self) -> Optional[NativeTransferStats]:
+        """Статистика приема, сложенная по всем обработчикам"""
+        with self._lock:
+            parts = list(self._worker_stats.values())
+        if not parts:
+            return None
+        total = NativeTransferStats()
+        for name, field_type in NativeTransferStats._fields_:
+            values = [getattr(part, name) for part in parts]
+            if hasattr(field_type, "_length_"):
+                getattr(total, name)[:] = [sum(column) for column in zip(*values)]
+            elif name in _RECEIVER_MAX_FIELDS:
+                setattr(total, name, max(values))
+            else:
+                setattr(total, name, sum(values))
+        return total
+    
+    def refresh_metrics(self) -> TransferMetrics:
+        """Метрики приема по всем обработчикам"""
+        stats = self.native_stats()
+        if stats is not None:
+            self.metrics.update_native(stats)
+        return self.metrics
+    
+    def set_encryption_keys(self, keys: List[bytes], required: bool = False) -> bool:
+        """Ключи сопряженных устройств для обработчиков; действуют при запуске"""
+        if not self.listener._has_encryption:
+            return self.listener.set_encryption_keys(keys, required)
+        self._encryption = (list(keys), required)
+        return True
+    
+    def set_link_simulation(self, config: Optional[LinkSimConfig]) -> bool:
+        """Имитация канала для слушающего сокета и обработчиков; действует при запуске"""
+        self._link_config = bytes(config) if config else None
+        return self.listener.set_link_simulation(config)
+    
+    def close(self):
+        """Остановка приема и освобождение слушающего сокета (повторный вызов ничего не делает)"""
+        if self._processes or self._collector:
+            self.stop()
+        self.listener.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+
+class TransferJob:
+    """Задание на отправку файла"""
+    
+    # Приоритеты: меньше - важнее
+    INTERACTIVE = 0
+    NORMAL = 50
+    BULK = 100
+    
+    _ids = itertools.count(1)
+    
+    def __init__(self, file_path: str, priority: int = NORMAL,
+                 rate_limit: int = 0, address: Optional[str] = None):
+        self.id = next(self._ids)
+        self.file_path = file_path
+        self.priority = priority
+        self.rate_limit = rate_limit  # байт/с, 0 - без ограничения
+        self.address = address
+        self.state = "queued"  # queued, running, done, failed, cancelled
+        self.seq = 0
+        self.error = ""
+        self.preemptions = 0
+        self.size = 0
+        self.acked = 0  # подтверждено получателем в последней попытке
+        self.started_at = None
+        self.finished_at = None
+    
+    def __repr__(self):
+        return f"TransferJob({self.id}, {os.path.basename(self.file_path)!r}, p={self.priority}, {self.state})"
+
+class TransferScheduler:
+    """Очередь отправки с приоритетами и ограничением скорости поверх send_file"""
+    
+    def __init__(self, backend: 'BluetoothBackend', global_rate_limit: int = 0):
+        self.backend = backend
+        self.global_rate_limit = global_rate_limit
+        self._cond = threading.Condition()
+        self._heap = []
+        self._seq = itertools.count()
+        self._jobs: Dict[int, TransferJob] = {}
+        self._running: Optional[TransferJob] = None
+        self._preempt_requested = False
+        self._stopped = False
+        self.logger = logging.getLogger('backend')
+        
+        # Callback для GUI (вызываются из потока планировщика)
+        self.on_job_started = None
+        self.on_job_finished = None
+        
+        self._thread = threading.Thread(target=self._run, name="TransferScheduler", daemon=True)
+        self._thread.start()
+    
+    def submit(self, file_path: str, priority: int = TransferJob.NORMAL,
+               rate_limit: int = 0, address: Optional[str] = None) -> TransferJob:
+        """Постановка файла в очередь"""
+        job = TransferJob(file_path, priority, rate_limit, address)
+        with self._cond:
+            self._jobs[job.id] = job
+            job.seq = next(self._seq)
+            self._push(job)
+            self._maybe_preempt(job)
+            self._cond.notify_all()
+        self.logger.info(f"В очередь добавлен {job}")
+        return job
+    
+    def cancel(self, job_id: int) -> bool:
+        """Отмена задания (в очереди или выполняемого)"""
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if not job or job.state not in ("queued", "running"):
+                return False
+            if job.state == "running":
+                if not self.backend._has_rate_control:
+                    # Библиотека не умеет прерывать отправку - задание дойдет до конца
+                    self.logger.warning(f"Нельзя прервать выполняемое {job}")
+                    return False
+                # on_job_finished вызовет поток планировщика, когда отправка прервется
+                job.state = "cancelled"
+                self.backend.cancel_send()
+                return True
+            job.state = "cancelled"
+            job.finished_at = time.time()
+            self._rebuild()
+        self.logger.info(f"Задание отменено в очереди: {job}")
+        self._notify_finished(job)
+        return True
+    
+    def reprioritize(self, job_id: int, priority: int) -> bool:
+        """Изменение приоритета задания"""
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if not job or job.state not in ("queued", "running"):
+                return False
+            job.priority = priority
+            if job.state == "queued":
+                self._rebuild()
+                self._maybe_preempt(job)
+            return True
+    
+    def set_global_rate_limit(self, bytes_per_second: int):
+        """Общее ограничение скорости для всех заданий"""
+        with self._cond:
+            self.global_rate_limit = max(0, int(bytes_per_second))
+            if self._running:
+                self.backend.set_rate_limit(self._effective_rate(self._running))
+    
+    def pending(self) -> List[TransferJob]:
+        """Задания в порядке выполнения"""
+        with self._cond:
+            return [job for _, _, job in sorted(self._heap)]
+    
+    def jobs(self) -> List[TransferJob]:
+        with self._cond:
+            return list(self._jobs.values())
+    
+    @property
+    def busy(self) -> bool:
+        """Есть выполняемое или ожидающее задание"""
+        with self._cond:
+            return self._running is not None or any(job.state == "queued" for _, _, job in self._heap)
+    
+    def stop(self) -> bool:
+        """Остановка планировщика с прерыванием текущей отправки; False - поток
+        не завершился за время ожидания (отправка еще идет)"""
+        with self._cond:
+            self._stopped = True
+            if self._running:
+                self.backend.cancel_send()
+            self._cond.notify_all()
+        self._thread.join(timeout=5)
+        return not self._thread.is_alive()
+    
+    def _push(self, job: TransferJob):
+        # Порядок внутри приоритета - по времени постановки, вытесненное задание не теряет место
+        heapq.heappush(self._heap, (job.priority, job.seq, job))
+    
+    def _rebuild(self):
+        self._heap = [(job.priority, job.seq, job) for _, _, job in self._heap if job.state == "queued"]
+        heapq.heapify(self._heap)
+    
+    def _maybe_preempt(self, job: TransferJob):
+        # Вызывается под блокировкой: более важное задание вытесняет текущее
+        running = self._running
+        if not self.backend._has_rate_control:
+            return  # прервать отправку нечем - задание дождется своей очереди
+        if running and job.priority < running.priority and not self._preempt_requested:
+            self.logger.info(f"{job} вытесняет {running}")
+            self._preempt_requested = True
+            self.backend.cancel_send()
+    
+    def _effective_rate(self, job: TransferJob) -> int:
+        limits = [limit for limit in (job.rate_limit, self.global_rate_limit) if limit > 0]
+        return min(limits) if limits else 0
+    
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._stopped and not self._heap:
+                    self._cond.wait()
+                if self._stopped:
+                    return
+                _, _, job = heapq.heappop(self._heap)
+                if job.state != "queued":
+                    continue
+                job.state = "running"
+                self._running = job
+                self._preempt_requested = False
+                self.backend.set_rate_limit(self._effective_rate(job))
+            
+            self._execute(job)
+            
+            with self._cond:
+                self._running = None
+                if job.state == "running" and self._preempt_requested:
+                    # Вытесненное задание возвращается в очередь и отправляется заново с начала:
+                    # получатель удаляет недопринятый файл, так что вытеснение стоит уже
+                    # переданных байт этого задания
+                    job.state = "queued"
+                    job.preemptions += 1
+                    self._push(job)
+                    self.logger.info(f"{job} вытеснено, будет отправлено заново "
+                                     f"(подтверждено {job.acked} из {job.size} байт)")
+                    continue
+            
+            self._notify_finished(job)
+    
+    def _notify_finished(self, job: TransferJob):
+        # Вызывается без блокировки: callback может обращаться к планировщику
+        if self.on_job_finished:
+            try:
+                self.on_job_finished(job)
+            except Exception as e:
+                self.logger.error(f"Ошибка в callback завершения задания: {e}")
+    
+    def _execute(self, job: TransferJob):
+        job.started_at = time.time()
+        if self.on_job_started:
+            try:
+                self.on_job_started(job)
+            except Exception as e:
+                self.logger.error(f"Ошибка в callback начала задания: {e}")
+        
+        try:
+            job.size = os.path.getsize(job.file_path)
+            # Сервер принимает один файл на соединение - переподключаемся перед каждым заданием
+            address = job.address or self.backend.connected_address
+            if not address:
+                raise RuntimeError("Не выбрано устройство для отправки")
+            if not self.backend.connect_to_device(address):
+                raise RuntimeError(self.backend.get_last_error())
+            # Подключение сбрасывает флаг прерывания в библиотеке: отмена или вытеснение,
+            # пришедшие во время подключения, проверяем здесь
+            with self._cond:
+                interrupted = job.state != "running" or self._preempt_requested
+            if interrupted:
+                # Получатель ждет заголовок - закрываем соединение, устройство остается выбранным
+                self.backend.disconnect_device()
+                self.backend.connected_address = address
+            else:
+                self.backend.set_file_to_send(job.file_path)
+                ok = self.backend.send_file()
+                job.acked = self.backend.metrics.acked_bytes
+                with self._cond:
+                    # Файл, успевший уйти целиком, в очередь не возвращается
+                    if job.state == "running" and (ok or not self._preempt_requested):
+                        job.state = "done" if ok else "failed"
+                        if not ok:
+                            job.error = self.backend.get_last_error()
+        except Exception as e:
+            with self._cond:
+                if job.state == "running":
+                    job.state = "failed"
+                    job.error = str(e)
+        job.finished_at = time.time()
+        self.logger.info(f"Задание завершено: {job} {job.error}")
+
+# Автосканирование: проверка по таймеру, интервал удваивается, пока список устройств не меняется
+AUTO_SCAN_TICK_MS = 1000
+AUTO_SCAN_BASE_INTERVAL = 30.0
+AUTO_SCAN_MAX_INTERVAL = 480.0
+AUTO_SCAN_RESUME_DELAY = 2.0  # после возврата пользователя к окну, если список устарел
+
+class ScanScheduler:
+    """Когда запускать автосканирование. Опрос эфира на том же радиомодуле сильно снижает
+    скорость RFCOMM, поэтому при подключении и во время передач он откладывается; пока
+    найденные устройства не меняются, интервал удваивается до max_interval, а возврат
+    пользователя к окну или изменение списка возвращают базовый интервал"""
+    
+    def __init__(self, base_interval: float = AUTO_SCAN_BASE_INTERVAL,
+                 max_interval: float = AUTO_SCAN_MAX_INTERVAL,
+                 resume_delay: float = AUTO_SCAN_RESUME_DELAY,
+                 clock: Callable[[], float] = time.monotonic):
+        self.base_interval = base_interval
+        self.max_interval = max_interval
+        self.resume_delay = resume_delay
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.interval = base_interval
+        self._next_due = clock() + base_interval
+        self._last_finished = None
+        self._known: Optional[frozenset] = None
+        self._deferred_counted = False
+        self.suspended_by: Tuple[str, ...] = ()
+        self.scans_started = 0
+        self.deferred: Dict[str, int] = {}
+        self.backoffs = 0
+        self.resets = 0
+        self.logger = logging.getLogger('GUI')
+    
+    def poll(self, busy: List[str]) -> bool:
+        """Проверка по таймеру; busy - причины отложить опрос ("connected", "transfer", ...).
+        True - пора сканировать"""
+        now = self._clock()
+        reasons = tuple(busy)
+        with self._lock:
+            if reasons != self.suspended_by:
+                if reasons:
+                    self.logger.debug(f"Автосканирование приостановлено: {', '.join(reasons)}")
+                else:
+                    self.logger.debug("Автосканирование возобновлено")
+                self.suspended_by = reasons
+            if now < self._next_due:
+                return False
+            if reasons:
+                # Просроченный опрос ждет конца передачи; в метриках - один раз на срок
+                if not self._deferred_counted:
+                    self._deferred_counted = True
+                    for reason in reasons:
+                        self.deferred[reason] = self.deferred.get(reason, 0) + 1
+                return False
+            self._deferred_counted = False
+            self.scans_started += 1
+            # Следующий срок назначит scan_finished; это - страховка, если итога не будет
+            self._next_due = now + self.max_interval
+            return True
+    
+    def scan_finished(self, addresses):
+        """Итог любого сканирования (и ручного): изменился список - базовый интервал,
+        нет - интервал удваивается"""
+        found = frozenset(addresses)
+        now = self._clock()
+        with self._lock:
+            if self._known is not None and found == self._known:
+                if self.interval < self.max_interval:
+                    self.interval = min(self.interval * 2, self.max_interval)
+                    self.backoffs += 1
+            elif self.interval != self.base_interval:
+                self.interval = self.base_interval
+                self.resets += 1
+            self._known = found
+            self._last_finished = now
+            self._next_due = now + self.interval
+    
+    def user_activity(self):
+        """Пользователь вернулся к окну: базовый интервал, а устаревший список - обновить скоро"""
+        now = self._clock()
+        with self._lock:
+            if self.interval != self.base_interval:
+                self.interval = self.base_interval
+                self.resets += 1
+            fresh_until = (self._last_finished + self.base_interval
+                           if self._last_finished is not None else now)
+            self._next_due = min(self._next_due, max(now + self.resume_delay, fresh_until))
+    
+    def snapshot(self) -> dict:
+        """Состояние и счетчики решений для метрик"""
+        with self._lock:
+            return {
+                "interval_seconds": self.interval,
+                "next_scan_seconds": max(0.0, self._next_due - self._clock()),
+                "suspended_by": list(self.suspended_by),
+                "scans_started": self.scans_started,
+                "deferred": dict(self.deferred),
+                "backoffs": self.backoffs,
+                "resets": self.resets,
+            }
+
+class BroadcastSource:
+    """Файл рассылки: читается с диска один раз в общее кольцо блоков библиотеки"""
+    
+    def __init__(self, backend: 'BluetoothBackend', file_path: str):
+        if not backend._has_broadcast:
+            raise RuntimeError("Библиотека не поддерживает рассылку")
+        self.lib = backend.lib
+        self.path = file_path
+        self.handle = self.lib.createBroadcastSource(file_path.encode('utf-8'))
+        self.size = self.lib.getBroadcastSize(self.handle)
+        if self.size < 0:
+            self.close()
+            raise FileNotFoundError(f"Не удалось открыть файл: {file_path}")
+    
+    def stats(self) -> Optional[NativeBroadcastStats]:
+        """Прочитано в общее кольцо и дочитано отставшими получателями"""
+        if not self.handle:
+            return None
+        stats = NativeBroadcastStats()
+        self.lib.getBroadcastStats(self.handle, ctypes.byref(stats))
+        return stats
+    
+    def close(self):
+        """Удаление источника - только после завершения всех передач с ним"""
+        handle, self.handle = self.handle, None
+        if handle:
+            self.lib.destroyBroadcastSource(handle)
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+
+class BroadcastSender:
+    """Одновременная отправка файла нескольким устройствам.
+    
+    На каждое устройство - свой экземпляр библиотеки и поток: медленное устройство не
+    задерживает остальные, а файл читается с диска один раз (BroadcastSource). Параметры
+    канала, ключи и настройки шифрования берутся у основного backend.
+    """
+    
+    def __init__(self, backend: 'BluetoothBackend'):
+        self.backend = backend
+        self.rate_limit = 0       # байт/с на каждое устройство, 0 - без ограничения
+        self.ack_interval = None  # None - значение библиотеки по умолчанию
+        self._lock = threading.Lock()
+        self._senders: Dict[str, BluetoothBackend] = {}
+        self._percent: Dict[str, int] = {}
+        self._running = False
+        self._cancelled = False
+        self._idle = threading.Event()
+        self._idle.set()
+        self.last_stats: Optional[NativeBroadcastStats] = None
+        self.logger = logging.getLogger('backend')
+        
+        # Callback (вызываются из потоков рассылки)
+        self.on_progress = None  # (адрес, процент)
+        self.on_device_finished = None  # (адрес, успех, ошибка)
+        self.on_transfer_finished = None  # как BluetoothBackend.on_transfer_finished
+    
+    @property
+    def supported(self) -> bool:
+        return self.backend._has_broadcast
+    
+    @property
+    def running(self) -> bool:
+        return self._running
+    
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Ожидание конца рассылки; False - не закончилась за timeout"""
+        return self._idle.wait(timeout)
+    
+    def send(self, file_path: str, addresses: List[str]) -> Dict[str, Tuple[bool, str]]:
+        """Рассылка с ожиданием всех устройств; результат - {адрес: (успех, ошибка)}"""
+        addresses = list(dict.fromkeys(addresses))
+        if not addresses:
+            return {}
+        with self._lock:
+            if self._running:
+                raise RuntimeError("Рассылка уже выполняется")
+            self._running = True
+            self._cancelled = False
+            self._idle.clear()
+        self._percent.clear()
+        results: Dict[str, Tuple[bool, str]] = {}
+        try:
+            with BroadcastSource(self.backend, file_path) as source:
+                self.logger.info(f"Рассылка {os.path.basename(file_path)} ({source.size} байт) "
+                                 f"на {len(addresses)} устройств")
+                threads = [threading.Thread(target=self._send_one, args=(source, address, results),
+                                            name=f"Broadcast-{address}", daemon=True)
+                           for address in addresses]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+                self.last_stats = source.stats()
+            stats = self.last_stats
+            self.logger.info(f"Рассылка завершена: {sum(ok for ok, _ in results.values())} из "
+                             f"{len(addresses)} устройств, прочитано с диска "
+                             f"{stats.diskBytes + stats.fallbackBytes} байт, "
+                             f"отставших получателей {stats.detached}")
+        finally:
+            with self._lock:
+                self._running = False
+            self._idle.set()
+        return results
+    
+    def cancel(self):
+        """Прерывание отправки на все устройства"""
+        with self._lock:
+            # Устройства, которые еще подключаются, проверяют флаг перед отправкой
+            self._cancelled = self._running
+            senders = list(self._senders.values())
+        for sender in senders:
+            sender.cancel_send()
+    
+    def close(self):
+        """Уничтожение экземпляров библиотеки для устройств"""
+        with self._lock:
+            senders, self._senders = list(self._senders.values()), {}
+        for sender in senders:
+            sender.close()
+    
+    def abandon(self):
+        """Отказ от экземпляров без уничтожения, если рассылка не завершилась (см. BluetoothBackend.abandon)"""
+        with self._lock:
+            senders = list(self._senders.values())
+        for sender in senders:
+            sender.abandon()
+    
+    def _sender(self, address: str) -> 'BluetoothBackend':
+        with self._lock:
+            sender = self._senders.get(address)
+            if sender is None:
+                sender = BluetoothBackend()
+                # Общие хранилища: один файл на диске - один владелец
+                sender.tuning = self.backend.tuning
+                sender.keys = self.backend.keys
+                sender.on_progress = lambda percent, address=address: self._report_progress(address, percent)
+                self._senders[address] = sender
+        sender.on_transfer_finished = self.on_transfer_finished
+        if self.backend.channel_resolver:
+            sender.set_channel_resolver(self.backend.channel_resolver)
+        sender.set_encryption_enabled(self.backend.encryption_enabled)
+        sender.set_rate_limit(self.rate_limit)
+        if self.ack_interval is not None:
+            sender.set_ack_interval(self.ack_interval)
+        return sender
+    
+    def _report_progress(self, address: str, percent: int):
+        # Библиотека сообщает прогресс на каждый чанк - дальше уходят только изменения
+        if self._percent.get(address) == percent:
+            return
+        self._percent[address] = percent
+        if self.on_progress:
+            self.on_progress(address, percent)
+    
+    def _send_one(self, source: BroadcastSource, address: str, results: Dict[str, Tuple[bool, str]]):
+        ok, error = False, ""
+        try:
+            sender = self._sender(address)
+            # Сервер принимает один файл на соединение
+            if not sender.connect_to_device(address):
+                raise RuntimeError(sender.get_last_error())
+            # Подключение сбрасывает флаг прерывания в библиотеке - отмену, пришедшую
+            # во время подключения, проверяем здесь
+            with self._lock:
+                cancelled = self._cancelled
+            if cancelled:
+                sender.disconnect_device()
+                raise RuntimeError("Рассылка прервана")
+            sender.set_broadcast_source(source)
+            try:
+                ok = sender.send_file()
+            finally:
+                # Источник удаляется после рассылки - ссылка на него не должна остаться
+                sender.set_broadcast_source(None)
+            if not ok:
+                error = sender.get_last_error()
+        except Exception as e:
+            error = str(e)
+        results[address] = (ok, error)
+        self.logger.info(f"Рассылка на {address}: {'успешно' if ok else error}")
+        if self.on_device_finished:
+            try:
+                self.on_device_finished(address, ok, error)
+            except Exception as e:
+                self.logger.error(f"Ошибка в callback завершения рассылки: {e}")
+
+# Синхронизация каталога с устройством
+SYNC_MANIFEST_FILE = 'sync_manifest.json'
+SYNC_IGNORED_SUFFIXES = ('.tmp', '.part', '.crdownload', '~')
+# Повтор неудачной отправки: задержка удваивается с каждой неудачей подряд
+SYNC_RETRY_BASE_DELAY = 5.0
+SYNC_RETRY_MAX_DELAY = 300.0
+
+class SyncManifest:
+    """Что уже есть на каждом устройстве: путь -> mtime, размер и хэш отправленной версии"""
+    
+    def __init__(self, manifest_path: str = SYNC_MANIFEST_FILE):
+        self.manifest_path = manifest_path
+        self._lock = threading.Lock()
+        self._devices: Dict[str, Dict[str, dict]] = {}
+        self._dirty = False
+        self.logger = logging.getLogger('backend')
+        self._load()
+    
+    def get(self, address: str, name: str) -> Optional[dict]:
+        """Запись об отправленной версии файла"""
+        with self._lock:
+            return self._devices.get(address, {}).get(name)
+    
+    def mark(self, address: str, name: str, mtime_ns: int, size: int, digest: str):
+        """Файл доставлен на устройство"""
+        with self._lock:
+            self._devices.setdefault(address, {})[name] = {
+                "mtime_ns": mtime_ns, "size": size, "sha1": digest,
+            }
+            self._dirty = True
+    
+    def files(self, address: str) -> Dict[str, dict]:
+        """Все файлы, отправленные на устройство"""
+        with self._lock:
+            return dict(self._devices.get(address, {}))
+    
+    def forget_device(self, address: str):
+        """Сброс манифеста устройства (например, на нем очищена папка)"""
+        with self._lock:
+            if self._devices.pop(address, None) is not None:
+                self._dirty = True
+    
+    def _load(self):
+        try:
+            with open(self.manifest_path, encoding='utf-8') as f:
+                self._devices = json.load(f)
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            self.logger.warning(f"Манифест синхронизации поврежден, будет перестроен: {e}")
+    
+    def save(self):
+        """Сохранение манифеста на диск (атомарно)"""
+        with self._lock:
+            if not self._dirty:
+                return
+            data = json.dumps(self._devices, ensure_ascii=False)
+            self._dirty = False
+        tmp_path = self.manifest_path + ".tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(data)
+            os.replace(tmp_path, self.manifest_path)
+        except OSError as e:
+            self.logger.error(f"Не удалось сохранить манифест синхронизации: {e}")
+
+class FolderWatcher:
+    """Наблюдение за каталогом опросом по индексу mtime/размеров с подавлением всплесков"""
+    
+    def __init__(self, root: str, interval: float = 2.0, debounce: float = 3.0):
+        self.root = os.path.abspath(root)
+        self.interval = interval
+        self.debounce = debounce  # файл считается готовым, если не менялся столько секунд
+        self._index: Dict[str, tuple] = {}
+        self._settling: Dict[str, float] = {}
+        self._invalidated: Dict[str, float] = {}  # путь -> когда сообщить повторно (monotonic)
+        self._invalidated_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.logger = logging.getLogger('backend')
+        
+        # Callback со списком готовых новых/измененных файлов (из потока наблюдателя)
+        self.on_files_changed = None
+    
+    def start(self):
+        """Запуск фонового опроса"""
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="folder-watcher", daemon=True)
+        self._thread.start()
+    
+    def stop(self) -> bool:
+        """Остановка опроса; False - поток не завершился за время ожидания"""
+        self._stop_event.set()
+        stopped = True
+        if self._thread:
+            self._thread.join(timeout=5)
+            stopped = not self._thread.is_alive()
+            self._thread = None
+        return stopped
+    
+    def invalidate(self, path: str, delay: float = 0.0):
+        """Повторно сообщить о файле на проходе не раньше чем через delay секунд"""
+        with self._invalidated_lock:
+            self._invalidated[path] = time.monotonic() + delay
+    
+    def scan(self) -> List[str]:
+        """Один проход: возвращает файлы, изменения которых улеглись"""
+        now = time.monotonic()
+        with self._invalidated_lock:
+            due = [path for path, when in self._invalidated.items() if when <= now]
+            for path in due:
+                del self._invalidated[path]
+        for path in due:
+            self._index.pop(path, None)
+        seen = {}
+        for path, key in self._walk(self.root):
+            seen[path] = key
+            if self._index.get(path) != key:
+                self._settling[path] = now
+        
+        for path in set(self._settling) - set(seen):
+            del self._settling[path]
+        self._index = seen
+        
+        ready = [path for path, changed in self._settling.items() if now - changed >= self.debounce]
+        for path in ready:
+            del self._settling[path]
+        return sorted(ready)
+    
+    def _walk(self, directory: str):
+        try:
+            entries = list(os.scandir(directory))
+        except OSError as e:
+            self.logger.warning(f"Не удалось прочитать каталог {directory}: {e}")
+            return
+        for entry in entries:
+            if entry.name.startswith('.') or entry.name.endswith(SYNC_IGNORED_SUFFIXES):
+                continue
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    yield from self._walk(entry.path)
+                elif entry.is_file():
+                    stat = entry.stat()
+                    yield entry.path, (stat.st_mtime_ns, stat.st_size)
+            except OSError:
+                continue
+    
+    def _run(self):
+        while True:
+            try:
+                ready = self.scan()
+                if ready and self.on_files_changed:
+                    self.on_files_changed(ready)
+            except Exception as e:
+                self.logger.error(f"Ошибка наблюдения за каталогом: {e}")
+            if self._stop_event.wait(self.interval):
+                return
+
+class FolderSync:
+    """Автоотправка новых и измененных файлов каталога на выбранное устройство"""
+    
+    def __init__(self, scheduler: TransferScheduler, manifest: SyncManifest, root: str,
+                 address: str, interval: float = 2.0, debounce: float = 3.0):
+        self.scheduler = scheduler
+        self.manifest = manifest
+        self.address = address
+        self.watcher = FolderWatcher(root, interval, debounce)
+        self.watcher.on_files_changed = self._on_files_changed
+        self._lock = threading.Lock()
+        self._jobs: Dict[int, tuple] = {}  # id задания -> (путь, имя, mtime_ns, размер, хэш)
+        self._in_flight: Set[str] = set()
+        self._changed_in_flight: Set[str] = set()
+        self._failures: Dict[str, int] = {}  # неудачных отправок подряд
+        self._owners: Dict[str, str] = {}  # имя файла у получателя -> путь в каталоге
+        self.files_sent = 0
+        self.files_skipped = 0
+        self.logger = logging.getLogger('backend')
+    
+    @property
+    def root(self) -> str:
+        return self.watcher.root
+    
+    def start(self):
+        """Запуск синхронизации: сначала отправляется все, чего нет у устройства"""
+        self.logger.info(f"Синхронизация {self.root} -> {self.address}")
+        self.watcher.start()
+    
+    def stop(self) -> bool:
+        """Остановка синхронизации; уже поставленные задания отменяются.
+        False - поток наблюдения не завершился за время ожидания"""
+        stopped = self.watcher.stop()
+        with self._lock:
+            job_ids = list(self._jobs)
+        for job_id in job_ids:
+            self.scheduler.cancel(job_id)
+        self.manifest.save()
+        return stopped
+    
+    def pending(self) -> int:
+        """Число файлов в очереди на отправку"""
+        with self._lock:
+            return len(self._jobs)
+    
+    def _name(self, path: str) -> str:
+        return os.path.relpath(path, self.root).replace(os.sep, '/')
+    
+    def _on_files_changed(self, paths: List[str]):
+        for path in paths:
+            with self._lock:
+                if path in self._in_flight:
+                    # Файл изменился во время отправки - проверим после завершения
+                    self._changed_in_flight.add(path)
+                    continue
+            self._consider(path)
+    
+    def _consider(self, path: str):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return
+        # Получатель сохраняет файл под именем без подкаталогов (регистр на Windows не
+        # различается): файлы с одним именем из разных подкаталогов затирали бы друг друга
+        remote_name = os.path.basename(path).lower()
+        with self._lock:
+            owner = self._owners.get(remote_name)
+            if owner is None or owner == path or not os.path.exists(owner):
+                self._owners[remote_name] = path
+                owner = None
+        if owner is not None:
+            self.logger.error(f"Синхронизация: {self._name(path)} не отправлен - у получателя "
+                              f"он совпадет с {self._name(owner)}")
+            return
+        name = self._name(path)
+        sent = self.manifest.get(self.address, name)
+        if sent and (sent["mtime_ns"], sent["size"]) == (stat.st_mtime_ns, stat.st_size):
+            return
+        try:
+            digest = file_digest(path)
+        except OSError as e:
+            self.logger.warning(f"Не удалось прочитать {path}: {e}")
+            return
+        if sent and sent["sha1"] == digest:
+            # Изменилась только дата - содержимое у устройства уже есть
+            self.manifest.mark(self.address, name, stat.st_mtime_ns, stat.st_size, digest)
+            self.files_skipped += 1
+            return
+        
+        with self._lock:
+            job = self.scheduler.submit(path, TransferJob.BULK, address=self.address)
+            self._jobs[job.id] = (path, name, stat.st_mtime_ns, stat.st_size, digest)
+            self._in_flight.add(path)
+        self.logger.info(f"Синхронизация: {name} поставлен в очередь ({job})")
+    
+    def on_job_finished(self, job: TransferJob) -> bool:
+        """Учет завершенного задания; False - задание не относится к синхронизации"""
+        with self._lock:
+            record = self._jobs.pop(job.id, None)
+            if record is None:
+                return False
+            path = record[0]
+            self._in_flight.discard(path)
+            recheck = path in self._changed_in_flight
+            self._changed_in_flight.discard(path)
+            if job.state == "done":
+                self._failures.pop(path, None)
+                failures = 0
+            else:
+                failures = self._failures[path] = self._failures.get(path, 0) + 1
+        
+        if job.state == "done":
+            self.manifest.mark(self.address, *record[1:])
+            self.manifest.save()
+            self.files_sent += 1
+            if recheck:
+                self.watcher.invalidate(path)
+        else:
+            # Неудачная или отмененная отправка повторяется с растущей задержкой; изменение
+            # файла во время отправки проверяется сразу
+            delay = 0.0 if recheck else min(SYNC_RETRY_MAX_DELAY, SYNC_RETRY_BASE_DELAY * 2 ** (failures - 1))
+            self.logger.info(f"Синхронизация: {record[1]} не отправлен ({job.state}), "
+                             f"повтор через {delay:.0f} с")
+            self.watcher.invalidate(path, delay)
+        return True
+
+# Хранение полученных файлов
+RECEIVED_FILES_DIR = 'received_files'
+RETENTION_INDEX_FILE = 'retention_index.json'
+
+class RetentionPolicy:
+    """Очистка полученных файлов: лимит объема, срок хранения и вытеснение давно не игравших"""
+    
+    def __init__(self, root: str = RECEIVED_FILES_DIR, index_path: str = RETENTION_INDEX_FILE,
+                 interval: float = 60.0):
+        self.root = os.path.abspath(root)
+        self.index_path = index_path
+        self.interval = interval
+        self.max_bytes = 0    # 0 - без лимита
+        self.max_age = 0.0    # секунды с последнего использования, 0 - бессрочно
+        self._lock = threading.Lock()
+        # путь -> [размер, mtime_ns, последнее использование]; в начале - давно не использованные
+        self._files: "OrderedDict[str, list]" = OrderedDict()
+        self._total = 0
+        self._dir_mtime_ns = 0  # каталог с другим mtime изменен извне - нужна пересборка
+        self._dirty = False
+        self._wake_event = threading.Event()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.reclaimed_total = 0
+        self.logger = logging.getLogger('server')
+        
+        # path -> True, если файл сейчас открыт (играет, принимается)
+        self.is_protected = None
+        # Callback со списком удаленных файлов (из фонового потока)
+        self.on_files_removed = None
+        
+        self._load()
+    
+    def configure(self, max_bytes: int, max_age: float):
+        """Новые лимиты (сохраняются вместе с индексом); проверка выполняется сразу"""
+        with self._lock:
+            if (max_bytes, max_age) != (self.max_bytes, self.max_age):
+                self._dirty = True
+            self.max_bytes = max_bytes
+            self.max_age = max_age
+        self.wake()
+    
+    def wake(self):
+        """Внеочередной проход очистки"""
+        self._wake_event.set()
+    
+    def start(self):
+        """Запуск фоновой очистки"""
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="retention", daemon=True)
+        self._thread.start()
+    
+    def stop(self):
+        """Остановка очистки и сохранение индекса"""
+        self._stop_event.set()
+        self._wake_event.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+        self.save()
+    
+    def total_bytes(self) -> int:
+        with self._lock:
+            return self._total
+    
+    def files(self) -> List[tuple]:
+        """Каталог полученных файлов: (путь, размер, время изменения)"""
+        with self._lock:
+            return [(path, size, mtime_ns / 1e9) for path, (size, mtime_ns, _) in self._files.items()]
+    
+    def note_file(self, path: str):
+        """Файл принят (или принята новая версия) - он становится самым свежим"""
+        path = os.path.abspath(path)
+        if path.endswith(RECEIVE_PART_SUFFIX):
+            return
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return
+        with self._lock:
+            old = self._files.pop(path, None)
+            if old:
+                self._total -= old[0]
+            self._files[path] = [stat.st_size, stat.st_mtime_ns, time.time()]
+            self._total += stat.st_size
+            self._sync_dir_mtime()
+            self._dirty = True
+            over_quota = self.max_bytes and self._total > self.max_bytes
+        if over_quota:
+            self.wake()
+    
+    def note_receiving(self):
+        """Начат прием во временный файл: каталог изменил приемник, пересборка не нужна
+        
+        Временный файл в индекс не попадает; принятый файл добавит note_file.
+        """
+        with self._lock:
+            self._sync_dir_mtime()
+    
+    def touch(self, path: str):
+        """Файл воспроизводится - переносится в конец очереди вытеснения"""
+        path = os.path.abspath(path)
+        with self._lock:
+            entry = self._files.get(path)
+            if entry:
+                entry[2] = time.time()
+                self._files.move_to_end(path)
+                self._dirty = True
+    
+    def forget(self, path: str):
+        """Файл удален не через политику хранения"""
+        path = os.path.abspath(path)
+        with self._lock:
+            entry = self._files.pop(path, None)
+            if entry:
+                self._total -= entry[0]
+                self._sync_dir_mtime()
+                self._dirty = True
+    
+    def enforce(self) -> List[str]:
+        """Один проход очистки; возвращает удаленные файлы"""
+        self._refresh()
+        now = time.time()
+        victims = []
+        with self._lock:
+            projected = self._total
+            # Очередь упорядочена по последнему использованию: просмотр идет с начала и
+            # останавливается на первом файле, который не просрочен и не выходит за лимит
+            for path, (size, _, used) in self._files.items():
+                expired = self.max_age and now - used > self.max_age
+                over_quota = self.max_bytes and projected > self.max_bytes
+                if not expired and not over_quota:
+                    break
+                if self.is_protected and self.is_protected(path):
+                    continue
+                victims.append((path, size, "срок хранения" if expired else "лимит объема"))
+                projected -= size
+        
+        removed = []
+        reclaimed = 0
+        for path, size, reason in victims:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                # Файл занят (Windows) - повторим на следующем проходе
+                self.logger.warning(f"Не удалось удалить {path}: {e}")
+                continue
+            self.logger.info(f"Удален полученный файл ({reason}): {os.path.basename(path)}")
+            self.forget(path)
+            removed.append(path)
+            reclaimed += size
+        
+        if removed:
+            self.reclaimed_total += reclaimed
+            self.logger.info(f"Очистка полученных файлов: удалено {len(removed)}, освобождено "
+                             f"{reclaimed / (1024 * 1024):.1f} МБ, занято "
+                             f"{self.total_bytes() / (1024 * 1024):.1f} МБ")
+        return removed
+    
+    def _sync_dir_mtime(self):
+        # Свои изменения каталога не требуют пересборки индекса
+        try:
+            self._dir_mtime_ns = os.stat(self.root).st_mtime_ns
+        except OSError:
+            pass
+    
+    def _refresh(self):
+        """Пересборка индекса, только если каталог изменен не через эту политику
+        
+        Прием сообщает о своих изменениях каталога сам (note_receiving, note_file), поэтому
+        полный просмотр нужен при первом запуске и после изменений извне.
+        """
+        try:
+            dir_mtime_ns = os.stat(self.root).st_mtime_ns
+        except OSError:
+            return
+        if dir_mtime_ns == self._dir_mtime_ns:
+            return
+        
+        seen = {}
+        try:
+            with os.scandir(self.root) as entries:
+                for entry in entries:
+                    if entry.name.endswith(SYNC_IGNORED_SUFFIXES):
+                        continue
+                    try:
+                        if entry.is_file():
+                            stat = entry.stat()
+                            seen[os.path.abspath(entry.path)] = (stat.st_size, stat.st_mtime_ns)
+                    except OSError:
+                        continue
+        except OSError as e:
+            self.logger.warning(f"Не удалось прочитать каталог {self.root}: {e}")
+            return
+        
+        with self._lock:
+            files = []
+            for path, (size, mtime_ns) in seen.items():
+                entry = self._files.get(path)
+                if entry and entry[:2] == [size, mtime_ns]:
+                    files.append((path, entry))
+                else:
+                    # Новый или измененный извне файл: использован в момент изменения
+                    files.append((path, [size, mtime_ns, mtime_ns / 1e9]))
+            files.sort(key=lambda item: item[1][2])
+            self._files = OrderedDict(files)
+            self._total = sum(entry[0] for entry in self._files.values())
+            self._dir_mtime_ns = dir_mtime_ns
+            self._dirty = True
+        self.logger.debug(f"Индекс полученных файлов пересобран: {len(seen)} файлов")
+    
+    def _run(self):
+        while not self._stop_event.is_set():
             try:
-                logger.info("Уничтожение экземпляра ServerThread")
-                self.lib.destroyServerThread(self.instance)
-                self.instance = None
+                removed = self.enforce()
+                if removed and self.on_files_removed:
+                    self.on_files_removed(removed)
+                self.save()
             except Exception as e:
-                logger.error(f"Ошибка при уничтожении экземпляра сервера: {e}")
+                self.logger.error(f"Ошибка очистки полученных файлов: {e}")
+            self._wake_event.wait(self.interval)
+            self._wake_event.clear()
+    
+    def _load(self):
+        try:
+            with open(self.index_path, encoding='utf-8') as f:
+                data = json.load(f)
+            files = sorted(data["files"].items(), key=lambda item: item[1][2])
+            self._files = OrderedDict(files)
+            self._total = sum(entry[0] for entry in self._files.values())
+            self._dir_mtime_ns = data["dir_mtime_ns"]
+            self.max_bytes = int(data.get("max_bytes", 0))
+            self.max_age = float(data.get("max_age", 0.0))
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError, IndexError, TypeError) as e:
+            self._files = OrderedDict()
+            self.logger.warning(f"Индекс полученных файлов поврежден, будет перестроен: {e}")
+    
+    def save(self):
+        """Сохранение индекса на диск (атомарно)"""
+        with self._lock:
+            if not self._dirty:
+                return
+            data = json.dumps({"dir_mtime_ns": self._dir_mtime_ns, "files": self._files,
+                               "max_bytes": self.max_bytes, "max_age": self.max_age},
+                              ensure_ascii=False)
+            self._dirty = False
+        tmp_path = self.index_path + ".tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(data)
+            os.replace(tmp_path, self.index_path)
+        except OSError as e:
+            self.logger.error(f"Не удалось сохранить индекс полученных файлов: {e}")
+
+# Извлечение метаданных аудиофайлов
+METADATA_INDEX_FILE = 'metadata_index.json'
+
+class AudioMetadataIndex:
+    """Кэш метаданных по ключу путь+mtime+размер с фоновым извлечением"""
+    
+    def __init__(self, index_path: str = METADATA_INDEX_FILE, workers: Optional[int] = None):
+        self.index_path = index_path
+        self._lock = threading.Lock()
+        self._entries: Dict[str, dict] = {}
+        self._pending: Set[str] = set()
+        self._dirty = False
+        self._executor = ThreadPoolExecutor(max_workers=workers or min(4, os.cpu_count() or 1),
+                                            thread_name_prefix="metadata")
+        self.logger = logging.getLogger('player')
+        
+        # Callback при готовности метаданных (вызывается из рабочего потока)
+        self.on_metadata_ready = None
+        
+        self._load()
+    
+    @staticmethod
+    def _key(path: str) -> Optional[tuple]:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+    
+    def lookup(self, path: str) -> Optional[dict]:
+        """Метаданные из кэша, если файл не изменился"""
+        path = os.path.abspath(path)
+        key = self._key(path)
+        with self._lock:
+            entry = self._entries.get(path)
+        if entry and key and (entry["mtime_ns"], entry["size"]) == key:
+            return entry
+        return None
+    
+    def get(self, path: str) -> Optional[dict]:
+        """Метаданные из кэша; при промахе ставит извлечение в очередь"""
+        entry = self.lookup(path)
+        if entry is None:
+            self.request(path)
+        return entry
+    
+    def request(self, path: str):
+        """Фоновое извлечение метаданных"""
+        path = os.path.abspath(path)
+        with self._lock:
+            if path in self._pending:
+                return
+            self._pending.add(path)
+        self._executor.submit(self._extract, path)
+    
+    def _extract(self, path: str):
+        try:
+            key = self._key(path)
+            if key is None:
+                return
+            try:
+                entry = extract_audio_metadata(path)
+            except Exception as e:
+                self.logger.warning(f"Не удалось прочитать метаданные {path}: {e}")
+                entry = {"codec": None, "duration": None, "bitrate": None,
+                         "sample_rate": None, "channels": None, "tags": {}}
+            entry["mtime_ns"], entry["size"] = key
+            with self._lock:
+                self._entries[path] = entry
+                self._dirty = True
+        finally:
+            with self._lock:
+                self._pending.discard(path)
+        
+        if self.on_metadata_ready:
+            try:
+                self.on_metadata_ready(path, entry)
+            except Exception as e:
+                self.logger.error(f"Ошибка в callback метаданных: {e}")
+    
+    def store(self, path: str, entry: Optional[dict]):
+        """Метаданные, извлеченные в другом месте (процессом-обработчиком приема)"""
+        key = self._key(path)
+        if entry is None or key is None:
+            return
+        entry = dict(entry)
+        entry["mtime_ns"], entry["size"] = key
+        with self._lock:
+            self._entries[os.path.abspath(path)] = entry
+            self._dirty = True
+    
+    def forget(self, path: str):
+        """Удаление записи (файл удален)"""
+        with self._lock:
+            if self._entries.pop(os.path.abspath(path), None) is not None:
+                self._dirty = True
+    
+    def _load(self):
+        try:
+            with open(self.index_path, encoding='utf-8') as f:
+                self._entries = json.load(f)
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            self.logger.warning(f"Индекс метаданных поврежден, будет перестроен: {e}")
+    
+    def save(self):
+        """Сохранение индекса на диск (атомарно)"""
+        with self._lock:
+            if not self._dirty:
+                return
+            data = json.dumps(self._entries, ensure_ascii=False)
+            self._dirty = False
+        tmp_path = self.index_path + ".tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(data)
+            os.replace(tmp_path, self.index_path)
+        except OSError as e:
+            self.logger.error(f"Не удалось сохранить индекс метаданных: {e}")
+    
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self.save()
+
+def received_target_path(part_path: str) -> str:
+    """Имя, под которым сохранится принимаемый файл (сервис пишет в <имя>.<pid>-<n>.part)"""
+    if not part_path.endswith(RECEIVE_PART_SUFFIX):
+        return part_path
+    base = part_path[:-len(RECEIVE_PART_SUFFIX)]
+    stem, dot, token = base.rpartition('.')
+    pid, dash, seq = token.partition('-')
+    if dot and dash and pid.isdigit() and seq.isdigit():
+        return stem
+    return base
+
+def open_shared_read(path: str):
+    """Открытие на чтение, не мешающее сервису переименовать или удалить файл: на Windows
+    open() запрещает это, пока файл открыт, а принятый файл переносится на место из .part"""
+    if os.name != 'nt':
+        return open(path, 'rb')
+    import msvcrt
+    kernel32 = ctypes.WinDLL('kernel32', use_last_error=True)
+    kernel32.CreateFileW.restype = c_void_p
+    kernel32.CreateFileW.argtypes = [ctypes.c_wchar_p, ctypes.c_ulong, ctypes.c_ulong, c_void_p,
+                                     ctypes.c_ulong, ctypes.c_ulong, c_void_p]
+    GENERIC_READ = 0x80000000
+    FILE_SHARE_READ_WRITE_DELETE = 0x7
+    OPEN_EXISTING = 3
+    handle = kernel32.CreateFileW(path, GENERIC_READ, FILE_SHARE_READ_WRITE_DELETE, None,
+                                  OPEN_EXISTING, 0, None)
+    if handle is None or handle == ctypes.c_void_p(-1).value:
+        raise ctypes.WinError(ctypes.get_last_error())
+    try:
+        fd = msvcrt.open_osfhandle(handle, os.O_RDONLY | os.O_BINARY)
+    except OSError:
+        kernel32.CloseHandle(c_void_p(handle))
+        raise
+    return os.fdopen(fd, 'rb')
+
+class GrowingFileReader(io.RawIOBase):
+    """Чтение файла, который еще принимается: read() ждет поступления данных"""
+    
+    POLL_INTERVAL = 0.05   # секунды между проверками размера файла
+    STALL_TIMEOUT = 10.0   # как SO_RCVTIMEO на сервере
+    
+    def __init__(self, path: str, total_size: int):
+        super().__init__()
+        self.path = path
+        self.target_path = received_target_path(path)
+        self.total_size = total_size
+        self.namehint = os.path.splitext(self.target_path)[1].lstrip('.') or "mp3"
+        self._file = open_shared_read(path)
+        self._cond = threading.Condition()
+        self._finished = False
+        self._aborted = False
+        self.waiting = False  # декодер ждет данных из сети
+    
+    def readable(self) -> bool:
+        return True
+    
+    def seekable(self) -> bool:
+        return True
+    
+    def received(self) -> int:
+        """Сколько байт уже записано на диск"""
+        if self._finished:
+            return self.total_size
+        return os.fstat(self._file.fileno()).st_size
+    
+    def buffered(self) -> int:
+        """Запас данных впереди позиции чтения"""
+        return max(0, self.received() - self._file.tell())
+    
+    def is_finished(self) -> bool:
+        return self._finished
+    
+    def finish(self):
+        """Файл принят полностью"""
+        with self._cond:
+            self._finished = True
+            self._cond.notify_all()
+    
+    def abort(self):
+        """Прием прерван или воспроизведение остановлено: чтение вернет EOF"""
+        with self._cond:
+            self._aborted = True
+            self._cond.notify_all()
+    
+    def readinto(self, buffer) -> int:
+        want = len(buffer)
+        deadline = time.monotonic() + self.STALL_TIMEOUT
+        with self._cond:
+            # Троттлинг: декодер ждет, пока сеть не догонит позицию чтения
+            while not self._aborted and not self._finished:
+                position = self._file.tell()
+                if position >= self.total_size or self.received() - position >= min(want, self.total_size - position):
+                    break
+                if time.monotonic() >= deadline:
+                    player_logger.warning(f"Нет данных от сети дольше {self.STALL_TIMEOUT} с: {self.path}")
+                    break
+                self.waiting = True
+                self._cond.wait(self.POLL_INTERVAL)
+            self.waiting = False
+            if self._aborted:
+                return 0
+        return self._file.readinto(buffer)
+    
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        # Конец файла - ожидаемый размер, а не текущий
+        if whence == io.SEEK_END:
+            return self._file.seek(self.total_size + offset)
+        return self._file.seek(offset, whence)
+    
+    def tell(self) -> int:
+        return self._file.tell()
+    
+    def close(self):
+        self.abort()
+        if not self._file.closed:
+            self._file.close()
+        super().close()
+
+class DecodedAudioCache:
+    """LRU-кэш декодированных треков (pygame.mixer.Sound) в пределах бюджета памяти"""
+    
+    def __init__(self, budget_bytes: int = 64 * 1024 * 1024):
+        self.budget_bytes = budget_bytes
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # path -> (key, sound, size)
+        self._lock = threading.Lock()
+        self.used_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    @staticmethod
+    def _key(path: str):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+    
+    @staticmethod
+    def sound_size(sound) -> int:
+        """Объем PCM-данных звука в памяти"""
+        frequency, sample_format, channels = pygame.mixer.get_init()
+        return int(sound.get_length() * frequency) * channels * (abs(sample_format) // 8)
+    
+    def get(self, path: str):
+        """Декодированный трек из кэша или None"""
+        path = os.path.abspath(path)
+        key = self._key(path)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry and entry[0] == key:
+                self._entries.move_to_end(path)
+                self.hits += 1
+                return entry[1]
+            if entry:
+                # Файл изменился - копия устарела
+                self._drop(path)
+            self.misses += 1
+        return None
+    
+    def put(self, path: str, sound) -> bool:
+        """Добавление трека; вытесняет давно не игравшие треки"""
+        path = os.path.abspath(path)
+        key = self._key(path)
+        size = self.sound_size(sound)
+        if key is None or size > self.budget_bytes:
+            return False
+        with self._lock:
+            if path in self._entries:
+                self._drop(path)
+            self._entries[path] = (key, sound, size)
+            self.used_bytes += size
+            self._shrink()
+        return True
+    
+    def load(self, path: str):
+        """Трек из кэша, при промахе - декодирование с диска и добавление в кэш"""
+        sound = self.get(path)
+        if sound is None:
+            sound = pygame.mixer.Sound(file=path)
+            self.put(path, sound)
+        return sound
+    
+    def contains(self, path: str) -> bool:
+        """Проверка наличия актуальной копии без учета в статистике"""
+        path = os.path.abspath(path)
+        with self._lock:
+            entry = self._entries.get(path)
+        return bool(entry) and entry[0] == self._key(path)
+    
+    def forget(self, path: str):
+        """Удаление трека из кэша"""
+        with self._lock:
+            self._drop(os.path.abspath(path))
+    
+    def set_budget(self, budget_bytes: int):
+        """Изменение бюджета памяти"""
+        with self._lock:
+            self.budget_bytes = budget_bytes
+            self._shrink()
+    
+    def clear(self):
+        """Очистка кэша"""
+        with self._lock:
+            self._entries.clear()
+            self.used_bytes = 0
+    
+    def stats(self) -> dict:
+        """Статистика попаданий и занятой памяти"""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                    "entries": len(self._entries), "used_bytes": self.used_bytes,
+                    "budget_bytes": self.budget_bytes}
+    
+    def _drop(self, path: str):
+        entry = self._entries.pop(path, None)
+        if entry:
+            self.used_bytes -= entry[2]
+    
+    def _shrink(self):
+        while self.used_bytes > self.budget_bytes and self._entries:
+            _, (_, _, size) = self._entries.popitem(last=False)
+            self.used_bytes -= size
+            self.evictions += 1
 
 class MusicPlayer:
     """Простой музыкальный плеер на pygame"""
@@ -437,64 +3519,606 @@ class MusicPlayer:
             pygame.mixer.init(frequency=44100, size=-16, channels=2, buffer=4096)
             self.current_file = None
             self.is_playing = False
-            logger.info("Музыкальный плеер инициализирован")
+            player_logger.info("Музыкальный плеер инициализирован")
         except Exception as e:
-            logger.error(f"Ошибка инициализации музыкального плеера: {e}")
+            player_logger.error(f"Ошибка инициализации музыкального плеера: {e}")
             self.current_file = None
             self.is_playing = False
+        self.stream: Optional[GrowingFileReader] = None
+        self.volume = 1.0
+        
+        # Плейлист с предзагрузкой следующего трека
+        self.playlist: List[str] = []
+        self.playlist_index = -1
+        self.crossfade_ms = 0  # 0 - бесшовный переход через music.queue()
+        self.duration_lookup = None  # path -> длительность в секундах или None
+        self.on_track_changed = None  # вызывается из tick() в потоке GUI
+        self.cache: Optional[DecodedAudioCache] = None  # None - кэш отключен
+        self._preloader = ThreadPoolExecutor(max_workers=1, thread_name_prefix="preload")
+        self._next = None
+        self._next_index = -1
+        self._queued = False
+        self._last_pos = 0
+        
+        # Воспроизведение через канал микшера (трек после кроссфейда)
+        self._sound = None
+        self._channel = None
+        self._track_started = 0.0
+        self._paused_at = None
     
     def play(self, file_path: str) -> bool:
         """Воспроизведение файла"""
+        self._reset_playlist()
         try:
             if not os.path.exists(file_path):
-                logger.error(f"Файл не существует: {file_path}")
+                player_logger.error(f"Файл не существует: {file_path}")
                 return False
             
-            if self.current_file != file_path:
-                pygame.mixer.music.load(file_path)
-                self.current_file = file_path
+            sound = self.cache.get(file_path) if self.cache else None
+            if sound is not None:
+                # Повторное воспроизведение из памяти, без чтения и декодирования
+                self._start_sound(file_path, sound)
+            elif self.current_file != file_path or self._channel:
+                self._start_music(file_path)
+                self._cache_in_background(file_path)
+            else:
+                pygame.mixer.music.play()
+                self._mark_started()
+                self._cache_in_background(file_path)
             
+            self.is_playing = True
+            player_logger.info(f"Воспроизведение файла: {os.path.basename(file_path)}")
+            return True
+        except Exception as e:
+            player_logger.error(f"Ошибка воспроизведения: {e}")
+            return False
+    
+    def play_stream(self, reader: GrowingFileReader) -> bool:
+        """Воспроизведение файла, который еще принимается"""
+        self._reset_playlist()
+        try:
+            self._stop_channel()
+            self._close_stream()
+            pygame.mixer.music.load(reader, reader.namehint)
+            self.stream = reader
+            self.current_file = reader.target_path
             pygame.mixer.music.play()
+            self._mark_started()
             self.is_playing = True
-            logger.info(f"Воспроизведение файла: {os.path.basename(file_path)}")
+            player_logger.info(f"Потоковое воспроизведение: {os.path.basename(reader.target_path)} "
+                               f"(буфер {reader.received()} из {reader.total_size} байт)")
             return True
         except Exception as e:
-            logger.error(f"Ошибка воспроизведения: {e}")
+            player_logger.error(f"Ошибка потокового воспроизведения: {e}")
+            return False
+    
+    def play_playlist(self, paths: List[str], index: int = 0) -> bool:
+        """Воспроизведение списка файлов с предзагрузкой следующего трека"""
+        self._reset_playlist()
+        self.playlist = list(paths)
+        return self._play_index(index)
+    
+    def enqueue(self, file_path: str):
+        """Добавление файла в конец плейлиста"""
+        self.playlist.append(file_path)
+        if self._next is None and self.playlist_index >= 0:
+            self._schedule_preload()
+    
+    def next_track(self) -> bool:
+        """Переход к следующему треку плейлиста"""
+        if 0 <= self.playlist_index < len(self.playlist) - 1:
+            return self._play_index(self.playlist_index + 1)
+        return False
+    
+    def tick(self):
+        """Переходы между треками; вызывается периодически из потока GUI"""
+        if self.playlist_index < 0 or not self.is_playing:
+            return
+        
+        ready = self._next.result() if self._next and self._next.done() else None
+        if ready and ready[0] is None:
+            ready = None  # предзагрузка не удалась - переключимся с диска
+        
+        # Кроссфейд: следующий трек уже декодирован, плавно сменяем текущий
+        if self.crossfade_ms and ready and ready[2] is not None:
+            duration = self._current_duration()
+            if duration and duration - self._elapsed() <= self.crossfade_ms / 1000.0:
+                self._crossfade_to(ready)
+                return
+        
+        if self._channel:
+            # Трек из памяти: следующий декодированный трек в очередь канала
+            if (ready and ready[2] is not None and ready[2] is not self._sound
+                    and not self._queued and not self.crossfade_ms):
+                self._channel.queue(ready[2])
+                self._queued = True
+            if self._queued and ready and self._channel.get_sound() is ready[2]:
+                self._sound = ready[2]
+                self._set_current(self._next_index)
+            elif not self._channel.get_busy():
+                self._advance_or_finish(ready)
+            return
+        
+        # Бесшовный переход: следующий трек из памяти в очереди pygame
+        position = pygame.mixer.music.get_pos()
+        if ready and not self._queued and not self.crossfade_ms:
+            try:
+                source = io.BytesIO(ready[1]) if ready[1] is not None else ready[0]
+                pygame.mixer.music.queue(source, self._namehint(ready[0]))
+                self._queued = True
+            except Exception as e:
+                player_logger.warning(f"Не удалось поставить трек в очередь: {e}")
+        
+        if self._queued and 0 <= position < self._last_pos:
+            # pygame сам запустил следующий трек - позиция сбросилась
+            self._set_current(self._next_index)
+        elif not pygame.mixer.music.get_busy():
+            self._advance_or_finish(ready)
+            return
+        self._last_pos = position
+    
+    def _play_index(self, index: int) -> bool:
+        if not 0 <= index < len(self.playlist):
+            return False
+        path = self.playlist[index]
+        ready = self._next.result() if self._next and self._next.done() and self._next_index == index else None
+        sound = ready[2] if ready and ready[0] else None
+        if sound is None and self.cache:
+            sound = self.cache.get(path)
+        try:
+            if sound is not None:
+                self._start_sound(path, sound)
+            else:
+                self._start_music(path, ready[1] if ready and ready[0] else None)
+        except Exception as e:
+            player_logger.error(f"Ошибка воспроизведения {path}: {e}")
             return False
+        self.is_playing = True
+        self._set_current(index)
+        return True
+    
+    def _set_current(self, index: int):
+        self.playlist_index = index
+        self.current_file = self.playlist[index]
+        self._queued = False
+        self._last_pos = 0
+        self._mark_started()
+        player_logger.info(f"Трек плейлиста {index + 1}/{len(self.playlist)}: {os.path.basename(self.current_file)}")
+        self._schedule_preload()
+        if self.on_track_changed:
+            self.on_track_changed(self.current_file)
+    
+    def _advance_or_finish(self, ready):
+        if self.playlist_index < len(self.playlist) - 1:
+            self._play_index(self.playlist_index + 1)
+        else:
+            self.is_playing = False
+            self.playlist_index = -1
+            player_logger.info("Плейлист закончился")
+            if self.on_track_changed:
+                self.on_track_changed(None)
+    
+    def _crossfade_to(self, ready):
+        path, _, sound = ready
+        if self._channel:
+            self._channel.fadeout(self.crossfade_ms)
+        else:
+            pygame.mixer.music.fadeout(self.crossfade_ms)
+        sound.set_volume(self.volume)
+        self._sound = sound
+        self._channel = sound.play(fade_ms=self.crossfade_ms)
+        self._set_current(self._next_index)
+    
+    def _schedule_preload(self):
+        # Чтение (и для кроссфейда - декодирование) следующего трека в фоне
+        self._next = None
+        self._next_index = self.playlist_index + 1
+        if self._next_index < len(self.playlist):
+            self._next = self._preloader.submit(self._load_track, self.playlist[self._next_index],
+                                                self.crossfade_ms > 0 or self.cache is not None)
+    
+    def _load_track(self, path: str, decode: bool):
+        cache = self.cache
+        sound = cache.get(path) if cache else None
+        if sound is not None:
+            return path, None, sound
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except OSError as e:
+            player_logger.warning(f"Не удалось предзагрузить {path}: {e}")
+            return None, None, None
+        if decode:
+            try:
+                sound = pygame.mixer.Sound(file=io.BytesIO(data))
+                if cache:
+                    cache.put(path, sound)
+            except Exception as e:
+                player_logger.warning(f"Не удалось декодировать {path}: {e}")
+        return path, data, sound
+    
+    def _cache_in_background(self, path: str):
+        cache = self.cache
+        if cache is None or cache.contains(path):
+            return
+        
+        def decode():
+            try:
+                cache.put(path, pygame.mixer.Sound(file=path))
+            except Exception as e:
+                player_logger.warning(f"Не удалось декодировать {path} для кэша: {e}")
+        
+        self._preloader.submit(decode)
+    
+    @staticmethod
+    def _namehint(path: str) -> str:
+        return os.path.splitext(path)[1].lstrip('.')
+    
+    def _start_music(self, path: str, data: Optional[bytes] = None):
+        self._stop_channel()
+        self._close_stream()
+        if data is not None:
+            pygame.mixer.music.load(io.BytesIO(data), self._namehint(path))
+        else:
+            pygame.mixer.music.load(path)
+        self.current_file = path
+        pygame.mixer.music.play()
+        self._mark_started()
+    
+    def _start_sound(self, path: str, sound):
+        pygame.mixer.music.stop()
+        self._stop_channel()
+        self._close_stream()
+        sound.set_volume(self.volume)
+        self._sound = sound
+        self._channel = sound.play()
+        self.current_file = path
+        self._mark_started()
+    
+    def _stop_channel(self):
+        if self._channel:
+            self._channel.stop()
+        self._channel = None
+        self._sound = None
+    
+    def _mark_started(self):
+        self._track_started = time.monotonic()
+        self._paused_at = None
+    
+    def _elapsed(self) -> float:
+        now = self._paused_at if self._paused_at is not None else time.monotonic()
+        return now - self._track_started
+    
+    def _current_duration(self) -> Optional[float]:
+        if self._sound:
+            return self._sound.get_length()
+        if self.duration_lookup and self.current_file:
+            return self.duration_lookup(self.current_file)
+        return None
+    
+    def _reset_playlist(self):
+        if self._next:
+            self._next.cancel()
+        self._next = None
+        self._next_index = -1
+        self.playlist = []
+        self.playlist_index = -1
+        self._queued = False
+    
+    def _close_stream(self):
+        if self.stream:
+            # Сначала будим декодер, ожидающий данных, иначе stop() заблокируется
+            self.stream.abort()
+            pygame.mixer.music.unload()
+            self.stream.close()
+            self.stream = None
     
     def pause(self):
         """Пауза воспроизведения"""
         if self.is_playing:
-            pygame.mixer.music.pause()
+            if self._channel:
+                self._channel.pause()
+            else:
+                pygame.mixer.music.pause()
+            self._paused_at = time.monotonic()
             self.is_playing = False
-            logger.info("Воспроизведение приостановлено")
+            player_logger.info("Воспроизведение приостановлено")
     
     def resume(self):
         """Возобновление воспроизведения"""
         if not self.is_playing and self.current_file:
-            pygame.mixer.music.unpause()
+            if self._channel:
+                self._channel.unpause()
+            else:
+                pygame.mixer.music.unpause()
+            if self._paused_at is not None:
+                self._track_started += time.monotonic() - self._paused_at
+                self._paused_at = None
             self.is_playing = True
-            logger.info("Воспроизведение возобновлено")
+            player_logger.info("Воспроизведение возобновлено")
     
     def stop(self):
         """Остановка воспроизведения"""
+        if self.stream:
+            self.stream.abort()
+        self._reset_playlist()
+        self._stop_channel()
         pygame.mixer.music.stop()
+        self._close_stream()
         self.is_playing = False
         self.current_file = None
-        logger.info("Воспроизведение остановлено")
+        player_logger.info("Воспроизведение остановлено")
     
     def set_volume(self, volume: float):
         """Установка громкости (0.0 до 1.0)"""
-        pygame.mixer.music.set_volume(max(0.0, min(1.0, volume)))
+        self.volume = max(0.0, min(1.0, volume))
+        pygame.mixer.music.set_volume(self.volume)
+        if self._sound:
+            self._sound.set_volume(self.volume)
     
     def is_initialized(self) -> bool:
         """Проверка инициализации плеера"""
         return pygame.mixer.get_init() is not None
+    
+    def shutdown(self):
+        """Остановка фоновой предзагрузки"""
+        self._preloader.shutdown(wait=False, cancel_futures=True)
+
+class ReceivedFileEntry:
+    """Запись каталога полученных файлов: только то, что нужно для сортировки и поиска"""
+    __slots__ = ("path", "name", "folded", "size", "mtime", "order")
+    
+    def __init__(self, path: str, size: int, mtime: float):
+        self.path = path
+        self.name = os.path.basename(path)
+        self.folded = self.name.casefold()
+        self.size = size
+        self.mtime = mtime
+        self.order = None  # (ключ сортировки, порядковый номер) - позиция в отсортированном списке
+
+class ReceivedFilesModel(QAbstractListModel):
+    """Виртуальный список полученных файлов для QListView
+    
+    Строки - легкие записи, подпись формируется только для отрисовываемых строк и
+    хранится в ограниченном кэше, поэтому память и время отрисовки зависят от числа
+    видимых строк, а не от размера каталога. Новые файлы вставляются двоичным поиском,
+    фильтр по имени сужает текущий результат, пока запрос только уточняется.
+    """
+    
+    SORT_TIME, SORT_NAME, SORT_SIZE, SORT_DURATION = range(4)
+    LABEL_CACHE_SIZE = 512
+    
+    def __init__(self, formatter: Callable[[str, int], str],
+                 duration_lookup: Callable[[str], Optional[float]], parent=None):
+        super().__init__(parent)
+        self.formatter = formatter
+        self.duration_lookup = duration_lookup
+        self._entries: Dict[str, ReceivedFileEntry] = {}  # абсолютный путь -> запись
+        self._all: List[ReceivedFileEntry] = []           # все записи в порядке сортировки
+        self._rows: List[ReceivedFileEntry] = self._all   # строки, прошедшие фильтр
+        self._sort_mode = self.SORT_TIME
+        self._filter = ""
+        self._labels: "OrderedDict[str, str]" = OrderedDict()
+        self._seq = itertools.count()
+    
+    # Интерфейс QAbstractListModel
+    def rowCount(self, parent=QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self._rows)
+    
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid() or index.row() >= len(self._rows):
+            return None
+        entry = self._rows[index.row()]
+        if role == Qt.ItemDataRole.DisplayRole:
+            return self._label(entry)
+        if role in (Qt.ItemDataRole.UserRole, Qt.ItemDataRole.ToolTipRole):
+            return entry.path
+        return None
+    
+    # Доступ к строкам
+    def path_at(self, row: int) -> Optional[str]:
+        return self._rows[row].path if 0 <= row < len(self._rows) else None
+    
+    def paths(self) -> List[str]:
+        """Видимые файлы в порядке списка (для плейлиста)"""
+        return [entry.path for entry in self._rows]
+    
+    def total_count(self) -> int:
+        return len(self._all)
+    
+    def has_file(self, path: str) -> bool:
+        return os.path.abspath(path) in self._entries
+    
+    def index_of(self, path: str) -> QModelIndex:
+        """Индекс строки файла; недействительный, если файла нет или он скрыт фильтром"""
+        entry = self._entries.get(os.path.abspath(path))
+        if entry is None:
+            return QModelIndex()
+        row = self._find(self._rows, entry)
+        return self.index(row) if row >= 0 else QModelIndex()
+    
+    # Изменение каталога
+    def set_files(self, files):
+        """Загрузка каталога целиком: (путь, размер, время изменения)"""
+        self.beginResetModel()
+        self._entries = {}
+        for path, size, mtime in files:
+            path = os.path.abspath(path)
+            self._entries[path] = ReceivedFileEntry(path, size, mtime)
+        self._labels.clear()
+        self._all = list(self._entries.values())
+        self._sort_all()
+        self._rows = self._apply_filter(self._all)
+        self.endResetModel()
+    
+    def add_file(self, path: str) -> QModelIndex:
+        """Новый файл или новая версия уже известного; возвращает его строку"""
+        path = os.path.abspath(path)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return QModelIndex()
+        entry = self._entries.get(path)
+        if entry is not None:
+            self._take(entry)
+            entry.size = stat.st_size
+            entry.mtime = stat.st_mtime
+        else:
+            entry = ReceivedFileEntry(path, stat.st_size, stat.st_mtime)
+            self._entries[path] = entry
+        self._put(entry)
+        return self.index_of(path)
+    
+    def remove_files(self, paths):
+        """Удаление файлов из каталога (пути - абсолютные)"""
+        victims = [self._entries.pop(path) for path in paths if path in self._entries]
+        if not victims:
+            return
+        for entry in victims:
+            self._labels.pop(entry.path, None)
+        # Массовое удаление дешевле одним сбросом, чем построчными уведомлениями
+        if len(victims) > 64:
+            self.beginResetModel()
+            removed = set(id(entry) for entry in victims)
+            self._all = [entry for entry in self._all if id(entry) not in removed]
+            self._rows = self._apply_filter(self._all)
+            self.endResetModel()
+            return
+        for entry in victims:
+            self._take(entry)
+    
+    def clear(self):
+        self.set_files([])
+    
+    def refresh(self, path: str):
+        """Подпись файла изменилась (готовы метаданные)"""
+        entry = self._entries.get(path)
+        if entry is None:
+            return
+        if self._sort_mode == self.SORT_DURATION:
+            # Позиция зависит от длительности - файл переставляется
+            if self._sort_key(entry) != entry.order[0]:
+                self._take(entry)
+                self._put(entry)
+                return
+        # Подпись не строилась - строка не отрисовывалась, и обновлять нечего
+        if self._labels.pop(path, None) is None:
+            return
+        row = self._find(self._rows, entry)
+        if row >= 0:
+            index = self.index(row)
+            self.dataChanged.emit(index, index, [Qt.ItemDataRole.DisplayRole])
+    
+    # Сортировка и фильтр
+    def sort_by(self, mode: int):
+        self.beginResetModel()
+        self._sort_mode = mode
+        self._sort_all()
+        self._rows = self._apply_filter(self._all)
+        self.endResetModel()
+    
+    def set_filter(self, text: str):
+        """Фильтр по подстроке имени без учета регистра"""
+        text = text.strip().casefold()
+        if text == self._filter:
+            return
+        # Уточнение запроса сужает текущий результат, иначе - проход по всему каталогу
+        source = self._rows if self._filter and self._filter in text else self._all
+        self.beginResetModel()
+        self._filter = text
+        self._rows = self._apply_filter(source)
+        self.endResetModel()
+    
+    def _apply_filter(self, entries: List[ReceivedFileEntry]) -> List[ReceivedFileEntry]:
+        if not self._filter:
+            return self._all
+        text = self._filter
+        return [entry for entry in entries if text in entry.folded]
+    
+    def _sort_key(self, entry: ReceivedFileEntry):
+        if self._sort_mode == self.SORT_NAME:
+            return entry.folded
+        if self._sort_mode == self.SORT_SIZE:
+            return entry.size
+        if self._sort_mode == self.SORT_DURATION:
+            return self.duration_lookup(entry.path) or 0.0
+        return entry.mtime
+    
+    def _sort_all(self):
+        for entry in self._all:
+            entry.order = (self._sort_key(entry), next(self._seq))
+        self._all.sort(key=lambda entry: entry.order)
+    
+    @staticmethod
+    def _position(rows: List[ReceivedFileEntry], order: tuple) -> int:
+        low, high = 0, len(rows)
+        while low < high:
+            middle = (low + high) // 2
+            if rows[middle].order < order:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+    
+    def _find(self, rows: List[ReceivedFileEntry], entry: ReceivedFileEntry) -> int:
+        row = self._position(rows, entry.order)
+        return row if row < len(rows) and rows[row] is entry else -1
+    
+    def _put(self, entry: ReceivedFileEntry):
+        entry.order = (self._sort_key(entry), next(self._seq))
+        position = self._position(self._all, entry.order)
+        if self._rows is self._all:
+            self.beginInsertRows(QModelIndex(), position, position)
+            self._all.insert(position, entry)
+            self.endInsertRows()
+            return
+        self._all.insert(position, entry)
+        if self._filter in entry.folded:
+            row = self._position(self._rows, entry.order)
+            self.beginInsertRows(QModelIndex(), row, row)
+            self._rows.insert(row, entry)
+            self.endInsertRows()
+    
+    def _take(self, entry: ReceivedFileEntry):
+        self._labels.pop(entry.path, None)
+        row = self._find(self._rows, entry)
+        if row >= 0:
+            self.beginRemoveRows(QModelIndex(), row, row)
+            del self._rows[row]
+            if self._rows is not self._all:
+                del self._all[self._find(self._all, entry)]
+            self.endRemoveRows()
+        else:
+            position = self._find(self._all, entry)
+            if position >= 0:
+                del self._all[position]
+    
+    def _label(self, entry: ReceivedFileEntry) -> str:
+        label = self._labels.get(entry.path)
+        if label is not None:
+            self._labels.move_to_end(entry.path)
+            return label
+        label = self.formatter(entry.path, entry.size)
+        self._labels[entry.path] = label
+        if len(self._labels) > self.LABEL_CACHE_SIZE:
+            self._labels.popitem(last=False)
+        return label
 
 class BluetoothGUI(QWidget):
     """Основной графический интерфейс"""
     
-    def __init__(self):
+    # Сигналы из рабочих потоков в поток GUI
+    transfer_job_finished = pyqtSignal(object)
+    file_stream_changed = pyqtSignal(str, int, int)
+    metadata_ready = pyqtSignal(str)
+    received_files_removed = pyqtSignal(list)
+    broadcast_progress = pyqtSignal(str, int)
+    broadcast_device_finished = pyqtSignal(str, bool, str)
+    broadcast_finished = pyqtSignal(object)
+    
+    def __init__(self, backend: Optional[BluetoothBackend] = None,
+                 server_backend: Optional[ServerBackend] = None):
+        """backend, server_backend - готовые бэкенды (воспроизведение журнала событий без DLL)"""
         super().__init__()
         
         # Настройка логирования для GUI
@@ -503,10 +4127,14 @@ class BluetoothGUI(QWidget):
         # Создаём таймер здесь, чтобы он был доступен в update_mode
         self.auto_scan_timer = QTimer(self)
         self.auto_scan_timer.timeout.connect(self.on_auto_scan)
+        self.scan_scheduler = ScanScheduler()
+        
+        # История передач (записи приходят из потоков бэкендов)
+        self.history = TransferHistory()
         
         # Инициализация бэкендов
         try:
-            self.backend = BluetoothBackend()
+            self.backend = backend or BluetoothBackend()
             self.backend.on_device_discovered = self.on_device_discovered
             self.backend.on_status = self.on_status
             self.backend.on_progress = self.on_progress
@@ -515,6 +4143,8 @@ class BluetoothGUI(QWidget):
             self.backend.on_scan_finished = self.on_scan_finished
             self.backend.on_connected = self.on_connected
             self.backend.on_disconnected = self.on_disconnected
+            self.backend.on_transfer_finished = lambda *result, **details: self.history.record(
+                "send", *result, **details)
             self.logger.info("Bluetooth бэкенд инициализирован")
         except Exception as e:
             self.logger.error(f"Не удалось загрузить бэкенд Bluetooth: {e}")
@@ -522,33 +4152,97 @@ class BluetoothGUI(QWidget):
             sys.exit(1)
         
         try:
-            self.server_backend = ServerBackend()
-            self.server_backend.on_status = self.on_server_status
-            self.server_backend.on_file_received = self.on_server_file_received
-            self.server_backend.on_client_connected = self.on_server_client_connected
-            self.server_backend.on_client_disconnected = self.on_server_client_disconnected
+            self.server_backend = server_backend or ServerBackend()
+            self._bind_server_callbacks(self.server_backend)
+            # Прием в этом процессе; при нескольких процессах приема его заменяет MultiprocessReceiver
+            self.inprocess_server_backend = self.server_backend
+            self.file_stream_changed.connect(self.on_file_stream_changed)
             self.logger.info("Серверный бэкенд инициализирован")
         except Exception as e:
             self.logger.error(f"Не удалось загрузить серверный бэкенд: {e}")
             QMessageBox.critical(self, "Ошибка", f"Не удалось загрузить серверный бэкенд: {e}")
             sys.exit(1)
         
+        # Очередь отправки
+        self.scheduler = TransferScheduler(self.backend)
+        self.scheduler.on_job_finished = self.transfer_job_finished.emit
+        self.transfer_job_finished.connect(self.on_transfer_job_finished)
+        
+        # Рассылка файла нескольким устройствам
+        self.broadcaster = BroadcastSender(self.backend)
+        self.broadcaster.on_progress = self.broadcast_progress.emit
+        self.broadcaster.on_device_finished = self.broadcast_device_finished.emit
+        self.broadcaster.on_transfer_finished = lambda *result, **details: self.history.record(
+            "send", *result, **details)
+        self.broadcast_progress.connect(self.on_broadcast_progress)
+        self.broadcast_device_finished.connect(self.on_broadcast_device_finished)
+        self.broadcast_finished.connect(self.on_broadcast_finished)
+        self._broadcast_items: Dict[str, QListWidgetItem] = {}
+        
+        # Синхронизация папки с устройством
+        self.sync_manifest = SyncManifest()
+        self.folder_sync: Optional[FolderSync] = None
+        
+        # Индекс метаданных аудиофайлов
+        self.metadata_index = AudioMetadataIndex()
+        self.metadata_index.on_metadata_ready = lambda path, entry: self.metadata_ready.emit(path)
+        self.metadata_ready.connect(self.on_metadata_ready)
+        
+        # Очистка старых полученных файлов
+        self.retention = RetentionPolicy()
+        self.retention.is_protected = self._is_file_in_use
+        self.retention.on_files_removed = self.received_files_removed.emit
+        self.received_files_removed.connect(self.on_received_files_removed)
+        
+        # Каталог полученных файлов для списка
+        self.received_model = ReceivedFilesModel(self._received_item_text, self._lookup_duration, self)
+        self.received_model.set_files(self.retention.files())
+        self.filter_timer = QTimer(self)
+        self.filter_timer.setSingleShot(True)
+        self.filter_timer.timeout.connect(self._filter_received_files)
+        
         # Инициализация плеера
         self.player = MusicPlayer()
+        self.player.duration_lookup = self._lookup_duration
+        self.player.on_track_changed = self.on_track_changed
         
         # Переменные состояния
         self.current_mode = "client"
         self.selected_file = ""
         self.received_files = []
         self.discovered_devices = {}  # Хранение устройств для фильтрации дубликатов
+        self._device_items: Dict[str, QListWidgetItem] = {}
+        self._scanning = False
+        self._scan_started = 0.0
         self.server_started = False
+        self._progress_decile = -1
+        self._stream_reader: Optional[GrowingFileReader] = None
+        # Файлы, которые сейчас принимаются (в этом процессе или обработчиками): итоговый
+        # путь -> число приемов, одноименные файлы могут приниматься одновременно
+        self._active_receives: Dict[str, int] = {}
+        
+        # Ожидание предбуфера и контроль потокового воспроизведения
+        self.stream_timer = QTimer(self)
+        self.stream_timer.timeout.connect(self.on_stream_timer)
+        
+        # Переходы между треками плейлиста
+        self.player_timer = QTimer(self)
+        self.player_timer.timeout.connect(self.player.tick)
+        self.player_timer.start(200)
         
         # Настройка интерфейса
         self.init_ui()
         self.setup_styles()
+        self.retention.start()
         
-        # Автосканирование каждые 30 секунд
-        self.auto_scan_timer.start(30000)
+        # Автосканирование: когда опрашивать эфир, решает scan_scheduler
+        self.backend.metrics.scan_scheduler = self.scan_scheduler
+        self.auto_scan_timer.start(AUTO_SCAN_TICK_MS)
+        
+        # Обновление панели статистики
+        self.stats_timer = QTimer(self)
+        self.stats_timer.timeout.connect(self.on_stats_timer)
+        self.stats_timer.start(1000)
         
         # Устанавливаем заголовок
         self.setWindowTitle("🎮 KIM5+ Bluetooth File Transfer - Лабораторная работа 6")
@@ -624,6 +4318,9 @@ class BluetoothGUI(QWidget):
         
         self.devices_list = QListWidget()
         self.devices_list.setMinimumHeight(120)
+        # Несколько устройств (Ctrl/Shift) - для рассылки
+        self.devices_list.setSelectionMode(QListWidget.SelectionMode.ExtendedSelection)
+        self.devices_list.itemDoubleClicked.connect(lambda _: self.on_connect_clicked())
         client_layout.addWidget(self.devices_list)
         
         # Выбор файла
@@ -638,13 +4335,64 @@ class BluetoothGUI(QWidget):
         self.file_path_edit.setReadOnly(True)
         self.send_button = QPushButton("📤 Отправить файл")
         self.send_button.clicked.connect(self.on_send_clicked)
+        self.broadcast_button = QPushButton("📡 Разослать")
+        self.broadcast_button.setToolTip("Одновременная отправка файла всем выделенным устройствам "
+                                         "(выделение - Ctrl/Shift + щелчок)")
+        self.broadcast_button.clicked.connect(self.on_broadcast_clicked)
         
         file_layout.addWidget(self.select_file_button)
         file_layout.addWidget(self.file_path_edit, 1)
         file_layout.addWidget(self.send_button)
+        file_layout.addWidget(self.broadcast_button)
         
         client_layout.addLayout(file_layout)
         
+        # Параметры очереди отправки
+        queue_layout = QHBoxLayout()
+        self.bulk_checkbox = QCheckBox("📦 Фоновая отправка (низкий приоритет)")
+        rate_label = QLabel("Лимит скорости, КБ/с:")
+        rate_label.setStyleSheet("color: #cccccc;")
+        self.rate_limit_spin = QSpinBox()
+        self.rate_limit_spin.setRange(0, 10000)
+        self.rate_limit_spin.setSpecialValueText("без лимита")
+        self.rate_limit_spin.valueChanged.connect(self.on_rate_limit_changed)
+        self.queue_label = QLabel("Очередь: 0")
+        self.queue_label.setStyleSheet("color: #cccccc;")
+        
+        self.delta_checkbox = QCheckBox("Δ Только изменения")
+        self.delta_checkbox.setToolTip("Если у получателя есть прежняя версия файла, "
+                                       "передаются только измененные блоки (получатель "
+                                       "с записью сервиса в SDP)")
+        self.delta_checkbox.toggled.connect(self.backend.set_delta_enabled)
+        
+        self.encrypt_checkbox = QCheckBox("🔒 Шифрование")
+        self.encrypt_checkbox.setToolTip("AES-256-GCM ключом пары с устройством; "
+                                         "без ключа файл не отправляется")
+        self.encrypt_checkbox.toggled.connect(self.on_encrypt_toggled)
+        self.device_key_button = QPushButton("🔑 Ключ устройства")
+        self.device_key_button.clicked.connect(self.on_device_key_clicked)
+        
+        queue_layout.addWidget(self.bulk_checkbox)
+        queue_layout.addWidget(self.delta_checkbox)
+        queue_layout.addWidget(self.encrypt_checkbox)
+        queue_layout.addWidget(self.device_key_button)
+        queue_layout.addStretch()
+        queue_layout.addWidget(rate_label)
+        queue_layout.addWidget(self.rate_limit_spin)
+        queue_layout.addWidget(self.queue_label)
+        
+        client_layout.addLayout(queue_layout)
+        
+        # Синхронизация папки
+        sync_layout = QHBoxLayout()
+        self.sync_button = QPushButton("🔄 Синхронизировать папку")
+        self.sync_button.clicked.connect(self.on_sync_clicked)
+        self.sync_label = QLabel("Синхронизация выключена")
+        self.sync_label.setStyleSheet("color: #cccccc;")
+        sync_layout.addWidget(self.sync_button)
+        sync_layout.addWidget(self.sync_label, 1)
+        client_layout.addLayout(sync_layout)
+        
         # Прогресс бар
         progress_label = QLabel("Прогресс отправки:")
         progress_label.setStyleSheet("color: #cccccc; font-weight: bold;")
@@ -652,6 +4400,12 @@ class BluetoothGUI(QWidget):
         self.progress_bar = QProgressBar()
         client_layout.addWidget(self.progress_bar)
         
+        # Прогресс рассылки по устройствам
+        self.broadcast_list = QListWidget()
+        self.broadcast_list.setMaximumHeight(100)
+        self.broadcast_list.setVisible(False)
+        client_layout.addWidget(self.broadcast_list)
+        
         self.client_group.setLayout(client_layout)
         main_layout.addWidget(self.client_group)
         
@@ -668,9 +4422,27 @@ class BluetoothGUI(QWidget):
         self.stop_server_button.clicked.connect(self.on_stop_server_clicked)
         self.stop_server_button.setEnabled(False)
         
+        receiver_workers_label = QLabel("Процессов приема:")
+        receiver_workers_label.setStyleSheet("color: #cccccc;")
+        self.receiver_workers_spin = QSpinBox()
+        self.receiver_workers_spin.setRange(1, max(1, os.cpu_count() or 1))
+        self.receiver_workers_spin.setToolTip(
+            "Больше одного - подключения принимают отдельные процессы, по одному на ядро "
+            "(много отправителей одновременно)")
+        
+        self.require_encryption_checkbox = QCheckBox("🔒 Только шифрованные")
+        self.require_encryption_checkbox.setToolTip("Отклонять передачи без шифрования "
+                                                    "(действует при запуске сервера)")
+        self.sender_key_button = QPushButton("🔑 Ключ отправителя")
+        self.sender_key_button.clicked.connect(self.on_sender_key_clicked)
+        
         server_buttons_layout.addWidget(self.start_server_button)
         server_buttons_layout.addWidget(self.stop_server_button)
         server_buttons_layout.addStretch()
+        server_buttons_layout.addWidget(self.require_encryption_checkbox)
+        server_buttons_layout.addWidget(self.sender_key_button)
+        server_buttons_layout.addWidget(receiver_workers_label)
+        server_buttons_layout.addWidget(self.receiver_workers_spin)
         
         server_layout.addLayout(server_buttons_layout)
         
@@ -694,14 +4466,33 @@ class BluetoothGUI(QWidget):
         server_layout.addWidget(self.server_status_label)
         
         # Список полученных файлов
+        received_header_layout = QHBoxLayout()
         received_label = QLabel("Полученные файлы:")
         received_label.setStyleSheet("color: #cccccc; font-weight: bold;")
-        server_layout.addWidget(received_label)
+        sort_label = QLabel("Сортировка:")
+        sort_label.setStyleSheet("color: #cccccc;")
+        self.sort_combo = QComboBox()
+        self.sort_combo.addItems(["по времени", "по имени", "по размеру", "по длительности"])
+        self.sort_combo.currentIndexChanged.connect(self._sort_received_files)
         
-        self.received_files_list = QListWidget()
+        self.received_filter_edit = QLineEdit()
+        self.received_filter_edit.setPlaceholderText("🔍 Поиск по имени")
+        self.received_filter_edit.setClearButtonEnabled(True)
+        self.received_filter_edit.textChanged.connect(lambda _: self.filter_timer.start(150))
+        
+        received_header_layout.addWidget(received_label)
+        received_header_layout.addWidget(self.received_filter_edit, 1)
+        received_header_layout.addWidget(sort_label)
+        received_header_layout.addWidget(self.sort_combo)
+        server_layout.addLayout(received_header_layout)
+        
+        # Виртуальный список: строки одной высоты, подписи строятся только для видимых
+        self.received_files_list = QListView()
+        self.received_files_list.setModel(self.received_model)
+        self.received_files_list.setUniformItemSizes(True)
         self.received_files_list.setMinimumHeight(120)
-        self.received_files_list.itemClicked.connect(self.on_file_selected)
-        self.received_files_list.itemDoubleClicked.connect(self.on_file_double_clicked)
+        self.received_files_list.clicked.connect(self.on_file_selected)
+        self.received_files_list.doubleClicked.connect(self.on_file_double_clicked)
         server_layout.addWidget(self.received_files_list)
         
         # Кнопки управления файлами
@@ -717,6 +4508,36 @@ class BluetoothGUI(QWidget):
         
         server_layout.addLayout(file_buttons_layout)
         
+        # Хранение полученных файлов
+        retention_layout = QHBoxLayout()
+        retention_label = QLabel("Хранить не больше, МБ:")
+        retention_label.setStyleSheet("color: #cccccc;")
+        self.retention_size_spin = QSpinBox()
+        self.retention_size_spin.setRange(0, 1024 * 1024)
+        self.retention_size_spin.setSingleStep(100)
+        self.retention_size_spin.setSpecialValueText("без лимита")
+        self.retention_size_spin.setToolTip("При превышении удаляются давно не игравшие файлы")
+        self.retention_size_spin.setValue(self.retention.max_bytes // (1024 * 1024))
+        self.retention_size_spin.valueChanged.connect(self.on_retention_changed)
+        retention_age_label = QLabel("Срок, дней:")
+        retention_age_label.setStyleSheet("color: #cccccc;")
+        self.retention_age_spin = QSpinBox()
+        self.retention_age_spin.setRange(0, 3650)
+        self.retention_age_spin.setSpecialValueText("бессрочно")
+        self.retention_age_spin.setToolTip("Удалять файлы, которые не воспроизводились столько дней")
+        self.retention_age_spin.setValue(int(self.retention.max_age // (24 * 3600)))
+        self.retention_age_spin.valueChanged.connect(self.on_retention_changed)
+        self.cleanup_button = QPushButton("🧹 Очистить сейчас")
+        self.cleanup_button.clicked.connect(self.retention.wake)
+        
+        retention_layout.addWidget(retention_label)
+        retention_layout.addWidget(self.retention_size_spin)
+        retention_layout.addWidget(retention_age_label)
+        retention_layout.addWidget(self.retention_age_spin)
+        retention_layout.addWidget(self.cleanup_button)
+        retention_layout.addStretch()
+        server_layout.addLayout(retention_layout)
+        
         # Управление воспроизведением
         player_label = QLabel("Управление воспроизведением:")
         player_label.setStyleSheet("color: #cccccc; font-weight: bold;")
@@ -728,8 +4549,12 @@ class BluetoothGUI(QWidget):
         self.stop_button = QPushButton("■ Остановить")
         self.stop_button.clicked.connect(self.on_stop_clicked)
         
+        self.next_button = QPushButton("⏭ Следующий")
+        self.next_button.clicked.connect(self.on_next_clicked)
+        
         player_layout.addWidget(self.play_button)
         player_layout.addWidget(self.stop_button)
+        player_layout.addWidget(self.next_button)
         player_layout.addStretch()
         
         # Громкость
@@ -745,9 +4570,99 @@ class BluetoothGUI(QWidget):
         
         server_layout.addLayout(player_layout)
         
+        # Плейлист по списку полученных файлов
+        playlist_layout = QHBoxLayout()
+        self.playlist_checkbox = QCheckBox("🔁 Плейлист")
+        self.playlist_checkbox.setChecked(True)
+        self.playlist_checkbox.setToolTip("Воспроизводить полученные файлы подряд без пауз")
+        crossfade_label = QLabel("Кроссфейд (мс):")
+        crossfade_label.setStyleSheet("color: #cccccc;")
+        self.crossfade_spin = QSpinBox()
+        self.crossfade_spin.setRange(0, 10000)
+        self.crossfade_spin.setSingleStep(500)
+        self.crossfade_spin.setValue(0)
+        self.crossfade_spin.setToolTip("0 - бесшовный переход без наложения")
+        self.crossfade_spin.valueChanged.connect(self.on_crossfade_changed)
+        
+        self.cache_checkbox = QCheckBox("Кэш в памяти (МБ):")
+        self.cache_checkbox.setToolTip("Хранить декодированные треки для мгновенного повтора")
+        self.cache_checkbox.toggled.connect(self.on_cache_settings_changed)
+        self.cache_budget_spin = QSpinBox()
+        self.cache_budget_spin.setRange(8, 2048)
+        self.cache_budget_spin.setSingleStep(16)
+        self.cache_budget_spin.setValue(64)
+        self.cache_budget_spin.valueChanged.connect(self.on_cache_settings_changed)
+        
+        playlist_layout.addWidget(self.playlist_checkbox)
+        playlist_layout.addWidget(crossfade_label)
+        playlist_layout.addWidget(self.crossfade_spin)
+        playlist_layout.addWidget(self.cache_checkbox)
+        playlist_layout.addWidget(self.cache_budget_spin)
+        playlist_layout.addStretch()
+        server_layout.addLayout(playlist_layout)
+        
+        # Потоковое воспроизведение во время приема
+        stream_layout = QHBoxLayout()
+        self.streaming_checkbox = QCheckBox("📡 Воспроизводить во время приема")
+        self.streaming_checkbox.setChecked(True)
+        prebuffer_label = QLabel("Предбуфер, КБ:")
+        prebuffer_label.setStyleSheet("color: #cccccc;")
+        self.prebuffer_spin = QSpinBox()
+        self.prebuffer_spin.setRange(16, 8192)
+        self.prebuffer_spin.setValue(256)
+        
+        stream_layout.addWidget(self.streaming_checkbox)
+        stream_layout.addStretch()
+        stream_layout.addWidget(prebuffer_label)
+        stream_layout.addWidget(self.prebuffer_spin)
+        
+        server_layout.addLayout(stream_layout)
+        
         self.server_group.setLayout(server_layout)
         main_layout.addWidget(self.server_group)
         
+        # Панель статистики передачи
+        self.stats_group = QGroupBox("📊 Статистика передачи")
+        self.stats_group.setFont(QFont("Arial", 10, QFont.Weight.Bold))
+        stats_layout = QVBoxLayout()
+        
+        self.stats_label = QLabel("Нет данных")
+        self.stats_label.setFont(QFont("Consolas", 9))
+        self.stats_label.setStyleSheet("color: #cccccc;")
+        stats_layout.addWidget(self.stats_label)
+        
+        # История передач: сводка по устройствам или последние передачи
+        history_header_layout = QHBoxLayout()
+        history_label = QLabel("История передач:")
+        history_label.setStyleSheet("color: #cccccc;")
+        self.history_view_combo = QComboBox()
+        self.history_view_combo.addItems(["по устройствам", "последние передачи", "только ошибки"])
+        self.history_view_combo.currentIndexChanged.connect(lambda _: self._update_history_view(force=True))
+        history_header_layout.addWidget(history_label)
+        history_header_layout.addWidget(self.history_view_combo)
+        history_header_layout.addStretch()
+        stats_layout.addLayout(history_header_layout)
+        
+        self.history_list = QListWidget()
+        self.history_list.setFont(QFont("Consolas", 9))
+        self.history_list.setMaximumHeight(110)
+        stats_layout.addWidget(self.history_list)
+        self._history_version = -1
+        
+        stats_buttons_layout = QHBoxLayout()
+        self.export_json_button = QPushButton("💾 Экспорт JSON")
+        self.export_json_button.clicked.connect(self.on_export_json_clicked)
+        self.export_prometheus_button = QPushButton("💾 Экспорт Prometheus")
+        self.export_prometheus_button.clicked.connect(self.on_export_prometheus_clicked)
+        
+        stats_buttons_layout.addWidget(self.export_json_button)
+        stats_buttons_layout.addWidget(self.export_prometheus_button)
+        stats_buttons_layout.addStretch()
+        stats_layout.addLayout(stats_buttons_layout)
+        
+        self.stats_group.setLayout(stats_layout)
+        main_layout.addWidget(self.stats_group)
+        
         # Статус бар
         self.status_label = QLabel("✅ Готов к работе")
         self.status_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
@@ -954,6 +4869,7 @@ class BluetoothGUI(QWidget):
         self.disconnect_button.setVisible(not is_server)
         self.select_file_button.setEnabled(not is_server)
         self.send_button.setEnabled(not is_server and self.backend.is_connected())
+        self.broadcast_button.setEnabled(not is_server and self.broadcaster.supported)
         
         # Серверный режим
         self.server_group.setVisible(is_server)
@@ -970,9 +4886,9 @@ class BluetoothGUI(QWidget):
             self.auto_scan_timer.stop()
         else:
             self.status_label.setText("✅ Клиентский режим: Готов к работе")
-            self.auto_scan_timer.start(30000)
+            self.auto_scan_timer.start(AUTO_SCAN_TICK_MS)
             # Автосканирование при переходе в клиентский режим
-            QTimer.singleShot(1000, self.on_scan_clicked)
+            QTimer.singleShot(1000, self.start_scan)
     
     # Обработчики событий
     def on_mode_changed(self, checked: bool):
@@ -992,12 +4908,24 @@ class BluetoothGUI(QWidget):
         self.update_mode()
     
     def on_scan_clicked(self):
-        """Обработчик кнопки сканирования"""
-        if self.current_mode != "client":
+        """Обработчик кнопки сканирования: запуск или остановка"""
+        if self._scanning:
+            self.backend.cancel_discovery()
+            self.status_label.setText("⏹ Остановка сканирования...")
+            return
+        self.start_scan()
+    
+    def start_scan(self):
+        """Запуск сканирования; устройства появляются в списке по мере обнаружения"""
+        if self.current_mode != "client" or self._scanning:
             return
             
         self.discovered_devices.clear()
+        self._device_items.clear()
         self.devices_list.clear()
+        self._scanning = True
+        self._scan_started = time.perf_counter()
+        self.scan_button.setText("⏹ Остановить сканирование")
         self.status_label.setText("🔍 Сканирование устройств...")
         self.backend.start_discovery()
         self.logger.info("Запущено сканирование устройств")
@@ -1015,6 +4943,7 @@ class BluetoothGUI(QWidget):
             QMessageBox.warning(self, "Ошибка", "Не удалось получить адрес устройства")
             return
         
+        # Подключаться можно, не дожидаясь конца сканирования: библиотека сама прервет опрос
         self.status_label.setText(f"🔗 Подключение к {address}...")
         self.logger.info(f"Попытка подключения к устройству: {address}")
         
@@ -1058,8 +4987,7 @@ class BluetoothGUI(QWidget):
                 
                 self.selected_file = file_path
                 file_name = os.path.basename(file_path)
-                self.file_path_edit.setText(f"{file_name} ({self._format_file_size(file_size)})")
-                self.backend.set_file_to_send(file_path)
+                self.file_path_edit.setText(self._describe_file(file_path))
                 self.logger.info(f"Выбран файл для отправки: {file_name} ({file_size} bytes)")
             except Exception as e:
                 self.logger.error(f"Ошибка при выборе файла: {e}")
@@ -1078,21 +5006,176 @@ class BluetoothGUI(QWidget):
             self.file_path_edit.clear()
             return
         
-        if not self.backend.is_connected():
+        if not self.backend.connected_address:
             QMessageBox.warning(self, "Предупреждение", "Сначала подключитесь к устройству")
             return
         
         # Сброс прогресс-бара
         self.progress_bar.reset()
-        self.status_label.setText("📤 Отправка файла...")
+        self._progress_decile = -1
         
-        # Запускаем отправку файла
-        if self.backend.send_file():
-            QMessageBox.information(self, "Успех", "✅ Файл успешно отправлен")
+        # Ставим файл в очередь: интерактивная отправка вытесняет фоновую
+        priority = TransferJob.BULK if self.bulk_checkbox.isChecked() else TransferJob.INTERACTIVE
+        job = self.scheduler.submit(self.selected_file, priority, address=self.backend.connected_address)
+        self.status_label.setText(f"📤 Отправка файла поставлена в очередь (№{job.id})")
+        self._update_queue_label()
+    
+    def on_transfer_job_finished(self, job: TransferJob):
+        """Завершение задания очереди отправки (в потоке GUI)"""
+        self._update_queue_label()
+        if self.folder_sync and self.folder_sync.on_job_finished(job):
+            self._update_sync_label()
+        file_name = os.path.basename(job.file_path)
+        if job.state == "done":
+            self.status_label.setText(f"✅ Отправлен файл: {file_name}")
+            if job.priority == TransferJob.INTERACTIVE:
+                QMessageBox.information(self, "Успех", "✅ Файл успешно отправлен")
+        elif job.state == "cancelled":
+            self.status_label.setText(f"⏹ Отправка отменена: {file_name}")
         else:
-            error_msg = self.backend.get_last_error()
-            QMessageBox.critical(self, "Ошибка", f"❌ Ошибка отправки: {error_msg}")
             self.progress_bar.setValue(0)  # Сброс прогресс-бара при ошибке
+            confirmed = (f" (получатель записал {self._format_file_size(job.acked)} из "
+                         f"{self._format_file_size(job.size)})") if job.acked else ""
+            self.status_label.setText(f"❌ Ошибка отправки {file_name}: {job.error}{confirmed}")
+            if job.priority == TransferJob.INTERACTIVE:
+                QMessageBox.critical(self, "Ошибка", f"❌ Ошибка отправки: {job.error}")
+    
+    def on_sync_clicked(self):
+        """Включение/выключение синхронизации папки с подключенным устройством"""
+        if self.folder_sync:
+            self.folder_sync.stop()
+            self.folder_sync = None
+            self.sync_button.setText("🔄 Синхронизировать папку")
+            self.sync_label.setText("Синхронизация выключена")
+            return
+        
+        if not self.backend.connected_address:
+            QMessageBox.warning(self, "Предупреждение", "Сначала подключитесь к устройству")
+            return
+        folder = QFileDialog.getExistingDirectory(self, "Папка для синхронизации")
+        if not folder:
+            return
+        
+        self.folder_sync = FolderSync(self.scheduler, self.sync_manifest, folder,
+                                      self.backend.connected_address)
+        self.folder_sync.start()
+        self.sync_button.setText("⏹ Остановить синхронизацию")
+        self._update_sync_label()
+        self.logger.info(f"Включена синхронизация папки {folder}")
+    
+    def _update_sync_label(self):
+        sync = self.folder_sync
+        if sync:
+            self.sync_label.setText(f"📂 {sync.root} → {sync.address}: отправлено {sync.files_sent}, "
+                                    f"в очереди {sync.pending()}")
+    
+    def on_encrypt_toggled(self, enabled: bool):
+        """Шифрование передачи: без ключа для устройства сразу предлагаем его задать"""
+        self.backend.set_encryption_enabled(enabled)
+        address = self.backend.connected_address
+        if enabled and address and self.backend.keys.get(address) is None:
+            self._ask_device_key(address)
+    
+    def on_device_key_clicked(self):
+        """Ключ пары с подключенным (или выбранным в списке) устройством"""
+        address = self.backend.connected_address
+        if not address and self.devices_list.currentItem():
+            address = self.devices_list.currentItem().data(Qt.ItemDataRole.UserRole)
+        if not address:
+            QMessageBox.warning(self, "Предупреждение", "Выберите устройство из списка")
+            return
+        self._ask_device_key(address)
+    
+    def on_sender_key_clicked(self):
+        """Ключ отправителя для приема: сервер принимает передачи, зашифрованные любым из ключей"""
+        address, ok = QInputDialog.getText(self, "Ключ отправителя", "Адрес или имя устройства-отправителя:")
+        if ok and address.strip():
+            self._ask_device_key(address.strip())
+    
+    def _ask_device_key(self, address: str):
+        """Ввод ключа пары: парольная фраза или ключ в hex; пусто - создать новый ключ"""
+        text, ok = QInputDialog.getText(
+            self, "Ключ устройства",
+            f"Устройство {address}.\nПарольная фраза (одна и та же на обоих устройствах) "
+            f"или ключ в hex ({TRANSFER_KEY_SIZE * 2} символов).\nПусто - создать новый ключ:")
+        if not ok:
+            return
+        try:
+            if text.strip():
+                self.backend.keys.set(address, parse_transfer_key(text))
+            else:
+                key = self.backend.keys.pair(address)
+                QApplication.clipboard().setText(key.hex())
+                QMessageBox.information(self, "Новый ключ",
+                                        f"Ключ для {address} скопирован в буфер обмена - "
+                                        f"введите его на втором устройстве:\n\n{key.hex()}")
+        except ValueError as e:
+            QMessageBox.warning(self, "Ошибка", f"Ключ не сохранен: {e}")
+            return
+        self.logger.info(f"Сохранен ключ шифрования для устройства {address}")
+        self.backend.set_encryption_enabled(self.encrypt_checkbox.isChecked())
+    
+    def on_broadcast_clicked(self):
+        """Рассылка выбранного файла всем выделенным устройствам (повторное нажатие - прерывание)"""
+        if self.broadcaster.running:
+            self.logger.info("Прерывание рассылки")
+            self.broadcaster.cancel()
+            return
+        if not self.selected_file or not os.path.exists(self.selected_file):
+            QMessageBox.warning(self, "Предупреждение", "Сначала выберите файл для отправки")
+            return
+        
+        items = [item for item in self.devices_list.selectedItems() if item.data(Qt.ItemDataRole.UserRole)]
+        if not items:
+            QMessageBox.warning(self, "Предупреждение", "Выделите устройства для рассылки")
+            return
+        
+        self.broadcast_list.clear()
+        self._broadcast_items = {}
+        for device in items:
+            address = device.data(Qt.ItemDataRole.UserRole)
+            item = QListWidgetItem(f"{device.text()}: ожидание")
+            item.setData(Qt.ItemDataRole.UserRole, device.text())
+            self.broadcast_list.addItem(item)
+            self._broadcast_items[address] = item
+        self.broadcast_list.setVisible(True)
+        
+        self.broadcaster.rate_limit = self.rate_limit_spin.value() * 1024
+        self.broadcast_button.setText("⏹ Остановить рассылку")
+        self.status_label.setText(f"📡 Рассылка на {len(items)} устройств...")
+        threading.Thread(target=self._run_broadcast, args=(self.selected_file, list(self._broadcast_items)),
+                         name="Broadcast", daemon=True).start()
+    
+    def _run_broadcast(self, file_path: str, addresses: List[str]):
+        try:
+            results = self.broadcaster.send(file_path, addresses)
+        except Exception as e:
+            self.logger.error(f"Ошибка рассылки: {e}")
+            results = {address: (False, str(e)) for address in addresses}
+        self.broadcast_finished.emit(results)
+    
+    def on_broadcast_progress(self, address: str, percent: int):
+        item = self._broadcast_items.get(address)
+        if item:
+            item.setText(f"{item.data(Qt.ItemDataRole.UserRole)}: {percent}%")
+    
+    def on_broadcast_device_finished(self, address: str, ok: bool, error: str):
+        item = self._broadcast_items.get(address)
+        if item:
+            name = item.data(Qt.ItemDataRole.UserRole)
+            item.setText(f"✅ {name}: отправлено" if ok else f"❌ {name}: {error}")
+    
+    def on_broadcast_finished(self, results: Dict[str, Tuple[bool, str]]):
+        self.broadcast_button.setText("📡 Разослать")
+        delivered = sum(1 for ok, _ in results.values() if ok)
+        self.status_label.setText(f"📡 Рассылка завершена: {delivered} из {len(results)} устройств")
+    
+    def on_rate_limit_changed(self, value: int):
+        """Изменение общего лимита скорости отправки"""
+        self.scheduler.set_global_rate_limit(value * 1024)
+    
+    def _update_queue_label(self):
+        self.queue_label.setText(f"Очередь: {len(self.scheduler.pending())}")
     
     def on_start_server_clicked(self):
         """Запуск сервера"""
@@ -1100,10 +5183,14 @@ class BluetoothGUI(QWidget):
             return
         
         try:
+            self._select_server_backend()
+            self.server_backend.set_encryption_keys(self.backend.keys.keys(),
+                                                    self.require_encryption_checkbox.isChecked())
             self.server_backend.start()
             self.server_started = True
             self.start_server_button.setEnabled(False)
             self.stop_server_button.setEnabled(True)
+            self.receiver_workers_spin.setEnabled(False)
             self.server_status_label.setText("▶ Сервер запущен")
             self.server_status_label.setStyleSheet("""
                 QLabel {
@@ -1121,6 +5208,34 @@ class BluetoothGUI(QWidget):
             self.logger.error(f"Не удалось запустить сервер: {e}")
             QMessageBox.critical(self, "Ошибка", f"❌ Не удалось запустить сервер: {e}")
     
+    def _bind_server_callbacks(self, backend):
+        """Callback GUI для бэкенда приема (ServerBackend или MultiprocessReceiver)"""
+        backend.on_status = self.on_server_status
+        backend.on_file_received = self.on_server_file_received
+        backend.on_client_connected = self.on_server_client_connected
+        backend.on_client_disconnected = self.on_server_client_disconnected
+        backend.on_file_stream = self.file_stream_changed.emit
+        backend.on_transfer_finished = lambda *result: self.history.record("receive", *result)
+    
+    def _select_server_backend(self):
+        """Прием в этом процессе или в нескольких - по значению «Процессов приема»"""
+        workers = self.receiver_workers_spin.value()
+        if workers <= 1:
+            backend = self.inprocess_server_backend
+        elif isinstance(self.server_backend, MultiprocessReceiver) and self.server_backend.workers == workers:
+            backend = self.server_backend
+        else:
+            backend = MultiprocessReceiver(workers)
+            self._bind_server_callbacks(backend)
+            # Метаданные уже извлек процесс-обработчик - GUI берет их из каталога
+            backend.on_file_cataloged = lambda path, entry: self.metadata_index.store(path, entry.get("metadata"))
+        
+        if backend is not self.server_backend:
+            if isinstance(self.server_backend, MultiprocessReceiver):
+                self.server_backend.close()
+            self.server_backend = backend
+            self.logger.info(f"Прием файлов: процессов {workers}")
+    
     def on_stop_server_clicked(self):
         """Остановка сервера"""
         try:
@@ -1128,6 +5243,7 @@ class BluetoothGUI(QWidget):
             self.server_started = False
             self.start_server_button.setEnabled(True)
             self.stop_server_button.setEnabled(False)
+            self.receiver_workers_spin.setEnabled(True)
             self.server_status_label.setText("⏹ Сервер остановлен")
             self.server_status_label.setStyleSheet("""
                 QLabel {
@@ -1146,12 +5262,12 @@ class BluetoothGUI(QWidget):
     
     def on_play_clicked(self):
         """Обработчик кнопки воспроизведения/паузы"""
-        current_item = self.received_files_list.currentItem()
-        if not current_item:
+        current = self.received_files_list.currentIndex()
+        if not current.isValid():
             QMessageBox.warning(self, "Предупреждение", "Выберите файл для воспроизведения")
             return
         
-        file_path = current_item.data(Qt.ItemDataRole.UserRole)
+        file_path = self.received_model.path_at(current.row())
         if not os.path.exists(file_path):
             QMessageBox.critical(self, "Ошибка", "Файл не найден")
             return
@@ -1161,7 +5277,12 @@ class BluetoothGUI(QWidget):
             self.play_button.setText("▶ Воспроизвести")
             self.status_label.setText("⏸ Воспроизведение приостановлено")
         else:
-            if self.player.play(file_path):
+            if self.playlist_checkbox.isChecked():
+                started = self.player.play_playlist(self.received_model.paths(), current.row())
+            else:
+                started = self.player.play(file_path)
+            if started:
+                self.retention.touch(file_path)
                 self.play_button.setText("⏸ Пауза")
                 file_name = os.path.basename(file_path)
                 self.status_label.setText(f"🎵 Воспроизведение: {file_name}")
@@ -1174,20 +5295,58 @@ class BluetoothGUI(QWidget):
         self.play_button.setText("▶ Воспроизвести")
         self.status_label.setText("⏹ Воспроизведение остановлено")
     
+    def on_next_clicked(self):
+        """Переход к следующему треку плейлиста"""
+        if not self.player.next_track():
+            self.status_label.setText("⏹ В плейлисте больше нет треков")
+    
+    def on_crossfade_changed(self, value: int):
+        """Изменение длительности кроссфейда"""
+        self.player.crossfade_ms = value
+    
+    def on_cache_settings_changed(self, *_):
+        """Включение кэша декодированных треков и изменение его бюджета"""
+        budget = self.cache_budget_spin.value() * 1024 * 1024
+        if not self.cache_checkbox.isChecked():
+            if self.player.cache:
+                self.player.cache.clear()
+            self.player.cache = None
+        elif self.player.cache is None:
+            self.player.cache = DecodedAudioCache(budget)
+        else:
+            self.player.cache.set_budget(budget)
+    
+    def on_track_changed(self, file_path: Optional[str]):
+        """Смена трека плейлиста (в потоке GUI)"""
+        if file_path is None:
+            self.play_button.setText("▶ Воспроизвести")
+            self.status_label.setText("⏹ Плейлист закончился")
+            return
+        self.retention.touch(file_path)
+        index = self.received_model.index_of(file_path)
+        if index.isValid():
+            self.received_files_list.setCurrentIndex(index)
+        self.status_label.setText(f"🎵 Воспроизведение: {os.path.basename(file_path)}")
+    
+    def _lookup_duration(self, file_path: str) -> Optional[float]:
+        """Длительность трека из индекса метаданных"""
+        entry = self.metadata_index.lookup(file_path)
+        return entry.get("duration") if entry else None
+    
     def on_volume_changed(self, value: int):
         """Обработчик изменения громкости"""
         volume = value / 100.0
         self.player.set_volume(volume)
     
-    def on_file_selected(self, item: QListWidgetItem):
+    def on_file_selected(self, index: QModelIndex):
         """Обработчик выбора файла в списке"""
-        file_path = item.data(Qt.ItemDataRole.UserRole)
+        file_path = self.received_model.path_at(index.row())
         if file_path and os.path.exists(file_path):
             file_name = os.path.basename(file_path)
             file_size = os.path.getsize(file_path)
             self.status_label.setText(f"📄 Выбран файл: {file_name} ({self._format_file_size(file_size)})")
     
-    def on_file_double_clicked(self, item: QListWidgetItem):
+    def on_file_double_clicked(self, index: QModelIndex):
         """Обработчик двойного клика по файлу"""
         self.on_play_clicked()
     
@@ -1201,9 +5360,33 @@ class BluetoothGUI(QWidget):
         )
         
         if reply == QMessageBox.StandardButton.Yes:
-            self.received_files_list.clear()
+            self.received_model.clear()
             self.status_label.setText("🗑️ Список файлов очищен")
     
+    def on_retention_changed(self, *_):
+        """Изменение лимитов хранения полученных файлов"""
+        self.retention.configure(self.retention_size_spin.value() * 1024 * 1024,
+                                 self.retention_age_spin.value() * 24 * 3600)
+    
+    def _is_file_in_use(self, file_path: str) -> bool:
+        """Файл нельзя удалять: он играет или еще принимается (вызывается из потока очистки).
+        Временные .part политика не учитывает - сравниваются итоговые пути"""
+        busy = [self.player.current_file]
+        reader = self._stream_reader
+        if reader is not None:
+            busy.append(reader.target_path)
+        busy.extend(list(self._active_receives))
+        return any(path and os.path.abspath(path) == file_path for path in busy)
+    
+    def on_received_files_removed(self, paths: list):
+        """Политика хранения удалила файлы (в потоке GUI)"""
+        self.received_model.remove_files(paths)
+        for path in paths:
+            self.metadata_index.forget(path)
+            if self.player.cache:
+                self.player.cache.forget(path)
+        self.status_label.setText(f"🧹 Удалено старых файлов: {len(paths)}")
+    
     def on_open_folder_clicked(self):
         """Открытие папки с полученными файлами"""
         download_dir = "received_files"
@@ -1213,23 +5396,159 @@ class BluetoothGUI(QWidget):
             QMessageBox.information(self, "Информация", f"Папка '{download_dir}' не существует")
     
     def on_auto_scan(self):
-        """Автоматическое сканирование в клиентском режиме"""
-        if self.current_mode == "client" and self.isVisible():
+        """Автоматическое сканирование в клиентском режиме (срок и паузы - scan_scheduler)"""
+        if self.current_mode != "client" or self._scanning:
+            return
+        if self.scan_scheduler.poll(self._scan_busy_reasons()):
             self.logger.debug("Автоматическое сканирование устройств")
-            self.on_scan_clicked()
+            self.start_scan()
+    
+    def _scan_busy_reasons(self) -> List[str]:
+        """Причины отложить автосканирование"""
+        reasons = []
+        if not self.isVisible() or self.isMinimized():
+            reasons.append("hidden")
+        if self.backend.is_connected():
+            reasons.append("connected")
+        if self.scheduler.busy:
+            reasons.append("transfer")
+        if self.broadcaster.running:
+            reasons.append("broadcast")
+        return reasons
+    
+    def changeEvent(self, event):
+        """Возврат к окну - повод скоро обновить устаревший список устройств"""
+        if event.type() == QEvent.Type.ActivationChange and self.isActiveWindow():
+            self.scan_scheduler.user_activity()
+        super().changeEvent(event)
+    
+    def _active_backend(self):
+        """Бэкенд текущего режима"""
+        return self.server_backend if self.current_mode == "server" else self.backend
+    
+    def on_stats_timer(self):
+        """Обновление панели статистики"""
+        if not self.isVisible():
+            return
+        self._update_queue_label()
+        snap = self._active_backend().refresh_metrics().snapshot()
+        
+        def ms(value):
+            return "—" if value is None else f"{value * 1000:.0f} мс"
+        
+        chunk = snap["chunk_latency_seconds"]
+        chunk_avg = chunk["sum"] / chunk["count"] if chunk["count"] else None
+        callbacks = snap["callback_latency_seconds"]
+        callback_avg = callbacks["sum"] / callbacks["count"] if callbacks["count"] else None
+        dispatch_avg = (snap["dispatch_seconds_total"] / snap["dispatch_count"]
+                        if snap["dispatch_count"] else None)
+        
+        lines = [
+            f"Подключение: {ms(snap['last_connect_latency_seconds'])}    "
+            f"До первого байта: {ms(snap['last_time_to_first_byte_seconds'])}",
+            f"Скорость: {self._format_file_size(snap['throughput_bytes_per_second'])}/с    "
+            f"Всего: {self._format_file_size(snap['bytes_total'])}    "
+            f"Передач: {snap['transfers_total']} (ошибок: {snap['transfers_failed']})",
+            f"Чанк: {self._format_file_size(snap['chunk_size_bytes']) if snap['chunk_size_bytes'] else '—'}, "
+            f"средн. {ms(chunk_avg)}    "
+            f"Зависаний: {snap['stall_count']} (макс. {ms(snap['stall_seconds_max'])})    "
+            f"Подтверждено: {self._format_file_size(snap['acked_bytes'])}",
+            f"Callback: {ms(callback_avg)}    Доставка: {ms(dispatch_avg)}    "
+            f"Очередь: {snap['event_queue_depth']} (макс. {snap['event_queue_max_depth']})",
+        ]
+        scan = snap.get("auto_scan")
+        if scan and self.current_mode == "client":
+            if scan["suspended_by"]:
+                state = f"отложено ({', '.join(scan['suspended_by'])})"
+            else:
+                state = f"через {scan['next_scan_seconds']:.0f} с"
+            lines.append(f"Автосканирование: {state}, интервал {scan['interval_seconds']:.0f} с    "
+                         f"запусков {scan['scans_started']}, отложено {sum(scan['deferred'].values())}")
+        if self.player.cache:
+            cache = self.player.cache.stats()
+            requests = cache["hits"] + cache["misses"]
+            hit_rate = f"{cache['hits'] * 100 / requests:.0f}%" if requests else "—"
+            lines.append(f"Кэш звука: попаданий {cache['hits']}, промахов {cache['misses']} ({hit_rate})    "
+                         f"{cache['entries']} тр., {self._format_file_size(cache['used_bytes'])} из "
+                         f"{self._format_file_size(cache['budget_bytes'])}")
+        self.stats_label.setText("\n".join(lines))
+        self._update_history_view()
+    
+    def _update_history_view(self, force: bool = False):
+        """Перерисовка истории передач, только если появились новые записи"""
+        if not force and self.history.version == self._history_version:
+            return
+        self._history_version = self.history.version
+        self.history_list.clear()
+        
+        if self.history_view_combo.currentIndex() == 0:
+            # Сначала устройства с наибольшей долей неудачных передач
+            summary = sorted(self.history.device_summary().items(),
+                             key=lambda item: (-item[1]["failure_rate"], -item[1]["last"]))
+            for peer, device in summary:
+                name = self.discovered_devices.get(peer) or peer or "неизвестно"
+                speed = self._format_file_size(device["avg_throughput"]) + "/с" if device["avg_throughput"] else "—"
+                self.history_list.addItem(
+                    f"{'⚠️' if device['failure_rate'] >= 0.2 else '✅'} {name}: {speed}, "
+                    f"передач {device['transfers']}, ошибок {device['failure_rate'] * 100:.0f}%, "
+                    f"повторов {device['retries']}")
+            return
+        
+        failed_only = self.history_view_combo.currentIndex() == 2
+        for entry in self.history.query(failed_only=failed_only, limit=200):
+            arrow = "⬆" if entry["direction"] == "send" else "⬇"
+            status = "✅" if entry["result"] == "ok" else "❌"
+            speed = self._format_file_size(entry["throughput"]) + "/с" if entry["throughput"] else "—"
+            item = QListWidgetItem(
+                f"{status} {datetime.fromtimestamp(entry['time']):%d.%m %H:%M:%S} {arrow} "
+                f"{entry['file'] or '—'} ({self._format_file_size(entry['size'])}, {speed}) "
+                f"{self.discovered_devices.get(entry['peer']) or entry['peer']}")
+            if entry.get("error"):
+                item.setToolTip(entry["error"])
+            self.history_list.addItem(item)
+    
+    def on_export_json_clicked(self):
+        """Экспорт метрик в JSON"""
+        self._export_metrics("JSON (*.json)", lambda metrics: metrics.to_json())
+    
+    def on_export_prometheus_clicked(self):
+        """Экспорт метрик в формате Prometheus"""
+        self._export_metrics("Prometheus (*.prom *.txt)", lambda metrics: metrics.to_prometheus())
+    
+    def _export_metrics(self, file_filter: str, render):
+        metrics = self._active_backend().refresh_metrics()
+        file_path, _ = QFileDialog.getSaveFileName(self, "Экспорт метрик", "", file_filter)
+        if not file_path:
+            return
+        try:
+            with open(file_path, 'w', encoding='utf-8') as f:
+                f.write(render(metrics))
+            self.logger.info(f"Метрики экспортированы: {file_path}")
+        except Exception as e:
+            self.logger.error(f"Ошибка экспорта метрик: {e}")
+            QMessageBox.critical(self, "Ошибка", f"❌ Не удалось сохранить метрики: {e}")
     
     # Callback методы от бэкенда
     def on_device_discovered(self, name: str, address: str):
-        """Callback при обнаружении устройства"""
+        """Callback при обнаружении устройства (повторно - когда стало известно имя)"""
+        item_text = f"{name or 'Без имени'} ({address})"
+        
         # Фильтрация дубликатов
         if address in self.discovered_devices:
+            if name and name != self.discovered_devices[address]:
+                self.discovered_devices[address] = name
+                self._device_items[address].setText(item_text)
+                self.devices_list.sortItems()
             return
         
+        if not self.discovered_devices and self._scanning:
+            self.logger.debug(f"Первое устройство найдено через "
+                              f"{(time.perf_counter() - self._scan_started) * 1000:.0f} мс")
         self.discovered_devices[address] = name
         
-        item_text = f"{name} ({address})"
         item = QListWidgetItem(item_text)
         item.setData(Qt.ItemDataRole.UserRole, address)
+        self._device_items[address] = item
         self.devices_list.addItem(item)
         
         # Сортировка по имени
@@ -1243,7 +5562,10 @@ class BluetoothGUI(QWidget):
     def on_progress(self, percent: int):
         """Callback обновления прогресса"""
         self.progress_bar.setValue(percent)
-        if percent % 10 == 0:  # Логируем каждые 10%
+        # Логируем только смену десятка процентов, а не каждый чанк
+        decile = percent // 10
+        if decile != self._progress_decile:
+            self._progress_decile = decile
             self.logger.debug(f"Прогресс отправки: {percent}%")
     
     def on_file_received(self, filename: str):
@@ -1253,12 +5575,15 @@ class BluetoothGUI(QWidget):
     
     def on_file_sent(self):
         """Callback при успешной отправке файла"""
+        # Уведомление показывает on_transfer_job_finished в потоке GUI
         self.progress_bar.setValue(100)
-        QMessageBox.information(self, "Успех", "✅ Файл успешно отправлен")
         self.logger.info("Файл успешно отправлен")
     
     def on_scan_finished(self):
         """Callback завершения сканирования"""
+        self._scanning = False
+        self.scan_scheduler.scan_finished(self.discovered_devices.keys())
+        self.scan_button.setText("🔍 Сканировать устройства")
         device_count = len(self.discovered_devices)
         self.status_label.setText(f"✅ Сканирование завершено. Найдено устройств: {device_count}")
         self.logger.info(f"Сканирование завершено. Найдено устройств: {device_count}")
@@ -1289,28 +5614,102 @@ class BluetoothGUI(QWidget):
             # Добавляем в список полученных файлов
             file_name = os.path.basename(filename)
             file_size = os.path.getsize(filename)
-            item_text = f"📄 {file_name} ({self._format_file_size(file_size)})"
-            
-            # Проверяем, нет ли уже этого файла в списке
-            for i in range(self.received_files_list.count()):
-                item = self.received_files_list.item(i)
-                if item.data(Qt.ItemDataRole.UserRole) == filename:
-                    return
+            self.retention.note_file(filename)
             
-            item = QListWidgetItem(item_text)
-            item.setData(Qt.ItemDataRole.UserRole, filename)
-            self.received_files_list.addItem(item)
+            # Файл уже в списке - получена новая версия (например, дельтой)
+            known = self.received_model.has_file(filename)
+            index = self.received_model.add_file(filename)
+            if known:
+                self.logger.info(f"Обновлен файл: {file_name} ({file_size} bytes)")
+                return
             
             self.logger.info(f"Получен файл: {file_name} ({file_size} bytes)")
             QMessageBox.information(self, "Успех", f"✅ Получен файл: {file_name}")
             
             # Автоматически воспроизводим если в серверном режиме
-            if self.current_mode == "server":
-                self.received_files_list.setCurrentItem(item)
+            # (файл, воспроизводимый потоком, уже играет или стартует по предбуферу)
+            streamed = self._stream_reader is not None and self._stream_reader.target_path == filename
+            if self.player.playlist_index >= 0:
+                # Идет плейлист - новый файл играет следующим, без прерывания
+                self.player.enqueue(filename)
+            elif self.current_mode == "server" and not streamed and index.isValid():
+                self.received_files_list.setCurrentIndex(index)
                 QTimer.singleShot(500, lambda: self.on_play_clicked())
+            elif streamed and index.isValid():
+                self.received_files_list.setCurrentIndex(index)
         else:
             self.logger.error(f"Получен файл не найден: {filename}")
     
+    def on_file_stream_changed(self, filename: str, total_size: int, state: int):
+        """Начало и конец приема файла (в потоке GUI)"""
+        target = os.path.abspath(received_target_path(filename))
+        if state == STREAM_STATE_STARTED:
+            self._active_receives[target] = self._active_receives.get(target, 0) + 1
+            self.retention.note_receiving()
+        elif self._active_receives.get(target, 0) > 1:
+            self._active_receives[target] -= 1
+        else:
+            self._active_receives.pop(target, None)
+        reader = self._stream_reader
+        if state == STREAM_STATE_STARTED:
+            if self.current_mode != "server" or not self.streaming_checkbox.isChecked():
+                return
+            try:
+                self._stream_reader = GrowingFileReader(filename, total_size)
+            except OSError as e:
+                self.logger.error(f"Не удалось открыть принимаемый файл: {e}")
+                return
+            self.stream_timer.start(100)
+        elif reader is None or reader.path != filename:
+            return
+        elif state == STREAM_STATE_FINISHED:
+            reader.finish()
+        elif state == STREAM_STATE_ABORTED:
+            self.logger.warning(f"Прием прерван, потоковое воспроизведение остановлено: {filename}")
+            if self.player.stream is reader:
+                self.player.stop()
+                self.play_button.setText("▶ Воспроизвести")
+            reader.close()
+            self._stream_reader = None
+            self.stream_timer.stop()
+            # Сервер не может удалить файл, пока он был открыт на чтение
+            if os.path.exists(filename):
+                try:
+                    os.remove(filename)
+                    self.retention.forget(filename)
+                except OSError as e:
+                    self.logger.error(f"Не удалось удалить неполный файл: {e}")
+    
+    def on_stream_timer(self):
+        """Запуск воспроизведения по предбуферу и индикация буферизации"""
+        reader = self._stream_reader
+        if reader is None:
+            self.stream_timer.stop()
+            return
+        
+        file_name = os.path.basename(reader.target_path)
+        if self.player.stream is not reader:
+            prebuffer = self.prebuffer_spin.value() * 1024
+            if reader.received() < min(prebuffer, reader.total_size) and not reader.is_finished():
+                percent = reader.received() * 100 // max(1, min(prebuffer, reader.total_size))
+                self.status_label.setText(f"⏳ Предбуферизация {file_name}: {percent}%")
+                return
+            if self.player.play_stream(reader):
+                self.play_button.setText("⏸ Пауза")
+                self.status_label.setText(f"🎵 Воспроизведение во время приема: {file_name}")
+            else:
+                reader.close()
+                self._stream_reader = None
+                self.stream_timer.stop()
+            return
+        
+        if reader.waiting:
+            self.status_label.setText(f"⏳ Буферизация: сеть отстает ({file_name})")
+        elif reader.is_finished():
+            self.status_label.setText(f"🎵 Воспроизведение: {file_name}")
+            self._stream_reader = None
+            self.stream_timer.stop()
+    
     def on_server_client_connected(self):
         """Callback при подключении клиента к серверу"""
         QMessageBox.information(self, "Уведомление", "✅ Клиент подключился к серверу")
@@ -1321,7 +5720,62 @@ class BluetoothGUI(QWidget):
         self.logger.info("Клиент отключился от сервера")
         # Можно добавить уведомление, если нужно
     
+    def on_metadata_ready(self, path: str):
+        """Метаданные файла извлечены (в потоке GUI)"""
+        if self.selected_file and os.path.abspath(self.selected_file) == path:
+            self.file_path_edit.setText(self._describe_file(self.selected_file))
+        
+        self.received_model.refresh(path)
+    
+    def _received_item_text(self, filename: str, size: int) -> str:
+        """Подпись файла в списке полученных (метаданные - из индекса)"""
+        return f"📄 {self._describe_file(filename, size)}"
+    
+    def _describe_file(self, file_path: str, size: Optional[int] = None) -> str:
+        """Имя, размер и, если уже известны, длительность и битрейт файла"""
+        if size is None:
+            size = os.path.getsize(file_path)
+        text = f"{os.path.basename(file_path)} ({self._format_file_size(size)})"
+        meta = self.metadata_index.get(file_path)
+        if meta:
+            details = []
+            if meta.get("duration"):
+                details.append(f"⏱ {self._format_duration(meta['duration'])}")
+            if meta.get("bitrate"):
+                details.append(f"{meta['bitrate'] // 1000} kbps")
+            title = " - ".join(meta["tags"][key] for key in ("artist", "title") if meta["tags"].get(key))
+            if title:
+                details.append(title)
+            if details:
+                text += " • " + " • ".join(details)
+        return text
+    
+    def _sort_received_files(self):
+        """Сортировка списка полученных файлов по выбранному ключу"""
+        current = self.received_model.path_at(self.received_files_list.currentIndex().row())
+        self.received_model.sort_by(self.sort_combo.currentIndex())
+        self._restore_received_selection(current)
+    
+    def _filter_received_files(self):
+        """Поиск по имени в списке полученных файлов (после паузы в наборе)"""
+        current = self.received_model.path_at(self.received_files_list.currentIndex().row())
+        self.received_model.set_filter(self.received_filter_edit.text())
+        self._restore_received_selection(current)
+    
+    def _restore_received_selection(self, path: Optional[str]):
+        if path:
+            index = self.received_model.index_of(path)
+            if index.isValid():
+                self.received_files_list.setCurrentIndex(index)
+                self.received_files_list.scrollTo(index)
+    
     # Вспомогательные методы
+    def _format_duration(self, seconds: float) -> str:
+        """Форматирование длительности трека"""
+        minutes, seconds = divmod(int(seconds), 60)
+        hours, minutes = divmod(minutes, 60)
+        return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes}:{seconds:02d}"
+    
     def _format_file_size(self, size_bytes: int) -> str:
         """Форматирование размера файла"""
         for unit in ['B', 'KB', 'MB', 'GB']:
@@ -1334,11 +5788,40 @@ class BluetoothGUI(QWidget):
         """Обработчик закрытия окна"""
         self.logger.info("Закрытие приложения")
         
-        # Останавливаем таймер
+        # Останавливаем таймеры
         self.auto_scan_timer.stop()
+        self.stats_timer.stop()
+        self.stream_timer.stop()
+        self.player_timer.stop()
         
         # Останавливаем воспроизведение
         self.player.stop()
+        self.player.shutdown()
+        
+        # Прерываем очередь отправки. Экземпляры библиотеки освобождаем, только если потоки,
+        # которые к ним обращаются, завершились, - иначе их освободит выход процесса
+        threads_stopped = True
+        if hasattr(self, 'folder_sync') and self.folder_sync:
+            threads_stopped &= self.folder_sync.stop()
+        if hasattr(self, 'scheduler'):
+            threads_stopped &= self.scheduler.stop()
+        if hasattr(self, 'broadcaster'):
+            self.broadcaster.cancel()
+            if self.broadcaster.wait(timeout=5):
+                self.broadcaster.close()
+            else:
+                self.broadcaster.abandon()
+                threads_stopped = False
+        if not threads_stopped:
+            self.logger.warning("Фоновые отправки не завершились, экземпляры библиотеки не освобождаются")
+        
+        # Сохраняем индекс метаданных
+        if hasattr(self, 'metadata_index'):
+            self.metadata_index.shutdown()
+        if hasattr(self, 'retention'):
+            self.retention.stop()
+        if hasattr(self, 'history'):
+            self.history.close()
         
         # Останавливаем сервер если он запущен
         if hasattr(self, 'server_backend') and self.server_backend and self.server_started:
@@ -1356,6 +5839,18 @@ class BluetoothGUI(QWidget):
             except Exception as e:
                 self.logger.error(f"Ошибка при отключении: {e}")
         
+        # Освобождаем экземпляры библиотек, не дожидаясь сборщика мусора
+        client_backend = getattr(self, 'backend', None)
+        if client_backend and not threads_stopped:
+            client_backend.abandon()
+        for backend in (client_backend, getattr(self, 'server_backend', None),
+                        getattr(self, 'inprocess_server_backend', None)):
+            if backend:
+                try:
+                    backend.close()
+                except Exception as e:
+                    self.logger.error(f"Ошибка при освобождении бэкенда: {e}")
+        
         # Завершаем pygame
         try:
             if pygame.mixer.get_init():
@@ -1367,7 +5862,16 @@ class BluetoothGUI(QWidget):
 
 def main():
     """Главная функция"""
-    app = QApplication(sys.argv)
+    parser = argparse.ArgumentParser(description="Передача файлов по Bluetooth")
+    parser.add_argument("--record-events", metavar="FILE",
+                        help="записывать callback библиотек в журнал событий")
+    parser.add_argument("--replay-events", metavar="FILE",
+                        help="воспроизвести журнал событий без DLL")
+    parser.add_argument("--replay-speed", type=float, default=1.0,
+                        help="темп воспроизведения: 1, 10, ... (0 - без пауз)")
+    args, qt_args = parser.parse_known_args()
+    
+    app = QApplication(sys.argv[:1] + qt_args)
     app.setStyle('Fusion')
     
     # Устанавливаем имя приложения
@@ -1375,10 +5879,39 @@ def main():
     app.setApplicationVersion("1.0.0")
     
     try:
-        window = BluetoothGUI()
+        replayer = None
+        if args.replay_events:
+            replayer = EventReplayer(args.replay_events)
+            window = BluetoothGUI(BluetoothBackend(library=ReplayLibrary()),
+                                  ServerBackend(library=ReplayLibrary()))
+        else:
+            window = BluetoothGUI()
+        
+        recorder = None
+        if args.record_events:
+            recorder = EventRecorder(args.record_events)
+            recorder.attach(window.backend)
+            recorder.attach(window.server_backend)
+            app.aboutToQuit.connect(recorder.close)
+        
         window.show()
         logger.info("Приложение успешно запущено")
         
+        if replayer:
+            # Темп задает отдельный поток, callback выполняются в потоке GUI
+            invoker = GuiThreadInvoker()
+            
+            def replay():
+                logger.info(f"Воспроизведение {args.replay_events}: {len(replayer.events)} событий, "
+                            f"{replayer.duration:.1f} с, темп {args.replay_speed or 'максимальный'}")
+                summary = replayer.replay(window.backend, window.server_backend, args.replay_speed, invoker)
+                logger.info(f"Воспроизведение завершено за {summary['replay_seconds']:.2f} с")
+                for name, timing in sorted(summary["callbacks"].items(), key=lambda item: -item[1]["total_ms"]):
+                    logger.info(f"  {name}: {timing['count']} вызовов, всего {timing['total_ms']:.1f} мс, "
+                                f"макс. {timing['max_ms']:.2f} мс")
+            app.aboutToQuit.connect(replayer.stop)
+            threading.Thread(target=replay, name="EventReplayer", daemon=True).start()
+        
         return app.exec()
     except Exception as e:
         logger.error(f"Критическая ошибка при запуске приложения: {e}")
@@ -1387,4 +5920,5 @@ def main():
         return 1
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()  # процессы-обработчики приема в собранном exe
     sys.exit(main())
\ No newline at end of file
@@ -6,14 +6,17 @@
 #include <iostream>
 #include <chrono>
 #include <cstdio>
+#include <cstring>
+#include <algorithm>
+#include <vector>
+#include <unordered_map>
+#include <climits>
 
 #pragma comment(lib, "Ws2_32.lib")
 #pragma comment(lib, "Bthprops.lib")
 
-// Определение RFCOMM сервисного UUID
-static const GUID RFCOMM_SERVICE_UUID = {
-    0x00001101, 0x0000, 0x1000, {0x80, 0x00, 0x00, 0x80, 0x5F, 0x9B, 0x34, 0xFB}
-};
+// Класс сервиса передачи в SDP (см. transferprotocol.h)
+static const GUID TRANSFER_SERVICE_UUID = TRANSFER_SERVICE_UUID_INIT;
 
 // Вспомогательная функция для конвертации wide string в UTF-8
 static std::string wide_to_utf8(const std::wstring& wstr) {
@@ -24,12 +27,104 @@ static std::string wide_to_utf8(const std::wstring& wstr) {
     return str;
 }
 
+// Верхние границы корзин задержки чанка в миллисекундах (последняя корзина - +inf)
+static const double STATS_LATENCY_BOUNDS_MS[STATS_LATENCY_BUCKETS - 1] = {
+    0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000
+};
+
+// Таймаут операций сокета вне передачи с подтверждениями
+static const int SOCKET_TIMEOUT_MS = 10000;
+
+static double elapsed_ms(std::chrono::steady_clock::time_point since) {
+    return std::chrono::duration<double, std::milli>(std::chrono::steady_clock::now() - since).count();
+}
+
+// Канал RFCOMM сервиса передачи по записи SDP устройства; 0 - запрос не удался.
+// Без записи (прежние версии сервера ее не публикуют) - канал SERVER_PREFERRED_CHANNEL
+// и advertised = false
+static int lookup_rfcomm_channel(BTH_ADDR address, bool& advertised, std::string& error)
+{
+    // Контекст запроса - адрес устройства в виде "(XX:XX:XX:XX:XX:XX)"
+    char context[32];
+    snprintf(context, sizeof(context), "(%02X:%02X:%02X:%02X:%02X:%02X)",
+        (unsigned)((address >> 40) & 0xff), (unsigned)((address >> 32) & 0xff), (unsigned)((address >> 24) & 0xff),
+        (unsigned)((address >> 16) & 0xff), (unsigned)((address >> 8) & 0xff), (unsigned)(address & 0xff));
+
+    advertised = false;
+    GUID serviceId = TRANSFER_SERVICE_UUID;
+    WSAQUERYSETA query = { 0 };
+    query.dwSize = sizeof(query);
+    query.lpServiceClassId = &serviceId;
+    query.dwNameSpace = NS_BTH;
+    query.lpszContext = context;
+
+    // LUP_FLUSHCACHE - спрашиваем само устройство, а не кэш стека
+    HANDLE lookup = nullptr;
+    if (WSALookupServiceBeginA(&query, LUP_FLUSHCACHE | LUP_RETURN_ADDR, &lookup) != 0) {
+        int code = WSAGetLastError();
+        if (code == WSASERVICE_NOT_FOUND) return SERVER_PREFERRED_CHANNEL;
+        error = "Service lookup failed with error: " + std::to_string(code);
+        return 0;
+    }
+
+    std::vector<char> buffer(4096);
+    WSAQUERYSETA* result = reinterpret_cast<WSAQUERYSETA*>(buffer.data());
+    DWORD size = (DWORD)buffer.size();
+    int channel = 0;
+    if (WSALookupServiceNextA(lookup, LUP_RETURN_ADDR, &size, result) == 0 &&
+        result->dwNumberOfCsAddrs > 0 && result->lpcsaBuffer) {
+        channel = (int)reinterpret_cast<SOCKADDR_BTH*>(result->lpcsaBuffer->RemoteAddr.lpSockaddr)->port;
+        advertised = true;
+    }
+    else {
+        int code = WSAGetLastError();
+        if (code == WSA_E_NO_MORE || code == WSAENOMORE || code == WSASERVICE_NOT_FOUND) {
+            channel = SERVER_PREFERRED_CHANNEL;
+        }
+        else {
+            error = "Service lookup failed with error: " + std::to_string(code);
+        }
+    }
+    WSALookupServiceEnd(lookup);
+    return channel;
+}
+
+static bool send_all(SOCKET socket, const char* data, size_t length) {
+    while (length > 0) {
+        int sent = link_send(socket, data, (int)(std::min)(length, (size_t)INT_MAX));
+        if (sent <= 0) return false;
+        data += sent;
+        length -= sent;
+    }
+    return true;
+}
+
+static bool recv_all(SOCKET socket, char* data, size_t length) {
+    while (length > 0) {
+        int received = link_recv(socket, data, (int)(std::min)(length, (size_t)INT_MAX));
+        if (received <= 0) return false;
+        data += received;
+        length -= received;
+    }
+    return true;
+}
+
 BluetoothTransfer::BluetoothTransfer()
     : m_clientSocket(INVALID_SOCKET)
+    , m_broadcast(nullptr)
     , m_isConnected(false)
     , m_isDiscovering(false)
     , m_stopDiscovery(false)
+    , m_rateLimit(0)
+    , m_cancelSend(false)
+    , m_initialChunk(TRANSFER_DEFAULT_CHUNK)
+    , m_initialSocketBuffer(0)
+    , m_deltaEnabled(false)
+    , m_channelResolver(nullptr)
+    , m_peerV2(false)
+    , m_ackInterval(ACK_DEFAULT_INTERVAL)
     , m_stopEventThread(false)
+    , m_batchEvents(false)
     , m_deviceDiscoveredCallback(nullptr)
     , m_statusCallback(nullptr)
     , m_progressCallback(nullptr)
@@ -39,6 +134,8 @@ BluetoothTransfer::BluetoothTransfer()
     , m_connectedCallback(nullptr)
     , m_disconnectedCallback(nullptr)
 {
+    memset(&m_stats, 0, sizeof(m_stats));
+
     WSADATA wsaData;
     WSAStartup(MAKEWORD(2, 2), &wsaData);
 
@@ -91,11 +188,12 @@ void BluetoothTransfer::processEvents()
         Event event;
         {
             std::unique_lock<std::mutex> lock(m_eventMutex);
+            // При пакетной выдаче события забирает drainEvents
             m_eventCV.wait(lock, [this]() {
-                return !m_eventQueue.empty() || m_stopEventThread;
+                return (!m_eventQueue.empty() && !m_batchEvents) || m_stopEventThread;
                 });
 
-            if (m_stopEventThread && m_eventQueue.empty()) {
+            if (m_stopEventThread && (m_eventQueue.empty() || m_batchEvents)) {
                 break;
             }
 
@@ -103,6 +201,11 @@ void BluetoothTransfer::processEvents()
             m_eventQueue.pop();
         }
 
+        {
+            std::lock_guard<std::mutex> lock(m_statsMutex);
+            m_stats.eventQueueDepth--;
+        }
+
         switch (event.type) {
         case Event::DeviceDiscovered:
             handleDeviceDiscovered(event.str1, event.str2);
@@ -126,16 +229,521 @@ void BluetoothTransfer::processEvents()
             handleStatusMessage(event.str1);
             break;
         }
+
+        // Задержка доставки: от постановки в очередь до завершения callback
+        double dispatchMs = elapsed_ms(event.posted);
+        std::lock_guard<std::mutex> lock(m_statsMutex);
+        m_stats.dispatchCount++;
+        m_stats.dispatchSumMs += dispatchMs;
+        m_stats.dispatchMaxMs = (std::max)(m_stats.dispatchMaxMs, dispatchMs);
     }
 }
 
 void BluetoothTransfer::postEvent(const Event& event)
+{
+    Event posted = event;
+    posted.posted = std::chrono::steady_clock::now();
+    {
+        std::lock_guard<std::mutex> lock(m_eventMutex);
+        // Еще не доставленный прогресс заменяется новым: отстающий потребитель получает
+        // последнее значение, а не всю историю
+        if (event.type == Event::ProgressUpdated && !m_eventQueue.empty() &&
+            m_eventQueue.back().type == Event::ProgressUpdated) {
+            m_eventQueue.back().intValue = event.intValue;
+            return;
+        }
+        m_eventQueue.push(posted);
+    }
+    {
+        std::lock_guard<std::mutex> lock(m_statsMutex);
+        m_stats.eventQueueDepth++;
+        m_stats.eventQueueMaxDepth = (std::max)(m_stats.eventQueueMaxDepth, m_stats.eventQueueDepth);
+    }
+    // Очередь ждут и поток событий, и drainEvents
+    m_eventCV.notify_all();
+}
+
+void BluetoothTransfer::setEventBatching(bool enabled)
 {
     {
         std::lock_guard<std::mutex> lock(m_eventMutex);
-        m_eventQueue.push(event);
+        m_batchEvents = enabled;
+    }
+    // Выключение будит drainEvents (вернет 0), накопившееся доставит поток событий
+    m_eventCV.notify_all();
+}
+
+static void copy_event_text(char* target, size_t size, const std::string& text)
+{
+    size_t length = (std::min)(text.size(), size - 1);
+    memcpy(target, text.data(), length);
+    target[length] = '\0';
+}
+
+int BluetoothTransfer::drainEvents(BatchedEvent* events, int capacity, int timeoutMs)
+{
+    if (!events || capacity <= 0) return 0;
+
+    std::vector<Event> batch;
+    {
+        std::unique_lock<std::mutex> lock(m_eventMutex);
+        m_eventCV.wait_for(lock, std::chrono::milliseconds(timeoutMs), [this]() {
+            return !m_eventQueue.empty() || !m_batchEvents || m_stopEventThread;
+            });
+        if (!m_batchEvents) {
+            return 0;
+        }
+        while (!m_eventQueue.empty() && (int)batch.size() < capacity) {
+            batch.push_back(std::move(m_eventQueue.front()));
+            m_eventQueue.pop();
+        }
+    }
+    if (batch.empty()) {
+        return 0;
+    }
+
+    for (size_t i = 0; i < batch.size(); ++i) {
+        BatchedEvent& record = events[i];
+        record.type = batch[i].type;
+        record.intValue = batch[i].intValue;
+        copy_event_text(record.text, sizeof(record.text), batch[i].str1);
+        copy_event_text(record.address, sizeof(record.address), batch[i].str2);
+    }
+
+    // Задержка доставки - до выдачи пачки; обработка в Python учитывается там же
+    std::lock_guard<std::mutex> lock(m_statsMutex);
+    m_stats.eventQueueDepth -= (int)batch.size();
+    for (const Event& event : batch) {
+        double dispatchMs = elapsed_ms(event.posted);
+        m_stats.dispatchCount++;
+        m_stats.dispatchSumMs += dispatchMs;
+        m_stats.dispatchMaxMs = (std::max)(m_stats.dispatchMaxMs, dispatchMs);
+    }
+    return (int)batch.size();
+}
+
+void BluetoothTransfer::recordChunk(double latencyMs, size_t bytes)
+{
+    std::lock_guard<std::mutex> lock(m_statsMutex);
+    m_stats.bytesTransferred += bytes;
+    m_stats.chunksTransferred++;
+    m_stats.chunkLatencySumMs += latencyMs;
+
+    int bucket = 0;
+    while (bucket < STATS_LATENCY_BUCKETS - 1 && latencyMs > STATS_LATENCY_BOUNDS_MS[bucket]) {
+        bucket++;
+    }
+    m_stats.chunkLatencyBuckets[bucket]++;
+
+    // Длительный send() считаем зависанием канала
+    if (latencyMs >= STATS_STALL_THRESHOLD_MS) {
+        m_stats.stallCount++;
+        m_stats.stallTotalMs += latencyMs;
+        m_stats.stallMaxMs = (std::max)(m_stats.stallMaxMs, latencyMs);
+    }
+}
+
+void BluetoothTransfer::throttle(size_t bytes, double& tokens, std::chrono::steady_clock::time_point& lastRefill)
+{
+    // Token bucket: емкость - четверть секунды трафика, но не меньше одного чанка
+    while (!m_cancelSend) {
+        long long rate = m_rateLimit;
+        if (rate <= 0) {
+            return;
+        }
+
+        double capacity = (std::max)(static_cast<double>(rate) / 4.0, static_cast<double>(bytes));
+        auto now = std::chrono::steady_clock::now();
+        tokens += std::chrono::duration<double>(now - lastRefill).count() * rate;
+        tokens = (std::min)(tokens, capacity);
+        lastRefill = now;
+
+        if (tokens >= static_cast<double>(bytes)) {
+            tokens -= static_cast<double>(bytes);
+            return;
+        }
+
+        double waitMs = (static_cast<double>(bytes) - tokens) * 1000.0 / rate;
+        std::this_thread::sleep_for(std::chrono::milliseconds(static_cast<long long>(waitMs) + 1));
+    }
+}
+
+PrefetchReader::PrefetchReader(FILE* file)
+    : m_file(file)
+{
+    m_thread = std::thread(&PrefetchReader::run, this);
+}
+
+PrefetchReader::~PrefetchReader()
+{
+    {
+        std::lock_guard<std::mutex> lock(m_mutex);
+        m_stop = true;
+    }
+    m_spaceCV.notify_all();
+    if (m_thread.joinable()) {
+        m_thread.join();
     }
-    m_eventCV.notify_one();
+}
+
+void PrefetchReader::run()
+{
+    while (true) {
+        std::vector<char> block;
+        {
+            std::unique_lock<std::mutex> lock(m_mutex);
+            m_spaceCV.wait(lock, [this] { return m_stop || m_blocks.size() < PREFETCH_DEPTH; });
+            if (m_stop) return;
+            if (!m_free.empty()) {
+                block = std::move(m_free.back());
+                m_free.pop_back();
+            }
+        }
+
+        // Чтение - без блокировки, отправка в это время забирает готовые блоки
+        block.resize(PREFETCH_BLOCK_SIZE);
+        size_t bytesRead = fread(block.data(), 1, block.size(), m_file);
+        block.resize(bytesRead);
+
+        {
+            std::lock_guard<std::mutex> lock(m_mutex);
+            if (bytesRead > 0) {
+                m_blocks.push_back(std::move(block));
+            }
+            if (bytesRead < PREFETCH_BLOCK_SIZE) {
+                m_eof = true;
+                m_failed = ferror(m_file) != 0;
+            }
+        }
+        m_dataCV.notify_one();
+        if (bytesRead < PREFETCH_BLOCK_SIZE) return;
+    }
+}
+
+size_t PrefetchReader::read(char* data, size_t size)
+{
+    size_t copied = 0;
+    std::unique_lock<std::mutex> lock(m_mutex);
+    while (copied < size) {
+        if (m_blocks.empty()) {
+            if (m_eof) break;
+            auto waitStart = std::chrono::steady_clock::now();
+            m_dataCV.wait(lock, [this] { return m_eof || !m_blocks.empty(); });
+            m_waitMs += elapsed_ms(waitStart);
+            continue;
+        }
+
+        std::vector<char>& front = m_blocks.front();
+        size_t length = (std::min)(size - copied, front.size() - m_offset);
+        memcpy(data + copied, front.data() + m_offset, length);
+        copied += length;
+        m_offset += length;
+        if (m_offset == front.size()) {
+            m_free.push_back(std::move(front));
+            m_blocks.pop_front();
+            m_offset = 0;
+            m_spaceCV.notify_one();
+        }
+    }
+    return copied;
+}
+
+BroadcastSource::BroadcastSource(const char* filePath)
+    : m_path(filePath ? filePath : "")
+    , m_file(nullptr)
+{
+    memset(&m_stats, 0, sizeof(m_stats));
+    m_file = fopen(m_path.c_str(), "rbS");
+    if (!m_file) return;
+
+    fseek(m_file, 0, SEEK_END);
+    m_fileSize = ftell(m_file);
+    fseek(m_file, 0, SEEK_SET);
+    m_blockCount = ((size_t)m_fileSize + PREFETCH_BLOCK_SIZE - 1) / PREFETCH_BLOCK_SIZE;
+    m_stats.fileSize = m_fileSize;
+    m_thread = std::thread(&BroadcastSource::run, this);
+}
+
+BroadcastSource::~BroadcastSource()
+{
+    {
+        std::lock_guard<std::mutex> lock(m_mutex);
+        m_stop = true;
+    }
+    m_wantCV.notify_all();
+    m_dataCV.notify_all();
+    if (m_thread.joinable()) {
+        m_thread.join();
+    }
+    if (m_file) {
+        fclose(m_file);
+    }
+}
+
+void BroadcastSource::run()
+{
+    while (true) {
+        size_t next;
+        {
+            std::unique_lock<std::mutex> lock(m_mutex);
+            m_wantCV.wait(lock, [this] {
+                size_t ahead = m_firstIndex + m_ring.size();
+                return m_stop || ahead >= m_blockCount || ahead < m_wanted + PREFETCH_DEPTH;
+            });
+            next = m_firstIndex + m_ring.size();
+            if (m_stop || next >= m_blockCount) return;
+        }
+
+        // Чтение - без блокировки, передачи в это время забирают готовые блоки
+        size_t expected = (std::min)((size_t)PREFETCH_BLOCK_SIZE, (size_t)m_fileSize - next * PREFETCH_BLOCK_SIZE);
+        auto block = std::make_shared<std::vector<char>>(expected);
+        size_t bytesRead = fread(block->data(), 1, expected, m_file);
+
+        {
+            std::lock_guard<std::mutex> lock(m_mutex);
+            if (bytesRead < expected) {
+                m_failed = true;
+            }
+            else {
+                m_ring.push_back(std::move(block));
+                m_stats.diskBytes += bytesRead;
+                if (m_ring.size() > BROADCAST_RING_BLOCKS) {
+                    m_ring.pop_front();
+                    m_firstIndex++;
+                }
+            }
+        }
+        m_dataCV.notify_all();
+        if (bytesRead < expected) return;
+    }
+}
+
+std::shared_ptr<const std::vector<char>> BroadcastSource::block(size_t index, bool& evicted, double& waitMs)
+{
+    std::unique_lock<std::mutex> lock(m_mutex);
+    evicted = false;
+    if (index + 1 > m_wanted) {
+        m_wanted = index + 1;
+        m_wantCV.notify_one();
+    }
+    if (index >= m_firstIndex + m_ring.size()) {
+        auto waitStart = std::chrono::steady_clock::now();
+        m_dataCV.wait(lock, [this, index] {
+            return m_stop || m_failed || index < m_firstIndex + m_ring.size();
+        });
+        waitMs += elapsed_ms(waitStart);
+    }
+    if (index < m_firstIndex) {
+        evicted = true;
+        return nullptr;
+    }
+    if (index >= m_firstIndex + m_ring.size()) return nullptr;
+    return m_ring[index - m_firstIndex];
+}
+
+void BroadcastSource::attach()
+{
+    std::lock_guard<std::mutex> lock(m_mutex);
+    m_stats.readers++;
+}
+
+void BroadcastSource::release(bool detached, unsigned long long fallbackBytes)
+{
+    std::lock_guard<std::mutex> lock(m_mutex);
+    m_stats.readers--;
+    if (detached) m_stats.detached++;
+    m_stats.fallbackBytes += fallbackBytes;
+}
+
+void BroadcastSource::getStats(BroadcastStats* stats)
+{
+    std::lock_guard<std::mutex> lock(m_mutex);
+    *stats = m_stats;
+}
+
+BroadcastReader::BroadcastReader(BroadcastSource* source)
+    : m_source(source)
+{
+    m_source->attach();
+}
+
+BroadcastReader::~BroadcastReader()
+{
+    m_fallback.reset();
+    if (m_file) {
+        fclose(m_file);
+    }
+    m_source->release(m_file != nullptr, m_fallbackBytes);
+}
+
+double BroadcastReader::waitMs() const
+{
+    return m_waitMs + (m_fallback ? m_fallback->waitMs() : 0.0);
+}
+
+// Блок вытеснен из кольца: остаток файла читается своим потоком с текущего смещения
+bool BroadcastReader::detach()
+{
+    m_file = fopen(m_source->path().c_str(), "rbS");
+    if (!m_file || fseek(m_file, m_position, SEEK_SET) != 0) return false;
+    m_fallback.reset(new PrefetchReader(m_file));
+    return true;
+}
+
+size_t BroadcastReader::read(char* data, size_t size)
+{
+    size_t copied = 0;
+    while (copied < size) {
+        if (m_fallback) {
+            size_t length = m_fallback->read(data + copied, size - copied);
+            copied += length;
+            m_fallbackBytes += length;
+            m_failed = m_fallback->failed();
+            break;
+        }
+
+        if (!m_block) {
+            if (m_position >= m_source->fileSize()) break;
+            bool evicted = false;
+            m_block = m_source->block(m_index, evicted, m_waitMs);
+            if (!m_block) {
+                if (evicted && detach()) continue;
+                m_failed = true;
+                break;
+            }
+            m_offset = 0;
+        }
+
+        size_t length = (std::min)(size - copied, m_block->size() - m_offset);
+        memcpy(data + copied, m_block->data() + m_offset, length);
+        copied += length;
+        m_offset += length;
+        m_position += (long)length;
+        if (m_offset == m_block->size()) {
+            m_block.reset();
+            m_index++;
+        }
+    }
+    return copied;
+}
+
+void ChunkTuner::reset(size_t initialChunk)
+{
+    m_chunk = (std::min)((std::max)(initialChunk, (size_t)TRANSFER_MIN_CHUNK), (size_t)TRANSFER_MAX_CHUNK);
+    m_bestChunk = m_chunk;
+    m_bestRate = 0.0;
+    m_direction = 1;
+    m_reversals = 0;
+    m_settled = false;
+    m_windowBytes = 0;
+    m_windowMs = 0.0;
+}
+
+bool ChunkTuner::record(size_t bytes, double ms)
+{
+    // Окно - 200 мс в send() или 2 МБ, чтобы замер не тонул в шуме
+    m_windowBytes += bytes;
+    m_windowMs += ms;
+    if (m_windowMs < 200.0 && m_windowBytes < 2 * 1024 * 1024) {
+        return false;
+    }
+
+    double rate = m_windowBytes / (std::max)(m_windowMs, 0.001);
+    m_windowBytes = 0;
+    m_windowMs = 0.0;
+    size_t before = m_chunk;
+
+    if (m_settled) {
+        if (rate >= m_bestRate * 0.7) {
+            return false;
+        }
+        // Канал заметно замедлился - ищем заново от текущего размера
+        m_settled = false;
+        m_reversals = 0;
+        m_bestRate = 0.0;
+    }
+
+    if (rate > m_bestRate * 1.05) {
+        m_bestRate = rate;
+        m_bestChunk = m_chunk;
+        step();
+    }
+    else {
+        // Шаг не помог - возвращаемся к лучшему размеру и пробуем другое направление
+        m_chunk = m_bestChunk;
+        m_direction = -m_direction;
+        if (++m_reversals >= 2) {
+            m_settled = true;
+        }
+        else {
+            step();
+        }
+    }
+    return m_chunk != before;
+}
+
+void ChunkTuner::step()
+{
+    for (int attempt = 0; attempt < 2 && !m_settled; ++attempt) {
+        size_t next = m_direction > 0 ? m_chunk * 2 : m_chunk / 2;
+        if (next >= TRANSFER_MIN_CHUNK && next <= TRANSFER_MAX_CHUNK) {
+            m_chunk = next;
+            return;
+        }
+        m_direction = -m_direction;
+        if (++m_reversals >= 2) {
+            m_settled = true;
+        }
+    }
+}
+
+void BluetoothTransfer::setTuning(int chunkSize, int socketBuffer)
+{
+    m_initialChunk = chunkSize > 0 ? (size_t)chunkSize : TRANSFER_DEFAULT_CHUNK;
+    m_initialSocketBuffer = socketBuffer > 0 ? socketBuffer : 0;
+}
+
+void BluetoothTransfer::setAckInterval(int bytes)
+{
+    m_ackInterval = bytes > 0 ? (std::max)(bytes, ACK_MIN_INTERVAL) : 0;
+}
+
+void BluetoothTransfer::setEncryptionKey(const unsigned char* key, int size)
+{
+    std::lock_guard<std::mutex> lock(m_keyMutex);
+    if (key && size == TRANSFER_KEY_SIZE) {
+        m_encryptionKey.assign(key, key + size);
+    }
+    else {
+        m_encryptionKey.clear();
+    }
+}
+
+int BluetoothTransfer::readAck(int timeoutMs, AckFrame& frame)
+{
+    fd_set readSet;
+    FD_ZERO(&readSet);
+    FD_SET(m_clientSocket, &readSet);
+
+    timeval timeout{ timeoutMs / 1000, (timeoutMs % 1000) * 1000 };
+    int ready = select(0, &readSet, nullptr, nullptr, &timeout);
+    if (ready == 0) return 0;
+    if (ready == SOCKET_ERROR) return -1;
+    return recv_all(m_clientSocket, reinterpret_cast<char*>(&frame), sizeof(frame)) ? 1 : -1;
+}
+
+void BluetoothTransfer::applySocketBuffer(int size)
+{
+    setsockopt(m_clientSocket, SOL_SOCKET, SO_SNDBUF, (char*)&size, sizeof(size));
+    std::lock_guard<std::mutex> lock(m_statsMutex);
+    m_stats.chunkSize = (int)m_tuner.chunkSize();
+    m_stats.socketBuffer = size;
+}
+
+void BluetoothTransfer::getStats(TransferStats* stats)
+{
+    std::lock_guard<std::mutex> lock(m_statsMutex);
+    *stats = m_stats;
 }
 
 void BluetoothTransfer::startDeviceDiscovery()
@@ -159,17 +767,65 @@ void BluetoothTransfer::startDeviceDiscovery()
 
 void BluetoothTransfer::runDiscovery()
 {
-    BLUETOOTH_DEVICE_SEARCH_PARAMS searchParams = { sizeof(BLUETOOTH_DEVICE_SEARCH_PARAMS) };
-    searchParams.fReturnAuthenticated = TRUE;
-    searchParams.fReturnConnected = TRUE;
-    searchParams.fReturnRemembered = TRUE;
-    searchParams.fReturnUnknown = TRUE;
-    searchParams.cTimeoutMultiplier = 8;
+    HANDLE radio = nullptr;
+    BLUETOOTH_FIND_RADIO_PARAMS radioParams = { sizeof(BLUETOOTH_FIND_RADIO_PARAMS) };
+    HBLUETOOTH_RADIO_FIND radioFind = BluetoothFindFirstRadio(&radioParams, &radio);
+    if (radioFind) {
+        BluetoothFindRadioClose(radioFind);
+    }
+
+    // Очередь устройств без имени для пула дозапроса имен
+    std::queue<BLUETOOTH_DEVICE_INFO> unnamed;
+    std::mutex unnamedMutex;
+    std::condition_variable unnamedCV;
+    bool searchDone = false;
+
+    auto resolveNames = [&]() {
+        while (true) {
+            BLUETOOTH_DEVICE_INFO info;
+            {
+                std::unique_lock<std::mutex> lock(unnamedMutex);
+                unnamedCV.wait(lock, [&] { return searchDone || !unnamed.empty(); });
+                if (unnamed.empty()) return;
+                info = unnamed.front();
+                unnamed.pop();
+            }
+
+            // Имя приходит от устройства с задержкой - опрашиваем кэш стека несколько раз
+            for (int attempt = 0; attempt < DISCOVERY_NAME_ATTEMPTS && !m_stopDiscovery; ++attempt) {
+                if (BluetoothGetDeviceInfo(radio, &info) == ERROR_SUCCESS && info.szName[0]) {
+                    std::ostringstream oss;
+                    oss << std::hex << info.Address.ullLong;
+                    postEvent({ Event::DeviceDiscovered, wide_to_utf8(info.szName), oss.str() });
+                    break;
+                }
+                std::this_thread::sleep_for(std::chrono::milliseconds(DISCOVERY_NAME_RETRY_MS));
+            }
+        }
+    };
+
+    std::vector<std::thread> workers;
+    for (int i = 0; i < DISCOVERY_NAME_WORKERS; ++i) {
+        workers.emplace_back(resolveNames);
+    }
+
+    // Уже опубликованные устройства: повторно - только если появилось имя
+    std::unordered_map<BTH_ADDR, std::string> published;
+
+    auto searchPass = [&](bool inquiry) {
+        BLUETOOTH_DEVICE_SEARCH_PARAMS searchParams = { sizeof(BLUETOOTH_DEVICE_SEARCH_PARAMS) };
+        searchParams.fReturnAuthenticated = TRUE;
+        searchParams.fReturnConnected = TRUE;
+        searchParams.fReturnRemembered = TRUE;
+        searchParams.fReturnUnknown = TRUE;
+        searchParams.fIssueInquiry = inquiry ? TRUE : FALSE;
+        searchParams.cTimeoutMultiplier = inquiry ? DISCOVERY_ROUND_MULTIPLIER : 0;
+        searchParams.hRadio = radio;
 
-    BLUETOOTH_DEVICE_INFO deviceInfo = { sizeof(BLUETOOTH_DEVICE_INFO), 0 };
+        BLUETOOTH_DEVICE_INFO deviceInfo = { sizeof(BLUETOOTH_DEVICE_INFO), 0 };
+        HBLUETOOTH_DEVICE_FIND hFind = BluetoothFindFirstDevice(&searchParams, &deviceInfo);
+        if (!hFind) return;
 
-    HBLUETOOTH_DEVICE_FIND hFind = BluetoothFindFirstDevice(&searchParams, &deviceInfo);
-    if (hFind) {
         do {
             if (m_stopDiscovery) break;
 
@@ -177,6 +833,10 @@ void BluetoothTransfer::runDiscovery()
             std::wstring wname(deviceInfo.szName);
             std::string name = wide_to_utf8(wname);
 
+            auto known = published.find(deviceInfo.Address.ullLong);
+            if (known != published.end() && (name.empty() || known->second == name)) continue;
+            published[deviceInfo.Address.ullLong] = name;
+
             // Форматирование адреса
             std::ostringstream oss;
             oss << std::hex << deviceInfo.Address.ullLong;
@@ -184,21 +844,136 @@ void BluetoothTransfer::runDiscovery()
 
             postEvent({ Event::DeviceDiscovered, name, address });
 
-            // Небольшая задержка для обработки событий
-            std::this_thread::sleep_for(std::chrono::milliseconds(10));
-
+            if (name.empty()) {
+                std::lock_guard<std::mutex> lock(unnamedMutex);
+                unnamed.push(deviceInfo);
+                unnamedCV.notify_one();
+            }
         } while (BluetoothFindNextDevice(hFind, &deviceInfo));
 
         BluetoothFindDeviceClose(hFind);
+    };
+
+    // Известные системе устройства доступны сразу, к ним можно подключаться, не дожидаясь опроса
+    searchPass(false);
+    for (int round = 0; round < DISCOVERY_INQUIRY_ROUNDS && !m_stopDiscovery; ++round) {
+        searchPass(true);
+    }
+
+    {
+        std::lock_guard<std::mutex> lock(unnamedMutex);
+        searchDone = true;
+    }
+    unnamedCV.notify_all();
+    for (auto& worker : workers) {
+        worker.join();
+    }
+    if (radio) {
+        CloseHandle(radio);
     }
 
     m_isDiscovering = false;
     postEvent({ Event::ScanFinished });
 }
 
+int BluetoothTransfer::resolveChannel(BTH_ADDR address, bool refresh, bool& fromCache, bool& peerV2)
+{
+    fromCache = false;
+    if (!refresh) {
+        std::lock_guard<std::mutex> lock(m_channelMutex);
+        auto cached = m_channelCache.find(address);
+        if (cached != m_channelCache.end()) {
+            fromCache = true;
+            peerV2 = cached->second.v2;
+            return cached->second.channel;
+        }
+    }
+
+    std::ostringstream oss;
+    oss << std::hex << address;
+    std::string error;
+    ChannelResolverCallback resolver = m_channelResolver;
+    // Подменный поиск указывает на сервер этой же версии
+    peerV2 = true;
+    int channel = resolver ? resolver(oss.str().c_str()) : lookup_rfcomm_channel(address, peerV2, error);
+
+    if (channel <= 0 || channel > RFCOMM_MAX_CHANNEL) {
+        {
+            std::lock_guard<std::mutex> lock(m_channelMutex);
+            m_channelCache.erase(address);
+        }
+        m_lastError = !error.empty() ? error
+            : channel <= 0 ? "Device does not offer the transfer service"
+            : "Invalid service channel: " + std::to_string(channel);
+        postEvent({ Event::StatusMessage, m_lastError });
+        return 0;
+    }
+
+    {
+        std::lock_guard<std::mutex> lock(m_channelMutex);
+        m_channelCache[address] = { channel, peerV2 };
+    }
+    postEvent({ Event::StatusMessage, peerV2
+        ? "Transfer service found on channel " + std::to_string(channel)
+        : "Transfer service is not advertised, trying legacy channel " + std::to_string(channel) });
+    return channel;
+}
+
+void BluetoothTransfer::forgetChannel(const char* address)
+{
+    std::lock_guard<std::mutex> lock(m_channelMutex);
+    if (!address) {
+        m_channelCache.clear();
+        return;
+    }
+    try {
+        m_channelCache.erase(std::stoull(address, nullptr, 16));
+    }
+    catch (...) {
+    }
+}
+
+bool BluetoothTransfer::openChannel(BTH_ADDR address, int channel, int& errorCode)
+{
+    SOCKADDR_BTH sockaddrBthServer = { 0 };
+    sockaddrBthServer.addressFamily = AF_BTH;
+    sockaddrBthServer.serviceClassId = TRANSFER_SERVICE_UUID;
+    sockaddrBthServer.port = channel;
+    sockaddrBthServer.btAddr = address;
+
+    LinkSimulator& simulator = LinkSimulator::instance();
+    m_clientSocket = simulator.enabled()
+        ? simulator.createSocket()
+        : socket(AF_BTH, SOCK_STREAM, BTHPROTO_RFCOMM);
+    if (m_clientSocket == INVALID_SOCKET) {
+        errorCode = 0;
+        return false;
+    }
+
+    // Устанавливаем таймауты для предотвращения зависаний
+    int timeout = SOCKET_TIMEOUT_MS;
+    setsockopt(m_clientSocket, SOL_SOCKET, SO_RCVTIMEO, (char*)&timeout, sizeof(timeout));
+    setsockopt(m_clientSocket, SOL_SOCKET, SO_SNDTIMEO, (char*)&timeout, sizeof(timeout));
+
+    int result = simulator.enabled()
+        ? simulator.connectChannel(m_clientSocket, channel)
+        : ::connect(m_clientSocket, reinterpret_cast<sockaddr*>(&sockaddrBthServer), sizeof(sockaddrBthServer));
+    if (result == SOCKET_ERROR) {
+        errorCode = WSAGetLastError();
+        cleanup();
+        return false;
+    }
+    return true;
+}
+
 bool BluetoothTransfer::connectToDevice(const char* address)
 {
+    // Опрос эфира занимает радиомодуль и замедляет подключение - прерываем сканирование
+    m_stopDiscovery = true;
     cleanup();
+    // Прерывание относится к передаче по этому соединению: флаг сбрасывается здесь, а не
+    // в sendFile(), иначе отмена, пришедшая между подключением и отправкой, теряется
+    m_cancelSend = false;
 
     std::string addrStr = address;
     BTH_ADDR addr;
@@ -212,33 +987,41 @@ bool BluetoothTransfer::connectToDevice(const char* address)
         return false;
     }
 
-    SOCKADDR_BTH sockaddrBthServer = { 0 };
-    sockaddrBthServer.addressFamily = AF_BTH;
-    sockaddrBthServer.serviceClassId = RFCOMM_SERVICE_UUID;
-    sockaddrBthServer.port = 6;
-    sockaddrBthServer.btAddr = addr;
-
-    m_clientSocket = socket(AF_BTH, SOCK_STREAM, BTHPROTO_RFCOMM);
-    if (m_clientSocket == INVALID_SOCKET) {
-        m_lastError = "Error creating client socket";
-        postEvent({ Event::StatusMessage, "Error creating client socket" });
+    // Без записи о сервисе подключаться бессмысленно - сразу сообщаем причину
+    bool fromCache = false;
+    bool peerV2 = false;
+    int channel = resolveChannel(addr, false, fromCache, peerV2);
+    if (channel == 0) {
         return false;
     }
 
-    // Устанавливаем таймауты для предотвращения зависаний
-    int timeout = 10000; // 10 секунд
-    setsockopt(m_clientSocket, SOL_SOCKET, SO_RCVTIMEO, (char*)&timeout, sizeof(timeout));
-    setsockopt(m_clientSocket, SOL_SOCKET, SO_SNDTIMEO, (char*)&timeout, sizeof(timeout));
+    int errorCode = 0;
+    bool connected = openChannel(addr, channel, errorCode);
+    if (!connected && fromCache && errorCode != 0) {
+        // Сервер мог перезапуститься на другом канале - уточняем запись SDP
+        int fresh = resolveChannel(addr, true, fromCache, peerV2);
+        if (fresh == 0) {
+            return false;
+        }
+        if (fresh != channel) {
+            channel = fresh;
+            connected = openChannel(addr, channel, errorCode);
+        }
+    }
 
-    if (::connect(m_clientSocket, reinterpret_cast<sockaddr*>(&sockaddrBthServer), sizeof(sockaddrBthServer)) == SOCKET_ERROR) {
-        int errorCode = WSAGetLastError();
+    if (!connected) {
+        if (errorCode == 0) {
+            m_lastError = "Error creating client socket";
+            postEvent({ Event::StatusMessage, "Error creating client socket" });
+            return false;
+        }
         m_lastError = "Connection failed with error: " + std::to_string(errorCode);
         postEvent({ Event::StatusMessage, "Connection failed with error: " + std::to_string(errorCode) });
-        cleanup();
         return false;
     }
 
     m_isConnected = true;
+    m_peerV2 = peerV2;
     postEvent({ Event::ClientConnected });
     postEvent({ Event::StatusMessage, "Connected to device" });
     return true;
@@ -255,16 +1038,30 @@ void BluetoothTransfer::disconnect()
 
 void BluetoothTransfer::setFileToSend(const char* filePath)
 {
+    m_broadcast = nullptr;
     m_fileToSendPath = filePath;
 }
 
+// Источник живет, пока его не удалит Python - после завершения всех передач рассылки
+void BluetoothTransfer::setSendBroadcast(BroadcastSource* source)
+{
+    m_broadcast = source;
+    m_fileToSendPath = source ? source->path() : "";
+}
+
 bool BluetoothTransfer::sendFile()
 {
+    m_lastError.clear();
     if (m_fileToSendPath.empty() || !m_isConnected) {
         m_lastError = "No file set or not connected";
         return false;
     }
 
+    BroadcastSource* broadcast = m_broadcast;
+    m_tuner.reset(m_initialChunk);
+    applySocketBuffer(m_initialSocketBuffer > 0 ? m_initialSocketBuffer
+        : socket_buffer_for_chunk(m_tuner.chunkSize()));
+
     // Проверяем существование файла
     if (GetFileAttributesA(m_fileToSendPath.c_str()) == INVALID_FILE_ATTRIBUTES) {
         m_lastError = "File does not exist";
@@ -272,67 +1069,453 @@ bool BluetoothTransfer::sendFile()
         return false;
     }
 
-    FILE* file = fopen(m_fileToSendPath.c_str(), "rb");
-    if (!file) {
+    // "S" - подсказка CRT о последовательном чтении (FILE_FLAG_SEQUENTIAL_SCAN): кэш
+    // системы читает файл с упреждением и не держит уже отправленные страницы.
+    // При рассылке файл уже открыт общим источником
+    FILE* file = broadcast ? nullptr : fopen(m_fileToSendPath.c_str(), "rbS");
+    if (broadcast ? !broadcast->isOpen() : !file) {
         m_lastError = "Cannot open file for reading";
         postEvent({ Event::StatusMessage, "Cannot open file for reading" });
         return false;
     }
 
-    fseek(file, 0, SEEK_END);
-    long fileSize = ftell(file);
-    fseek(file, 0, SEEK_SET);
+    long fileSize = 0;
+    if (broadcast) {
+        fileSize = broadcast->fileSize();
+    }
+    else {
+        fseek(file, 0, SEEK_END);
+        fileSize = ftell(file);
+        fseek(file, 0, SEEK_SET);
+    }
 
     if (fileSize == 0) {
         m_lastError = "File is empty";
         postEvent({ Event::StatusMessage, "File is empty" });
-        fclose(file);
+        if (file) fclose(file);
         return false;
     }
 
-    std::string sizeStr = std::to_string(fileSize);
-    sizeStr.resize(20, ' ');
+    {
+        std::lock_guard<std::mutex> lock(m_statsMutex);
+        m_stats.ackedBytes = 0;
+    }
+
+    std::vector<unsigned char> key;
+    {
+        std::lock_guard<std::mutex> lock(m_keyMutex);
+        key = m_encryptionKey;
+    }
 
-    int bytesSent = send(m_clientSocket, sizeStr.c_str(), 20, 0);
-    if (bytesSent != 20) {
-        m_lastError = "Failed to send file size";
-        postEvent({ Event::StatusMessage, "Failed to send file size" });
-        fclose(file);
+    std::vector<DeltaBlockSignature> signature;
+    uint32_t blockSize = 0;
+    // Старый получатель (без записи сервиса в SDP) подтверждений не отправляет
+    int ackInterval = m_peerV2 ? (int)m_ackInterval : 0;
+    ChunkCipher cipher;
+    if (!sendHeader(fileSize, ackInterval, key, cipher, signature, blockSize)) {
+        if (file) fclose(file);
         return false;
     }
 
     long totalSent = 0;
-    char buffer[1024];
-    size_t bytesRead;
-
-    while ((bytesRead = fread(buffer, 1, sizeof(buffer), file)) > 0) {
-        bytesSent = send(m_clientSocket, buffer, bytesRead, 0);
+    int lastProgress = -1;
+    long long wireBytes = 0;
+    auto transferStart = std::chrono::steady_clock::now();
+    double tokens = 0.0;
+    auto lastRefill = transferStart;
+
+    // Отправка с учетом лимита скорости и метрик; false - ошибка или отмена
+    auto sendTracked = [&](const char* data, size_t length) -> bool {
+        throttle(length, tokens, lastRefill);
+        if (m_cancelSend) {
+            m_lastError = "Transfer cancelled";
+            postEvent({ Event::StatusMessage, "Transfer cancelled" });
+            return false;
+        }
 
-        if (bytesSent <= 0) {
+        auto chunkStart = std::chrono::steady_clock::now();
+        if (!send_all(m_clientSocket, data, length)) {
+            if (ackInterval > 0 && WSAGetLastError() == WSAETIMEDOUT) {
+                // Буферы заполнены, а получатель не читает - тот же признак зависания
+                m_lastError = "Transfer stalled: receiver is not reading";
+                postEvent({ Event::StatusMessage, "Transfer stalled: receiver is not reading" });
+                return false;
+            }
             m_lastError = "Error sending file data";
             postEvent({ Event::StatusMessage, "Error sending file data" });
-            break;
+            return false;
+        }
+
+        double chunkMs = elapsed_ms(chunkStart);
+        recordChunk(chunkMs, length);
+        if (m_tuner.record(length, chunkMs)) {
+            applySocketBuffer(socket_buffer_for_chunk(m_tuner.chunkSize()));
+        }
+        if (wireBytes == 0) {
+            std::lock_guard<std::mutex> lock(m_statsMutex);
+            m_stats.firstByteMs = elapsed_ms(transferStart);
+        }
+        wireBytes += length;
+        return true;
+    };
+
+    // Подтверждения получателя: прогресс считается по записанным на его стороне байтам,
+    // отправка ждет только при заполненном окне, а не после каждого чанка
+    long long acked = 0;
+    bool receiverDone = false;
+    bool receiverOk = true;
+
+    // Разбор пришедших подтверждений; пока подтверждено меньше required байт (или до
+    // завершения при untilDone) - ожидание с таймаутом зависания
+    auto receiveAcks = [&](long long required, bool untilDone) -> bool {
+        while (!receiverDone) {
+            bool waiting = untilDone || acked < required;
+            auto waitStart = std::chrono::steady_clock::now();
+            AckFrame frame;
+            int r = readAck(waiting ? ACK_STALL_TIMEOUT_MS : 0, frame);
+            if (waiting) {
+                std::lock_guard<std::mutex> lock(m_statsMutex);
+                m_stats.ackWaitMs += elapsed_ms(waitStart);
+            }
+            if (r == 0) {
+                if (!waiting) return true;
+                m_lastError = "Transfer stalled: no acknowledgement from receiver";
+                postEvent({ Event::StatusMessage, "Transfer stalled: no acknowledgement from receiver" });
+                return false;
+            }
+            if (r < 0 || frame.offset > (uint64_t)totalSent || (long long)frame.offset < acked ||
+                (frame.type != ACK_CHECKPOINT && frame.type != ACK_DONE && frame.type != ACK_FAILED)) {
+                m_lastError = "Invalid acknowledgement from receiver";
+                postEvent({ Event::StatusMessage, "Invalid acknowledgement from receiver" });
+                return false;
+            }
+
+            acked = (long long)frame.offset;
+            {
+                std::lock_guard<std::mutex> lock(m_statsMutex);
+                m_stats.ackedBytes = acked;
+            }
+            int progress = (int)((acked * 100) / fileSize);
+            if (progress != lastProgress) {
+                lastProgress = progress;
+                postEvent({ Event::ProgressUpdated, "", "", progress });
+            }
+
+            if (frame.type == ACK_FAILED) {
+                receiverOk = false;
+                m_lastError = "Receiver failed to write file";
+                postEvent({ Event::StatusMessage, "Receiver failed to write file" });
+                return false;
+            }
+            receiverDone = frame.type == ACK_DONE;
+        }
+        return true;
+    };
+
+    if (signature.empty()) {
+        std::vector<char> buffer(TRANSFER_MAX_CHUNK);
+        // При шифровании каждый чанк уходит отдельной записью: длина, шифртекст, тег
+        std::vector<char> record(key.empty() ? 0 : TRANSFER_MAX_CHUNK + TRANSFER_RECORD_OVERHEAD);
+        double cryptoMs = 0.0;
+        size_t bytesRead;
+        std::unique_ptr<ChunkReader> reader;
+        if (broadcast) reader.reset(new BroadcastReader(broadcast));
+        else reader.reset(new PrefetchReader(file));
+        long long window = (long long)ackInterval * ACK_WINDOW_CHECKPOINTS;
+        long long nextPoll = ackInterval;
+
+        if (ackInterval > 0) {
+            // Зависший получатель не должен держать send() дольше, чем ожидание подтверждений
+            int stallTimeout = ACK_STALL_TIMEOUT_MS;
+            setsockopt(m_clientSocket, SOL_SOCKET, SO_SNDTIMEO, (char*)&stallTimeout, sizeof(stallTimeout));
         }
 
-        totalSent += bytesSent;
+        while ((bytesRead = reader->read(buffer.data(), m_tuner.chunkSize())) > 0) {
+            // Подтверждения приходят раз в интервал - чаще проверять сокет незачем
+            long long required = totalSent + (long long)bytesRead - window;
+            if (ackInterval > 0 && (totalSent >= nextPoll || acked < required)) {
+                if (!receiveAcks(required, false)) break;
+                nextPoll = totalSent + ackInterval;
+            }
+            if (key.empty()) {
+                if (!sendTracked(buffer.data(), bytesRead)) break;
+            }
+            else {
+                auto sealStart = std::chrono::steady_clock::now();
+                if (!cipher.seal(buffer.data(), (uint32_t)bytesRead, record.data())) {
+                    m_lastError = "Encryption failed";
+                    postEvent({ Event::StatusMessage, "Encryption failed" });
+                    break;
+                }
+                cryptoMs += elapsed_ms(sealStart);
+                if (!sendTracked(record.data(), bytesRead + TRANSFER_RECORD_OVERHEAD)) break;
+            }
+            totalSent += (long)bytesRead;
+
+            if (ackInterval == 0) {
+                // Событие - только при смене процента, а не на каждый чанк
+                int progress = (int)((totalSent * 100) / fileSize);
+                if (progress != lastProgress) {
+                    lastProgress = progress;
+                    postEvent({ Event::ProgressUpdated, "", "", progress });
+                }
+            }
+        }
 
-        int progress = (int)((totalSent * 100) / fileSize);
-        postEvent({ Event::ProgressUpdated, "", "", progress });
+        if (ackInterval > 0) {
+            if (totalSent == fileSize && !receiveAcks(fileSize, true)) {
+                totalSent = (long)acked;
+            }
+            if (totalSent != fileSize && receiverOk) {
+                postEvent({ Event::StatusMessage, "Receiver confirmed " + std::to_string(acked) +
+                    " of " + std::to_string(fileSize) + " bytes" });
+            }
+            int timeout = SOCKET_TIMEOUT_MS;
+            setsockopt(m_clientSocket, SOL_SOCKET, SO_SNDTIMEO, (char*)&timeout, sizeof(timeout));
+        }
+
+        if (reader->failed()) {
+            m_lastError = "Cannot read file";
+            postEvent({ Event::StatusMessage, "Cannot read file" });
+        }
+        std::lock_guard<std::mutex> lock(m_statsMutex);
+        m_stats.diskWaitMs += reader->waitMs();
+        m_stats.cryptoMs += cryptoMs;
     }
+    else if (sendDelta(file, fileSize, signature, blockSize, sendTracked)) {
+        totalSent = fileSize;
+        {
+            std::lock_guard<std::mutex> lock(m_statsMutex);
+            m_stats.ackedBytes = fileSize;
+        }
+        postEvent({ Event::StatusMessage, "Delta transfer: sent " + std::to_string(wireBytes / 1024) +
+            " KB of " + std::to_string(fileSize / 1024) + " KB" });
+    }
+
+    if (file) fclose(file);
 
-    fclose(file);
+    {
+        std::lock_guard<std::mutex> lock(m_statsMutex);
+        m_stats.lastTransferMs = elapsed_ms(transferStart);
+    }
 
     if (totalSent == fileSize) {
         postEvent({ Event::FileSent });
         return true;
     }
+    else if (m_cancelSend) {
+        // Получатель ждет остаток файла - разрываем соединение,
+        // чтобы он удалил неполный файл
+        disconnect();
+        return false;
+    }
     else {
-        m_lastError = "File transfer incomplete";
+        if (m_lastError.empty()) m_lastError = "File transfer incomplete";
         postEvent({ Event::StatusMessage, "File transfer incomplete" });
         return false;
     }
 }
 
+bool BluetoothTransfer::sendHeader(long fileSize, int ackInterval, const std::vector<unsigned char>& key, ChunkCipher& cipher,
+    std::vector<DeltaBlockSignature>& signature, uint32_t& blockSize)
+{
+    if (!m_peerV2 && !key.empty()) {
+        // Старый получатель не разберет заголовок версии 2 - открытым текстом не отправляем
+        m_lastError = "Receiver does not support encryption";
+        postEvent({ Event::StatusMessage, "Receiver does not support encryption" });
+        return false;
+    }
+    bool deltaEnabled = m_deltaEnabled && m_peerV2;
+    if (!deltaEnabled && ackInterval == 0 && key.empty()) {
+        // Версия 1: только размер файла
+        std::string sizeStr = std::to_string(fileSize);
+        sizeStr.resize(PROTOCOL_HEADER_SIZE, ' ');
+        if (!send_all(m_clientSocket, sizeStr.c_str(), PROTOCOL_HEADER_SIZE)) {
+            m_lastError = "Failed to send file size";
+            postEvent({ Event::StatusMessage, "Failed to send file size" });
+            return false;
+        }
+        return true;
+    }
+
+    // Версия 2: имя файла и предложение дельта-передачи. Операции дельты не шифруются,
+    // поэтому с ключом файл всегда идет целиком; при рассылке - тоже (данные идут из общего кольца)
+    std::string name = m_fileToSendPath.substr(m_fileToSendPath.find_last_of("\\/") + 1);
+    bool offerDelta = deltaEnabled && key.empty() && !m_broadcast &&
+        fileSize >= DELTA_MIN_FILE_SIZE && fileSize <= DELTA_MAX_FILE_SIZE;
+    std::map<std::string, std::string> fields = {
+        { "size", std::to_string(fileSize) },
+        { "name", name },
+        { "delta", offerDelta ? "1" : "0" },
+        { "chunk", std::to_string(m_tuner.chunkSize()) },
+        { "ack", std::to_string(ackInterval) },
+    };
+
+    unsigned char noncePrefix[TRANSFER_NONCE_PREFIX_SIZE];
+    if (!key.empty()) {
+        std::string keyId = transfer_key_id(key);
+        if (keyId.empty() || !transfer_random(noncePrefix, sizeof(noncePrefix))) {
+            m_lastError = "Encryption is not available";
+            postEvent({ Event::StatusMessage, "Encryption is not available" });
+            return false;
+        }
+        fields["enc"] = TRANSFER_CIPHER_NAME;
+        fields["key"] = keyId;
+        fields["nonce"] = to_hex(noncePrefix, sizeof(noncePrefix));
+    }
+
+    std::string header = build_v2_header(fields);
+    if (!key.empty() && !cipher.init(key, noncePrefix, header.substr(PROTOCOL_HEADER_SIZE))) {
+        m_lastError = "Encryption is not available";
+        postEvent({ Event::StatusMessage, "Encryption is not available" });
+        return false;
+    }
+    if (!send_all(m_clientSocket, header.data(), header.size())) {
+        m_lastError = "Failed to send file header";
+        postEvent({ Event::StatusMessage, "Failed to send file header" });
+        return false;
+    }
+    if (!offerDelta) return true;
+
+    DeltaSignatureHeader sigHeader;
+    if (!recv_all(m_clientSocket, reinterpret_cast<char*>(&sigHeader), sizeof(sigHeader)) ||
+        memcmp(sigHeader.magic, DELTA_SIGNATURE_MAGIC, 4) != 0) {
+        m_lastError = "Receiver does not support delta transfer";
+        postEvent({ Event::StatusMessage, "Receiver does not support delta transfer" });
+        return false;
+    }
+    if (sigHeader.blockCount == 0) return true;
+
+    if (sigHeader.blockSize < DELTA_MIN_BLOCK_SIZE || sigHeader.blockSize > DELTA_MAX_BLOCK_SIZE ||
+        sigHeader.blockCount > DELTA_MAX_FILE_SIZE / DELTA_MIN_BLOCK_SIZE) {
+        m_lastError = "Invalid delta signature";
+        postEvent({ Event::StatusMessage, "Invalid delta signature" });
+        return false;
+    }
+
+    signature.resize(sigHeader.blockCount);
+    if (!recv_all(m_clientSocket, reinterpret_cast<char*>(signature.data()),
+        signature.size() * sizeof(DeltaBlockSignature))) {
+        m_lastError = "Failed to receive delta signature";
+        postEvent({ Event::StatusMessage, "Failed to receive delta signature" });
+        signature.clear();
+        return false;
+    }
+    blockSize = sigHeader.blockSize;
+    return true;
+}
+
+bool BluetoothTransfer::sendDelta(FILE* file, long fileSize, const std::vector<DeltaBlockSignature>& signature,
+    uint32_t blockSize, const std::function<bool(const char*, size_t)>& sendTracked)
+{
+    std::vector<unsigned char> data(fileSize);
+    if (fread(data.data(), 1, data.size(), file) != data.size()) {
+        m_lastError = "Cannot read file";
+        postEvent({ Event::StatusMessage, "Cannot read file" });
+        return false;
+    }
+
+    std::unordered_multimap<uint32_t, uint32_t> blocks;
+    blocks.reserve(signature.size());
+    for (uint32_t i = 0; i < signature.size(); ++i) {
+        blocks.emplace(signature[i].weak, i);
+    }
+
+    // Операции копятся в буфере и отправляются порциями
+    std::string out;
+    size_t literalStart = 0;
+    uint32_t copyStart = 0;
+    uint32_t copyCount = 0;
+    int lastProgress = -1;
+
+    auto putU32 = [&out](uint32_t value) { out.append(reinterpret_cast<const char*>(&value), 4); };
+    auto flushCopy = [&]() {
+        if (copyCount == 0) return;
+        out += DELTA_OP_COPY;
+        putU32(copyStart);
+        putU32(copyCount);
+        copyCount = 0;
+    };
+    auto flushLiteral = [&](size_t end) {
+        while (literalStart < end) {
+            uint32_t length = (uint32_t)(std::min)((size_t)DELTA_MAX_LITERAL, end - literalStart);
+            out += DELTA_OP_LITERAL;
+            putU32(length);
+            out.append(reinterpret_cast<const char*>(&data[literalStart]), length);
+            literalStart += length;
+        }
+    };
+    auto flushOut = [&]() {
+        bool ok = out.empty() || sendTracked(out.data(), out.size());
+        out.clear();
+        return ok;
+    };
+
+    size_t size = data.size();
+    size_t pos = 0;
+    RollingChecksum sum;
+    if (size >= blockSize) sum.reset(&data[0], blockSize);
+
+    while (pos + blockSize <= size) {
+        long match = -1;
+        auto range = blocks.equal_range(sum.value());
+        if (range.first != range.second) {
+            uint64_t strong = fnv64(&data[pos], blockSize);
+            for (auto it = range.first; it != range.second; ++it) {
+                if (signature[it->second].strong != strong) continue;
+                match = it->second;
+                if (copyCount && it->second == copyStart + copyCount) break;  // продолжение серии
+            }
+        }
+
+        if (match >= 0) {
+            if (literalStart < pos || (copyCount && (uint32_t)match != copyStart + copyCount)) {
+                flushCopy();
+                flushLiteral(pos);
+            }
+            if (copyCount == 0) copyStart = (uint32_t)match;
+            copyCount++;
+            pos += blockSize;
+            literalStart = pos;
+            if (pos + blockSize <= size) sum.reset(&data[pos], blockSize);
+        }
+        else {
+            if (pos + blockSize < size) sum.roll(data[pos], data[pos + blockSize]);
+            pos++;
+            if (pos - literalStart >= DELTA_MAX_LITERAL) {
+                flushCopy();
+                flushLiteral(pos);
+            }
+        }
+
+        if (out.size() >= m_tuner.chunkSize() && !flushOut()) return false;
+
+        int progress = (int)((pos * 100) / size);
+        if (progress != lastProgress) {
+            lastProgress = progress;
+            postEvent({ Event::ProgressUpdated, "", "", progress });
+        }
+    }
+
+    flushCopy();
+    flushLiteral(size);
+    out += DELTA_OP_END;
+    uint64_t hash = fnv64(data.data(), size);
+    out.append(reinterpret_cast<const char*>(&hash), sizeof(hash));
+    if (!flushOut()) return false;
+
+    // Получатель подтверждает, что собранный файл совпал по хэшу
+    char result = DELTA_RESULT_FAILED;
+    if (!recv_all(m_clientSocket, &result, 1) || result != DELTA_RESULT_OK) {
+        m_lastError = "Receiver failed to apply delta";
+        postEvent({ Event::StatusMessage, "Receiver failed to apply delta" });
+        return false;
+    }
+
+    postEvent({ Event::ProgressUpdated, "", "", 100 });
+    return true;
+}
+
 void BluetoothTransfer::cleanup()
 {
     if (m_clientSocket != INVALID_SOCKET) {
@@ -412,6 +1595,11 @@ extern "C" {
         instance->startDeviceDiscovery();
     }
 
+    __declspec(dllexport) void cancelDiscovery(BluetoothTransfer* instance)
+    {
+        instance->cancelDiscovery();
+    }
+
     __declspec(dllexport) int connectDevice(BluetoothTransfer* instance, const char* address)
     {
         return instance->connectToDevice(address) ? 1 : 0;
@@ -447,6 +1635,109 @@ extern "C" {
         return instance->getLastError();
     }
 
+    __declspec(dllexport) void setSendRateLimit(BluetoothTransfer* instance, long long bytesPerSecond)
+    {
+        instance->setRateLimit(bytesPerSecond);
+    }
+
+    __declspec(dllexport) void cancelSendFile(BluetoothTransfer* instance)
+    {
+        instance->cancelSend();
+    }
+
+    __declspec(dllexport) void setDeltaTransfer(BluetoothTransfer* instance, int enabled)
+    {
+        instance->setDeltaEnabled(enabled != 0);
+    }
+
+    __declspec(dllexport) void setTransferTuning(BluetoothTransfer* instance, int chunkSize, int socketBuffer)
+    {
+        instance->setTuning(chunkSize, socketBuffer);
+    }
+
+    __declspec(dllexport) void setAckInterval(BluetoothTransfer* instance, int bytes)
+    {
+        instance->setAckInterval(bytes);
+    }
+
+    __declspec(dllexport) void setChannelResolver(BluetoothTransfer* instance, ChannelResolverCallback resolver)
+    {
+        instance->setChannelResolver(resolver);
+    }
+
+    __declspec(dllexport) void forgetDeviceChannel(BluetoothTransfer* instance, const char* address)
+    {
+        instance->forgetChannel(address);
+    }
+
+    // Ключ шифрования передачи (TRANSFER_KEY_SIZE байт); nullptr или size 0 - без шифрования
+    __declspec(dllexport) void setEncryptionKey(BluetoothTransfer* instance, const unsigned char* key, int size)
+    {
+        instance->setEncryptionKey(key, size);
+    }
+
+    // Общий источник рассылки: удаляется только после завершения всех передач с ним
+    __declspec(dllexport) BroadcastSource* createBroadcastSource(const char* filePath)
+    {
+        return new BroadcastSource(filePath);
+    }
+
+    __declspec(dllexport) void destroyBroadcastSource(BroadcastSource* source)
+    {
+        delete source;
+    }
+
+    // Размер файла; -1 - файл не открылся
+    __declspec(dllexport) long long getBroadcastSize(BroadcastSource* source)
+    {
+        return source->isOpen() ? source->fileSize() : -1;
+    }
+
+    __declspec(dllexport) int getBroadcastStats(BroadcastSource* source, BroadcastStats* stats)
+    {
+        if (!stats) return 0;
+        source->getStats(stats);
+        return 1;
+    }
+
+    // Следующая sendFileData берет данные из источника рассылки; nullptr - обычная отправка
+    __declspec(dllexport) void setSendBroadcast(BluetoothTransfer* instance, BroadcastSource* source)
+    {
+        instance->setSendBroadcast(source);
+    }
+
+    // Имитация канала (общая для всех экземпляров в этой DLL); nullptr - выключить
+    __declspec(dllexport) void setLinkSimulation(const LinkSimConfig* config)
+    {
+        LinkSimulator::instance().configure(config);
+    }
+
+    __declspec(dllexport) int getLinkSimulationStats(LinkSimStats* stats)
+    {
+        if (!stats) return 0;
+        LinkSimulator::instance().getStats(stats);
+        return 1;
+    }
+
+    __declspec(dllexport) int getTransferStats(BluetoothTransfer* instance, TransferStats* stats)
+    {
+        if (!stats) return 0;
+        instance->getStats(stats);
+        return 1;
+    }
+
+    __declspec(dllexport) void setEventBatching(BluetoothTransfer* instance, int enabled)
+    {
+        instance->setEventBatching(enabled != 0);
+    }
+
+    // До capacity событий за вызов; ждет первое не дольше timeoutMs. 0 - событий нет
+    // (или пакетная выдача выключена)
+    __declspec(dllexport) int drainEvents(BluetoothTransfer* instance, BatchedEvent* events, int capacity, int timeoutMs)
+    {
+        return instance->drainEvents(events, capacity, timeoutMs);
+    }
+
     __declspec(dllexport) void registerCallbacks(
         BluetoothTransfer* instance,
         DeviceDiscoveredCallback deviceDiscovered,
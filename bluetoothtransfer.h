@@ -9,8 +9,17 @@
 #include <thread>
 #include <atomic>
 #include <queue>
+#include <deque>
 #include <mutex>
 #include <condition_variable>
+#include <chrono>
+#include <vector>
+#include <memory>
+#include <unordered_map>
+#include <cstdio>
+#include "transferprotocol.h"
+#include "linksim.h"
+#include "transfercrypto.h"
 
 // Callback типы для взаимодействия с Python
 typedef void (*DeviceDiscoveredCallback)(const char* name, const char* address);
@@ -20,6 +29,201 @@ typedef void (*FileCallback)(const char* filename);
 typedef void (*ScanFinishedCallback)();
 typedef void (*ConnectedCallback)();
 typedef void (*DisconnectedCallback)();  // Добавлен callback для отключения
+// Подменный поиск канала (тесты, известные заранее устройства): номер канала RFCOMM или 0
+typedef int (*ChannelResolverCallback)(const char* address);
+
+#define RFCOMM_MAX_CHANNEL 30
+
+// Пакетная выдача событий (drainEvents): вместо вызова callback на каждое событие Python
+// одним вызовом забирает массив записей фиксированного размера. Строки лежат в самой записи
+// с завершающим нулем (более длинные обрезаются), тип - BluetoothTransfer::Event::Type
+#define EVENT_BATCH_TEXT_SIZE 256
+#define EVENT_BATCH_ADDRESS_SIZE 32
+
+struct BatchedEvent {
+    int type;
+    int intValue;                           // процент для ProgressUpdated
+    char text[EVENT_BATCH_TEXT_SIZE];       // сообщение или имя устройства
+    char address[EVENT_BATCH_ADDRESS_SIZE]; // адрес найденного устройства
+};
+
+// Сканирование: сначала известные системе устройства (без опроса эфира), затем короткие
+// раунды опроса, результаты которых публикуются сразу; имена безымянных устройств
+// дозапрашиваются пулом потоков
+#define DISCOVERY_INQUIRY_ROUNDS 4
+#define DISCOVERY_ROUND_MULTIPLIER 2   // раунд опроса - 2 x 1.28 с
+#define DISCOVERY_NAME_WORKERS 4
+#define DISCOVERY_NAME_ATTEMPTS 6
+#define DISCOVERY_NAME_RETRY_MS 500
+
+// Статистика передачи для метрик на стороне Python
+// Границы корзин задержки чанка (мс): 0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, +inf
+#define STATS_LATENCY_BUCKETS 12
+#define STATS_STALL_THRESHOLD_MS 500.0
+
+struct TransferStats {
+    unsigned long long bytesTransferred;
+    unsigned long long chunksTransferred;
+    double lastTransferMs;
+    double firstByteMs;
+    unsigned long long stallCount;
+    double stallTotalMs;
+    double stallMaxMs;
+    unsigned long long chunkLatencyBuckets[STATS_LATENCY_BUCKETS];
+    double chunkLatencySumMs;
+    unsigned long long dispatchCount;
+    double dispatchSumMs;
+    double dispatchMaxMs;
+    int eventQueueDepth;
+    int eventQueueMaxDepth;
+    int chunkSize;
+    int socketBuffer;
+    unsigned long long ackedBytes;  // подтверждено получателем в последней передаче
+    double ackWaitMs;               // ожидание подтверждений при заполненном окне
+    double diskWaitMs;              // ожидание чтения файла (канал простаивал)
+    double cryptoMs;                // шифрование чанков (при заданном ключе)
+};
+
+// Подбор размера чанка по скорости, измеренной на окнах передачи: размер удваивается
+// или уменьшается вдвое, пока скорость растет; после двух разворотов - фиксируется,
+// при заметном падении скорости поиск начинается заново
+class ChunkTuner
+{
+public:
+    void reset(size_t initialChunk);
+    bool record(size_t bytes, double ms);  // true - размер чанка изменился
+    size_t chunkSize() const { return m_chunk; }
+
+private:
+    void step();
+
+    size_t m_chunk = TRANSFER_DEFAULT_CHUNK;
+    size_t m_bestChunk = TRANSFER_DEFAULT_CHUNK;
+    double m_bestRate = 0.0;
+    int m_direction = 1;
+    int m_reversals = 0;
+    bool m_settled = false;
+    size_t m_windowBytes = 0;
+    double m_windowMs = 0.0;
+};
+
+// Чтение файла с упреждением в отдельном потоке: пока идет send(), следующие блоки
+// уже читаются, и медленный носитель (флешка, сетевая папка) не останавливает канал
+#define PREFETCH_BLOCK_SIZE (64 * 1024)
+#define PREFETCH_DEPTH 8
+
+// Источник данных отправки: файл целиком или общий буфер рассылки
+class ChunkReader
+{
+public:
+    virtual ~ChunkReader() {}
+    virtual size_t read(char* data, size_t size) = 0;  // как fread: меньше size - конец файла или ошибка
+    virtual bool failed() const = 0;
+    virtual double waitMs() const = 0;
+};
+
+class PrefetchReader : public ChunkReader
+{
+public:
+    explicit PrefetchReader(FILE* file);
+    ~PrefetchReader();
+
+    size_t read(char* data, size_t size) override;
+    bool failed() const override { return m_failed; }
+    double waitMs() const override { return m_waitMs; }
+
+private:
+    void run();
+
+    FILE* m_file;
+    std::deque<std::vector<char>> m_blocks;  // прочитанные блоки, первый - частично отдан
+    std::vector<std::vector<char>> m_free;   // буферы для повторного использования
+    size_t m_offset = 0;
+    bool m_eof = false;
+    bool m_failed = false;
+    bool m_stop = false;
+    double m_waitMs = 0.0;
+    std::mutex m_mutex;
+    std::condition_variable m_dataCV;
+    std::condition_variable m_spaceCV;
+    std::thread m_thread;
+};
+
+// Рассылка файла нескольким устройствам: файл читается с диска один раз в общее кольцо
+// блоков, а каждая передача (свой экземпляр BluetoothTransfer) идет по нему своим курсором.
+// Чтение опережает самого быстрого получателя не больше чем на PREFETCH_DEPTH блоков;
+// получатель, отставший дальше кольца, дочитывает файл с диска сам и не тормозит остальных
+#define BROADCAST_RING_BLOCKS 64
+
+struct BroadcastStats {
+    unsigned long long fileSize;
+    unsigned long long diskBytes;      // прочитано с диска в общее кольцо
+    unsigned long long fallbackBytes;  // дочитано с диска отставшими получателями
+    int readers;                       // идущие передачи
+    int detached;                      // получатели, выпавшие из кольца
+};
+
+class BroadcastSource
+{
+public:
+    explicit BroadcastSource(const char* filePath);
+    ~BroadcastSource();
+
+    bool isOpen() const { return m_file != nullptr; }
+    const std::string& path() const { return m_path; }
+    long fileSize() const { return m_fileSize; }
+    void getStats(BroadcastStats* stats);
+
+    // Блок index (PREFETCH_BLOCK_SIZE байт со смещения index * PREFETCH_BLOCK_SIZE).
+    // nullptr - блок уже вытеснен из кольца (evicted) или не прочитан из-за ошибки
+    std::shared_ptr<const std::vector<char>> block(size_t index, bool& evicted, double& waitMs);
+    void attach();
+    void release(bool detached, unsigned long long fallbackBytes);
+
+private:
+    void run();
+
+    std::string m_path;
+    FILE* m_file;
+    long m_fileSize = 0;
+    size_t m_blockCount = 0;
+    std::deque<std::shared_ptr<const std::vector<char>>> m_ring;
+    size_t m_firstIndex = 0;  // номер блока m_ring.front()
+    size_t m_wanted = 0;      // за самым дальним запрошенным блоком
+    bool m_failed = false;
+    bool m_stop = false;
+    BroadcastStats m_stats;
+    std::mutex m_mutex;
+    std::condition_variable m_dataCV;
+    std::condition_variable m_wantCV;
+    std::thread m_thread;
+};
+
+// Курсор одной передачи по общему кольцу; после вытеснения - собственное чтение с диска
+class BroadcastReader : public ChunkReader
+{
+public:
+    explicit BroadcastReader(BroadcastSource* source);
+    ~BroadcastReader();
+
+    size_t read(char* data, size_t size) override;
+    bool failed() const override { return m_failed; }
+    double waitMs() const override;
+
+private:
+    bool detach();
+
+    BroadcastSource* m_source;
+    std::shared_ptr<const std::vector<char>> m_block;
+    size_t m_index = 0;
+    size_t m_offset = 0;
+    long m_position = 0;
+    FILE* m_file = nullptr;
+    std::unique_ptr<PrefetchReader> m_fallback;
+    unsigned long long m_fallbackBytes = 0;
+    bool m_failed = false;
+    double m_waitMs = 0.0;
+};
 
 class BluetoothTransfer
 {
@@ -29,15 +233,30 @@ public:
 
     // Python-совместимые методы
     void startDeviceDiscovery();
+    void cancelDiscovery() { m_stopDiscovery = true; }
     bool connectToDevice(const char* address);
     void setFileToSend(const char* filePath);
+    void setSendBroadcast(BroadcastSource* source);
     bool sendFile();
     void cleanup();
     void disconnect();  // Добавлен метод для отключения
+    void setRateLimit(long long bytesPerSecond) { m_rateLimit = bytesPerSecond; }
+    void cancelSend() { m_cancelSend = true; }
+    void setDeltaEnabled(bool enabled) { m_deltaEnabled = enabled; }
+    void setTuning(int chunkSize, int socketBuffer);
+    void setAckInterval(int bytes);
+    void setChannelResolver(ChannelResolverCallback resolver) { m_channelResolver = resolver; }
+    void forgetChannel(const char* address);
+    void setEncryptionKey(const unsigned char* key, int size);
 
     // Методы для Python
     bool isConnected() const { return m_isConnected; }
     const char* getLastError() const { return m_lastError.c_str(); }
+    void getStats(TransferStats* stats);
+
+    // Пакетная выдача: пока включена, события не передаются в callback, а копятся до drainEvents
+    void setEventBatching(bool enabled);
+    int drainEvents(BatchedEvent* events, int capacity, int timeoutMs);
 
     // Установка callback-функций из Python
     void setCallbacks(
@@ -60,9 +279,11 @@ private:
     void handleClientDisconnected();  // Добавлен обработчик отключения
     void handleFileSent();
     void handleProgressUpdated(int percent);
+    void recordChunk(double latencyMs, size_t bytes);
 
     SOCKET m_clientSocket;
     std::string m_fileToSendPath;
+    std::atomic<BroadcastSource*> m_broadcast;  // задан - данные берутся из общего кольца рассылки
     std::atomic<bool> m_isConnected;
     std::atomic<bool> m_isDiscovering;
     std::string m_lastError;
@@ -70,6 +291,43 @@ private:
     std::thread m_discoveryThread;
     std::atomic<bool> m_stopDiscovery;
 
+    // Ограничение скорости (token bucket, 0 - без ограничения) и отмена отправки
+    std::atomic<long long> m_rateLimit;
+    std::atomic<bool> m_cancelSend;
+    void throttle(size_t bytes, double& tokens, std::chrono::steady_clock::time_point& lastRefill);
+
+    // Автоподстройка размера чанка и буфера сокета (начальные значения - из Python)
+    ChunkTuner m_tuner;
+    size_t m_initialChunk;
+    int m_initialSocketBuffer;
+    void applySocketBuffer(int size);
+
+    // Заголовок версии 2 и дельта-передача по сигнатуре копии получателя
+    std::atomic<bool> m_deltaEnabled;
+    bool sendHeader(long fileSize, int ackInterval, const std::vector<unsigned char>& key, ChunkCipher& cipher,
+        std::vector<DeltaBlockSignature>& signature, uint32_t& blockSize);
+    bool sendDelta(FILE* file, long fileSize, const std::vector<DeltaBlockSignature>& signature,
+        uint32_t blockSize, const std::function<bool(const char*, size_t)>& sendTracked);
+
+    // Канал сервиса на устройстве: запрос SDP (или подменный поиск) с кэшем по адресу.
+    // peerV2 - устройство опубликовало запись сервиса, значит понимает заголовок версии 2;
+    // без записи (канал по умолчанию) получатель считается старым и получает версию 1
+    struct PeerService { int channel; bool v2; };
+    ChannelResolverCallback m_channelResolver;
+    std::unordered_map<BTH_ADDR, PeerService> m_channelCache;
+    std::mutex m_channelMutex;
+    std::atomic<bool> m_peerV2;
+    int resolveChannel(BTH_ADDR address, bool refresh, bool& fromCache, bool& peerV2);
+    bool openChannel(BTH_ADDR address, int channel, int& errorCode);
+
+    // Подтверждения записи от получателя (0 - без подтверждений)
+    std::atomic<int> m_ackInterval;
+    int readAck(int timeoutMs, AckFrame& frame);
+
+    // Ключ шифрования для устройства (пустой - данные идут открытым текстом)
+    std::vector<unsigned char> m_encryptionKey;
+    std::mutex m_keyMutex;
+
     // Callback функции
     DeviceDiscoveredCallback m_deviceDiscoveredCallback;
     StatusCallback m_statusCallback;
@@ -80,7 +338,7 @@ private:
     ConnectedCallback m_connectedCallback;
     DisconnectedCallback m_disconnectedCallback;  // Добавлен callback отключения
 
-    // Thread-safe очередь для событий
+    // Thread-safe очередь для событий (номера типов - EVENT_* в bluetooth_gui.py)
     struct Event {
         enum Type {
             DeviceDiscovered, ScanFinished, ClientConnected,
@@ -90,6 +348,7 @@ private:
         std::string str1;
         std::string str2;
         int intValue;
+        std::chrono::steady_clock::time_point posted;
     };
 
     std::queue<Event> m_eventQueue;
@@ -97,9 +356,14 @@ private:
     std::condition_variable m_eventCV;
     std::thread m_eventThread;
     std::atomic<bool> m_stopEventThread;
+    bool m_batchEvents;  // под m_eventMutex
 
     void processEvents();
     void postEvent(const Event& event);
+
+    // Метрики передачи
+    TransferStats m_stats;
+    std::mutex m_statsMutex;
 };
 
 // C-совместимый интерфейс для Python
@@ -107,6 +371,7 @@ extern "C" {
     __declspec(dllexport) BluetoothTransfer* createBluetoothTransfer();
     __declspec(dllexport) void destroyBluetoothTransfer(BluetoothTransfer* instance);
     __declspec(dllexport) void startDiscovery(BluetoothTransfer* instance);
+    __declspec(dllexport) void cancelDiscovery(BluetoothTransfer* instance);
     __declspec(dllexport) int connectDevice(BluetoothTransfer* instance, const char* address);
     __declspec(dllexport) void disconnectDevice(BluetoothTransfer* instance);  // Добавлена функция
     __declspec(dllexport) void setSendFile(BluetoothTransfer* instance, const char* filePath);
@@ -114,6 +379,24 @@ extern "C" {
     __declspec(dllexport) void cleanupTransfer(BluetoothTransfer* instance);
     __declspec(dllexport) int isDeviceConnected(BluetoothTransfer* instance);
     __declspec(dllexport) const char* getLastErrorMessage(BluetoothTransfer* instance);
+    __declspec(dllexport) int getTransferStats(BluetoothTransfer* instance, TransferStats* stats);
+    __declspec(dllexport) void setEventBatching(BluetoothTransfer* instance, int enabled);
+    __declspec(dllexport) int drainEvents(BluetoothTransfer* instance, BatchedEvent* events, int capacity, int timeoutMs);
+    __declspec(dllexport) void setSendRateLimit(BluetoothTransfer* instance, long long bytesPerSecond);
+    __declspec(dllexport) void cancelSendFile(BluetoothTransfer* instance);
+    __declspec(dllexport) void setDeltaTransfer(BluetoothTransfer* instance, int enabled);
+    __declspec(dllexport) void setTransferTuning(BluetoothTransfer* instance, int chunkSize, int socketBuffer);
+    __declspec(dllexport) void setAckInterval(BluetoothTransfer* instance, int bytes);
+    __declspec(dllexport) void setChannelResolver(BluetoothTransfer* instance, ChannelResolverCallback resolver);
+    __declspec(dllexport) void forgetDeviceChannel(BluetoothTransfer* instance, const char* address);
+    __declspec(dllexport) void setEncryptionKey(BluetoothTransfer* instance, const unsigned char* key, int size);
+    __declspec(dllexport) BroadcastSource* createBroadcastSource(const char* filePath);
+    __declspec(dllexport) void destroyBroadcastSource(BroadcastSource* source);
+    __declspec(dllexport) long long getBroadcastSize(BroadcastSource* source);
+    __declspec(dllexport) int getBroadcastStats(BroadcastSource* source, BroadcastStats* stats);
+    __declspec(dllexport) void setSendBroadcast(BluetoothTransfer* instance, BroadcastSource* source);
+    __declspec(dllexport) void setLinkSimulation(const LinkSimConfig* config);
+    __declspec(dllexport) int getLinkSimulationStats(LinkSimStats* stats);
 
     // Callback регистрация
     __declspec(dllexport) void registerCallbacks(
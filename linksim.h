@@ -0,0 +1,238 @@
+#ifndef LINKSIM_H
+#define LINKSIM_H
+
+// Имитация канала RFCOMM для отладки и длительных прогонов без радиомодуля.
+//
+// При включенной имитации сокеты создаются как TCP на 127.0.0.1 (канал N - порт
+// basePort + N), а send()/recv() проходят через инжектор сбоев: ограничение полосы,
+// задержка с джиттером, дробление на сегменты (частичные чтения и записи), паузы
+// и обрывы соединения посреди передачи. Состояние свое в каждой DLL - клиент и сервер
+// настраиваются отдельно (setLinkSimulation).
+
+#include <winsock2.h>
+#include <ws2bth.h>
+#include <cstring>
+#include <mutex>
+#include <atomic>
+#include <random>
+#include <chrono>
+#include <thread>
+#include <algorithm>
+
+#define LINK_SIM_DEFAULT_BASE_PORT 41000
+#define LINK_SIM_MAX_CHANNEL 30
+
+struct LinkSimConfig {
+    int enabled;
+    int basePort;                           // 0 - LINK_SIM_DEFAULT_BASE_PORT
+    double bandwidthKBps;                   // 0 - без ограничения
+    double latencyMs;                       // задержка каждого send()
+    double jitterMs;                        // случайное отклонение задержки, +-
+    int maxSegment;                         // send()/recv() передают 1..maxSegment байт, 0 - целиком
+    double stallProbability;                // вероятность паузы на вызов
+    double stallMs;
+    double disconnectProbability;           // вероятность обрыва на вызов
+    unsigned long long disconnectAfterBytes; // обрыв после стольких байт, 0 - нет
+    unsigned int seed;                      // 0 - случайное зерно
+};
+
+struct LinkSimStats {
+    unsigned long long bytesSent;
+    unsigned long long bytesReceived;
+    unsigned long long partialCalls;   // вызовы, урезанные до сегмента
+    unsigned long long stalls;
+    unsigned long long disconnects;
+    double injectedDelayMs;            // суммарная внесенная задержка (полоса, задержка, паузы)
+};
+
+class LinkSimulator
+{
+public:
+    static LinkSimulator& instance() {
+        static LinkSimulator simulator;
+        return simulator;
+    }
+
+    void configure(const LinkSimConfig* config) {
+        std::lock_guard<std::mutex> lock(m_mutex);
+        if (config) {
+            m_config = *config;
+        }
+        else {
+            memset(&m_config, 0, sizeof(m_config));
+        }
+        if (m_config.basePort == 0) m_config.basePort = LINK_SIM_DEFAULT_BASE_PORT;
+        m_rng.seed(m_config.seed ? m_config.seed : std::random_device{}());
+        m_bytesUntilDisconnect = m_config.disconnectAfterBytes;
+        m_nextSendSlot = std::chrono::steady_clock::now();
+        m_enabled = m_config.enabled != 0;
+    }
+
+    bool enabled() const { return m_enabled; }
+
+    void getStats(LinkSimStats* stats) {
+        std::lock_guard<std::mutex> lock(m_mutex);
+        *stats = m_stats;
+    }
+
+    SOCKET createSocket() {
+        return socket(AF_INET, SOCK_STREAM, IPPROTO_TCP);
+    }
+
+    int connectChannel(SOCKET socket, ULONG channel) {
+        sockaddr_in address = channelAddress(channel);
+        return connect(socket, reinterpret_cast<sockaddr*>(&address), sizeof(address));
+    }
+
+    // BT_PORT_ANY - первый свободный канал, как у стека Bluetooth
+    int bindChannel(SOCKET socket, ULONG channel) {
+        if (channel != (ULONG)BT_PORT_ANY) {
+            sockaddr_in address = channelAddress(channel);
+            return bind(socket, reinterpret_cast<sockaddr*>(&address), sizeof(address));
+        }
+        for (ULONG candidate = 1; candidate <= LINK_SIM_MAX_CHANNEL; ++candidate) {
+            sockaddr_in address = channelAddress(candidate);
+            if (bind(socket, reinterpret_cast<sockaddr*>(&address), sizeof(address)) == 0) {
+                return 0;
+            }
+        }
+        return SOCKET_ERROR;
+    }
+
+    ULONG boundChannel(SOCKET socket) {
+        sockaddr_in address = { 0 };
+        int size = sizeof(address);
+        if (getsockname(socket, reinterpret_cast<sockaddr*>(&address), &size) == SOCKET_ERROR) {
+            return 0;
+        }
+        return ntohs(address.sin_port) - (ULONG)m_config.basePort;
+    }
+
+    int sendSome(SOCKET socket, const char* data, int length) {
+        if (!m_enabled) return send(socket, data, length, 0);
+
+        double delayMs = 0.0;
+        if (!injectFaults(socket, length, delayMs)) return SOCKET_ERROR;
+        {
+            std::lock_guard<std::mutex> lock(m_mutex);
+            if (m_config.latencyMs > 0 || m_config.jitterMs > 0) {
+                double jitter = m_config.jitterMs * (2.0 * m_uniform(m_rng) - 1.0);
+                delayMs += (std::max)(0.0, m_config.latencyMs + jitter);
+            }
+            // Полоса: каждый вызов занимает канал на length / bandwidth
+            if (m_config.bandwidthKBps > 0) {
+                auto now = std::chrono::steady_clock::now();
+                if (m_nextSendSlot < now) m_nextSendSlot = now;
+                m_nextSendSlot += std::chrono::microseconds(
+                    (long long)(length * 1000.0 / m_config.bandwidthKBps * 1000.0 / 1024.0));
+                delayMs += std::chrono::duration<double, std::milli>(m_nextSendSlot - now).count();
+            }
+            m_stats.injectedDelayMs += delayMs;
+        }
+        pause(delayMs);
+
+        int sent = send(socket, data, length, 0);
+        if (sent > 0) {
+            std::lock_guard<std::mutex> lock(m_mutex);
+            m_stats.bytesSent += sent;
+        }
+        return sent;
+    }
+
+    int recvSome(SOCKET socket, char* data, int length) {
+        if (!m_enabled) return recv(socket, data, length, 0);
+
+        double delayMs = 0.0;
+        if (!injectFaults(socket, length, delayMs)) return SOCKET_ERROR;
+        pause(delayMs);
+
+        int received = recv(socket, data, length, 0);
+        if (received > 0) {
+            std::lock_guard<std::mutex> lock(m_mutex);
+            m_stats.bytesReceived += received;
+        }
+        return received;
+    }
+
+private:
+    LinkSimulator() {
+        memset(&m_config, 0, sizeof(m_config));
+        memset(&m_stats, 0, sizeof(m_stats));
+    }
+
+    sockaddr_in channelAddress(ULONG channel) {
+        sockaddr_in address = { 0 };
+        address.sin_family = AF_INET;
+        address.sin_addr.s_addr = htonl(INADDR_LOOPBACK);
+        address.sin_port = htons((u_short)(m_config.basePort + channel));
+        return address;
+    }
+
+    // Общие для send и recv сбои: дробление, пауза, обрыв. false - соединение оборвано
+    bool injectFaults(SOCKET socket, int& length, double& delayMs) {
+        bool disconnect = false;
+        {
+            std::lock_guard<std::mutex> lock(m_mutex);
+            if (m_config.maxSegment > 0 && length > 1) {
+                int segment = std::uniform_int_distribution<int>(1, m_config.maxSegment)(m_rng);
+                if (segment < length) {
+                    length = segment;
+                    m_stats.partialCalls++;
+                }
+            }
+            if (m_config.stallProbability > 0 && m_uniform(m_rng) < m_config.stallProbability) {
+                delayMs += m_config.stallMs;
+                m_stats.stalls++;
+                m_stats.injectedDelayMs += m_config.stallMs;
+            }
+            if (m_config.disconnectProbability > 0 && m_uniform(m_rng) < m_config.disconnectProbability) {
+                disconnect = true;
+            }
+            if (m_config.disconnectAfterBytes > 0) {
+                if (m_bytesUntilDisconnect <= (unsigned long long)length) {
+                    disconnect = true;
+                }
+                else {
+                    m_bytesUntilDisconnect -= length;
+                }
+            }
+            if (disconnect) {
+                m_bytesUntilDisconnect = m_config.disconnectAfterBytes;
+                m_stats.disconnects++;
+            }
+        }
+        if (disconnect) {
+            // Обе стороны видят разрыв, как при потере радиоканала
+            shutdown(socket, SD_BOTH);
+            WSASetLastError(WSAECONNRESET);
+            return false;
+        }
+        return true;
+    }
+
+    static void pause(double delayMs) {
+        if (delayMs > 0) {
+            std::this_thread::sleep_for(std::chrono::microseconds((long long)(delayMs * 1000.0)));
+        }
+    }
+
+    std::atomic<bool> m_enabled{ false };
+    LinkSimConfig m_config;
+    LinkSimStats m_stats;
+    unsigned long long m_bytesUntilDisconnect = 0;
+    std::chrono::steady_clock::time_point m_nextSendSlot;
+    std::mt19937 m_rng;
+    std::uniform_real_distribution<double> m_uniform{ 0.0, 1.0 };
+    std::mutex m_mutex;
+};
+
+// send()/recv() транспорта: при включенной имитации - через инжектор сбоев
+inline int link_send(SOCKET socket, const char* data, int length) {
+    return LinkSimulator::instance().sendSome(socket, data, length);
+}
+
+inline int link_recv(SOCKET socket, char* data, int length) {
+    return LinkSimulator::instance().recvSome(socket, data, length);
+}
+
+#endif // LINKSIM_H
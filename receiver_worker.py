@@ -0,0 +1,131 @@
+"""Процесс-обработчик приема для MultiprocessReceiver (bluetooth_gui.py)
+
+Точка входа запускается через spawn, поэтому модуль не импортирует bluetooth_gui, а с ним
+PyQt6 и pygame: обработчику нужны только функции serverthread.dll, которыми он принимает
+файлы на копии слушающего сокета, и разбор полученных файлов.
+"""
+import ctypes
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from ctypes import c_char_p, c_double, c_int, c_ulonglong, c_void_p, CFUNCTYPE
+from logging.handlers import QueueHandler
+from typing import Optional
+
+from audio_metadata import extract_audio_metadata, file_digest
+
+STATS_INTERVAL = 1.0  # секунды между отправкой статистики обработчиком
+
+# Типы callback сервера - те же, что у ServerBackend
+ServerStatusCallback = CFUNCTYPE(None, c_char_p)
+FileReceivedCallback = CFUNCTYPE(None, c_char_p)
+ClientConnectedCallback = CFUNCTYPE(None)
+ClientDisconnectedCallback = CFUNCTYPE(None)
+FileStreamCallback = CFUNCTYPE(None, c_char_p, c_int, c_int)
+TransferFinishedCallback = CFUNCTYPE(None, c_char_p, c_char_p, c_ulonglong, c_double, c_int)
+
+logger = logging.getLogger('server')
+
+def describe_received_file(index: int, path: str) -> dict:
+    """Запись каталога: хэш и метаданные считает процесс-обработчик, а не GUI"""
+    entry = {"worker": index, "received_at": time.time()}
+    try:
+        entry["size"] = os.path.getsize(path)
+        entry["sha1"] = file_digest(path)
+        entry["metadata"] = extract_audio_metadata(path)
+    except Exception as e:
+        logger.warning(f"Не удалось разобрать полученный файл {path}: {e}")
+    return entry
+
+def _decode(value: bytes) -> str:
+    return value.decode('utf-8', errors='ignore')
+
+def run(index: int, control, events, library_path: str, stats_size: int,
+        link_config: Optional[bytes], encryption: Optional[tuple] = None):
+    """Прием на копии слушающего сокета и разбор полученных файлов
+    
+    library_path - serverthread.dll, найденная родителем; stats_size - sizeof(TransferStats),
+    статистика уходит родителю байтами и разбирается там (NativeTransferStats).
+    """
+    root = logging.getLogger()
+    root.handlers = [QueueHandler(events)]
+    root.setLevel(logging.INFO)
+    
+    lib = ctypes.CDLL(library_path)
+    lib.createServerThread.restype = c_void_p
+    lib.createServerThread.argtypes = []
+    lib.destroyServerThread.argtypes = [c_void_p]
+    lib.stopServer.argtypes = [c_void_p]
+    lib.registerServerCallbacks.argtypes = [c_void_p, ServerStatusCallback, FileReceivedCallback,
+                                            ClientConnectedCallback, ClientDisconnectedCallback]
+    lib.startServerOnSharedListener.argtypes = [c_void_p, c_char_p, c_int]
+    lib.startServerOnSharedListener.restype = c_int
+    has_native_stats = hasattr(lib, 'getServerStats')
+    if has_native_stats:
+        lib.getServerStats.argtypes = [c_void_p, c_void_p]
+        lib.getServerStats.restype = c_int
+    
+    # Разбор файла - в своем потоке, чтобы не задерживать поток событий библиотеки
+    postprocess = ThreadPoolExecutor(max_workers=1, thread_name_prefix="receiver-postprocess")
+    
+    def on_file_received(path: bytes):
+        path = _decode(path)
+        postprocess.submit(lambda: events.put(("file", index, path, describe_received_file(index, path))))
+    
+    # Ссылки на callback держатся до уничтожения экземпляра
+    callbacks = (
+        ServerStatusCallback(lambda message: events.put(("status", index, _decode(message)))),
+        FileReceivedCallback(on_file_received),
+        ClientConnectedCallback(lambda: events.put(("connected", index))),
+        ClientDisconnectedCallback(lambda: events.put(("disconnected", index))),
+    )
+    stream_cb = FileStreamCallback(
+        lambda name, size, state: events.put(("stream", index, _decode(name), size, state)))
+    transfer_cb = TransferFinishedCallback(
+        lambda peer, name, size, duration_ms, ok: events.put(
+            ("transfer", index, _decode(peer), _decode(name), size, duration_ms / 1000.0, bool(ok))))
+    
+    if link_config is not None:
+        lib.setLinkSimulation.argtypes = [c_void_p]
+        config = ctypes.create_string_buffer(link_config, len(link_config))
+        lib.setLinkSimulation(config)
+    
+    instance = lib.createServerThread()
+    lib.registerServerCallbacks(instance, *callbacks)
+    if hasattr(lib, 'registerServerStreamCallback'):
+        lib.registerServerStreamCallback.argtypes = [c_void_p, FileStreamCallback]
+        lib.registerServerStreamCallback(instance, stream_cb)
+    if hasattr(lib, 'registerServerTransferCallback'):
+        lib.registerServerTransferCallback.argtypes = [c_void_p, TransferFinishedCallback]
+        lib.registerServerTransferCallback(instance, transfer_cb)
+    if encryption is not None:
+        keys, required = encryption
+        lib.addServerKey.argtypes = [c_void_p, c_char_p, c_int]
+        lib.setServerRequireEncryption.argtypes = [c_void_p, c_int]
+        for key in keys:
+            lib.addServerKey(instance, key, len(key))
+        lib.setServerRequireEncryption(instance, 1 if required else 0)
+    
+    def send_stats():
+        if not has_native_stats:
+            return
+        stats = ctypes.create_string_buffer(stats_size)
+        if lib.getServerStats(instance, stats) == 1:
+            events.put(("stats", index, stats.raw))
+    
+    try:
+        protocol_info = control.recv_bytes()
+        logger.info("Запуск приема на общем слушающем сокете")
+        if lib.startServerOnSharedListener(instance, protocol_info, len(protocol_info)) != 1:
+            events.put(("status", index, "Cannot start on shared listener"))
+            return
+        # Любое сообщение родителя или закрытие канала (родитель завершился) - остановка
+        while not control.poll(STATS_INTERVAL):
+            send_stats()
+        lib.stopServer(instance)
+        postprocess.shutdown(wait=True)
+        send_stats()
+    finally:
+        # Деструктор останавливает сервер и поток событий, затем освобождает Winsock
+        lib.destroyServerThread(instance)
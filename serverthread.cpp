@@ -8,14 +8,15 @@
 #include <ctime>
 #include <fstream>
 #include <algorithm>
+#include <cstring>
+#include <climits>
+#include <vector>
 
 #pragma comment(lib, "Ws2_32.lib")
 #pragma comment(lib, "Bthprops.lib")
 
-// Определение RFCOMM сервисного UUID
-static const GUID RFCOMM_SERVICE_UUID = {
-    0x00001101, 0x0000, 0x1000, {0x80, 0x00, 0x00, 0x80, 0x5F, 0x9B, 0x34, 0xFB}
-};
+// Класс сервиса передачи в SDP (см. transferprotocol.h)
+static const GUID TRANSFER_SERVICE_UUID = TRANSFER_SERVICE_UUID_INIT;
 
 // Вспомогательная функция для конвертации wide string в UTF-8
 static std::string wide_to_utf8(const std::wstring& wstr) {
@@ -26,14 +27,78 @@ static std::string wide_to_utf8(const std::wstring& wstr) {
     return str;
 }
 
+// Верхние границы корзин задержки чанка в миллисекундах (последняя корзина - +inf)
+static const double STATS_LATENCY_BOUNDS_MS[STATS_LATENCY_BUCKETS - 1] = {
+    0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000
+};
+
+static double elapsed_ms(std::chrono::steady_clock::time_point since) {
+    return std::chrono::duration<double, std::milli>(std::chrono::steady_clock::now() - since).count();
+}
+
+// Временное имя приема: уникально для соединения, чтобы одновременные приемы файлов с одним
+// именем (в том числе несколькими процессами-приемниками) не писали в один файл
+static std::string part_file_name(const std::string& fileName) {
+    static std::atomic<unsigned> sequence{ 0 };
+    return fileName + "." + std::to_string(GetCurrentProcessId()) + "-" + std::to_string(++sequence) + ".part";
+}
+
+// Адрес отправителя в том же виде, что и адреса найденных устройств у клиента (hex);
+// при имитации канала - IP-адрес
+static std::string peer_address(const SOCKADDR_BTH& address) {
+    std::ostringstream oss;
+    if (address.addressFamily == AF_BTH) {
+        oss << std::hex << address.btAddr;
+    }
+    else {
+        const unsigned char* ip = reinterpret_cast<const unsigned char*>(
+            &reinterpret_cast<const sockaddr_in*>(&address)->sin_addr);
+        oss << (int)ip[0] << '.' << (int)ip[1] << '.' << (int)ip[2] << '.' << (int)ip[3];
+    }
+    return oss.str();
+}
+
+static bool send_all(SOCKET socket, const char* data, size_t length) {
+    while (length > 0) {
+        int sent = link_send(socket, data, (int)(std::min)(length, (size_t)INT_MAX));
+        if (sent <= 0) return false;
+        data += sent;
+        length -= sent;
+    }
+    return true;
+}
+
+static bool recv_all(SOCKET socket, char* data, size_t length) {
+    while (length > 0) {
+        int received = link_recv(socket, data, (int)(std::min)(length, (size_t)INT_MAX));
+        if (received <= 0) return false;
+        data += received;
+        length -= received;
+    }
+    return true;
+}
+
 ServerThread::ServerThread()
     : m_stopServer(false)
+    , m_running(false)
+    , m_winsockReady(false)
+    , m_mode(ListenAndAccept)
+    , m_listenSocket(INVALID_SOCKET)
     , m_stopEventThread(false)
+    , m_requireEncryption(false)
     , m_statusCallback(nullptr)
     , m_fileReceivedCallback(nullptr)
     , m_clientConnectedCallback(nullptr)
     , m_clientDisconnectedCallback(nullptr)
+    , m_fileStreamCallback(nullptr)
+    , m_transferCallback(nullptr)
 {
+    memset(&m_stats, 0, sizeof(m_stats));
+    memset(&m_sharedListener, 0, sizeof(m_sharedListener));
+
+    WSADATA wsaData;
+    m_winsockReady = WSAStartup(MAKEWORD(2, 2), &wsaData) == 0;
+
     // Запускаем поток обработки событий
     m_eventThread = std::thread(&ServerThread::processEvents, this);
 }
@@ -48,6 +113,10 @@ ServerThread::~ServerThread()
     if (m_eventThread.joinable()) {
         m_eventThread.join();
     }
+
+    if (m_winsockReady) {
+        WSACleanup();
+    }
 }
 
 void ServerThread::setCallbacks(
@@ -62,17 +131,72 @@ void ServerThread::setCallbacks(
     m_clientDisconnectedCallback = clientDisconnected;
 }
 
-void ServerThread::start()
+void ServerThread::start(ListenMode mode)
 {
+    // Уже работающий сервер не перезапускаем: join() ждал бы его остановки
+    if (m_running) {
+        return;
+    }
     m_stopServer = false;
 
     if (m_serverThread.joinable()) {
         m_serverThread.join();
     }
 
+    m_mode = mode;
+    m_running = true;
     m_serverThread = std::thread(&ServerThread::run, this);
 }
 
+bool ServerThread::startShared(const char* protocolInfo, int size)
+{
+    if (m_running || !protocolInfo || size != (int)sizeof(WSAPROTOCOL_INFOA)) {
+        return false;
+    }
+    memcpy(&m_sharedListener, protocolInfo, sizeof(m_sharedListener));
+    start(AcceptShared);
+    return true;
+}
+
+int ServerThread::shareListener(DWORD processId, char* buffer, int size)
+{
+    if (!buffer || size < (int)sizeof(WSAPROTOCOL_INFOA)) {
+        return 0;
+    }
+    std::lock_guard<std::mutex> lock(m_listenMutex);
+    if (m_listenSocket == INVALID_SOCKET) {
+        return 0;
+    }
+    WSAPROTOCOL_INFOA info;
+    if (WSADuplicateSocketA(m_listenSocket, processId, &info) != 0) {
+        postEvent({ Event::StatusMessage, "Cannot share listening socket: " + std::to_string(WSAGetLastError()) });
+        return 0;
+    }
+    memcpy(buffer, &info, sizeof(info));
+    return (int)sizeof(info);
+}
+
+void ServerThread::addKey(const unsigned char* key, int size)
+{
+    if (!key || size != TRANSFER_KEY_SIZE) {
+        return;
+    }
+    std::vector<unsigned char> value(key, key + size);
+    std::string keyId = transfer_key_id(value);
+    if (keyId.empty()) {
+        postEvent({ Event::StatusMessage, "Encryption is not available" });
+        return;
+    }
+    std::lock_guard<std::mutex> lock(m_keyMutex);
+    m_keys[keyId] = value;
+}
+
+void ServerThread::clearKeys()
+{
+    std::lock_guard<std::mutex> lock(m_keyMutex);
+    m_keys.clear();
+}
+
 void ServerThread::stop()
 {
     m_stopServer = true;
@@ -100,6 +224,11 @@ void ServerThread::processEvents()
             m_eventQueue.pop();
         }
 
+        {
+            std::lock_guard<std::mutex> lock(m_statsMutex);
+            m_stats.eventQueueDepth--;
+        }
+
         switch (event.type) {
         case Event::ClientConnected:
             handleClientConnected();
@@ -113,36 +242,115 @@ void ServerThread::processEvents()
         case Event::StatusMessage:
             handleStatusMessage(event.str);
             break;
+        case Event::FileStream:
+            handleFileStream(event.str, event.intValue, event.state);
+            break;
+        case Event::TransferFinished:
+            handleTransferFinished(event);
+            break;
         }
+
+        // Задержка доставки: от постановки в очередь до завершения callback
+        double dispatchMs = elapsed_ms(event.posted);
+        std::lock_guard<std::mutex> lock(m_statsMutex);
+        m_stats.dispatchCount++;
+        m_stats.dispatchSumMs += dispatchMs;
+        m_stats.dispatchMaxMs = (std::max)(m_stats.dispatchMaxMs, dispatchMs);
     }
 }
 
 void ServerThread::postEvent(const Event& event)
 {
+    Event posted = event;
+    posted.posted = std::chrono::steady_clock::now();
     {
         std::lock_guard<std::mutex> lock(m_eventMutex);
-        m_eventQueue.push(event);
+        m_eventQueue.push(posted);
+    }
+    {
+        std::lock_guard<std::mutex> lock(m_statsMutex);
+        m_stats.eventQueueDepth++;
+        m_stats.eventQueueMaxDepth = (std::max)(m_stats.eventQueueMaxDepth, m_stats.eventQueueDepth);
     }
     m_eventCV.notify_one();
 }
 
+void ServerThread::reportTransfer(const std::string& peer, const std::string& fileName, unsigned long long bytes,
+    std::chrono::steady_clock::time_point transferStart, bool ok)
+{
+    Event event{ Event::TransferFinished, fileName, ok ? 1 : 0 };
+    event.peer = peer;
+    event.bytes = bytes;
+    event.durationMs = elapsed_ms(transferStart);
+    postEvent(event);
+}
+
+void ServerThread::recordChunk(double latencyMs, size_t bytes)
+{
+    std::lock_guard<std::mutex> lock(m_statsMutex);
+    m_stats.bytesTransferred += bytes;
+    m_stats.chunksTransferred++;
+    m_stats.chunkLatencySumMs += latencyMs;
+
+    int bucket = 0;
+    while (bucket < STATS_LATENCY_BUCKETS - 1 && latencyMs > STATS_LATENCY_BOUNDS_MS[bucket]) {
+        bucket++;
+    }
+    m_stats.chunkLatencyBuckets[bucket]++;
+
+    // Долгое ожидание recv() считаем зависанием канала
+    if (latencyMs >= STATS_STALL_THRESHOLD_MS) {
+        m_stats.stallCount++;
+        m_stats.stallTotalMs += latencyMs;
+        m_stats.stallMaxMs = (std::max)(m_stats.stallMaxMs, latencyMs);
+    }
+}
+
+void ServerThread::getStats(ServerStats* stats)
+{
+    std::lock_guard<std::mutex> lock(m_statsMutex);
+    *stats = m_stats;
+}
+
 void ServerThread::run()
 {
-    WSADATA wsaData;
-    if (WSAStartup(MAKEWORD(2, 2), &wsaData) != 0) {
+    // Поток сервера сбрасывает признак работы при любом выходе из run()
+    struct RunningGuard {
+        std::atomic<bool>& running;
+        ~RunningGuard() { running = false; }
+    } runningGuard{ m_running };
+
+    if (!m_winsockReady) {
         postEvent({ Event::StatusMessage, "WSAStartup failed" });
         return;
     }
 
+    // Обработчик: сокет, канал и запись SDP принадлежат родительскому процессу
+    if (m_mode == AcceptShared) {
+        SOCKET sharedSocket = WSASocketA(FROM_PROTOCOL_INFO, FROM_PROTOCOL_INFO, FROM_PROTOCOL_INFO,
+            &m_sharedListener, 0, 0);
+        if (sharedSocket == INVALID_SOCKET) {
+            postEvent({ Event::StatusMessage, "Cannot open shared listening socket: " + std::to_string(WSAGetLastError()) });
+            return;
+        }
+        postEvent({ Event::StatusMessage, "Server accepting on shared listener, waiting for connections..." });
+        acceptConnections(sharedSocket);
+        closesocket(sharedSocket);
+        postEvent({ Event::StatusMessage, "Server stopped" });
+        return;
+    }
+
     SOCKADDR_BTH sockaddrBth = { 0 };
     sockaddrBth.addressFamily = AF_BTH;
-    sockaddrBth.serviceClassId = RFCOMM_SERVICE_UUID;
-    sockaddrBth.port = 6;
+    sockaddrBth.serviceClassId = TRANSFER_SERVICE_UUID;
 
-    SOCKET serverSocket = socket(AF_BTH, SOCK_STREAM, BTHPROTO_RFCOMM);
+    LinkSimulator& simulator = LinkSimulator::instance();
+    bool simulated = simulator.enabled();
+    SOCKET serverSocket = simulated
+        ? simulator.createSocket()
+        : socket(AF_BTH, SOCK_STREAM, BTHPROTO_RFCOMM);
     if (serverSocket == INVALID_SOCKET) {
         postEvent({ Event::StatusMessage, "Error creating server socket" });
-        WSACleanup();
         return;
     }
 
@@ -151,31 +359,103 @@ void ServerThread::run()
     setsockopt(serverSocket, SOL_SOCKET, SO_RCVTIMEO, (char*)&timeout, sizeof(timeout));
     setsockopt(serverSocket, SOL_SOCKET, SO_SNDTIMEO, (char*)&timeout, sizeof(timeout));
 
-    if (bind(serverSocket,
-        reinterpret_cast<sockaddr*>(&sockaddrBth),
-        sizeof(sockaddrBth)) == SOCKET_ERROR) {
-        postEvent({ Event::StatusMessage, "Bind failed" });
-        closesocket(serverSocket);
-        WSACleanup();
-        return;
+    auto bindChannel = [&](ULONG channel) {
+        if (simulated) return simulator.bindChannel(serverSocket, channel);
+        sockaddrBth.port = channel;
+        return bind(serverSocket, reinterpret_cast<sockaddr*>(&sockaddrBth), sizeof(sockaddrBth));
+    };
+
+    // Прежний канал для старых клиентов; если он занят - любой свободный, клиенты найдут его по SDP
+    if (bindChannel(SERVER_PREFERRED_CHANNEL) == SOCKET_ERROR) {
+        if (bindChannel(BT_PORT_ANY) == SOCKET_ERROR) {
+            postEvent({ Event::StatusMessage, "Bind failed" });
+            closesocket(serverSocket);
+            return;
+        }
+    }
+
+    SOCKADDR_BTH boundAddr = { 0 };
+    int boundSize = sizeof(boundAddr);
+    if (simulated) {
+        boundAddr.port = simulator.boundChannel(serverSocket);
+    }
+    else {
+        getsockname(serverSocket, reinterpret_cast<sockaddr*>(&boundAddr), &boundSize);
     }
 
     if (listen(serverSocket, SOMAXCONN) == SOCKET_ERROR) {
         postEvent({ Event::StatusMessage, "Listen failed" });
         closesocket(serverSocket);
-        WSACleanup();
         return;
     }
 
-    postEvent({ Event::StatusMessage, "Server started, waiting for connections..." });
+    // Запись SDP с фактическим каналом: клиенты подключаются к нему без перебора портов
+    CSADDR_INFO serviceAddr = { 0 };
+    serviceAddr.LocalAddr.lpSockaddr = reinterpret_cast<LPSOCKADDR>(&boundAddr);
+    serviceAddr.LocalAddr.iSockaddrLength = sizeof(boundAddr);
+    serviceAddr.iSocketType = SOCK_STREAM;
+    serviceAddr.iProtocol = BTHPROTO_RFCOMM;
+
+    GUID serviceId = TRANSFER_SERVICE_UUID;
+    char serviceName[] = "Bluetooth Audio Transfer";
+    WSAQUERYSETA service = { 0 };
+    service.dwSize = sizeof(service);
+    service.lpszServiceInstanceName = serviceName;
+    service.lpServiceClassId = &serviceId;
+    service.dwNameSpace = NS_BTH;
+    service.dwNumberOfCsAddrs = 1;
+    service.lpcsaBuffer = &serviceAddr;
+
+    // Имитируемый канал в SDP не публикуется - клиент получает номер канала от подменного поиска
+    bool serviceRegistered = !simulated && WSASetServiceA(&service, RNRSERVICE_REGISTER, 0) == 0;
+    if (!serviceRegistered && !simulated) {
+        postEvent({ Event::StatusMessage, "SDP registration failed with error: " + std::to_string(WSAGetLastError()) });
+    }
+
+    postEvent({ Event::StatusMessage, "Server started on channel " + std::to_string(boundAddr.port) +
+        ", waiting for connections..." });
+
+    {
+        std::lock_guard<std::mutex> lock(m_listenMutex);
+        m_listenSocket = serverSocket;
+    }
+    if (m_mode == ListenOnly) {
+        // Подключения принимают процессы-обработчики на копиях сокета, здесь только ждем остановки
+        while (!m_stopServer) {
+            std::this_thread::sleep_for(std::chrono::milliseconds(SERVER_ACCEPT_POLL_MS));
+        }
+    }
+    else {
+        acceptConnections(serverSocket);
+    }
+    {
+        std::lock_guard<std::mutex> lock(m_listenMutex);
+        m_listenSocket = INVALID_SOCKET;
+    }
+
+    if (serviceRegistered) {
+        WSASetServiceA(&service, RNRSERVICE_DELETE, 0);
+    }
+    closesocket(serverSocket);
+    postEvent({ Event::StatusMessage, "Server stopped" });
+}
+
+void ServerThread::acceptConnections(SOCKET serverSocket)
+{
+    int timeout = 10000; // 10 секунд
+
+    // Неблокирующий accept(): select() будит все процессы с копией сокета, а подключение
+    // достается одному - остальные не должны зависнуть в accept() до следующего
+    u_long nonBlocking = 1;
+    ioctlsocket(serverSocket, FIONBIO, &nonBlocking);
 
     while (!m_stopServer) {
         fd_set readSet;
         FD_ZERO(&readSet);
         FD_SET(serverSocket, &readSet);
 
-        timeval timeout{ 1, 0 };
-        int sel = select(0, &readSet, nullptr, nullptr, &timeout);
+        timeval selectTimeout{ 0, SERVER_ACCEPT_POLL_MS * 1000 };
+        int sel = select(0, &readSet, nullptr, nullptr, &selectTimeout);
         if (sel == SOCKET_ERROR) break;
         if (sel == 0) continue;
 
@@ -186,6 +466,10 @@ void ServerThread::run()
             &clientAddrSize);
         if (clientSocket == INVALID_SOCKET) continue;
 
+        // Принятый сокет наследует неблокирующий режим слушающего
+        u_long blocking = 0;
+        ioctlsocket(clientSocket, FIONBIO, &blocking);
+
         // Устанавливаем таймауты для клиентского сокета
         setsockopt(clientSocket, SOL_SOCKET, SO_RCVTIMEO, (char*)&timeout, sizeof(timeout));
         setsockopt(clientSocket, SOL_SOCKET, SO_SNDTIMEO, (char*)&timeout, sizeof(timeout));
@@ -193,12 +477,18 @@ void ServerThread::run()
         postEvent({ Event::ClientConnected });
         postEvent({ Event::StatusMessage, "Client connected" });
 
+        std::string peer = peer_address(clientAddr);
+        auto transferStart = std::chrono::steady_clock::now();
         char sizeBuf[21] = { 0 };
         int received = 0;
 
         while (received < 20 && !m_stopServer) {
-            int r = recv(clientSocket, sizeBuf + received, 20 - received, 0);
+            int r = link_recv(clientSocket, sizeBuf + received, 20 - received);
             if (r <= 0) break;
+            if (received == 0) {
+                std::lock_guard<std::mutex> lock(m_statsMutex);
+                m_stats.firstByteMs = elapsed_ms(transferStart);
+            }
             received += r;
         }
 
@@ -211,13 +501,75 @@ void ServerThread::run()
         if (received < 20) {
             postEvent({ Event::ClientDisconnected });
             postEvent({ Event::StatusMessage, "Client disconnected before sending file size" });
+            reportTransfer(peer, "", 0, transferStart, false);
             closesocket(clientSocket);
             continue;
         }
 
-        int dataSize = atoi(sizeBuf);
+        // Версия 1 - только размер, версия 2 - размер, имя файла и параметры передачи
+        std::map<std::string, std::string> fields;
+        std::string body;
+        if (is_v2_header(sizeBuf)) {
+            int headerLength = atoi(sizeBuf + 4);
+            body.resize(headerLength > 0 ? headerLength : 0);
+            if (headerLength <= 0 || headerLength > PROTOCOL_V2_MAX_HEADER ||
+                !recv_all(clientSocket, &body[0], body.size())) {
+                postEvent({ Event::StatusMessage, "Invalid file header received" });
+                reportTransfer(peer, "", 0, transferStart, false);
+                closesocket(clientSocket);
+                continue;
+            }
+            fields = parse_v2_header(body);
+        }
+
+        // Буфер приема под размер чанка, который подобрал отправитель
+        int chunkHint = atoi(fields["chunk"].c_str());
+        if (chunkHint > 0) {
+            int socketBuffer = socket_buffer_for_chunk((std::min)(chunkHint, TRANSFER_MAX_CHUNK));
+            setsockopt(clientSocket, SOL_SOCKET, SO_RCVBUF, (char*)&socketBuffer, sizeof(socketBuffer));
+            std::lock_guard<std::mutex> lock(m_statsMutex);
+            m_stats.chunkSize = chunkHint;
+            m_stats.socketBuffer = socketBuffer;
+        }
+
+        int dataSize = atoi(is_v2_header(sizeBuf) ? fields["size"].c_str() : sizeBuf);
         if (dataSize <= 0) {
             postEvent({ Event::StatusMessage, "Invalid file size received" });
+            reportTransfer(peer, fields["name"], 0, transferStart, false);
+            closesocket(clientSocket);
+            continue;
+        }
+
+        // Шифрованная передача: ключ пары находится по идентификатору из заголовка,
+        // заголовок целиком - дополнительные данные каждой записи
+        ChunkCipher cipher;
+        bool encrypted = !fields["enc"].empty();
+        if (encrypted) {
+            std::vector<unsigned char> key;
+            {
+                std::lock_guard<std::mutex> lock(m_keyMutex);
+                auto found = m_keys.find(fields["key"]);
+                if (found != m_keys.end()) key = found->second;
+            }
+            unsigned char noncePrefix[TRANSFER_NONCE_PREFIX_SIZE];
+            if (key.empty()) {
+                postEvent({ Event::StatusMessage, "No key for encrypted transfer from this device" });
+                reportTransfer(peer, fields["name"], 0, transferStart, false);
+                closesocket(clientSocket);
+                continue;
+            }
+            if (fields["enc"] != TRANSFER_CIPHER_NAME ||
+                !from_hex(fields["nonce"], noncePrefix, sizeof(noncePrefix)) ||
+                !cipher.init(key, noncePrefix, body)) {
+                postEvent({ Event::StatusMessage, "Unsupported encryption: " + fields["enc"] });
+                reportTransfer(peer, fields["name"], 0, transferStart, false);
+                closesocket(clientSocket);
+                continue;
+            }
+        }
+        else if (m_requireEncryption) {
+            postEvent({ Event::StatusMessage, "Unencrypted transfer rejected" });
+            reportTransfer(peer, fields["name"], 0, transferStart, false);
             closesocket(clientSocket);
             continue;
         }
@@ -235,54 +587,341 @@ void ServerThread::run()
         std::string downloadDir = "received_files";
         CreateDirectoryA(downloadDir.c_str(), NULL);
 
-        std::string fileName = downloadDir + "\\received_file_" + std::string(timeStr) + ".mp3";
+        // Файл с именем отправителя; без имени - имя по времени
+        std::string safeName = sanitize_file_name(fields["name"]);
+        std::string fileName = safeName.empty()
+            ? downloadDir + "\\received_file_" + std::string(timeStr) + ".mp3"
+            : downloadDir + "\\" + safeName;
 
-        // Открываем файл для записи
-        std::ofstream outFile(fileName, std::ios::binary);
-        if (!outFile.is_open()) {
-            postEvent({ Event::StatusMessage, "Cannot create output file" });
-            closesocket(clientSocket);
-            continue;
+        // Запасное имя, если файл с таким именем уже есть (или занят)
+        size_t dot = fileName.find_last_of('.');
+        if (dot == std::string::npos || dot < downloadDir.size() + 1) dot = fileName.size();
+        std::string altName = fileName.substr(0, dot) + "_" + timeStr + fileName.substr(dot);
+
+        int deltaResult = fields["delta"] == "1" && !encrypted
+            ? receiveDelta(clientSocket, fileName, altName, dataSize, transferStart)
+            : DeltaUnused;
+        bool ok = deltaResult == DeltaDone;
+        int fileBytes = ok ? dataSize : 0;
+        if (deltaResult == DeltaUnused) {
+            // Отправитель ждет подтверждений записи, если предложил интервал
+            int ackInterval = atoi(fields["ack"].c_str());
+            if (ackInterval > 0) ackInterval = (std::max)(ackInterval, ACK_MIN_INTERVAL);
+            // Прежнюю версию заменяет только обновление (отправитель предложил дельту; при
+            // шифровании дельты нет), иначе принятый файл не затирает уже имеющийся с тем же именем
+            bool replaceExisting = fields["delta"] == "1" && !encrypted;
+            ok = receiveFile(clientSocket, fileName, altName, replaceExisting, dataSize, ackInterval,
+                encrypted ? &cipher : nullptr, transferStart, fileBytes);
+        }
+        reportTransfer(peer, fileName, fileBytes, transferStart, ok);
+
+        closesocket(clientSocket);
+        postEvent({ Event::ClientDisconnected });
+        postEvent({ Event::StatusMessage, "Client disconnected" });
+    }
+}
+
+bool ServerThread::publishFile(const std::string& tempName, std::string& fileName, const std::string& altName,
+    bool replaceExisting)
+{
+    // Без MOVEFILE_REPLACE_EXISTING перенос не удается, если имя занято, - проверка и перенос атомарны
+    if (MoveFileExA(tempName.c_str(), fileName.c_str(), replaceExisting ? MOVEFILE_REPLACE_EXISTING : 0)) {
+        return true;
+    }
+    if (fileName == altName) return false;
+    // Запасное имя тоже может быть занято (два приема за секунду) - добавляется номер
+    size_t dot = altName.find_last_of('.');
+    size_t slash = altName.find_last_of('\\');
+    if (dot == std::string::npos || (slash != std::string::npos && dot < slash)) dot = altName.size();
+    for (int attempt = 1; attempt <= 100; ++attempt) {
+        std::string candidate = attempt == 1 ? altName
+            : altName.substr(0, dot) + "_" + std::to_string(attempt) + altName.substr(dot);
+        if (MoveFileExA(tempName.c_str(), candidate.c_str(), 0)) {
+            fileName = candidate;
+            return true;
         }
+    }
+    return false;
+}
 
-        int remaining = dataSize;
-        char buffer[1024];
-        int total = 0;
+bool ServerThread::receiveFile(SOCKET clientSocket, std::string& fileName, const std::string& altName,
+    bool replaceExisting, int dataSize, int ackInterval, ChunkCipher* cipher,
+    std::chrono::steady_clock::time_point transferStart, int& received)
+{
+    auto sendAck = [&](char type, long long offset) {
+        if (ackInterval <= 0) return true;
+        AckFrame frame{ type, (uint64_t)offset };
+        if (!send_all(clientSocket, reinterpret_cast<const char*>(&frame), sizeof(frame))) return false;
+        std::lock_guard<std::mutex> lock(m_statsMutex);
+        m_stats.ackedBytes = offset;
+        return true;
+    };
+    {
+        std::lock_guard<std::mutex> lock(m_statsMutex);
+        m_stats.ackedBytes = 0;
+    }
 
-        while (remaining > 0 && !m_stopServer) {
-            int want = (std::min)(static_cast<int>(sizeof(buffer)), remaining);
-            int r = recv(clientSocket, buffer, want, 0);
-            if (r <= 0) break;
+    // Имеющийся файл с тем же именем не трогаем, пока новый не принят целиком: обрыв
+    // или ошибка удаляют только временный файл. Он создается с первыми данными, при
+    // шифровании - после проверки тега первой записи: отправитель без ключа не создает
+    // на диске ничего
+    std::string tempName = part_file_name(fileName);
+    std::ofstream outFile;
+    bool started = false;
 
-            outFile.write(buffer, r);
-            remaining -= r;
-            total += r;
+    // recv() возвращает все, что накопилось в буфере сокета, - читаем крупными порциями
+    int remaining = dataSize;
+    std::vector<char> buffer(TRANSFER_MAX_CHUNK);
+    std::vector<char> record(cipher ? TRANSFER_MAX_CHUNK + TRANSFER_TAG_SIZE : 0);
+    double cryptoMs = 0.0;
+    int total = 0;
+    int unflushed = 0;
+    int lastDecile = -1;
+    int lastAck = 0;
+    bool writeFailed = false;
+    bool decryptFailed = false;
 
-            int percent = (total * 100) / dataSize;
-            if (percent % 10 == 0) {  // Отправляем статус каждые 10%
-                postEvent({ Event::StatusMessage, "Receiving: " + std::to_string(percent) + "%" });
+    while (remaining > 0 && !m_stopServer) {
+        auto chunkStart = std::chrono::steady_clock::now();
+        int r;
+        if (cipher) {
+            // Запись проверяется целиком до записи на диск: в файл (и в воспроизведение
+            // по мере приема) попадают только подлинные данные
+            uint32_t length;
+            if (!recv_all(clientSocket, reinterpret_cast<char*>(&length), sizeof(length)) ||
+                length == 0 || length > TRANSFER_MAX_CHUNK || (int)length > remaining ||
+                !recv_all(clientSocket, record.data(), length + TRANSFER_TAG_SIZE)) {
+                break;
             }
+            recordChunk(elapsed_ms(chunkStart), length + TRANSFER_RECORD_OVERHEAD);
+            auto openStart = std::chrono::steady_clock::now();
+            if (!cipher->open(record.data(), length, buffer.data())) {
+                decryptFailed = true;
+                break;
+            }
+            cryptoMs += elapsed_ms(openStart);
+            r = (int)length;
+        }
+        else {
+            int want = (std::min)(static_cast<int>(buffer.size()), remaining);
+            r = link_recv(clientSocket, buffer.data(), want);
+            if (r <= 0) break;
+            recordChunk(elapsed_ms(chunkStart), r);
+        }
+
+        if (!started) {
+            outFile.open(tempName, std::ios::binary);
+            if (!outFile.is_open()) {
+                postEvent({ Event::StatusMessage, "Cannot create output file" });
+                sendAck(ACK_FAILED, 0);
+                received = 0;
+                return false;
+            }
+            started = true;
+            // Воспроизведение во время приема читает временный файл
+            postEvent({ Event::FileStream, tempName, dataSize, STREAM_STATE_STARTED });
+        }
+
+        outFile.write(buffer.data(), r);
+        remaining -= r;
+        total += r;
+
+        // Периодически сбрасываем буфер, чтобы файл можно было читать во время приема
+        unflushed += r;
+        if (unflushed >= 64 * 1024 || (ackInterval > 0 && total - lastAck >= ackInterval)) {
+            outFile.flush();
+            unflushed = 0;
+        }
+        if (!outFile) {
+            writeFailed = true;
+            break;
+        }
+
+        // Подтверждаем только то, что уже передано в файл
+        if (ackInterval > 0 && total - lastAck >= ackInterval) {
+            if (!sendAck(ACK_CHECKPOINT, total)) break;
+            lastAck = total;
+        }
+
+        int decile = (int)((long long)total * 10 / dataSize);
+        if (decile != lastDecile) {  // Отправляем статус каждые 10%
+            lastDecile = decile;
+            postEvent({ Event::StatusMessage, "Receiving: " + std::to_string(decile * 10) + "%" });
         }
+    }
+    if (started) {
         outFile.close();
+        if (outFile.fail()) writeFailed = true;
+    }
+
+    {
+        std::lock_guard<std::mutex> lock(m_statsMutex);
+        m_stats.lastTransferMs = elapsed_ms(transferStart);
+        m_stats.cryptoMs += cryptoMs;
+    }
+    received = total;
+
+    if (writeFailed || decryptFailed) {
+        sendAck(ACK_FAILED, lastAck);
+        postEvent({ Event::StatusMessage, decryptFailed
+            ? "Decryption failed: wrong key or corrupted data" : "Cannot write received file" });
+        if (started) {
+            postEvent({ Event::FileStream, tempName, dataSize, STREAM_STATE_ABORTED });
+            DeleteFileA(tempName.c_str());
+        }
+        return false;
+    }
+    if (remaining == 0) {
+        postEvent({ Event::FileStream, tempName, dataSize, STREAM_STATE_FINISHED });
+        if (!publishFile(tempName, fileName, altName, replaceExisting)) {
+            sendAck(ACK_FAILED, lastAck);
+            postEvent({ Event::StatusMessage, "Cannot save received file" });
+            DeleteFileA(tempName.c_str());
+            return false;
+        }
+        // Подтверждение 'K' - файл уже на своем месте
+        sendAck(ACK_DONE, total);
+        postEvent({ Event::FileReceived, fileName });
+        postEvent({ Event::StatusMessage, "File received successfully" });
+        return true;
+    }
+    postEvent({ Event::StatusMessage, "File transfer incomplete" });
+    if (started) {
+        // Удаляем неполный файл
+        postEvent({ Event::FileStream, tempName, dataSize, STREAM_STATE_ABORTED });
+        DeleteFileA(tempName.c_str());
+    }
+    return false;
+}
+
+int ServerThread::receiveDelta(SOCKET clientSocket, std::string& fileName, const std::string& altName,
+    int dataSize, std::chrono::steady_clock::time_point transferStart)
+{
+    DeltaSignatureHeader header;
+    memcpy(header.magic, DELTA_SIGNATURE_MAGIC, 4);
+    header.blockCount = 0;
+    header.reserved = 0;
+
+    // Сигнатура нашей копии файла с тем же именем
+    std::ifstream base(fileName, std::ios::binary | std::ios::ate);
+    long long baseSize = base.is_open() ? (long long)base.tellg() : 0;
+    header.blockSize = delta_block_size(baseSize);
 
-        if (remaining == 0) {
-            postEvent({ Event::FileReceived, fileName });
-            postEvent({ Event::StatusMessage, "File received successfully" });
+    std::vector<DeltaBlockSignature> signature;
+    if (baseSize >= DELTA_MIN_FILE_SIZE && baseSize <= DELTA_MAX_FILE_SIZE) {
+        std::vector<unsigned char> block(header.blockSize);
+        base.seekg(0);
+        while (base.read(reinterpret_cast<char*>(block.data()), block.size()) || base.gcount() > 0) {
+            size_t length = (size_t)base.gcount();
+            signature.push_back({ weak_checksum(block.data(), length), fnv64(block.data(), length) });
+        }
+        header.blockCount = (uint32_t)signature.size();
+    }
+
+    if (!send_all(clientSocket, reinterpret_cast<const char*>(&header), sizeof(header)) ||
+        !send_all(clientSocket, reinterpret_cast<const char*>(signature.data()),
+            signature.size() * sizeof(DeltaBlockSignature))) {
+        postEvent({ Event::StatusMessage, "Failed to send delta signature" });
+        return DeltaFailed;
+    }
+    if (signature.empty()) return DeltaUnused;
+
+    // Файл собирается рядом и заменяет прежнюю версию только после проверки хэша
+    std::string tempName = part_file_name(fileName);
+    std::ofstream outFile(tempName, std::ios::binary);
+    if (!outFile.is_open()) {
+        postEvent({ Event::StatusMessage, "Cannot create output file" });
+        return DeltaFailed;
+    }
+    postEvent({ Event::StatusMessage, "Receiving changes to existing file" });
+
+    std::vector<char> buffer((std::max)((size_t)DELTA_MAX_LITERAL, (size_t)header.blockSize));
+    uint64_t hash = FNV64_OFFSET;
+    long long total = 0;
+    int lastDecile = -1;
+    bool ok = false;
+    bool valid = true;
+
+    while (valid && !m_stopServer) {
+        char op;
+        auto chunkStart = std::chrono::steady_clock::now();
+        if (!recv_all(clientSocket, &op, 1)) break;
+
+        if (op == DELTA_OP_LITERAL) {
+            uint32_t length;
+            if (!recv_all(clientSocket, reinterpret_cast<char*>(&length), sizeof(length)) ||
+                length > DELTA_MAX_LITERAL || total + length > dataSize ||
+                !recv_all(clientSocket, buffer.data(), length)) {
+                break;
+            }
+            recordChunk(elapsed_ms(chunkStart), length + 5);
+            outFile.write(buffer.data(), length);
+            hash = fnv64_update(hash, reinterpret_cast<unsigned char*>(buffer.data()), length);
+            total += length;
+        }
+        else if (op == DELTA_OP_COPY) {
+            uint32_t range[2];
+            if (!recv_all(clientSocket, reinterpret_cast<char*>(range), sizeof(range)) ||
+                (unsigned long long)range[0] + range[1] > signature.size()) {
+                break;
+            }
+            recordChunk(elapsed_ms(chunkStart), 9);
+            base.clear();
+            base.seekg((std::streamoff)range[0] * header.blockSize);
+            for (uint32_t i = 0; i < range[1] && valid; ++i) {
+                base.read(buffer.data(), header.blockSize);
+                size_t length = (size_t)base.gcount();
+                valid = length > 0 && total + (long long)length <= dataSize;
+                if (valid) {
+                    outFile.write(buffer.data(), length);
+                    hash = fnv64_update(hash, reinterpret_cast<unsigned char*>(buffer.data()), length);
+                    total += length;
+                }
+            }
+        }
+        else if (op == DELTA_OP_END) {
+            uint64_t expected;
+            ok = recv_all(clientSocket, reinterpret_cast<char*>(&expected), sizeof(expected)) &&
+                expected == hash && total == dataSize;
+            if (!ok) {
+                postEvent({ Event::StatusMessage, "Delta verification failed" });
+            }
+            break;
         }
         else {
-            postEvent({ Event::StatusMessage, "File transfer incomplete" });
-            // Удаляем неполный файл
-            DeleteFileA(fileName.c_str());
+            break;
         }
 
-        closesocket(clientSocket);
-        postEvent({ Event::ClientDisconnected });
-        postEvent({ Event::StatusMessage, "Client disconnected" });
+        int decile = (int)(total * 10 / dataSize);
+        if (decile != lastDecile) {
+            lastDecile = decile;
+            postEvent({ Event::StatusMessage, "Receiving: " + std::to_string(decile * 10) + "%" });
+        }
     }
+    outFile.close();
+    base.close();
 
-    closesocket(serverSocket);
-    WSACleanup();
-    postEvent({ Event::StatusMessage, "Server stopped" });
+    {
+        std::lock_guard<std::mutex> lock(m_statsMutex);
+        m_stats.lastTransferMs = elapsed_ms(transferStart);
+    }
+
+    if (ok) {
+        ok = publishFile(tempName, fileName, altName, true);
+    }
+
+    char result = ok ? DELTA_RESULT_OK : DELTA_RESULT_FAILED;
+    send_all(clientSocket, &result, 1);
+
+    if (!ok) {
+        DeleteFileA(tempName.c_str());
+        postEvent({ Event::StatusMessage, "File transfer incomplete" });
+        return DeltaFailed;
+    }
+
+    postEvent({ Event::FileReceived, fileName });
+    postEvent({ Event::StatusMessage, "File received successfully" });
+    return DeltaDone;
 }
 
 void ServerThread::handleClientConnected()
@@ -313,6 +952,20 @@ void ServerThread::handleStatusMessage(const std::string& message)
     }
 }
 
+void ServerThread::handleFileStream(const std::string& filename, int totalSize, int state)
+{
+    if (m_fileStreamCallback) {
+        m_fileStreamCallback(filename.c_str(), totalSize, state);
+    }
+}
+
+void ServerThread::handleTransferFinished(const Event& event)
+{
+    if (m_transferCallback) {
+        m_transferCallback(event.peer.c_str(), event.str.c_str(), event.bytes, event.durationMs, event.intValue);
+    }
+}
+
 // C interface implementation
 extern "C" {
     __declspec(dllexport) ServerThread* createServerThread()
@@ -335,6 +988,46 @@ extern "C" {
         instance->stop();
     }
 
+    // Прием в нескольких процессах: родитель держит слушающий сокет и запись SDP,
+    // обработчики принимают подключения на его копиях (WSADuplicateSocket)
+    __declspec(dllexport) void startSharedListener(ServerThread* instance)
+    {
+        instance->start(ServerThread::ListenOnly);
+    }
+
+    __declspec(dllexport) int shareListener(ServerThread* instance, unsigned long processId, char* buffer, int size)
+    {
+        return instance->shareListener(processId, buffer, size);
+    }
+
+    __declspec(dllexport) int startServerOnSharedListener(ServerThread* instance, const char* protocolInfo, int size)
+    {
+        return instance->startShared(protocolInfo, size) ? 1 : 0;
+    }
+
+    __declspec(dllexport) int getServerStats(ServerThread* instance, ServerStats* stats)
+    {
+        if (!stats) return 0;
+        instance->getStats(stats);
+        return 1;
+    }
+
+    // Ключи шифрования сопряженных устройств (TRANSFER_KEY_SIZE байт)
+    __declspec(dllexport) void addServerKey(ServerThread* instance, const unsigned char* key, int size)
+    {
+        instance->addKey(key, size);
+    }
+
+    __declspec(dllexport) void clearServerKeys(ServerThread* instance)
+    {
+        instance->clearKeys();
+    }
+
+    __declspec(dllexport) void setServerRequireEncryption(ServerThread* instance, int required)
+    {
+        instance->setRequireEncryption(required != 0);
+    }
+
     __declspec(dllexport) void registerServerCallbacks(
         ServerThread* instance,
         ServerStatusCallback status,
@@ -344,4 +1037,31 @@ extern "C" {
     {
         instance->setCallbacks(status, fileReceived, clientConnected, clientDisconnected);
     }
+
+    __declspec(dllexport) void registerServerStreamCallback(
+        ServerThread* instance,
+        FileStreamCallback fileStream)
+    {
+        instance->setStreamCallback(fileStream);
+    }
+
+    __declspec(dllexport) void registerServerTransferCallback(
+        ServerThread* instance,
+        TransferFinishedCallback transferFinished)
+    {
+        instance->setTransferCallback(transferFinished);
+    }
+
+    // Имитация канала (общая для всех экземпляров в этой DLL); nullptr - выключить
+    __declspec(dllexport) void setLinkSimulation(const LinkSimConfig* config)
+    {
+        LinkSimulator::instance().configure(config);
+    }
+
+    __declspec(dllexport) int getLinkSimulationStats(LinkSimStats* stats)
+    {
+        if (!stats) return 0;
+        LinkSimulator::instance().getStats(stats);
+        return 1;
+    }
 }
\ No newline at end of file
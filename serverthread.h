@@ -11,12 +11,57 @@
 #include <mutex>
 #include <condition_variable>
 #include <queue>
+#include <chrono>
+#include "transferprotocol.h"
+#include "linksim.h"
+#include "transfercrypto.h"
 
 // Callback типы для сервера
 typedef void (*ServerStatusCallback)(const char* message);
 typedef void (*FileReceivedCallback)(const char* filename);
 typedef void (*ClientConnectedCallback)();
 typedef void (*ClientDisconnectedCallback)();  // Добавлен callback для отключения клиента
+// Состояние принимаемого файла для потокового воспроизведения
+typedef void (*FileStreamCallback)(const char* filename, int totalSize, int state);
+// Итог подключения для истории передач: адрес отправителя, файл (пустой - до файла не дошло),
+// принятые байты, длительность, ok = 1 - файл принят
+typedef void (*TransferFinishedCallback)(const char* peer, const char* filename,
+    unsigned long long bytes, double durationMs, int ok);
+
+// Период проверки флага остановки в ожидании подключений: stop() ждет не дольше
+#define SERVER_ACCEPT_POLL_MS 100
+
+#define STREAM_STATE_STARTED 0
+#define STREAM_STATE_FINISHED 1
+#define STREAM_STATE_ABORTED 2
+
+// Статистика приема для метрик на стороне Python (раскладка совпадает с TransferStats клиента)
+// Границы корзин задержки чанка (мс): 0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, +inf
+#define STATS_LATENCY_BUCKETS 12
+#define STATS_STALL_THRESHOLD_MS 500.0
+
+struct ServerStats {
+    unsigned long long bytesTransferred;
+    unsigned long long chunksTransferred;
+    double lastTransferMs;
+    double firstByteMs;
+    unsigned long long stallCount;
+    double stallTotalMs;
+    double stallMaxMs;
+    unsigned long long chunkLatencyBuckets[STATS_LATENCY_BUCKETS];
+    double chunkLatencySumMs;
+    unsigned long long dispatchCount;
+    double dispatchSumMs;
+    double dispatchMaxMs;
+    int eventQueueDepth;
+    int eventQueueMaxDepth;
+    int chunkSize;
+    int socketBuffer;
+    unsigned long long ackedBytes;  // подтверждено отправителю в последнем приеме
+    double ackWaitMs;               // не используется на стороне получателя
+    double diskWaitMs;              // не используется на стороне получателя
+    double cryptoMs;                // расшифровка и проверка записей
+};
 
 class ServerThread
 {
@@ -24,8 +69,22 @@ public:
     explicit ServerThread();
     ~ServerThread();
 
-    void start();
+    // Прием в нескольких процессах: родитель (ListenOnly) держит слушающий сокет и запись SDP,
+    // процессы-обработчики (AcceptShared) принимают подключения на его копиях
+    enum ListenMode { ListenAndAccept, ListenOnly, AcceptShared };
+
+    void start(ListenMode mode = ListenAndAccept);
     void stop();
+    // Копия слушающего сокета для процесса processId (WSAPROTOCOL_INFOA); 0 - сокета нет
+    int shareListener(DWORD processId, char* buffer, int size);
+    // Прием на копии сокета, полученной из shareListener() другого процесса
+    bool startShared(const char* protocolInfo, int size);
+    // Ключи сопряженных устройств: шифрованная передача принимается, только если ключ
+    // отправителя есть в списке; requireEncryption - отклонять передачи открытым текстом
+    void addKey(const unsigned char* key, int size);
+    void clearKeys();
+    void setRequireEncryption(bool required) { m_requireEncryption = required; }
+    void getStats(ServerStats* stats);
 
     void setCallbacks(
         ServerStatusCallback status,
@@ -33,28 +92,67 @@ public:
         ClientConnectedCallback clientConnected,
         ClientDisconnectedCallback clientDisconnected = nullptr  // Добавлен необязательный callback
     );
+    void setStreamCallback(FileStreamCallback fileStream) { m_fileStreamCallback = fileStream; }
+    void setTransferCallback(TransferFinishedCallback transferFinished) { m_transferCallback = transferFinished; }
 
 private:
     void run();
+    void acceptConnections(SOCKET serverSocket);
     void processEvents();
 
     struct Event {
-        enum Type { ClientConnected, ClientDisconnected, FileReceived, StatusMessage };
+        enum Type { ClientConnected, ClientDisconnected, FileReceived, StatusMessage, FileStream, TransferFinished };
         Type type;
         std::string str;
+        int intValue;
+        int state;
+        std::chrono::steady_clock::time_point posted;
+        std::string peer;            // TransferFinished: адрес отправителя, байты и длительность
+        unsigned long long bytes;
+        double durationMs;
     };
 
     void postEvent(const Event& event);
+    void recordChunk(double latencyMs, size_t bytes);
+    void reportTransfer(const std::string& peer, const std::string& fileName, unsigned long long bytes,
+        std::chrono::steady_clock::time_point transferStart, bool ok);
+
+    // Прием файла целиком или сборка из изменений относительно имеющейся копии
+    enum DeltaResult { DeltaUnused, DeltaDone, DeltaFailed };
+    // Данные пишутся во временный файл "<имя>.<pid>-<n>.part", на место он переносится только после
+    // приема целиком. Возвращает true, если файл принят и сохранен; received - байт записано
+    bool receiveFile(SOCKET clientSocket, std::string& fileName, const std::string& altName,
+        bool replaceExisting, int dataSize, int ackInterval, ChunkCipher* cipher,
+        std::chrono::steady_clock::time_point transferStart, int& received);
+    int receiveDelta(SOCKET clientSocket, std::string& fileName, const std::string& altName,
+        int dataSize, std::chrono::steady_clock::time_point transferStart);
+    // Перенос принятого файла на место; занятое имя заменяется только при replaceExisting,
+    // иначе файл сохраняется под запасным именем (fileName меняется)
+    bool publishFile(const std::string& tempName, std::string& fileName, const std::string& altName,
+        bool replaceExisting);
     void handleClientConnected();
     void handleClientDisconnected();
     void handleFileReceived(const std::string& filename);
     void handleStatusMessage(const std::string& message);
+    void handleFileStream(const std::string& filename, int totalSize, int state);
+    void handleTransferFinished(const Event& event);
 
     std::thread m_serverThread;
     std::thread m_eventThread;
     std::atomic<bool> m_stopServer;
+    std::atomic<bool> m_running;  // поток сервера работает (start() повторно не запускает)
+    bool m_winsockReady;          // WSAStartup - один раз на экземпляр, а не на каждый запуск
+    ListenMode m_mode;
+    WSAPROTOCOL_INFOA m_sharedListener;  // для AcceptShared
+    SOCKET m_listenSocket;               // для shareListener(), под m_listenMutex
+    std::mutex m_listenMutex;
     std::atomic<bool> m_stopEventThread;
 
+    // Ключи шифрования по идентификатору (transfer_key_id)
+    std::map<std::string, std::vector<unsigned char>> m_keys;
+    std::mutex m_keyMutex;
+    std::atomic<bool> m_requireEncryption;
+
     // Thread-safe очередь для событий
     std::queue<Event> m_eventQueue;
     std::mutex m_eventMutex;
@@ -65,6 +163,12 @@ private:
     FileReceivedCallback m_fileReceivedCallback;
     ClientConnectedCallback m_clientConnectedCallback;
     ClientDisconnectedCallback m_clientDisconnectedCallback;
+    FileStreamCallback m_fileStreamCallback;
+    TransferFinishedCallback m_transferCallback;
+
+    // Метрики приема
+    ServerStats m_stats;
+    std::mutex m_statsMutex;
 };
 
 // C-совместимый интерфейс для сервера
@@ -73,6 +177,13 @@ extern "C" {
     __declspec(dllexport) void destroyServerThread(ServerThread* instance);
     __declspec(dllexport) void startServer(ServerThread* instance);
     __declspec(dllexport) void stopServer(ServerThread* instance);
+    __declspec(dllexport) void startSharedListener(ServerThread* instance);
+    __declspec(dllexport) int shareListener(ServerThread* instance, unsigned long processId, char* buffer, int size);
+    __declspec(dllexport) int startServerOnSharedListener(ServerThread* instance, const char* protocolInfo, int size);
+    __declspec(dllexport) int getServerStats(ServerThread* instance, ServerStats* stats);
+    __declspec(dllexport) void addServerKey(ServerThread* instance, const unsigned char* key, int size);
+    __declspec(dllexport) void clearServerKeys(ServerThread* instance);
+    __declspec(dllexport) void setServerRequireEncryption(ServerThread* instance, int required);
     __declspec(dllexport) void registerServerCallbacks(
         ServerThread* instance,
         ServerStatusCallback status,
@@ -80,6 +191,17 @@ extern "C" {
         ClientConnectedCallback clientConnected,
         ClientDisconnectedCallback clientDisconnected
     );
+    __declspec(dllexport) void registerServerStreamCallback(
+        ServerThread* instance,
+        FileStreamCallback fileStream
+    );
+    // Итог каждого подключения (история передач; нет в старых сборках)
+    __declspec(dllexport) void registerServerTransferCallback(
+        ServerThread* instance,
+        TransferFinishedCallback transferFinished
+    );
+    __declspec(dllexport) void setLinkSimulation(const LinkSimConfig* config);
+    __declspec(dllexport) int getLinkSimulationStats(LinkSimStats* stats);
 }
 
 #endif // SERVERTHREAD_H
\ No newline at end of file
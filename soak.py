@@ -0,0 +1,560 @@
+"""Длительный прогон передачи файлов через имитированный канал со сбоями.
+
+Клиент (BluetoothBackend) и сервер (ServerBackend) работают в одном процессе поверх
+имитации RFCOMM (linksim.h): ограничение полосы, задержка с джиттером, дробление
+на сегменты, паузы и обрывы соединения. Прогон отправляет файлы случайного размера,
+сверяет их содержимое у получателя и следит за деградацией скорости, ростом памяти
+и утечкой дескрипторов.
+
+Режим --lifecycle N проверяет жизненный цикл бэкендов: N раз создает клиент и сервер,
+подключается, отправляет файл, останавливает и уничтожает оба экземпляра - память,
+дескрипторы и потоки процесса не должны расти.
+
+Режим --crypto-bench N сравнивает шифрованную передачу с передачей открытым текстом:
+по N МБ в каждом режиме (попеременно, чтобы дрейф нагрузки делился поровну). Бюджет
+шифрования - --crypto-budget мс процессорного времени процесса (клиент и сервер вместе)
+на мегабайт сверх открытого текста, по умолчанию 10: при 100-300 КБ/с канала RFCOMM
+мегабайт идет 3-10 с, так что это доли процента одного ядра. Скорость на имитированном
+канале (--bandwidth) не должна падать больше чем на --max-crypto-slowdown.
+
+Пример:
+    python soak.py --hours 4 --bandwidth 200 --latency 20 --jitter 10 --segment 900 --disconnect-prob 0.0005
+    python soak.py --lifecycle 10000
+    python soak.py --crypto-bench 64 --bandwidth 2048 --max-size 8388608
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import random
+import re
+import secrets
+import statistics
+import sys
+import threading
+import time
+from typing import Dict, List, Optional
+
+from bluetooth_gui import (BluetoothBackend, ServerBackend, LinkSimConfig, DeviceKeyStore,
+                           TRANSFER_KEY_SIZE)
+
+try:
+    import psutil  # Необязательная зависимость: память и дескрипторы на любой платформе
+except ImportError:
+    psutil = None
+
+logger = logging.getLogger('backend')
+
+SOAK_DEVICE_ADDRESS = "00000000000A"  # имитация не использует адрес, но клиент его проверяет
+
+def process_resources() -> Dict[str, int]:
+    """Память (RSS), открытые дескрипторы и потоки процесса"""
+    if psutil is not None:
+        process = psutil.Process()
+        handles = process.num_handles() if hasattr(process, "num_handles") else process.num_fds()
+        return {"rss": process.memory_info().rss, "handles": handles, "threads": process.num_threads()}
+
+    if sys.platform == "win32":
+        import ctypes
+        from ctypes import wintypes
+
+        class ProcessMemoryCounters(ctypes.Structure):
+            _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD)] + [
+                (name, ctypes.c_size_t) for name in (
+                    "PeakWorkingSetSize", "WorkingSetSize", "QuotaPeakPagedPoolUsage",
+                    "QuotaPagedPoolUsage", "QuotaPeakNonPagedPoolUsage", "QuotaNonPagedPoolUsage",
+                    "PagefileUsage", "PeakPagefileUsage")]
+
+        kernel32 = ctypes.windll.kernel32
+        kernel32.GetCurrentProcess.restype = wintypes.HANDLE
+        current = kernel32.GetCurrentProcess()
+        counters = ProcessMemoryCounters()
+        counters.cb = ctypes.sizeof(counters)
+        ctypes.windll.psapi.GetProcessMemoryInfo(current, ctypes.byref(counters), counters.cb)
+        handles = wintypes.DWORD()
+        kernel32.GetProcessHandleCount(current, ctypes.byref(handles))
+        return {"rss": counters.WorkingSetSize, "handles": handles.value, "threads": threading.active_count()}
+
+    # Linux: /proc
+    with open("/proc/self/statm") as f:
+        rss = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    return {"rss": rss, "handles": len(os.listdir("/proc/self/fd")),
+            "threads": len(os.listdir("/proc/self/task"))}
+
+class SoakRunner:
+    """Прогон: отправка, проверка доставки, периодические замеры"""
+
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.rng = random.Random(args.seed or None)
+        self.client = BluetoothBackend()
+        self.server = ServerBackend()
+        self.client.set_delta_enabled(args.delta)
+
+        self._received = threading.Event()
+        self._received_name = None
+        self._channel = 0
+        self._channel_ready = threading.Event()
+        self.server.on_file_received = self._on_server_file_received
+        self.server.on_status = self._on_server_status
+        self.client.set_channel_resolver(lambda address: self._channel)
+        if args.encrypt and not self.enable_encryption(required=True):
+            logger.error("Библиотеки собраны без шифрования передачи, прогон - открытым текстом")
+
+        self.files_ok = 0
+        self.files_failed = 0
+        self.corrupted = 0
+        self.attempts_failed = 0
+        self.bytes_ok = 0
+        self.samples: List[dict] = []
+        self._stop = False
+
+    def _link_config(self) -> LinkSimConfig:
+        args = self.args
+        return LinkSimConfig(
+            enabled=1, basePort=args.base_port, bandwidthKBps=args.bandwidth,
+            latencyMs=args.latency, jitterMs=args.jitter, maxSegment=args.segment,
+            stallProbability=args.stall_prob, stallMs=args.stall_ms,
+            disconnectProbability=args.disconnect_prob, disconnectAfterBytes=args.disconnect_after,
+            seed=args.seed)
+
+    def enable_encryption(self, required: bool) -> bool:
+        """Ключ пары только для прогона: пользовательский файл ключей не меняется"""
+        if not self.client._has_encryption:
+            return False
+        key = secrets.token_bytes(TRANSFER_KEY_SIZE)
+        self.client.keys = DeviceKeyStore(os.path.join(self.args.source_dir, "soak_keys.json"))
+        self.client.keys.set(SOAK_DEVICE_ADDRESS, key)
+        if not self.server.set_encryption_keys([key], required):
+            return False
+        self.client.set_encryption_enabled(True)
+        return True
+
+    def _on_server_status(self, message: str):
+        match = re.search(r"started on channel (\d+)", message)
+        if match:
+            self._channel = int(match.group(1))
+            self._channel_ready.set()
+
+    def _on_server_file_received(self, filename: str):
+        self._received_name = filename
+        self._received.set()
+
+    def start(self) -> bool:
+        config = self._link_config()
+        if not (self.client.set_link_simulation(config) and self.server.set_link_simulation(config)):
+            logger.error("Библиотеки собраны без имитации канала (setLinkSimulation)")
+            return False
+        self.server.start()
+        if not self._channel_ready.wait(10):
+            logger.error("Сервер не запустился на имитированном канале")
+            return False
+        logger.info(f"Имитированный сервер на канале {self._channel}")
+        return True
+
+    def stop(self):
+        self._stop = True
+
+    def shutdown(self):
+        self.client.disconnect_device()
+        self.server.stop()
+        self.client.set_link_simulation(None)
+        self.server.set_link_simulation(None)
+
+    def _make_file(self, index: int) -> tuple:
+        """Исходный файл со случайным содержимым; имена повторяются по кругу"""
+        size = self.rng.randint(self.args.min_size, self.args.max_size)
+        name = f"soak_{index % self.args.pool:04d}.bin"
+        path = os.path.join(self.args.source_dir, name)
+        data = self.rng.randbytes(size)
+        with open(path, "wb") as f:
+            f.write(data)
+        return path, name, size, hashlib.sha1(data).hexdigest()
+
+    def _send_once(self, path: str) -> bool:
+        # Сервер принимает один файл на соединение - как TransferScheduler, подключаемся заново
+        if not self.client.connect_to_device(SOAK_DEVICE_ADDRESS):
+            return False
+        self._received.clear()
+        self.client.set_file_to_send(path)
+        return self.client.send_file()
+
+    def _deliver(self, path: str, name: str, digest: str) -> bool:
+        for attempt in range(self.args.retries + 1):
+            if self._stop:
+                return False
+            if self._send_once(path):
+                if not self._received.wait(self.args.receive_timeout):
+                    logger.warning(f"{name}: получатель не сообщил о приеме")
+                    return False
+                try:
+                    with open(self._received_name, "rb") as f:
+                        ok = hashlib.sha1(f.read()).hexdigest() == digest
+                except OSError:
+                    ok = False
+                if not ok:
+                    self.corrupted += 1
+                    logger.error(f"{name}: содержимое у получателя не совпадает")
+                return ok
+            self.attempts_failed += 1
+            logger.debug(f"{name}: попытка {attempt + 1} неудачна")
+        return False
+
+    def _sample(self, window_bytes: int, window_time: float):
+        resources = process_resources()
+        client_faults = self.client.link_simulation_stats()
+        sample = {
+            "elapsed": time.monotonic() - self._started,
+            "files_ok": self.files_ok,
+            "files_failed": self.files_failed,
+            "throughput": window_bytes / window_time if window_time > 0 else 0.0,
+            "disconnects": client_faults.disconnects if client_faults else 0,
+            **resources,
+        }
+        self.samples.append(sample)
+        logger.info(f"Прогон {sample['elapsed'] / 60:.1f} мин: доставлено {self.files_ok}, "
+                    f"ошибок {self.files_failed}, {sample['throughput'] / 1024:.1f} КБ/с, "
+                    f"RSS {sample['rss'] / (1024 * 1024):.1f} МБ, дескрипторов {sample['handles']}, "
+                    f"потоков {sample['threads']}")
+
+    def run(self) -> dict:
+        self._started = time.monotonic()
+        deadline = self._started + self.args.hours * 3600 if self.args.hours else None
+        window_start = time.monotonic()
+        window_bytes = 0
+        window_time = 0.0
+        index = 0
+        self._sample(0, 0)
+
+        while not self._stop:
+            if deadline and time.monotonic() >= deadline:
+                break
+            if self.args.files and index >= self.args.files:
+                break
+
+            path, name, size, digest = self._make_file(index)
+            index += 1
+            started = time.monotonic()
+            if self._deliver(path, name, digest):
+                self.files_ok += 1
+                self.bytes_ok += size
+                window_bytes += size
+                window_time += time.monotonic() - started
+            else:
+                self.files_failed += 1
+
+            if time.monotonic() - window_start >= self.args.report_interval:
+                self._sample(window_bytes, window_time)
+                window_start = time.monotonic()
+                window_bytes = 0
+                window_time = 0.0
+
+        self._sample(window_bytes, window_time)
+        return self.summary()
+
+    def summary(self) -> dict:
+        """Итоги: деградация скорости и рост ресурсов относительно начала прогона"""
+        # Первые замеры - прогрев (кэши, пулы потоков), базой служит следующий за ними
+        warmup = min(self.args.warmup_samples, len(self.samples) - 1)
+        baseline = self.samples[warmup]
+        last = self.samples[-1]
+        rates = [s["throughput"] for s in self.samples[warmup + 1:] if s["throughput"] > 0]
+        span = max(1, len(rates) // 4)
+        degradation = None
+        if len(rates) >= 2:
+            early = statistics.median(rates[:span])
+            late = statistics.median(rates[-span:])
+            degradation = (early - late) / early if early else None
+
+        client_faults = self.client.link_simulation_stats()
+        server_faults = self.server.link_simulation_stats()
+        return {
+            "duration_seconds": last["elapsed"],
+            "files_ok": self.files_ok,
+            "files_failed": self.files_failed,
+            "files_corrupted": self.corrupted,
+            "failed_attempts": self.attempts_failed,
+            "bytes_delivered": self.bytes_ok,
+            "throughput_degradation": degradation,
+            "rss_growth_bytes": last["rss"] - baseline["rss"],
+            "handle_growth": last["handles"] - baseline["handles"],
+            "thread_growth": last["threads"] - baseline["threads"],
+            "client_faults": {name: getattr(client_faults, name) for name, _ in client_faults._fields_}
+                             if client_faults else None,
+            "server_faults": {name: getattr(server_faults, name) for name, _ in server_faults._fields_}
+                             if server_faults else None,
+            "samples": self.samples,
+        }
+
+def run_lifecycle(args: argparse.Namespace) -> dict:
+    """Циклы создание - запуск сервера - подключение - отправка - остановка - уничтожение"""
+    rng = random.Random(args.seed or None)
+    data = rng.randbytes(args.min_size)
+    path = os.path.join(args.source_dir, "lifecycle.bin")
+    with open(path, "wb") as f:
+        f.write(data)
+    digest = hashlib.sha1(data).hexdigest()
+    config = LinkSimConfig(enabled=1, basePort=args.base_port, seed=args.seed)
+
+    # Каждый цикл пишет в журнал запуск и остановку бэкендов - на тысячах циклов это шум
+    levels = {name: logging.getLogger(name).level for name in ("backend", "server")}
+    for name in levels:
+        logging.getLogger(name).setLevel(logging.WARNING)
+    try:
+        return _lifecycle_cycles(args, path, digest, config)
+    finally:
+        for name, level in levels.items():
+            logging.getLogger(name).setLevel(level)
+
+def _lifecycle_cycles(args: argparse.Namespace, path: str, digest: str, config: LinkSimConfig) -> dict:
+    """Сами циклы и замеры ресурсов каждые 2% прогона"""
+    failed = corrupted = 0
+    samples: List[dict] = []
+    step = max(1, args.lifecycle // 50)
+    started = time.monotonic()
+    for cycle in range(args.lifecycle):
+        channel_ready = threading.Event()
+        received = threading.Event()
+        state = {"channel": 0, "file": None}
+
+        def on_status(message: str):
+            match = re.search(r"started on channel (\d+)", message)
+            if match:
+                state["channel"] = int(match.group(1))
+                channel_ready.set()
+
+        def on_file_received(filename: str):
+            state["file"] = filename
+            received.set()
+
+        with ServerBackend() as server, BluetoothBackend() as client:
+            if cycle == 0 and not (client.set_link_simulation(config) and server.set_link_simulation(config)):
+                raise RuntimeError("Библиотеки собраны без имитации канала (setLinkSimulation)")
+            server.on_status = on_status
+            server.on_file_received = on_file_received
+            client.set_channel_resolver(lambda address: state["channel"])
+            server.start()
+            ok = channel_ready.wait(10) and client.connect_to_device(SOAK_DEVICE_ADDRESS)
+            if ok:
+                client.set_file_to_send(path)
+                ok = client.send_file() and received.wait(args.receive_timeout)
+            if ok:
+                with open(state["file"], "rb") as f:
+                    if hashlib.sha1(f.read()).hexdigest() != digest:
+                        corrupted += 1
+            else:
+                failed += 1
+            client.disconnect_device()
+            server.stop()
+
+        if cycle % step == 0 or cycle == args.lifecycle - 1:
+            sample = dict(process_resources(), cycle=cycle + 1, elapsed=time.monotonic() - started)
+            samples.append(sample)
+            logger.warning(f"Цикл {cycle + 1}/{args.lifecycle}: RSS {sample['rss'] / (1024 * 1024):.1f} МБ, "
+                           f"дескрипторов {sample['handles']}, потоков {sample['threads']}, ошибок {failed}")
+
+    warmup = min(args.warmup_samples, len(samples) - 1)
+    baseline, last = samples[warmup], samples[-1]
+    return {
+        "duration_seconds": last["elapsed"],
+        "cycles": args.lifecycle,
+        "files_ok": args.lifecycle - failed,
+        "files_failed": failed,
+        "files_corrupted": corrupted,
+        "failed_attempts": 0,
+        "throughput_degradation": None,
+        "rss_growth_bytes": last["rss"] - baseline["rss"],
+        "handle_growth": last["handles"] - baseline["handles"],
+        "thread_growth": last["threads"] - baseline["threads"],
+        "samples": samples,
+    }
+
+def run_crypto_bench(args: argparse.Namespace) -> dict:
+    """Процессорное время и скорость на мегабайт: открытым текстом и с шифрованием"""
+    runner = SoakRunner(args)
+    if not runner.enable_encryption(required=False):
+        raise RuntimeError("Библиотеки собраны без шифрования передачи")
+    if not runner.start():
+        raise RuntimeError("Имитированный канал не запустился")
+
+    size = min(args.max_size, args.crypto_bench * 1024 * 1024)
+    rounds = max(1, args.crypto_bench * 1024 * 1024 // size)
+    data = runner.rng.randbytes(size)
+    name = "crypto_bench.bin"
+    path = os.path.join(args.source_dir, name)
+    with open(path, "wb") as f:
+        f.write(data)
+    digest = hashlib.sha1(data).hexdigest()
+
+    def crypto_seconds() -> float:
+        return runner.client.refresh_metrics().crypto_time + runner.server.refresh_metrics().crypto_time
+
+    totals = {mode: {"cpu": 0.0, "wall": 0.0, "crypto": 0.0, "bytes": 0, "failed": 0}
+              for mode in ("plain", "encrypted")}
+    try:
+        for index in range(rounds):
+            for mode in ("plain", "encrypted") if index % 2 == 0 else ("encrypted", "plain"):
+                runner.client.set_encryption_enabled(mode == "encrypted")
+                crypto_before = crypto_seconds()
+                cpu_before, wall_before = time.process_time(), time.perf_counter()
+                ok = runner._deliver(path, name, digest)
+                entry = totals[mode]
+                entry["cpu"] += time.process_time() - cpu_before
+                entry["wall"] += time.perf_counter() - wall_before
+                entry["crypto"] += crypto_seconds() - crypto_before
+                if ok:
+                    entry["bytes"] += size
+                else:
+                    entry["failed"] += 1
+            logger.info(f"Раунд {index + 1}/{rounds}: открытым текстом {totals['plain']['cpu']:.2f} с CPU, "
+                        f"с шифрованием {totals['encrypted']['cpu']:.2f} с CPU")
+    finally:
+        runner.shutdown()
+
+    summary = {"file_size": size, "rounds": rounds, "files_corrupted": runner.corrupted}
+    for mode, entry in totals.items():
+        megabytes = entry["bytes"] / (1024 * 1024)
+        summary[mode] = {
+            "megabytes": megabytes,
+            "files_failed": entry["failed"],
+            "cpu_ms_per_mb": entry["cpu"] * 1000 / megabytes if megabytes else None,
+            "crypto_ms_per_mb": entry["crypto"] * 1000 / megabytes if megabytes else None,
+            "throughput": entry["bytes"] / entry["wall"] if entry["wall"] else 0.0,
+        }
+    plain, encrypted = summary["plain"], summary["encrypted"]
+    summary["cpu_overhead_ms_per_mb"] = (encrypted["cpu_ms_per_mb"] - plain["cpu_ms_per_mb"]
+                                         if plain["cpu_ms_per_mb"] is not None and
+                                         encrypted["cpu_ms_per_mb"] is not None else None)
+    summary["throughput_ratio"] = (encrypted["throughput"] / plain["throughput"]
+                                   if plain["throughput"] else None)
+    return summary
+
+def check_crypto_bench(summary: dict, args: argparse.Namespace) -> List[str]:
+    """Нарушенные пороги сравнения с шифрованием"""
+    problems = []
+    if summary["files_corrupted"]:
+        problems.append(f"поврежденных файлов: {summary['files_corrupted']}")
+    for mode in ("plain", "encrypted"):
+        if summary[mode]["files_failed"]:
+            problems.append(f"не доставлено ({mode}): {summary[mode]['files_failed']}")
+    overhead = summary["cpu_overhead_ms_per_mb"]
+    if overhead is None:
+        problems.append("нет доставленных файлов для сравнения")
+    elif overhead > args.crypto_budget:
+        problems.append(f"шифрование стоит {overhead:.1f} мс CPU на МБ при бюджете {args.crypto_budget:g}")
+    ratio = summary["throughput_ratio"]
+    if ratio is not None and ratio < 1 - args.max_crypto_slowdown:
+        problems.append(f"скорость с шифрованием - {ratio * 100:.0f}% от открытого текста")
+    return problems
+
+def check_summary(summary: dict, args: argparse.Namespace) -> List[str]:
+    """Нарушенные пороги прогона"""
+    problems = []
+    if summary["files_corrupted"]:
+        problems.append(f"поврежденных файлов: {summary['files_corrupted']}")
+    degradation = summary["throughput_degradation"]
+    if degradation is not None and degradation > args.max_degradation:
+        problems.append(f"скорость упала на {degradation * 100:.0f}%")
+    if summary["rss_growth_bytes"] > args.max_rss_growth * 1024 * 1024:
+        problems.append(f"память выросла на {summary['rss_growth_bytes'] / (1024 * 1024):.1f} МБ")
+    if summary["handle_growth"] > args.max_handle_growth:
+        problems.append(f"дескрипторов стало больше на {summary['handle_growth']}")
+    if summary["thread_growth"] > args.max_handle_growth:
+        problems.append(f"потоков стало больше на {summary['thread_growth']}")
+    return problems
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Длительный прогон передачи через имитированный канал")
+    run = parser.add_argument_group("прогон")
+    run.add_argument("--hours", type=float, default=0, help="длительность (0 - по числу файлов)")
+    run.add_argument("--files", type=int, default=1000, help="число файлов (0 - по длительности)")
+    run.add_argument("--min-size", type=int, default=1024)
+    run.add_argument("--max-size", type=int, default=4 * 1024 * 1024)
+    run.add_argument("--pool", type=int, default=50, help="имена файлов повторяются по кругу")
+    run.add_argument("--retries", type=int, default=3, help="повторы после обрыва")
+    run.add_argument("--delta", action="store_true", help="разрешить дельта-передачу")
+    run.add_argument("--encrypt", action="store_true", help="шифровать передачу (ключ только для прогона)")
+    run.add_argument("--receive-timeout", type=float, default=30.0)
+    run.add_argument("--report-interval", type=float, default=60.0, help="секунды между замерами")
+    run.add_argument("--warmup-samples", type=int, default=1)
+    run.add_argument("--source-dir", default="soak_source")
+    run.add_argument("--report", help="JSON с итогами и замерами")
+    run.add_argument("--seed", type=int, default=0)
+    run.add_argument("--lifecycle", type=int, default=0,
+                     help="вместо прогона: N циклов создания и уничтожения бэкендов (--min-size - размер файла)")
+    run.add_argument("--crypto-bench", type=int, default=0,
+                     help="вместо прогона: по N МБ открытым текстом и с шифрованием (--max-size - размер файла)")
+
+    link = parser.add_argument_group("канал")
+    link.add_argument("--base-port", type=int, default=0, help="TCP-порт канала 0 (0 - по умолчанию)")
+    link.add_argument("--bandwidth", type=float, default=0, help="КБ/с, 0 - без ограничения")
+    link.add_argument("--latency", type=float, default=0, help="мс на вызов send()")
+    link.add_argument("--jitter", type=float, default=0, help="мс, +-")
+    link.add_argument("--segment", type=int, default=0, help="максимум байт за вызов (частичные чтения)")
+    link.add_argument("--stall-prob", type=float, default=0)
+    link.add_argument("--stall-ms", type=float, default=500)
+    link.add_argument("--disconnect-prob", type=float, default=0)
+    link.add_argument("--disconnect-after", type=int, default=0, help="обрыв каждые N байт")
+
+    limits = parser.add_argument_group("пороги")
+    limits.add_argument("--max-degradation", type=float, default=0.2, help="доля падения скорости")
+    limits.add_argument("--max-rss-growth", type=float, default=64, help="МБ")
+    limits.add_argument("--max-handle-growth", type=int, default=16)
+    limits.add_argument("--crypto-budget", type=float, default=10.0,
+                        help="мс CPU на МБ сверх открытого текста (клиент и сервер вместе)")
+    limits.add_argument("--max-crypto-slowdown", type=float, default=0.1,
+                        help="доля падения скорости с шифрованием")
+    return parser.parse_args(argv)
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    os.makedirs(args.source_dir, exist_ok=True)
+    if args.crypto_bench:
+        try:
+            summary = run_crypto_bench(args)
+        except RuntimeError as e:
+            logger.error(str(e))
+            return 2
+    elif args.lifecycle:
+        try:
+            summary = run_lifecycle(args)
+        except RuntimeError as e:
+            logger.error(str(e))
+            return 2
+    else:
+        runner = SoakRunner(args)
+        if not runner.start():
+            return 2
+        try:
+            summary = runner.run()
+        except KeyboardInterrupt:
+            logger.info("Прогон прерван, подводим итоги")
+            summary = runner.summary()
+        finally:
+            runner.shutdown()
+
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+
+    if args.crypto_bench:
+        problems = check_crypto_bench(summary, args)
+        plain, encrypted = summary["plain"], summary["encrypted"]
+        message = (f"Итоги сравнения: CPU {plain['cpu_ms_per_mb'] or 0:.1f} мс/МБ открытым текстом, "
+                   f"{encrypted['cpu_ms_per_mb'] or 0:.1f} мс/МБ с шифрованием "
+                   f"(из них шифрование {encrypted['crypto_ms_per_mb'] or 0:.2f} мс/МБ), "
+                   f"скорость {plain['throughput'] / 1024:.0f} и {encrypted['throughput'] / 1024:.0f} КБ/с")
+    else:
+        problems = check_summary(summary, args)
+        message = (f"Итоги прогона: доставлено {summary['files_ok']}, не доставлено {summary['files_failed']}, "
+                   f"повторов после сбоев {summary['failed_attempts']}")
+        if summary["throughput_degradation"] is not None:
+            message += f", деградация скорости {summary['throughput_degradation'] * 100:.1f}%"
+    logger.info(message)
+    for problem in problems:
+        logger.error(f"Порог нарушен: {problem}")
+    return 1 if problems else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
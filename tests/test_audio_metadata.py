@@ -0,0 +1,99 @@
+"""Разбор метаданных аудиофайлов без mutagen (audio_metadata)"""
+import struct
+import wave
+
+import pytest
+
+import audio_metadata
+from audio_metadata import extract_audio_metadata, file_digest
+
+# MPEG-1 Layer III, 128 кбит/с, 44100 Гц, стерео
+MP3_FRAME_HEADER = b"\xff\xfb\x90\x00"
+
+
+@pytest.fixture(autouse=True)
+def without_mutagen(monkeypatch):
+    monkeypatch.setattr(audio_metadata, "mutagen", None)
+
+
+def id3v2_tag(**frames) -> bytes:
+    body = b""
+    for frame_id, text in frames.items():
+        data = b"\x03" + text.encode("utf-8")
+        body += frame_id.encode() + struct.pack(">I", len(data)) + b"\x00\x00" + data
+    size = len(body)
+    syncsafe = bytes([(size >> 21) & 0x7F, (size >> 14) & 0x7F, (size >> 7) & 0x7F, size & 0x7F])
+    return b"ID3\x03\x00\x00" + syncsafe + body
+
+
+def test_mp3_cbr_with_id3v2(tmp_path):
+    path = tmp_path / "song.mp3"
+    path.write_bytes(id3v2_tag(TIT2="Песня", TPE1="Artist") + MP3_FRAME_HEADER + b"\x00" * 15996)
+    info = extract_audio_metadata(str(path))
+    assert info["codec"] == "mp3"
+    assert (info["sample_rate"], info["channels"], info["bitrate"]) == (44100, 2, 128000)
+    assert info["duration"] == pytest.approx(1.0)
+    assert info["tags"] == {"title": "Песня", "artist": "Artist"}
+
+
+def test_mp3_vbr_uses_xing_frame_count(tmp_path):
+    frame = bytearray(MP3_FRAME_HEADER + b"\x00" * 413)
+    xing = 4 + 32  # после боковой информации MPEG-1 стерео
+    frame[xing:xing + 12] = b"Xing" + struct.pack(">II", 1, 100)
+    path = tmp_path / "vbr.mp3"
+    path.write_bytes(bytes(frame) + b"\x00" * 10000)
+    info = extract_audio_metadata(str(path))
+    assert info["duration"] == pytest.approx(100 * 1152 / 44100)
+
+
+def test_mp3_id3v1_tags(tmp_path):
+    tail = b"TAG" + b"Title".ljust(30, b"\x00") + b"Artist".ljust(30, b"\x00") + b"Album".ljust(30, b"\x00")
+    path = tmp_path / "old.mp3"
+    path.write_bytes(MP3_FRAME_HEADER + b"\x00" * 2000 + tail.ljust(128, b"\x00"))
+    info = extract_audio_metadata(str(path))
+    assert info["tags"] == {"title": "Title", "artist": "Artist", "album": "Album"}
+
+
+def test_flac_streaminfo_and_comments(tmp_path):
+    sample_rate, channels, bits, samples = 48000, 2, 16, 96000
+    packed = (sample_rate << 44) | ((channels - 1) << 41) | ((bits - 1) << 36) | samples
+    streaminfo = b"\x00" * 10 + packed.to_bytes(8, "big") + b"\x00" * 16
+    comment = b"TITLE=Flac song"
+    vorbis = (struct.pack("<I", 6) + b"vendor" + struct.pack("<I", 1)
+              + struct.pack("<I", len(comment)) + comment)
+    data = (b"fLaC" + bytes([0]) + len(streaminfo).to_bytes(3, "big") + streaminfo
+            + bytes([0x80 | 4]) + len(vorbis).to_bytes(3, "big") + vorbis)
+    path = tmp_path / "song.flac"
+    path.write_bytes(data)
+    info = extract_audio_metadata(str(path))
+    assert info["codec"] == "flac"
+    assert (info["sample_rate"], info["channels"]) == (48000, 2)
+    assert info["duration"] == pytest.approx(2.0)
+    assert info["tags"] == {"title": "Flac song"}
+
+
+def test_wav(tmp_path):
+    path = tmp_path / "song.wav"
+    with wave.open(str(path), "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(44100)
+        w.writeframes(b"\x00\x00" * 22050)
+    info = extract_audio_metadata(str(path))
+    assert info["codec"] == "pcm"
+    assert info["bitrate"] == 44100 * 16
+    assert info["duration"] == pytest.approx(0.5)
+
+
+def test_unknown_format_keeps_extension(tmp_path):
+    path = tmp_path / "notes.ogg"
+    path.write_bytes(b"OggS" + b"\x00" * 100)
+    info = extract_audio_metadata(str(path))
+    assert info["codec"] == "ogg"
+    assert info["duration"] is None and info["tags"] == {}
+
+
+def test_file_digest(tmp_path):
+    path = tmp_path / "a.bin"
+    path.write_bytes(b"abc")
+    assert file_digest(str(path)) == "a9993e364706816aba3e25717850c26c9cd0d89d"
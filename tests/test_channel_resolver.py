@@ -0,0 +1,155 @@
+"""Подменный поиск канала RFCOMM (set_channel_resolver)
+
+Передача в библиотеку проверяется на библиотеке-пустышке, без DLL и Bluetooth. Кэш каналов
+и повторный поиск при неудачном подключении живут в bluetooth_transfer.dll: эти тесты идут
+через имитацию канала и пропускаются, если библиотеку не удалось загрузить.
+"""
+import itertools
+import threading
+
+import pytest
+
+from bluetooth_gui import (BluetoothBackend, ServerBackend, LinkSimConfig, ReplayLibrary,
+                           ChannelResolverCallback)
+
+ADDRESS = "aabbccddeeff"
+SERVER_CHANNEL = 6  # SERVER_PREFERRED_CHANNEL в transferprotocol.h
+_ports = itertools.count(41800, 20)
+
+
+class FakeTransferLibrary(ReplayLibrary):
+    """Экспорты bluetooth_transfer.dll без DLL: запоминает зарегистрированный поиск канала"""
+    
+    def __init__(self):
+        self.resolver = None
+        
+        def create():
+            return 1
+        
+        def set_channel_resolver(instance, callback):
+            self.resolver = callback
+        
+        self.createBluetoothTransfer = create
+        self.setChannelResolver = set_channel_resolver
+    
+    def lookup(self, address: str) -> int:
+        """Как BluetoothTransfer::resolveChannel: адрес в hex -> канал (0 - сервиса нет)"""
+        return self.resolver(address.encode())
+
+
+class CountingResolver:
+    def __init__(self, *channels):
+        self.channels = list(channels)
+        self.calls = []
+    
+    def __call__(self, address: str) -> int:
+        self.calls.append(address)
+        return self.channels.pop(0) if len(self.channels) > 1 else self.channels[0]
+
+
+@pytest.fixture
+def fake_backend():
+    library = FakeTransferLibrary()
+    backend = BluetoothBackend(library=library)
+    yield backend, library
+    backend.close()
+
+
+def test_lookup_passes_address_and_channel(fake_backend):
+    backend, library = fake_backend
+    resolver = CountingResolver(9)
+    backend.set_channel_resolver(resolver)
+    assert library.lookup(ADDRESS) == 9
+    assert resolver.calls == [ADDRESS]
+    assert backend.channel_resolver is resolver
+
+
+@pytest.mark.parametrize("result", [None, 0])
+def test_lookup_without_service_returns_zero(fake_backend, result):
+    backend, library = fake_backend
+    backend.set_channel_resolver(lambda address: result)
+    assert library.lookup(ADDRESS) == 0
+
+
+def test_lookup_error_returns_zero(fake_backend):
+    backend, library = fake_backend
+    
+    def broken(address):
+        raise OSError("no route")
+    
+    backend.set_channel_resolver(broken)
+    assert library.lookup(ADDRESS) == 0
+
+
+def test_reset_falls_back_to_sdp(fake_backend):
+    backend, library = fake_backend
+    backend.set_channel_resolver(lambda address: 9)
+    backend.set_channel_resolver(None)
+    # Пустой указатель: библиотека снова спрашивает SDP
+    assert isinstance(library.resolver, ChannelResolverCallback)
+    assert not library.resolver
+    assert backend.channel_resolver is None
+
+
+def test_library_without_resolver_export():
+    class OldLibrary(ReplayLibrary):
+        _ABSENT_EXPORTS = ReplayLibrary._ABSENT_EXPORTS + ("setChannelResolver",)
+    
+    backend = BluetoothBackend(library=OldLibrary())
+    try:
+        backend.set_channel_resolver(lambda address: 9)
+        assert backend.channel_resolver is None
+    finally:
+        backend.close()
+
+
+@pytest.fixture
+def link():
+    """Сервер и клиент на имитации канала; без библиотек тест пропускается"""
+    config = LinkSimConfig(enabled=1, basePort=next(_ports))
+    try:
+        server = ServerBackend()
+    except (RuntimeError, OSError) as e:
+        pytest.skip(f"библиотека сервера недоступна: {e}")
+    try:
+        client = BluetoothBackend()
+    except (RuntimeError, OSError) as e:
+        server.close()
+        pytest.skip(f"библиотека клиента недоступна: {e}")
+    server.set_link_simulation(config)
+    client.set_link_simulation(config)
+    started = threading.Event()
+    server.on_status = lambda message: "started on channel" in message and started.set()
+    server.start()
+    assert started.wait(5), "сервер не запустился"
+    yield client
+    client.close()
+    server.close()
+
+
+def test_channel_is_cached_between_connections(link):
+    resolver = CountingResolver(SERVER_CHANNEL)
+    link.set_channel_resolver(resolver)
+    for _ in range(2):
+        assert link.connect_to_device(ADDRESS)
+        link.disconnect_device()
+    assert resolver.calls == [ADDRESS]
+
+
+def test_stale_cached_channel_is_looked_up_again(link):
+    # Первый ответ - канал, на котором никто не слушает: подключение не удается, но канал
+    # уже в кэше; следующее подключение по кэшу не удается и уточняет канал
+    resolver = CountingResolver(SERVER_CHANNEL + 1, SERVER_CHANNEL)
+    link.set_channel_resolver(resolver)
+    assert not link.connect_to_device(ADDRESS)
+    assert link.connect_to_device(ADDRESS)
+    assert len(resolver.calls) == 2
+
+
+def test_missing_service_is_not_cached(link):
+    resolver = CountingResolver(0, SERVER_CHANNEL)
+    link.set_channel_resolver(resolver)
+    assert not link.connect_to_device(ADDRESS)
+    assert "does not offer" in link.get_last_error()
+    assert link.connect_to_device(ADDRESS)
+    assert len(resolver.calls) == 2
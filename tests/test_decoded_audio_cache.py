@@ -0,0 +1,84 @@
+"""LRU-кэш декодированных треков (DecodedAudioCache) на подменных звуках"""
+import os
+
+import pytest
+
+from bluetooth_gui import DecodedAudioCache
+
+
+class FakeSound:
+    def __init__(self, size: int):
+        self.size = size
+
+
+class SizedCache(DecodedAudioCache):
+    """Размер звука задан явно: pygame.mixer для тестов не нужен"""
+    
+    @staticmethod
+    def sound_size(sound) -> int:
+        return sound.size
+
+
+@pytest.fixture
+def tracks(tmp_path):
+    paths = []
+    for name in ("a.mp3", "b.mp3", "c.mp3"):
+        path = tmp_path / name
+        path.write_bytes(b"x")
+        paths.append(str(path))
+    return paths
+
+
+def test_hit_and_miss(tracks):
+    cache = SizedCache(budget_bytes=100)
+    assert cache.get(tracks[0]) is None
+    sound = FakeSound(10)
+    assert cache.put(tracks[0], sound)
+    assert cache.get(tracks[0]) is sound
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_least_recently_used_is_evicted(tracks):
+    cache = SizedCache(budget_bytes=100)
+    cache.put(tracks[0], FakeSound(40))
+    cache.put(tracks[1], FakeSound(40))
+    cache.get(tracks[0])
+    cache.put(tracks[2], FakeSound(40))
+    assert cache.contains(tracks[0]) and cache.contains(tracks[2])
+    assert not cache.contains(tracks[1])
+    assert cache.used_bytes == 80
+    assert cache.evictions == 1
+
+
+def test_oversized_sound_is_not_cached(tracks):
+    cache = SizedCache(budget_bytes=100)
+    assert not cache.put(tracks[0], FakeSound(101))
+    assert cache.used_bytes == 0
+
+
+def test_changed_file_invalidates_copy(tracks):
+    cache = SizedCache(budget_bytes=100)
+    cache.put(tracks[0], FakeSound(10))
+    with open(tracks[0], "ab") as f:
+        f.write(b"more")
+    assert not cache.contains(tracks[0])
+    assert cache.get(tracks[0]) is None
+    assert cache.used_bytes == 0
+
+
+def test_shrinking_budget_evicts(tracks):
+    cache = SizedCache(budget_bytes=100)
+    for path in tracks:
+        cache.put(path, FakeSound(30))
+    cache.set_budget(50)
+    assert cache.stats()["entries"] == 1
+    assert cache.contains(tracks[2])
+
+
+def test_forget_and_relative_paths(tracks, monkeypatch):
+    monkeypatch.chdir(os.path.dirname(tracks[0]))
+    cache = SizedCache(budget_bytes=100)
+    cache.put("a.mp3", FakeSound(10))
+    assert cache.contains(tracks[0])
+    cache.forget(tracks[0])
+    assert cache.used_bytes == 0
@@ -0,0 +1,28 @@
+"""Имя принимаемого файла и уровни журнала подсистем"""
+import logging
+
+import pytest
+
+from bluetooth_gui import received_target_path, _parse_log_levels
+
+
+@pytest.mark.parametrize("part_path, target", [
+    (r"received_files\song.mp3.1234-7.part", r"received_files\song.mp3"),
+    ("song.tar.gz.99-1.part", "song.tar.gz"),
+    # Прежнее имя временного файла - без pid и номера
+    ("song.mp3.part", "song.mp3"),
+    ("song.mp3.abc-1.part", "song.mp3.abc-1"),
+    ("song.mp3", "song.mp3"),
+])
+def test_received_target_path(part_path, target):
+    assert received_target_path(part_path) == target
+
+
+def test_parse_log_levels():
+    levels = _parse_log_levels(" backend = debug ,player=WARNING")
+    assert levels == {"backend": logging.DEBUG, "player": logging.WARNING}
+
+
+@pytest.mark.parametrize("spec", ["", "backend", "unknown=DEBUG", "server=LOUD", "GUI=Level 5"])
+def test_parse_log_levels_ignores_invalid(spec):
+    assert _parse_log_levels(spec) == {}
@@ -0,0 +1,69 @@
+"""Гистограммы и экспорт метрик в формате Prometheus"""
+from bluetooth_gui import Histogram, TransferMetrics, ScanScheduler
+
+
+def test_histogram_buckets_include_upper_bound():
+    histogram = Histogram((1.0, 2.0))
+    for value in (0.5, 1.0, 1.5, 2.0, 3.0):
+        histogram.observe(value)
+    assert histogram.counts == [2, 2, 1]
+    assert histogram.count == 5
+    assert histogram.sum == 8.0
+
+
+def test_histogram_load_replaces_counts():
+    histogram = Histogram((1.0, 2.0))
+    histogram.observe(5.0)
+    histogram.load([1, 2, 3], 4.5)
+    assert histogram.snapshot() == {"buckets": [1.0, 2.0], "counts": [1, 2, 3], "sum": 4.5, "count": 6}
+
+
+def _samples(text: str) -> dict:
+    samples = {}
+    for line in text.splitlines():
+        if line and not line.startswith("#"):
+            name, value = line.rsplit(" ", 1)
+            samples[name] = value
+    return samples
+
+
+def test_prometheus_histogram_is_cumulative():
+    metrics = TransferMetrics("client")
+    for seconds in (0.05, 0.3, 0.3, 30.0):
+        metrics.observe_connect(seconds, ok=True)
+    samples = _samples(metrics.to_prometheus())
+    prefix = "bluetooth_client_connect_latency_seconds"
+    assert samples[f'{prefix}_bucket{{le="0.1"}}'] == "1"
+    assert samples[f'{prefix}_bucket{{le="0.5"}}'] == "3"
+    assert samples[f'{prefix}_bucket{{le="20.0"}}'] == "3"
+    assert samples[f'{prefix}_bucket{{le="+Inf"}}'] == "4"
+    assert samples[f"{prefix}_count"] == "4"
+
+
+def test_prometheus_types_and_missing_values():
+    metrics = TransferMetrics("server")
+    metrics.begin_transfer(1000)
+    metrics.end_transfer(False)
+    text = metrics.to_prometheus()
+    assert text.endswith("\n")
+    assert "# TYPE bluetooth_server_transfers_failed_total counter" in text
+    assert "# TYPE bluetooth_server_throughput_bytes_per_second gauge" in text
+    samples = _samples(text)
+    assert samples["bluetooth_server_transfers_total"] == "1"
+    assert samples["bluetooth_server_transfers_failed_total"] == "1"
+    assert samples["bluetooth_server_bytes_total"] == "0"
+    # Без подключений последней задержки нет
+    assert metrics.snapshot()["last_connect_latency_seconds"] is None
+    assert "bluetooth_server_auto_scan_interval_seconds" not in samples
+
+
+def test_prometheus_exports_auto_scan_decisions():
+    now = [0.0]
+    scheduler = ScanScheduler(base_interval=10, max_interval=40, clock=lambda: now[0])
+    metrics = TransferMetrics("client")
+    metrics.scan_scheduler = scheduler
+    now[0] = 11
+    assert not scheduler.poll(["transfer"])
+    samples = _samples(metrics.to_prometheus())
+    assert samples["bluetooth_client_auto_scan_suspended"] == "1"
+    assert samples['bluetooth_client_auto_scan_deferred_total{reason="transfer"}'] == "1"
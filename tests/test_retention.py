@@ -0,0 +1,146 @@
+"""Очистка полученных файлов (RetentionPolicy)"""
+import os
+import time
+
+import pytest
+
+import bluetooth_gui
+from bluetooth_gui import RetentionPolicy
+
+DAY = 24 * 3600
+
+
+@pytest.fixture
+def root(tmp_path):
+    path = tmp_path / "received_files"
+    path.mkdir()
+    return path
+
+
+def make_policy(root, tmp_path) -> RetentionPolicy:
+    return RetentionPolicy(str(root), str(tmp_path / "retention_index.json"))
+
+
+def receive(policy: RetentionPolicy, root, name: str, size: int = 100) -> str:
+    path = str(root / name)
+    with open(path, "wb") as f:
+        f.write(b"x" * size)
+    policy.note_file(path)
+    return path
+
+
+def test_quota_removes_least_recently_used(root, tmp_path):
+    policy = make_policy(root, tmp_path)
+    first = receive(policy, root, "a.mp3")
+    second = receive(policy, root, "b.mp3")
+    third = receive(policy, root, "c.mp3")
+    policy.touch(first)
+    policy.configure(max_bytes=250, max_age=0)
+    assert policy.enforce() == [os.path.abspath(second)]
+    assert not os.path.exists(second)
+    assert os.path.exists(first) and os.path.exists(third)
+    assert policy.total_bytes() == 200
+    assert policy.reclaimed_total == 100
+
+
+def test_protected_files_are_kept(root, tmp_path):
+    policy = make_policy(root, tmp_path)
+    first = receive(policy, root, "a.mp3")
+    second = receive(policy, root, "b.mp3")
+    policy.is_protected = lambda path: path == os.path.abspath(first)
+    policy.configure(max_bytes=150, max_age=0)
+    assert policy.enforce() == [os.path.abspath(second)]
+    assert os.path.exists(first)
+
+
+def test_max_age_counts_from_last_use(root, tmp_path):
+    old = root / "old.mp3"
+    old.write_bytes(b"x" * 10)
+    week_ago = time.time() - 7 * DAY
+    os.utime(old, (week_ago, week_ago))
+    (root / "new.mp3").write_bytes(b"x" * 10)
+    
+    policy = make_policy(root, tmp_path)
+    policy.configure(max_bytes=0, max_age=DAY)
+    assert policy.enforce() == [os.path.abspath(old)]
+    assert [os.path.basename(path) for path, _, _ in policy.files()] == ["new.mp3"]
+
+
+def test_played_file_does_not_expire(root, tmp_path):
+    old = root / "old.mp3"
+    old.write_bytes(b"x" * 10)
+    week_ago = time.time() - 7 * DAY
+    os.utime(old, (week_ago, week_ago))
+    
+    policy = make_policy(root, tmp_path)
+    policy.enforce()
+    policy.touch(str(old))
+    policy.configure(max_bytes=0, max_age=DAY)
+    assert policy.enforce() == []
+
+
+def test_index_and_limits_survive_restart(root, tmp_path):
+    policy = make_policy(root, tmp_path)
+    receive(policy, root, "a.mp3", size=10)
+    receive(policy, root, "b.mp3", size=20)
+    policy.configure(max_bytes=1000, max_age=DAY)
+    policy.save()
+    
+    restored = make_policy(root, tmp_path)
+    assert (restored.max_bytes, restored.max_age) == (1000, DAY)
+    assert [(os.path.basename(path), size) for path, size, _ in restored.files()] == [("a.mp3", 10), ("b.mp3", 20)]
+    assert restored.total_bytes() == 30
+
+
+def test_corrupted_index_is_rebuilt(root, tmp_path):
+    (tmp_path / "retention_index.json").write_text("{", encoding="utf-8")
+    (root / "a.mp3").write_bytes(b"x" * 10)
+    policy = make_policy(root, tmp_path)
+    policy.enforce()
+    assert policy.total_bytes() == 10
+
+
+@pytest.fixture
+def scans(monkeypatch):
+    calls = []
+    scandir = os.scandir
+    
+    def counting(path):
+        calls.append(path)
+        return scandir(path)
+    
+    monkeypatch.setattr(bluetooth_gui.os, "scandir", counting)
+    return calls
+
+
+def test_receives_update_index_without_rescan(root, tmp_path, scans):
+    policy = make_policy(root, tmp_path)
+    policy.enforce()
+    assert len(scans) == 1
+    
+    for index in range(3):
+        time.sleep(0.01)  # mtime каталога должен успеть измениться
+        part = root / f"song{index}.mp3.1234-{index}.part"
+        part.write_bytes(b"x" * 100)
+        policy.note_receiving()
+        policy.note_file(str(part))  # временный файл в индекс не попадает
+        time.sleep(0.01)
+        os.replace(part, root / f"song{index}.mp3")
+        policy.note_file(str(root / f"song{index}.mp3"))
+        policy.enforce()
+    assert len(scans) == 1
+    assert policy.total_bytes() == 300
+    
+    time.sleep(0.01)
+    (root / "copied.mp3").write_bytes(b"x")
+    policy.enforce()
+    assert len(scans) == 2
+    assert policy.total_bytes() == 301
+
+
+def test_rescan_skips_partial_files(root, tmp_path):
+    (root / "a.mp3").write_bytes(b"x" * 10)
+    (root / "b.mp3.1234-1.part").write_bytes(b"x" * 10)
+    policy = make_policy(root, tmp_path)
+    policy.enforce()
+    assert [os.path.basename(path) for path, _, _ in policy.files()] == ["a.mp3"]
@@ -0,0 +1,83 @@
+"""Расписание автосканирования (ScanScheduler) на подменных часах"""
+import pytest
+
+from bluetooth_gui import ScanScheduler
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+    
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+@pytest.fixture
+def scheduler(clock):
+    return ScanScheduler(base_interval=10, max_interval=40, resume_delay=2, clock=clock)
+
+
+def test_first_scan_after_base_interval(scheduler, clock):
+    clock.now += 9
+    assert not scheduler.poll([])
+    clock.now += 1
+    assert scheduler.poll([])
+    assert scheduler.scans_started == 1
+
+
+def test_busy_defers_and_counts_once(scheduler, clock):
+    clock.now += 15
+    assert not scheduler.poll(["connected", "transfer"])
+    assert not scheduler.poll(["transfer"])
+    assert scheduler.deferred == {"connected": 1, "transfer": 1}
+    assert scheduler.suspended_by == ("transfer",)
+    assert scheduler.poll([])
+    assert scheduler.suspended_by == ()
+
+
+def test_unchanged_results_back_off_to_max(scheduler, clock):
+    intervals = []
+    for _ in range(4):
+        scheduler.scan_finished(["a", "b"])
+        intervals.append(scheduler.interval)
+    assert intervals == [10, 20, 40, 40]
+    assert scheduler.backoffs == 2
+    clock.now += 39
+    assert not scheduler.poll([])
+    clock.now += 1
+    assert scheduler.poll([])
+
+
+def test_changed_results_reset_interval(scheduler):
+    scheduler.scan_finished(["a"])
+    scheduler.scan_finished(["a"])
+    assert scheduler.interval == 20
+    scheduler.scan_finished(["a", "b"])
+    assert scheduler.interval == 10
+    assert scheduler.resets == 1
+
+
+def test_user_activity_refreshes_stale_list_soon(scheduler, clock):
+    scheduler.scan_finished(["a"])
+    scheduler.scan_finished(["a"])
+    scheduler.scan_finished(["a"])
+    assert scheduler.interval == 40
+    clock.now += 30
+    scheduler.user_activity()
+    assert scheduler.interval == 10
+    assert scheduler.snapshot()["next_scan_seconds"] == 2
+    clock.now += 2
+    assert scheduler.poll([])
+
+
+def test_user_activity_keeps_fresh_list(scheduler, clock):
+    scheduler.scan_finished(["a"])
+    clock.now += 3
+    scheduler.user_activity()
+    # Список получен 3 с назад - следующий опрос по базовому интервалу
+    assert scheduler.snapshot()["next_scan_seconds"] == 7
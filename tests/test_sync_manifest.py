@@ -0,0 +1,48 @@
+"""Манифест синхронизации папки (SyncManifest)"""
+from bluetooth_gui import SyncManifest
+
+ADDRESS = "aabbccddeeff"
+
+
+def test_mark_and_reload(tmp_path):
+    path = str(tmp_path / "sync_manifest.json")
+    manifest = SyncManifest(path)
+    assert manifest.get(ADDRESS, "a/x.mp3") is None
+    manifest.mark(ADDRESS, "a/x.mp3", 123, 10, "sha")
+    manifest.save()
+    
+    restored = SyncManifest(path)
+    assert restored.get(ADDRESS, "a/x.mp3") == {"mtime_ns": 123, "size": 10, "sha1": "sha"}
+    assert restored.files(ADDRESS) == {"a/x.mp3": {"mtime_ns": 123, "size": 10, "sha1": "sha"}}
+    assert restored.files("other") == {}
+
+
+def test_mark_replaces_previous_version(tmp_path):
+    manifest = SyncManifest(str(tmp_path / "sync_manifest.json"))
+    manifest.mark(ADDRESS, "x.mp3", 1, 10, "old")
+    manifest.mark(ADDRESS, "x.mp3", 2, 20, "new")
+    assert manifest.get(ADDRESS, "x.mp3")["sha1"] == "new"
+
+
+def test_forget_device(tmp_path):
+    path = str(tmp_path / "sync_manifest.json")
+    manifest = SyncManifest(path)
+    manifest.mark(ADDRESS, "x.mp3", 1, 10, "sha")
+    manifest.mark("112233445566", "x.mp3", 1, 10, "sha")
+    manifest.forget_device(ADDRESS)
+    manifest.save()
+    restored = SyncManifest(path)
+    assert restored.files(ADDRESS) == {}
+    assert restored.get("112233445566", "x.mp3") is not None
+
+
+def test_save_without_changes_writes_nothing(tmp_path):
+    path = tmp_path / "sync_manifest.json"
+    SyncManifest(str(path)).save()
+    assert not path.exists()
+
+
+def test_corrupted_manifest_starts_empty(tmp_path):
+    path = tmp_path / "sync_manifest.json"
+    path.write_text("{not json", encoding="utf-8")
+    assert SyncManifest(str(path)).files(ADDRESS) == {}
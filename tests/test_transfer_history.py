@@ -0,0 +1,85 @@
+"""Журнал передач и сводка по устройствам (TransferHistory)"""
+import json
+
+import pytest
+
+from bluetooth_gui import TransferHistory
+
+PEER = "aabbccddeeff"
+
+
+@pytest.fixture
+def history_path(tmp_path):
+    return str(tmp_path / "transfer_history.jsonl")
+
+
+@pytest.fixture
+def history(history_path):
+    history = TransferHistory(history_path)
+    yield history
+    history.close()
+
+
+def test_retries_and_device_summary(history):
+    history.record("send", PEER, "music/a.mp3", 1000, 1.0, False, error="timeout")
+    history.record("send", PEER, "music/a.mp3", 1000, 1.0, False)
+    entry = history.record("send", PEER, "music/a.mp3", 4000, 2.0, True)
+    assert entry["file"] == "a.mp3"
+    assert entry["retries"] == 2
+    assert entry["throughput"] == 2000
+    
+    summary = history.device_summary()[PEER]
+    assert summary["transfers"] == 3
+    assert summary["failures"] == 2
+    assert summary["failure_rate"] == pytest.approx(2 / 3)
+    assert summary["retries"] == 2
+    assert summary["avg_throughput"] == 2000
+
+
+def test_query_filters_newest_first(history):
+    history.record("send", PEER, "a.mp3", 10, 1.0, True)
+    history.record("receive", "112233445566", "b.mp3", 10, 1.0, False)
+    history.record("send", PEER, "c.mp3", 10, 1.0, False)
+    assert [entry["file"] for entry in history.query()] == ["c.mp3", "b.mp3", "a.mp3"]
+    assert [entry["file"] for entry in history.query(peer=PEER)] == ["c.mp3", "a.mp3"]
+    assert [entry["file"] for entry in history.query(direction="receive")] == ["b.mp3"]
+    assert [entry["file"] for entry in history.query(failed_only=True)] == ["c.mp3", "b.mp3"]
+    assert [entry["file"] for entry in history.query(limit=1)] == ["c.mp3"]
+
+
+def test_history_survives_restart(history, history_path):
+    history.record("send", PEER, "a.mp3", 10, 1.0, False)
+    history.record("send", PEER, "a.mp3", 10, 1.0, True)
+    history.flush()
+    
+    restored = TransferHistory(history_path)
+    try:
+        assert restored.device_summary() == history.device_summary()
+        assert restored.query(limit=1)[0]["retries"] == 1
+    finally:
+        restored.close()
+
+
+def test_truncated_last_line_is_skipped(history_path):
+    entry = {"time": 1.0, "direction": "send", "peer": PEER, "file": "a.mp3", "size": 10,
+             "duration": 1.0, "throughput": 10, "retries": 0, "stalls": 0, "result": "ok"}
+    with open(history_path, "w", encoding="utf-8") as f:
+        f.write(json.dumps(entry) + "\n" + '{"time": 2.0, "dire')
+    history = TransferHistory(history_path)
+    try:
+        assert len(history.query()) == 1
+    finally:
+        history.close()
+
+
+def test_log_is_compacted(history_path):
+    history = TransferHistory(history_path, limit=3)
+    try:
+        for index in range(7):
+            history.record("send", PEER, f"{index}.mp3", 10, 1.0, True)
+            history.flush()
+    finally:
+        history.close()
+    with open(history_path, encoding="utf-8") as f:
+        files = [json.loads(line)["file"] for line in f]
+    assert files == ["4.mp3", "5.mp3", "6.mp3"]
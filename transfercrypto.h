@@ -0,0 +1,162 @@
+#ifndef TRANSFERCRYPTO_H
+#define TRANSFERCRYPTO_H
+
+// Шифрование передачи (AEAD) для клиента и сервера.
+//
+// AES-256-GCM через CNG (bcrypt): система использует AES-NI и PCLMULQDQ процессора,
+// поэтому шифрование стоит единицы миллисекунд на мегабайт и не ограничивает канал RFCOMM.
+// Ключ общий для пары устройств (задается заранее или при сопряжении, 32 байта), на каждую
+// передачу отправитель выбирает случайный префикс nonce; nonce записи - префикс + номер
+// записи, поэтому записи нельзя переставить или повторить. Каждый чанк - отдельная запись:
+// uint32 длина открытого текста, шифртекст, тег. Дополнительные данные (AAD) каждой записи -
+// расширенный заголовок версии 2, так что подменить размер или имя файла тоже нельзя.
+
+#include <windows.h>
+#include <bcrypt.h>
+#include <cstdint>
+#include <cstring>
+#include <string>
+#include <vector>
+
+#pragma comment(lib, "bcrypt.lib")
+
+#define TRANSFER_CIPHER_NAME "aes-256-gcm"
+#define TRANSFER_KEY_SIZE 32
+#define TRANSFER_NONCE_PREFIX_SIZE 8
+#define TRANSFER_NONCE_SIZE 12
+#define TRANSFER_TAG_SIZE 16
+#define TRANSFER_KEY_ID_SIZE 8
+#define TRANSFER_RECORD_OVERHEAD (sizeof(uint32_t) + TRANSFER_TAG_SIZE)
+
+inline std::string to_hex(const unsigned char* data, size_t size) {
+    static const char digits[] = "0123456789abcdef";
+    std::string result;
+    result.reserve(size * 2);
+    for (size_t i = 0; i < size; ++i) {
+        result += digits[data[i] >> 4];
+        result += digits[data[i] & 0x0f];
+    }
+    return result;
+}
+
+inline bool from_hex(const std::string& text, unsigned char* data, size_t size) {
+    if (text.size() != size * 2) return false;
+    auto nibble = [](char c) -> int {
+        if (c >= '0' && c <= '9') return c - '0';
+        if (c >= 'a' && c <= 'f') return c - 'a' + 10;
+        if (c >= 'A' && c <= 'F') return c - 'A' + 10;
+        return -1;
+    };
+    for (size_t i = 0; i < size; ++i) {
+        int high = nibble(text[i * 2]);
+        int low = nibble(text[i * 2 + 1]);
+        if (high < 0 || low < 0) return false;
+        data[i] = (unsigned char)(high << 4 | low);
+    }
+    return true;
+}
+
+inline bool transfer_random(unsigned char* data, size_t size) {
+    return BCRYPT_SUCCESS(BCryptGenRandom(nullptr, data, (ULONG)size, BCRYPT_USE_SYSTEM_PREFERRED_RNG));
+}
+
+// Провайдеры алгоритмов открываются один раз на процесс: открытие дорогое, а сами
+// дескрипторы потокобезопасны
+inline BCRYPT_ALG_HANDLE gcm_provider() {
+    static BCRYPT_ALG_HANDLE provider = []() -> BCRYPT_ALG_HANDLE {
+        BCRYPT_ALG_HANDLE handle = nullptr;
+        if (!BCRYPT_SUCCESS(BCryptOpenAlgorithmProvider(&handle, BCRYPT_AES_ALGORITHM, nullptr, 0))) {
+            return nullptr;
+        }
+        if (!BCRYPT_SUCCESS(BCryptSetProperty(handle, BCRYPT_CHAINING_MODE, (PUCHAR)BCRYPT_CHAIN_MODE_GCM,
+            sizeof(BCRYPT_CHAIN_MODE_GCM), 0))) {
+            BCryptCloseAlgorithmProvider(handle, 0);
+            return nullptr;
+        }
+        return handle;
+    }();
+    return provider;
+}
+
+// Идентификатор ключа для заголовка: получатель находит по нему ключ пары, не раскрывая
+// сам ключ (первые байты SHA-256)
+inline std::string transfer_key_id(const std::vector<unsigned char>& key) {
+    static BCRYPT_ALG_HANDLE provider = []() -> BCRYPT_ALG_HANDLE {
+        BCRYPT_ALG_HANDLE handle = nullptr;
+        if (!BCRYPT_SUCCESS(BCryptOpenAlgorithmProvider(&handle, BCRYPT_SHA256_ALGORITHM, nullptr, 0))) {
+            return nullptr;
+        }
+        return handle;
+    }();
+    unsigned char digest[32];
+    if (!provider || !BCRYPT_SUCCESS(BCryptHash(provider, nullptr, 0, (PUCHAR)key.data(), (ULONG)key.size(),
+        digest, sizeof(digest)))) {
+        return "";
+    }
+    return to_hex(digest, TRANSFER_KEY_ID_SIZE);
+}
+
+class ChunkCipher
+{
+public:
+    ChunkCipher() = default;
+    ChunkCipher(const ChunkCipher&) = delete;
+    ChunkCipher& operator=(const ChunkCipher&) = delete;
+    ~ChunkCipher() {
+        if (m_key) BCryptDestroyKey(m_key);
+    }
+
+    bool init(const std::vector<unsigned char>& key, const unsigned char* noncePrefix, const std::string& aad) {
+        BCRYPT_ALG_HANDLE provider = gcm_provider();
+        if (!provider || key.size() != TRANSFER_KEY_SIZE || m_key) return false;
+        if (!BCRYPT_SUCCESS(BCryptGenerateSymmetricKey(provider, &m_key, nullptr, 0,
+            (PUCHAR)key.data(), (ULONG)key.size(), 0))) {
+            m_key = nullptr;
+            return false;
+        }
+        memcpy(m_nonce, noncePrefix, TRANSFER_NONCE_PREFIX_SIZE);
+        m_counter = 0;
+        m_aad = aad;
+        return true;
+    }
+
+    // Запись из length байт data; record - не меньше length + TRANSFER_RECORD_OVERHEAD
+    bool seal(const char* data, uint32_t length, char* record) {
+        memcpy(record, &length, sizeof(length));
+        char* ciphertext = record + sizeof(length);
+        ULONG written = 0;
+        BCRYPT_AUTHENTICATED_CIPHER_MODE_INFO info;
+        prepare(info, reinterpret_cast<unsigned char*>(ciphertext + length));
+        return BCRYPT_SUCCESS(BCryptEncrypt(m_key, (PUCHAR)data, length, &info, nullptr, 0,
+            (PUCHAR)ciphertext, length, &written, 0)) && written == length;
+    }
+
+    // Шифртекст длины length, за которым следует тег; false - запись подделана или ключ не тот
+    bool open(const char* ciphertext, uint32_t length, char* data) {
+        ULONG written = 0;
+        BCRYPT_AUTHENTICATED_CIPHER_MODE_INFO info;
+        prepare(info, (unsigned char*)(ciphertext + length));
+        return BCRYPT_SUCCESS(BCryptDecrypt(m_key, (PUCHAR)ciphertext, length, &info, nullptr, 0,
+            (PUCHAR)data, length, &written, 0)) && written == length;
+    }
+
+private:
+    void prepare(BCRYPT_AUTHENTICATED_CIPHER_MODE_INFO& info, unsigned char* tag) {
+        uint32_t counter = m_counter++;
+        memcpy(m_nonce + TRANSFER_NONCE_PREFIX_SIZE, &counter, sizeof(counter));
+        BCRYPT_INIT_AUTH_MODE_INFO(info);
+        info.pbNonce = m_nonce;
+        info.cbNonce = TRANSFER_NONCE_SIZE;
+        info.pbAuthData = (PUCHAR)m_aad.data();
+        info.cbAuthData = (ULONG)m_aad.size();
+        info.pbTag = tag;
+        info.cbTag = TRANSFER_TAG_SIZE;
+    }
+
+    BCRYPT_KEY_HANDLE m_key = nullptr;
+    unsigned char m_nonce[TRANSFER_NONCE_SIZE] = { 0 };
+    uint32_t m_counter = 0;
+    std::string m_aad;
+};
+
+#endif // TRANSFERCRYPTO_H
@@ -0,0 +1,220 @@
+#ifndef TRANSFERPROTOCOL_H
+#define TRANSFERPROTOCOL_H
+
+// Общий формат обмена клиента и сервера (bluetoothtransfer.cpp / serverthread.cpp)
+//
+// Версия 1: 20 байт ASCII - размер файла, дополненный пробелами, затем данные.
+// Версия 2: 20 байт "BTX2" + длина расширенного заголовка (ASCII), затем строки
+// "ключ=значение\n": size, name, delta, chunk (размер чанка отправителя), ack (интервал
+// подтверждений, см. ниже). Если отправитель предложил delta=1,
+// получатель отвечает сигнатурой своей копии файла с тем же именем (DeltaSignatureHeader
+// + blockCount записей DeltaBlockSignature). Пустая сигнатура - отправляются все данные,
+// иначе - поток операций: 'L' + uint32 длина + данные, 'C' + uint32 блок + uint32 число
+// блоков, 'E' + uint64 хэш всего файла; получатель подтверждает сборку байтом 'K'
+// (или 'F' при ошибке). Все числа - little-endian.
+// Версию 2 клиент отправляет только получателю, опубликовавшему в SDP запись сервиса
+// TRANSFER_SERVICE_UUID: прежние версии сервера записи не публикуют и понимают только версию 1.
+//
+// Подтверждения (ack=N, только при передаче файла целиком): получатель после каждых N байт,
+// записанных на диск, отправляет AckFrame 'A' со смещением, а после закрытия файла - 'K'
+// (файл записан) или 'F' (ошибка записи, смещение - последняя подтвержденная точка).
+// Отправитель держит неподтвержденными не больше ACK_WINDOW_CHECKPOINTS интервалов.
+//
+// Шифрование (enc=aes-256-gcm, key - идентификатор ключа пары, nonce - префикс nonce в hex,
+// см. transfercrypto.h): данные идут записями по чанку - uint32 длина открытого текста,
+// шифртекст, тег. Дельта-передача при шифровании не используется, подтверждения считают
+// байты открытого текста.
+
+#include <cstdint>
+#include <cstring>
+#include <cstdio>
+#include <string>
+#include <map>
+
+#define PROTOCOL_HEADER_SIZE 20
+#define PROTOCOL_V2_MAGIC "BTX2"
+#define PROTOCOL_V2_MAX_HEADER 4096
+
+// Класс сервиса передачи в SDP - собственный UUID {5E8E2A61-3C8D-4B1A-9F4E-7A2C51D0B6E3},
+// а не общий SPP (0x1101): по SPP находятся чужие сервисы последовательного порта
+#define TRANSFER_SERVICE_UUID_INIT \
+    { 0x5E8E2A61, 0x3C8D, 0x4B1A, { 0x9F, 0x4E, 0x7A, 0x2C, 0x51, 0xD0, 0xB6, 0xE3 } }
+
+// Канал RFCOMM, который сервер занимает, если он свободен; на нем же клиент ищет
+// получателя без записи SDP (прежние версии сервера)
+#define SERVER_PREFERRED_CHANNEL 6
+
+// Границы размера чанка и буфера сокета для автоподстройки под канал
+#define TRANSFER_DEFAULT_CHUNK 1024
+#define TRANSFER_MIN_CHUNK 512
+#define TRANSFER_MAX_CHUNK (64 * 1024)
+#define TRANSFER_MIN_SOCKET_BUFFER (16 * 1024)
+#define TRANSFER_MAX_SOCKET_BUFFER (1024 * 1024)
+
+// Буфер сокета вмещает несколько чанков, чтобы канал не простаивал между send()
+inline int socket_buffer_for_chunk(size_t chunk) {
+    size_t size = chunk * 8;
+    if (size < TRANSFER_MIN_SOCKET_BUFFER) size = TRANSFER_MIN_SOCKET_BUFFER;
+    if (size > TRANSFER_MAX_SOCKET_BUFFER) size = TRANSFER_MAX_SOCKET_BUFFER;
+    return (int)size;
+}
+
+// Окно подтверждений: подтвержденное смещение - точка, с которой можно продолжить передачу
+#define ACK_DEFAULT_INTERVAL (64 * 1024)
+#define ACK_MIN_INTERVAL (4 * 1024)
+#define ACK_WINDOW_CHECKPOINTS 8
+#define ACK_STALL_TIMEOUT_MS 3000  // без подтверждений дольше - канал считается зависшим
+
+#define ACK_CHECKPOINT 'A'
+#define ACK_DONE 'K'
+#define ACK_FAILED 'F'
+
+#define DELTA_SIGNATURE_MAGIC "BSIG"
+#define DELTA_MIN_FILE_SIZE (64 * 1024)       // меньшие файлы дешевле отправить целиком
+#define DELTA_MIN_BLOCK_SIZE 1024
+#define DELTA_MAX_BLOCK_SIZE (64 * 1024)
+#define DELTA_MAX_FILE_SIZE (256 * 1024 * 1024) // отправитель держит файл в памяти
+#define DELTA_MAX_LITERAL (64 * 1024)
+
+#define DELTA_OP_LITERAL 'L'
+#define DELTA_OP_COPY 'C'
+#define DELTA_OP_END 'E'
+#define DELTA_RESULT_OK 'K'
+#define DELTA_RESULT_FAILED 'F'
+
+#pragma pack(push, 1)
+struct DeltaSignatureHeader {
+    char magic[4];
+    uint32_t blockSize;
+    uint32_t blockCount;
+    uint32_t reserved;
+};
+
+struct DeltaBlockSignature {
+    uint32_t weak;
+    uint64_t strong;
+};
+
+struct AckFrame {
+    char type;
+    uint64_t offset;
+};
+#pragma pack(pop)
+
+// Размер блока ~ sqrt(размера файла), как в rsync
+inline uint32_t delta_block_size(unsigned long long fileSize) {
+    uint32_t size = DELTA_MIN_BLOCK_SIZE;
+    while (size < DELTA_MAX_BLOCK_SIZE && (unsigned long long)size * size < fileSize) {
+        size *= 2;
+    }
+    return size;
+}
+
+// Сильный хэш блока и всего файла (FNV-1a, 64 бита)
+#define FNV64_OFFSET 14695981039346656037ULL
+#define FNV64_PRIME 1099511628211ULL
+
+inline uint64_t fnv64_update(uint64_t hash, const unsigned char* data, size_t length) {
+    for (size_t i = 0; i < length; ++i) {
+        hash ^= data[i];
+        hash *= FNV64_PRIME;
+    }
+    return hash;
+}
+
+inline uint64_t fnv64(const unsigned char* data, size_t length) {
+    return fnv64_update(FNV64_OFFSET, data, length);
+}
+
+// Слабая скользящая контрольная сумма (rsync): сдвиг окна на байт за O(1)
+struct RollingChecksum {
+    uint32_t a = 0;
+    uint32_t b = 0;
+    size_t length = 0;
+
+    void reset(const unsigned char* data, size_t count) {
+        a = b = 0;
+        length = count;
+        for (size_t i = 0; i < count; ++i) {
+            a += data[i];
+            b += (uint32_t)(count - i) * data[i];
+        }
+    }
+
+    void roll(unsigned char out, unsigned char in) {
+        a += in - out;
+        b += a - (uint32_t)length * out;
+    }
+
+    uint32_t value() const { return (a & 0xffff) | (b << 16); }
+};
+
+inline uint32_t weak_checksum(const unsigned char* data, size_t length) {
+    RollingChecksum sum;
+    sum.reset(data, length);
+    return sum.value();
+}
+
+// Расширенный заголовок версии 2
+inline std::string build_v2_header(const std::map<std::string, std::string>& fields) {
+    std::string body;
+    for (const auto& field : fields) {
+        body += field.first + "=" + field.second + "\n";
+    }
+    std::string header = PROTOCOL_V2_MAGIC + std::to_string(body.size());
+    header.resize(PROTOCOL_HEADER_SIZE, ' ');
+    return header + body;
+}
+
+inline std::map<std::string, std::string> parse_v2_header(const std::string& body) {
+    std::map<std::string, std::string> fields;
+    size_t start = 0;
+    while (start < body.size()) {
+        size_t end = body.find('\n', start);
+        if (end == std::string::npos) end = body.size();
+        std::string line = body.substr(start, end - start);
+        size_t eq = line.find('=');
+        if (eq != std::string::npos) {
+            fields[line.substr(0, eq)] = line.substr(eq + 1);
+        }
+        start = end + 1;
+    }
+    return fields;
+}
+
+// Безопасное ASCII-имя для папки полученных файлов. Недопустимые символы (в т.ч.
+// не-ASCII) заменяются на '_', а чтобы разные имена не совпали, добавляется хэш
+// исходного имени. Пустая строка - имя непригодно.
+inline std::string sanitize_file_name(const std::string& name) {
+    std::string result;
+    bool replaced = false;
+    for (unsigned char c : name) {
+        if ((c >= 'a' && c <= 'z') || (c >= 'A' && c <= 'Z') || (c >= '0' && c <= '9') ||
+            c == '-' || c == '_' || c == '.' || c == ' ' || c == '(' || c == ')') {
+            result += (char)c;
+        }
+        else {
+            result += '_';
+            replaced = true;
+        }
+    }
+    while (!result.empty() && (result.front() == '.' || result.front() == ' ')) result.erase(0, 1);
+    while (!result.empty() && (result.back() == '.' || result.back() == ' ')) result.pop_back();
+    if (result.empty() || result.size() > 200) return "";
+
+    if (replaced) {
+        char suffix[16];
+        snprintf(suffix, sizeof(suffix), "-%08x",
+            (unsigned)(fnv64((const unsigned char*)name.data(), name.size()) & 0xffffffffu));
+        size_t dot = result.find_last_of('.');
+        if (dot == std::string::npos || dot == 0) dot = result.size();
+        result.insert(dot, suffix);
+    }
+    return result;
+}
+
+inline bool is_v2_header(const char* header) {
+    return memcmp(header, PROTOCOL_V2_MAGIC, 4) == 0;
+}
+
+#endif // TRANSFERPROTOCOL_H